@@ -3,6 +3,7 @@ interface InferenceRequest {
   session_id?: string;
   max_new_tokens?: number;
   top_k?: number;
+  response_mode?: "full" | "compact" | "ids";
 }
 
 interface InferenceResponse {
@@ -40,6 +41,8 @@ export async function callInferenceAPI(
         session_id: request.session_id || "default",
         max_new_tokens: request.max_new_tokens,
         top_k: request.top_k,
+        // Only answer + source metadata are used here; skip draft/router_plan and full abstracts
+        response_mode: request.response_mode ?? "compact",
       }),
     });
 
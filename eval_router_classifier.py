@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Accuracy / latency comparison of router classifiers on a labelled Vietnamese set.
+
+Compares the rule-based mock, the sampled-JSON classifier ('generate') and the
+label-scoring classifier ('score') loaded in qwen_router_server.
+
+Usage:
+    python eval_router_classifier.py --model Qwen/Qwen2.5-14B-Instruct --quantize 8bit
+    python eval_router_classifier.py --model ./local-qwen --device cpu --modes mock score
+    python eval_router_classifier.py --modes mock            # no model needed
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import qwen_router_server as router
+
+
+def load_examples(path: Path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_model(model_path: str, device: str, quantize: str | None):
+    if device == "cuda":
+        if not router.load_qwen3_model(model_path, quantize):
+            raise SystemExit("Failed to load model on GPU")
+        return
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    router.tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
+    router.tokenizer.padding_side = "left"
+    if router.tokenizer.pad_token is None:
+        router.tokenizer.pad_token = router.tokenizer.eos_token
+    router.model = AutoModelForCausalLM.from_pretrained(
+        model_path, trust_remote_code=True, torch_dtype=torch.float32
+    ).eval()
+    router.USE_MOCK = False
+    if router.PREFIX_CACHE_ENABLED:
+        router.build_prefix_cache()
+
+
+def fit_temperature(examples, label_logprobs):
+    """Grid-search the softmax temperature minimising NLL on the labelled set"""
+    import math
+
+    best = (float("inf"), 1.0)
+    for temperature in [0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 8.0]:
+        nll = 0.0
+        for example, scores in zip(examples, label_logprobs):
+            values = {k: v / temperature for k, v in scores.items()}
+            top = max(values.values())
+            log_z = top + math.log(sum(math.exp(v - top) for v in values.values()))
+            nll -= values[example["intent"]] - log_z
+        best = min(best, (nll / len(examples), temperature))
+    return best[1], best[0]
+
+
+def evaluate(mode: str, examples, batch_size: int):
+    fallbacks_before = router.classifier_stats["fallbacks"]
+    latencies, predictions = [], []
+    label_logprobs = []
+    for start in range(0, len(examples), batch_size):
+        batch = [e["text"] for e in examples[start:start + batch_size]]
+        t0 = time.perf_counter()
+        if mode == "mock":
+            results = [router.classify_intent_mock(text) for text in batch]
+        elif mode == "score":
+            router.CLASSIFIER_MODE = "score"
+            scores = router.score_intent_labels(batch)
+            label_logprobs.extend(scores)
+            results = [router.scores_to_classification(s) for s in scores]
+        else:
+            router.CLASSIFIER_MODE = "generate"
+            results = router.classify_batch_with_model(batch)
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        latencies.extend([elapsed_ms / len(batch)] * len(batch))
+        predictions.extend(r.get("intent") for r in results)
+
+    correct = sum(p == e["intent"] for p, e in zip(predictions, examples))
+    latencies.sort()
+    report = {
+        "mode": mode,
+        "examples": len(examples),
+        "accuracy": round(correct / len(examples), 4),
+        "mean_ms": round(statistics.mean(latencies), 2),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 2),
+        "fallbacks": router.classifier_stats["fallbacks"] - fallbacks_before,
+    }
+    if label_logprobs:
+        temperature, nll = fit_temperature(examples, label_logprobs)
+        report["fitted_temperature"] = temperature
+        report["nll_at_fitted_temperature"] = round(nll, 4)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", type=Path, default=Path(__file__).parent / "router_eval_vi.jsonl")
+    parser.add_argument("--model", type=str, default=None)
+    parser.add_argument("--device", choices=["cuda", "cpu"], default="cuda")
+    parser.add_argument("--quantize", choices=["4bit", "8bit"], default=None)
+    parser.add_argument("--modes", nargs="+", choices=["mock", "generate", "score"],
+                        default=["mock", "generate", "score"])
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--max-new-tokens", type=int, default=None,
+                        help="Override max_new_tokens for generate mode")
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    examples = load_examples(args.data)
+    if any(m != "mock" for m in args.modes):
+        if not args.model:
+            parser.error("--model is required for generate/score modes")
+        load_model(args.model, args.device, args.quantize)
+    if args.max_new_tokens:
+        router.GENERATION_KWARGS["max_new_tokens"] = args.max_new_tokens
+
+    reports = [evaluate(mode, examples, args.batch_size) for mode in args.modes]
+    print(f"{'mode':>10} {'acc':>7} {'mean_ms':>9} {'p95_ms':>9} {'fallbacks':>10}")
+    for r in reports:
+        print(f"{r['mode']:>10} {r['accuracy']:>7.3f} {r['mean_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['fallbacks']:>10}")
+    if args.output:
+        args.output.write_text(json.dumps(reports, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Benchmark scripts cho inference server (chạy offline, không cần GPU)."""
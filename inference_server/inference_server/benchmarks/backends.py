@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+So sánh latency giữa các backend sinh text (GENERATION_BACKEND) trên cùng bộ câu hỏi.
+
+Mỗi backend đo: thời gian load, latency một prompt (p50/p95), throughput khi generate
+một batch --batch-size prompt (token/s), và thời gian tới đoạn stream đầu tiên.
+Backend không load được (thiếu vllm/GPU, không tải được model) được ghi là skipped.
+Backend "transformers" mặc định dùng GPT-2 random rất nhỏ (write_stub_causal_lm), nên
+chỉ đo overhead của đường CPU; truyền --cpu-model-id để đo một checkpoint thật.
+
+Usage:
+    python -m benchmarks.backends
+    python -m benchmarks.backends --backends transformers vllm --cpu-model-id Qwen/Qwen2.5-0.5B-Instruct
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.fakes import FakeEngine, write_stub_causal_lm  # noqa: E402
+from benchmarks.load_test import load_question_sets, summarize  # noqa: E402
+from src.backends import EngineBackend, GenerationBackend, SamplingConfig, build_backend  # noqa: E402
+from src.backends.mock import MockSamplingParams  # noqa: E402
+from src.config import Settings  # noqa: E402
+
+BACKENDS = ("mock", "fake", "transformers", "vllm")
+
+
+def load_backend(name: str, args: argparse.Namespace, workdir: Path) -> GenerationBackend:
+    if name == "fake":
+        engine = FakeEngine(token_latency_ms=args.token_latency_ms, answer_tokens=args.max_new_tokens)
+        return EngineBackend(engine, sampling_params_factory=MockSamplingParams, name="fake")
+    if name == "mock":
+        return build_backend(Settings(GENERATION_BACKEND="mock", MOCK_TOKEN_LATENCY_MS=args.token_latency_ms))
+    if name == "transformers":
+        model_id = args.cpu_model_id or str(write_stub_causal_lm(workdir / "stub-lm"))
+        return build_backend(
+            Settings(
+                GENERATION_BACKEND="transformers",
+                CPU_MODEL_ID=model_id,
+                CPU_THREADS=args.cpu_threads,
+                MAX_MODEL_LEN=args.max_model_len,
+            )
+        )
+    return build_backend(Settings(), name)
+
+
+def measure(backend: GenerationBackend, prompts: List[str], args: argparse.Namespace) -> Dict:
+    params = SamplingConfig(max_new_tokens=args.max_new_tokens)
+    backend.generate(prompts[0], params)  # warmup
+
+    single_ms = []
+    for i in range(args.requests):
+        started = time.perf_counter()
+        backend.generate(prompts[i % len(prompts)], params)
+        single_ms.append((time.perf_counter() - started) * 1000.0)
+
+    batch = [prompts[i % len(prompts)] for i in range(args.batch_size)]
+    started = time.perf_counter()
+    generations = backend.generate_batch(batch, params)
+    batch_s = time.perf_counter() - started
+    batch_tokens = sum(len(generation.token_probs) for generation in generations)
+
+    first_chunk_ms = []
+    for i in range(min(args.requests, 10)):
+        started = time.perf_counter()
+        for _ in backend.stream(prompts[i % len(prompts)], params):
+            first_chunk_ms.append((time.perf_counter() - started) * 1000.0)
+            break
+    return {
+        "single_ms": summarize(single_ms),
+        "batch_tokens_per_s": round(batch_tokens / batch_s, 1) if batch_s else 0.0,
+        "batch_s": round(batch_s, 3),
+        "stream_first_chunk_ms": summarize(first_chunk_ms),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--max-model-len", type=int, default=512)
+    parser.add_argument("--token-latency-ms", type=float, default=2.0, help="mock/fake engine")
+    parser.add_argument("--cpu-model-id", default=None, help="checkpoint cho backend transformers")
+    parser.add_argument("--cpu-threads", type=int, default=0)
+    parser.add_argument("--questions", type=Path, default=ROOT / "test_questions.txt")
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    prompts = load_question_sets(args.questions)["single"]
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.backends:
+            started = time.perf_counter()
+            try:
+                backend = load_backend(name, args, Path(tmp))
+            except Exception as exc:  # noqa: BLE001
+                rows.append({"backend": name, "skipped": f"{type(exc).__name__}: {exc}"})
+                continue
+            row = {"backend": name, "load_s": round(time.perf_counter() - started, 3)}
+            row.update(measure(backend, prompts, args))
+            rows.append(row)
+
+    print(f"{'backend':<14}{'load s':>8}{'p50 ms':>9}{'p95 ms':>9}{'batch tok/s':>13}{'stream 1st ms':>15}")
+    for row in rows:
+        if "skipped" in row:
+            print(f"{row['backend']:<14} skipped ({row['skipped'][:80]})")
+            continue
+        print(
+            f"{row['backend']:<14}{row['load_s']:>8.2f}{row['single_ms']['p50']:>9.1f}{row['single_ms']['p95']:>9.1f}"
+            f"{row['batch_tokens_per_s']:>13.1f}{row['stream_first_chunk_ms']['p50']:>15.1f}"
+        )
+
+    if args.output:
+        config = {key: getattr(args, key) for key in vars(args) if key not in ("output", "questions")}
+        args.output.write_text(json.dumps({"config": config, "runs": rows}, indent=2), encoding="utf-8")
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
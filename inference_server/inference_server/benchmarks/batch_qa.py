@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+So sánh throughput (questions/sec) giữa đường HTTP tuần tự (mỗi lần một request
+POST /v1/chat/completions, in-process) và CLI offline src.batch_qa ở các batch size,
+cùng FakeEngine + SyntheticRetriever trên CPU.
+
+Workload: test_questions.txt lặp lại đến đủ --questions câu; câu hỏi đơn mỗi câu
+một session, kịch bản hội thoại giữ nguyên thứ tự lượt trong session của nó.
+
+Usage:
+    python -m benchmarks.batch_qa
+    python -m benchmarks.batch_qa --questions 200 --batch-sizes 1 8 32 64 --token-latency-ms 2
+    python -m benchmarks.batch_qa --output batch_qa.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.load_test import build_in_process_app, load_question_sets, run_load_test  # noqa: E402
+from src.batch_qa import BatchItem, run_batch  # noqa: E402
+
+
+def build_items(question_sets: Dict[str, List], total: int, prefix: str) -> List[BatchItem]:
+    jobs = [[q] for q in question_sets["single"]] + [list(turns) for turns in question_sets["conversation"]]
+    items: List[BatchItem] = []
+    job_no = 0
+    while len(items) < total:
+        turns = jobs[job_no % len(jobs)]
+        session_id = f"{prefix}-s{job_no}"
+        for question in turns[: total - len(items)]:
+            items.append(BatchItem(f"{prefix}-q{len(items)}", question, session_id))
+        job_no += 1
+    return items
+
+
+def serial_http(app, items: List[BatchItem], max_new_tokens) -> Dict:
+    sessions: "OrderedDict[str, List[str]]" = OrderedDict()
+    for item in items:
+        sessions.setdefault(item.session_id, []).append(item.question)
+
+    async def _run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://batchqa", timeout=120.0) as client:
+            return await run_load_test(client, list(sessions.values()), concurrency=1, max_new_tokens=max_new_tokens)
+
+    report = asyncio.run(_run()).report()
+    return {
+        "mode": "serial_http",
+        "batch_size": 1,
+        "answered": report["requests"] - report["errors"],
+        "errors": report["errors"],
+        "elapsed_s": report["duration_s"],
+        "questions_per_s": report["throughput_rps"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=120)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--max-new-tokens", type=int, default=None)
+    parser.add_argument("--token-latency-ms", type=float, default=1.0)
+    parser.add_argument("--answer-tokens", type=int, default=64)
+    parser.add_argument("--router-tokens", type=int, default=48)
+    parser.add_argument("--engine-slots", type=int, default=None)
+    parser.add_argument("--retrieval-latency-ms", type=float, default=10.0)
+    parser.add_argument("--semantic-cache", action="store_true")
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    app = build_in_process_app(args)
+    from src import api
+
+    question_sets = load_question_sets()
+    rows = [serial_http(app, build_items(question_sets, args.questions, "http"), args.max_new_tokens)]
+    with tempfile.TemporaryDirectory() as tmp:
+        for batch_size in args.batch_sizes:
+            prefix = f"batch{batch_size}"
+            stats = run_batch(
+                api.pipeline,
+                build_items(question_sets, args.questions, prefix),
+                Path(tmp) / f"{prefix}.jsonl",
+                batch_size=batch_size,
+                max_new_tokens=args.max_new_tokens,
+            )
+            rows.append({"mode": "batch_qa", "batch_size": batch_size, **stats})
+
+    baseline = rows[0]["questions_per_s"] or 1.0
+    print(f"{'mode':<13}{'batch':>7}{'answered':>10}{'errors':>8}{'elapsed s':>11}{'q/s':>9}{'speedup':>9}")
+    for row in rows:
+        row["speedup"] = round(row["questions_per_s"] / baseline, 2)
+        print(
+            f"{row['mode']:<13}{row['batch_size']:>7}{row['answered']:>10}{row['errors']:>8}"
+            f"{row['elapsed_s']:>11.2f}{row['questions_per_s']:>9.2f}{row['speedup']:>8.2f}x"
+        )
+
+    if args.output:
+        config = {key: getattr(args, key) for key in vars(args) if key != "output"}
+        args.output.write_text(json.dumps({"config": config, "runs": rows}, indent=2, default=str), encoding="utf-8")
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
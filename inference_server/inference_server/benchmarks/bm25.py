@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Benchmark BM25 index (src/lexical_index.py): thời gian build, dung lượng disk, RSS,
+latency search thuần ở nhiều mức RAG_BM25_MAX_POSTINGS và latency fallback đầy đủ
+(BM25 + đọc document từ shard) so với dense retrieval khi có encoder.
+
+--cache-dir trỏ tới RAG_CACHE_DIR có sẵn (corpus thật hoặc tổng hợp); không có thì
+sinh corpus tổng hợp --rows dòng vào --work-dir. Index được build nếu chưa có.
+
+Usage:
+    python -m benchmarks.bm25 --rows 100000
+    python -m benchmarks.bm25 --cache-dir .cache/rag --max-postings 500 2000 20000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.load_test import load_question_sets, summarize  # noqa: E402
+from benchmarks.query_encoder import rss_mb  # noqa: E402
+from benchmarks.synthetic_corpus import generate_corpus  # noqa: E402
+from src.config import Settings  # noqa: E402
+from src.lexical_index import LexicalIndex, build_index  # noqa: E402
+from src.retriever import PubMedRetriever  # noqa: E402
+
+# Keywords kiểu router (db_query_spec.keywords) cho corpus tiếng Anh
+KEYWORD_QUERIES = [
+    "type 2 diabetes metformin insulin",
+    "migraine headache treatment",
+    "hypertension stroke risk",
+    "statin cholesterol cardiovascular",
+    "asthma pediatric inflammation",
+    "depression anxiety sleep",
+    "chemotherapy cancer adverse effects",
+    "kidney liver dose",
+]
+
+
+def _timed(fn, queries: List[str], iterations: int) -> Dict[str, float]:
+    for query in queries:
+        fn(query)
+    latencies = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        fn(queries[i % len(queries)])
+        latencies.append((time.perf_counter() - started) * 1000)
+    return summarize(latencies)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cache-dir", type=Path, default=None)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--work-dir", type=Path, default=Path(".cache") / "synthetic")
+    parser.add_argument("--max-postings", type=int, nargs="+", default=[500, 2_000, 20_000])
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--rebuild", action="store_true")
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    env: Dict[str, str] = {}
+    cache_dir = args.cache_dir
+    if cache_dir is None:
+        out_dir = args.work_dir / f"bm25-rows-{args.rows}"
+        manifest_path = out_dir / "manifest.json"
+        if manifest_path.exists():
+            env = json.loads(manifest_path.read_text(encoding="utf-8"))["env"]
+        else:
+            print(f"Generating {args.rows} rows into {out_dir} ...")
+            env = generate_corpus(out_dir, rows=args.rows)["env"]
+        cache_dir = Path(env["RAG_CACHE_DIR"])
+    settings = Settings(
+        RAG_CACHE_DIR=cache_dir,
+        RAG_ACCESS_STATS_ENABLED=False,
+        RAG_PRELOAD_ENABLED=False,
+        **({"MEDCPT_ENCODER_ID": env["MEDCPT_ENCODER_ID"]} if "MEDCPT_ENCODER_ID" in env else {}),
+    )
+    index_dir = cache_dir / settings.rag_bm25_dirname
+    if args.rebuild or not LexicalIndex.exists(index_dir):
+        print(f"Building BM25 index into {index_dir} ...")
+        build_index(cache_dir / settings.rag_dataset_dirname, index_dir)
+    meta = json.loads((index_dir / "meta.json").read_text(encoding="utf-8"))
+
+    queries = KEYWORD_QUERIES + load_question_sets()["single"]
+    rss_before = rss_mb()
+    index = LexicalIndex(index_dir)
+    rss_loaded = rss_mb()
+    search = {}
+    for max_postings in args.max_postings:
+        index.max_postings = max_postings
+        search[max_postings] = _timed(lambda q: index.search(q, args.top_k), queries, args.iterations)
+    rss_queried = rss_mb()
+
+    retriever = PubMedRetriever(settings, load=False)
+    retriever.load_dataset()
+    retriever.load_lexical()
+    fallback = _timed(lambda q: retriever.retrieve(q, args.top_k), queries, args.iterations)
+    dense = None
+    if "MEDCPT_ENCODER_ID" in env or args.cache_dir is not None:
+        try:
+            retriever.load_index()
+            retriever.load_encoder()
+            dense = _timed(lambda q: retriever.retrieve_dense(q, args.top_k), queries, args.iterations)
+        except Exception as exc:  # encoder/index thật có thể không có trên máy benchmark
+            print(f"Dense retrieval skipped: {exc}")
+
+    report = {
+        "num_docs": meta["num_docs"],
+        "postings": meta["postings"],
+        "build_seconds": meta["build_seconds"],
+        "disk_mb": round(index.disk_bytes() / 1e6, 1),
+        "rss_mb": {"after_load": round(rss_loaded - rss_before, 1), "after_queries": round(rss_queried - rss_before, 1)},
+        "search_ms": {str(k): v for k, v in search.items()},
+        "fallback_retrieve_ms": fallback,
+        "dense_retrieve_ms": dense,
+    }
+    print(
+        f"docs={report['num_docs']} postings={report['postings']} build={report['build_seconds']}s "
+        f"disk={report['disk_mb']}MB rss load/queries={report['rss_mb']['after_load']}/"
+        f"{report['rss_mb']['after_queries']}MB"
+    )
+    print(f"{'stage':<28}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = [(f"bm25 search (max {k})", v) for k, v in search.items()]
+    rows.append(("bm25 fallback retrieve", fallback))
+    if dense:
+        rows.append(("dense retrieve", dense))
+    for name, stats in rows:
+        print(f"{name:<28}{stats['p50']:>10.3f}{stats['p95']:>10.3f}{stats['p99']:>10.3f}")
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark: thời gian cold start (tới khi /health/ready trả 200) với các
+component nặng được stub bằng sleep, so sánh load tuần tự với warmup song song.
+
+Usage:
+    python -m benchmarks.cold_start
+    python -m benchmarks.cold_start --dataset 2.0 --index 1.5 --encoder 1.0 --engine 4.0
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.warmup import ReadinessTracker, Stage, run_stages  # noqa: E402
+
+
+def _sleeper(seconds: float):
+    def _fn():
+        time.sleep(seconds)
+
+    return _fn
+
+
+def build_stages(durations: Dict[str, float]) -> List[Stage]:
+    """Cùng cấu trúc stage với MedAssistantPipeline.warmup_stages()."""
+    return [
+        [
+            ("dataset", _sleeper(durations["dataset"]), False),
+            ("faiss_index", _sleeper(durations["index"]), False),
+            ("query_encoder", _sleeper(durations["encoder"]), False),
+            ("engine", _sleeper(durations["engine"]), True),
+        ],
+        [
+            ("warmup_encoder", _sleeper(durations["warmup_encoder"]), False),
+            ("warmup_engine", _sleeper(durations["warmup_engine"]), True),
+        ],
+    ]
+
+
+def measure(durations: Dict[str, float], max_workers: int) -> Dict:
+    tracker = ReadinessTracker()
+    started = time.perf_counter()
+    run_stages(build_stages(durations), tracker, max_workers=max_workers)
+    elapsed = time.perf_counter() - started
+    snapshot = tracker.snapshot()
+    return {
+        "max_workers": max_workers,
+        "cold_start_seconds": round(elapsed, 3),
+        "ready": snapshot["ready"],
+        "components": {
+            name: status["load_seconds"] for name, status in snapshot["components"].items()
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", type=float, default=0.6)
+    parser.add_argument("--index", type=float, default=0.5)
+    parser.add_argument("--encoder", type=float, default=0.4)
+    parser.add_argument("--engine", type=float, default=1.0)
+    parser.add_argument("--warmup-encoder", type=float, default=0.05)
+    parser.add_argument("--warmup-engine", type=float, default=0.2)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    durations = {
+        "dataset": args.dataset,
+        "index": args.index,
+        "encoder": args.encoder,
+        "engine": args.engine,
+        "warmup_encoder": args.warmup_encoder,
+        "warmup_engine": args.warmup_engine,
+    }
+    sequential = measure(durations, max_workers=1)
+    parallel = measure(durations, max_workers=args.workers)
+    result = {
+        "durations": durations,
+        "sequential": sequential,
+        "parallel": parallel,
+        "speedup": round(sequential["cold_start_seconds"] / parallel["cold_start_seconds"], 2),
+    }
+
+    print(f"{'mode':<12}{'workers':>8}{'cold start (s)':>16}")
+    for name in ("sequential", "parallel"):
+        row = result[name]
+        print(f"{name:<12}{row['max_workers']:>8}{row['cold_start_seconds']:>16.3f}")
+    print(f"speedup: {result['speedup']}x")
+
+    if args.output:
+        args.output.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Đo engine-seconds bị lãng phí khi client bỏ request (timeout của backend) — có và không
+có deadline/cancellation.
+
+Chạy load test in-process với FakeEngine + scheduler, client hủy mỗi request sau
+--client-timeout giây. "Wasted" = tổng thời gian engine bận (FakeEngine.busy_s, kể cả
+phần bị abort) trừ thời gian router + generation của các request trả 200 — tức là
+GPU-seconds sinh ra những token không ai đọc.
+
+Usage:
+    python -m benchmarks.deadlines
+    python -m benchmarks.deadlines --requests 300 --concurrency 24 --client-timeout 0.6 --output deadlines.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.load_test import (  # noqa: E402
+    build_in_process_app,
+    build_workload,
+    load_question_sets,
+    run_load_test,
+)
+
+VARIANTS = ("no_deadline", "deadline")
+
+
+def run_variant(args: argparse.Namespace, variant: str) -> Dict:
+    app = build_in_process_app(args)
+    from src import api
+    from src.api import TIMEOUT_HEADER
+    from src.model_loader import get_engine
+
+    engine = get_engine()
+    api.settings.request_deadline_enabled = variant == "deadline"
+    headers = {TIMEOUT_HEADER: str(args.client_timeout)} if variant == "deadline" else None
+    jobs = build_workload(args, load_question_sets(args.questions))
+
+    async def _run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://deadlines", timeout=None) as client:
+            return await run_load_test(
+                client, jobs, concurrency=args.concurrency,
+                client_timeout_s=args.client_timeout, headers=headers,
+            )
+
+    result = asyncio.run(_run())
+    # Thread pipeline của request bị bỏ vẫn có thể đang chạy: chờ xong hết rồi mới đọc busy_s
+    while api.pipeline.scheduler.stats()["in_flight"]:
+        time.sleep(0.01)
+    report = result.report()
+    useful_s = sum(
+        sum(result.stage_ms.get(stage, [])) for stage in ("router", "generation")
+    ) / 1000.0
+    return {
+        "variant": variant,
+        "requests": report["requests"],
+        "ok": report["status_codes"].get("200", 0),
+        "client_timeouts": report["status_codes"].get("598", 0),
+        "status_codes": report["status_codes"],
+        "engine_busy_s": round(engine.busy_s, 3),
+        "useful_s": round(useful_s, 3),
+        "wasted_s": round(max(0.0, engine.busy_s - useful_s), 3),
+        "aborted_engine_calls": engine.aborted,
+        "latency_ms": report["latency_ms"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--client-timeout", type=float, default=0.5)
+    parser.add_argument("--mix", default="single=1.0")
+    parser.add_argument("--questions", type=Path, default=ROOT / "test_questions.txt")
+    parser.add_argument("--token-latency-ms", type=float, default=2.0)
+    parser.add_argument("--answer-tokens", type=int, default=128)
+    parser.add_argument("--router-tokens", type=int, default=48)
+    parser.add_argument("--retrieval-latency-ms", type=float, default=10.0)
+    parser.add_argument("--scheduler-max-running", type=int, default=8)
+    parser.add_argument("--scheduler-max-queue", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+    args.engine_slots = None
+    args.semantic_cache = False
+
+    rows = [run_variant(args, variant) for variant in VARIANTS]
+    print(f"{'variant':<13}{'ok':>6}{'timeouts':>10}{'busy s':>9}{'useful s':>10}{'wasted s':>10}{'aborted':>9}")
+    for row in rows:
+        print(
+            f"{row['variant']:<13}{row['ok']:>6}{row['client_timeouts']:>10}{row['engine_busy_s']:>9.2f}"
+            f"{row['useful_s']:>10.2f}{row['wasted_s']:>10.2f}{row['aborted_engine_calls']:>9}"
+        )
+
+    if args.output:
+        config = {key: getattr(args, key) for key in vars(args) if key not in ("output", "questions")}
+        args.output.write_text(json.dumps({"config": config, "runs": rows}, indent=2), encoding="utf-8")
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Benchmark: docstore nén theo block (src/docstore.py) so với đọc lazy các shard Arrow.
+
+Đo trên cùng một dataset (shard tổng hợp của benchmarks.synthetic_corpus nếu không truyền
+--dataset-dir):
+- size: tổng byte các shard data-*.arrow so với file docstore;
+- startup: thời gian PubMedRetriever.load_dataset() (Arrow: thử load_from_disk rồi đọc
+  metadata mọi shard; docstore: mở mmap + đọc header);
+- fetch: latency docs_for_indices cho --queries query top_k id ngẫu nhiên, sau khi bỏ
+  file khỏi page cache (POSIX_FADV_DONTNEED), lần lượt cold và warm.
+
+Usage:
+    python -m benchmarks.docstore
+    python -m benchmarks.docstore --rows 500000 --rows-per-shard 20000 --codec zstd --block-kb 32
+    python -m benchmarks.docstore --dataset-dir .cache/rag/pubmed_ds_embedded --output docstore.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.shard_preload import replay, summarize  # noqa: E402
+from benchmarks.synthetic_corpus import shard_sizes, write_dataset  # noqa: E402
+from src.config import Settings  # noqa: E402
+from src.docstore import build_from_shards  # noqa: E402
+from src.retriever import PubMedRetriever  # noqa: E402
+
+DOCSTORE_FILE = "pubmed_docstore.bin"
+
+
+def drop_page_cache(paths: List[Path]) -> None:
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for path in paths:
+        fd = os.open(str(path), os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def _make_retriever(cache_dir: Path, dirname: str, use_docstore: bool, args: argparse.Namespace) -> PubMedRetriever:
+    settings = Settings(
+        RAG_CACHE_DIR=cache_dir,
+        RAG_DATASET_DIRNAME=dirname,
+        RAG_ACCESS_STATS_ENABLED=False,
+        RAG_PRELOAD_ENABLED=False,
+        RAG_SHARD_CACHE_SIZE=args.shard_cache,
+        RAG_DOCSTORE_ENABLED=use_docstore,
+        RAG_DOCSTORE_CACHE_BLOCKS=args.cache_blocks,
+    )
+    return PubMedRetriever(settings, load=False)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset-dir", type=Path, default=None)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--rows-per-shard", type=int, default=10_000)
+    parser.add_argument("--abstract-words", type=int, default=200)
+    parser.add_argument("--codec", choices=("zstd", "zlib"), default=None, help="Mặc định zstd nếu có zstandard")
+    parser.add_argument("--level", type=int, default=9)
+    parser.add_argument("--block-kb", type=int, default=16)
+    parser.add_argument("--cache-blocks", type=int, default=512)
+    parser.add_argument("--shard-cache", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--startup-repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_dir = Path(tmp)
+        if args.dataset_dir is None:
+            rng = np.random.default_rng(args.seed)
+            dataset_dir = cache_dir / "pubmed_ds_embedded"
+            sizes = shard_sizes(args.rows, args.rows_per_shard, "uniform", rng)
+            write_dataset(dataset_dir, sizes, abstract_words=args.abstract_words, rng=rng)
+        else:
+            dataset_dir = cache_dir / args.dataset_dir.name
+            dataset_dir.symlink_to(args.dataset_dir.resolve(), target_is_directory=True)
+        shards = sorted(dataset_dir.glob("data-*.arrow"))
+        docstore_path = cache_dir / DOCSTORE_FILE
+        build = build_from_shards(
+            dataset_dir, docstore_path, block_bytes=args.block_kb * 1024, codec=args.codec, level=args.level
+        )
+
+        size = {
+            "arrow_bytes": sum(path.stat().st_size for path in shards),
+            "docstore_bytes": docstore_path.stat().st_size,
+            "docstore_raw_bytes": build["raw_bytes"],
+        }
+        size["ratio_vs_arrow"] = round(size["arrow_bytes"] / size["docstore_bytes"], 2)
+
+        rng = random.Random(args.seed)
+        queries = [[rng.randrange(build["num_docs"]) for _ in range(args.top_k)] for _ in range(args.queries)]
+        results: Dict[str, Dict] = {}
+        for name, use_docstore, files in (("arrow", False, shards), ("docstore", True, [docstore_path])):
+            startup = []
+            for _ in range(args.startup_repeat):
+                drop_page_cache(files)
+                retriever = _make_retriever(cache_dir, dataset_dir.name, use_docstore, args)
+                started = time.perf_counter()
+                retriever.load_dataset()
+                startup.append((time.perf_counter() - started) * 1000)
+            assert (retriever.docstore is not None) == use_docstore
+            drop_page_cache(files)
+            cold = summarize(replay(retriever, queries))
+            warm = summarize(replay(retriever, queries))
+            results[name] = {"startup_ms": round(statistics.median(startup), 2), "cold": cold, "warm": warm}
+
+    print(
+        f"Docstore ({build['codec']}, block {args.block_kb} KB): {build['num_docs']} docs, "
+        f"{build['num_blocks']} blocks, built in {build['build_seconds']} s"
+    )
+    print(
+        f"Size: arrow {size['arrow_bytes'] / 1e6:.1f} MB, docstore {size['docstore_bytes'] / 1e6:.1f} MB "
+        f"(x{size['ratio_vs_arrow']} smaller)"
+    )
+    print(f"\n{'path':<10}{'startup ms':>12}{'cold p50':>10}{'cold p95':>10}{'warm p50':>10}{'warm p95':>10}")
+    for name, row in results.items():
+        print(
+            f"{name:<10}{row['startup_ms']:>12.2f}{row['cold']['p50_ms']:>10.3f}{row['cold']['p95_ms']:>10.3f}"
+            f"{row['warm']['p50_ms']:>10.3f}{row['warm']['p95_ms']:>10.3f}"
+        )
+
+    if args.output:
+        config = {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items() if key != "output"}
+        args.output.write_text(
+            json.dumps({"config": config, "build": build, "size": size, "results": results}, indent=2),
+            encoding="utf-8",
+        )
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""
+Thành phần giả lập cho benchmark/test không cần GPU hay asset HF.
+
+- FakeEngine: cùng interface `generate(prompts, sampling_params, use_tqdm)` với vLLM,
+  output deterministic, độ trễ = số token sinh ra × token_latency_ms
+  (+ prefill: số token prompt × prefill_ms_per_token, token ước lượng = ký tự / 4).
+  Xác suất token của câu trả lời có thể rải trong confidence_range (kèm đoạn token
+  confidence thấp với tỉ lệ low_span_rate) để thử self-correction.
+  Một lần generate nhiều prompt được tính như continuous batching: mỗi nhóm
+  max_batch_size sequence decode song song (độ trễ theo sequence dài nhất).
+- SyntheticRetriever: cùng interface `retrieve`/`retrieve_batch` với PubMedRetriever,
+  trả documents deterministic theo câu hỏi với độ trễ cố định.
+- HashEmbedder: cùng interface `embed_one` với HistoryEmbedder, vector ngẫu nhiên chuẩn hóa L2
+  seed theo hash của câu (cùng câu -> cùng vector), không cần sentence-transformers.
+- write_stub_causal_lm: GPT-2 random rất nhỏ + tokenizer word-level, load được bằng
+  AutoModelForCausalLM/AutoTokenizer (backend "transformers" không cần tải model từ HF).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+ROUTER_MARKER = "local safety router"
+VERIFY_MARKER = "bác sĩ giám sát"
+
+_WORDS = (
+    "bệnh nhân nên theo dõi triệu chứng uống đủ nước nghỉ ngơi hợp lý và đi khám "
+    "nếu tình trạng kéo dài hoặc nặng hơn theo chỉ định của bác sĩ chuyên khoa"
+).split()
+
+
+def _stable_hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+@dataclass
+class FakeLogprob:
+    logprob: float
+
+
+@dataclass
+class FakeCompletion:
+    text: str
+    token_ids: List[int]
+    logprobs: List[Dict[int, FakeLogprob]] = field(default_factory=list)
+
+
+@dataclass
+class FakeRequestOutput:
+    prompt: str
+    outputs: List[FakeCompletion]
+
+
+class FakeEngine:
+    """
+    Engine deterministic: prompt router -> JSON plan (SEARCH_DB), prompt self-correction ->
+    JSON verdict (verify_tokens token), prompt khác -> câu trả lời answer_tokens từ.
+    `slots` giới hạn số request sinh đồng thời (None = không giới hạn).
+    Hỗ trợ `should_stop` như SteppedVLLMEngine: abort giữa lúc decode, không trả output.
+    """
+
+    supports_should_stop = True
+
+    def __init__(
+        self,
+        *,
+        token_latency_ms: float = 2.0,
+        answer_tokens: int = 64,
+        router_tokens: int = 48,
+        slots: Optional[int] = None,
+        prefill_ms_per_token: float = 0.0,
+        max_batch_size: int = 32,
+        verify_tokens: int = 96,
+        confidence_range: Optional[Tuple[float, float]] = None,
+        low_span_rate: float = 0.0,
+    ):
+        self.token_latency_ms = token_latency_ms
+        self.max_batch_size = max_batch_size
+        self.prefill_ms_per_token = prefill_ms_per_token
+        self.answer_prompt_tokens: List[int] = []  # số token prompt của các lần sinh câu trả lời
+        self.answer_tokens = answer_tokens
+        self.router_tokens = router_tokens
+        self.verify_tokens = verify_tokens
+        self.confidence_range = confidence_range
+        self.low_span_rate = low_span_rate
+        self.verify_prompts = 0
+        self._slots = threading.Semaphore(slots) if slots else None
+        self.calls = 0
+        self.busy_s = 0.0  # tổng thời gian engine bận (kể cả phần bị abort)
+        self.aborted = 0
+        self._lock = threading.Lock()
+
+    def _router_reply(self, prompt: str) -> str:
+        question = prompt.split("User message:", 1)[-1].split("Intent options:", 1)[0].strip()
+        return json.dumps(
+            {
+                "intent": "GENERAL_MEDICAL_QA",
+                "confidence": 0.9,
+                "action": "SEARCH_DB",
+                "needs_patient_db": False,
+                "db_query_spec": {"target_collection": "all", "time_frame": "latest", "keywords": []},
+                "gemini_payload_spec": {
+                    "is_pii_removed": False,
+                    "sanitized_user_prompt": question,
+                    "system_instruction_hint": "medical_consultant",
+                },
+            },
+            ensure_ascii=False,
+        )
+
+    @staticmethod
+    def _verify_reply(prompt: str) -> str:
+        draft = prompt.rsplit("[DRAFT]", 1)[-1].split("Trả về JSON duy nhất.", 1)[0].split()
+        return json.dumps(
+            {"verdict": "pass", "final_answer": " ".join(draft[:24] + ["[1]."]), "citations": ["[1]"]},
+            ensure_ascii=False,
+        )
+
+    def _token_logprobs(self, prompt: str, n_tokens: int) -> List[Dict[int, FakeLogprob]]:
+        if self.confidence_range is None:
+            return [{i: FakeLogprob(-0.05)} for i in range(n_tokens)]
+        rng = random.Random(_stable_hash(prompt))
+        base = rng.uniform(*self.confidence_range)
+        probs = [min(0.999, max(0.01, base + rng.uniform(-0.05, 0.05))) for _ in range(n_tokens)]
+        if n_tokens and rng.random() < self.low_span_rate:
+            span = rng.randint(4, 16)
+            start = rng.randrange(max(1, n_tokens - span))
+            probs[start:start + span] = [0.1] * len(probs[start:start + span])
+        return [{i: FakeLogprob(math.log(p))} for i, p in enumerate(probs)]
+
+    def _answer(self, prompt: str, n_tokens: int) -> str:
+        offset = _stable_hash(prompt) % len(_WORDS)
+        return " ".join(_WORDS[(offset + i) % len(_WORDS)] for i in range(n_tokens))
+
+    @staticmethod
+    def count_tokens(text: str) -> int:
+        return max(1, len(text) // 4)
+
+    def _complete(self, prompt: str, max_tokens: int) -> FakeCompletion:
+        prompt_tokens = self.count_tokens(prompt)
+        logprobs = None
+        if ROUTER_MARKER in prompt:
+            text = self._router_reply(prompt)
+            n_tokens = min(max_tokens, self.router_tokens)
+        elif VERIFY_MARKER in prompt:
+            text = self._verify_reply(prompt)
+            n_tokens = min(max_tokens, self.verify_tokens)
+            with self._lock:
+                self.verify_prompts += 1
+        else:
+            n_tokens = max(1, min(max_tokens, self.answer_tokens))
+            text = self._answer(prompt, n_tokens)
+            logprobs = self._token_logprobs(prompt, n_tokens)
+            with self._lock:
+                self.answer_prompt_tokens.append(prompt_tokens)
+        return FakeCompletion(
+            text=text,
+            token_ids=list(range(n_tokens)),
+            logprobs=logprobs or [{i: FakeLogprob(-0.05)} for i in range(n_tokens)],
+        )
+
+    def _batch_delay_ms(self, prompts: List[str], completions: List[FakeCompletion]) -> float:
+        delay = 0.0
+        for start in range(0, len(prompts), self.max_batch_size):
+            chunk = range(start, min(len(prompts), start + self.max_batch_size))
+            delay += self.token_latency_ms * max(len(completions[i].token_ids) for i in chunk)
+            delay += self.prefill_ms_per_token * sum(self.count_tokens(prompts[i]) for i in chunk)
+        return delay
+
+    @staticmethod
+    def _sleep(seconds: float, should_stop) -> float:
+        """Ngủ tối đa seconds, dừng sớm khi should_stop(); trả về thời gian đã ngủ."""
+        if should_stop is None:
+            if seconds > 0:
+                time.sleep(seconds)
+            return max(0.0, seconds)
+        started = time.perf_counter()
+        while True:
+            elapsed = time.perf_counter() - started
+            if elapsed >= seconds or should_stop():
+                return min(elapsed, seconds)
+            time.sleep(min(0.005, seconds - elapsed))
+
+    def generate(self, prompts, sampling_params, use_tqdm: bool = False, should_stop=None):
+        if isinstance(prompts, str):
+            prompts = [prompts]
+        with self._lock:
+            self.calls += 1
+        if self._slots is not None:
+            self._slots.acquire()
+        try:
+            completions = [self._complete(p, sampling_params.max_tokens) for p in prompts]
+            delay_ms = self._batch_delay_ms(prompts, completions)
+            busy_s = self._sleep(delay_ms / 1000.0, should_stop)
+            with self._lock:
+                self.busy_s += busy_s
+            if busy_s < delay_ms / 1000.0:
+                # Bị abort giữa chừng: như vLLM, request bị abort không trả output
+                with self._lock:
+                    self.aborted += len(prompts)
+                return []
+            return [FakeRequestOutput(prompt=p, outputs=[c]) for p, c in zip(prompts, completions)]
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+
+class SyntheticRetriever:
+    """Retriever giả: top_k documents deterministic theo câu hỏi, độ trễ latency_ms."""
+
+    def __init__(self, *, num_docs: int = 10_000, latency_ms: float = 10.0, abstract_chars: int = 600):
+        self.num_docs = num_docs
+        self.latency_ms = latency_ms
+        self.abstract_chars = abstract_chars
+        self.available = True
+        self.lexical_available = False
+        self.encoder = object()
+
+    def retrieve(self, question: str, top_k: int, *, keywords: Optional[Sequence[str]] = None) -> List[Dict]:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        return self._docs(question, top_k, keywords)
+
+    def retrieve_batch(
+        self,
+        questions: Sequence[str],
+        top_k: int,
+        *,
+        keywords: Optional[Sequence[Sequence[str]]] = None,
+    ) -> List[List[Dict]]:
+        # Như encoder thật: một lần encode/search cho cả batch
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        keywords = keywords or [[]] * len(questions)
+        return [self._docs(q, top_k, k) for q, k in zip(questions, keywords)]
+
+    def _docs(self, question: str, top_k: int, keywords: Optional[Sequence[str]]) -> List[Dict]:
+        if keywords:
+            question = f"{question} {' '.join(keywords)}"
+        start = _stable_hash(question) % self.num_docs
+        docs = []
+        for rank in range(1, top_k + 1):
+            idx = (start + rank * 7919) % self.num_docs
+            abstract = " ".join(_WORDS[(idx + i) % len(_WORDS)] for i in range(self.abstract_chars // 6))
+            docs.append(
+                {
+                    "title": f"Synthetic PubMed article {idx}",
+                    "abstract": abstract[: self.abstract_chars],
+                    "pmid": str(30_000_000 + idx),
+                    "score": round(0.95 - 0.05 * rank, 4),
+                    "rank": rank,
+                }
+            )
+        return docs
+
+    def encode_query(self, query: str):
+        return None
+
+    def flush_access_stats(self) -> None:
+        pass
+
+    def memory_stats(self) -> Dict[str, Dict]:
+        return {}
+
+
+class HashEmbedder:
+    """Embedder deterministic theo hash của câu: câu khác nhau gần như trực giao."""
+
+    def __init__(self, dim: int = 16):
+        self.dim = dim
+
+    def embed_one(self, text: str) -> np.ndarray:
+        seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=4).digest(), "big")
+        vector = np.random.default_rng(seed).standard_normal(self.dim).astype("float32")
+        return vector / np.linalg.norm(vector)
+
+
+def write_stub_causal_lm(model_dir: Path, *, hidden: int = 64, layers: int = 2, seed: int = 0) -> Path:
+    """GPT-2 random (vocab = _WORDS) lưu bằng save_pretrained; context tối đa 512 token."""
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+
+    model_dir = Path(model_dir)
+    model_dir.mkdir(parents=True, exist_ok=True)
+    vocab = {token: i for i, token in enumerate(["<pad>", "<unk>", "</s>", *sorted(set(_WORDS))])}
+    backend = Tokenizer(models.WordLevel(vocab=vocab, unk_token="<unk>"))
+    backend.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=backend,
+        pad_token="<pad>",
+        unk_token="<unk>",
+        eos_token="</s>",
+        model_input_names=["input_ids", "attention_mask"],
+    )
+    tokenizer.save_pretrained(str(model_dir))
+
+    config = GPT2Config(
+        vocab_size=len(vocab),
+        n_positions=512,
+        n_embd=hidden,
+        n_layer=layers,
+        n_head=4,
+        bos_token_id=vocab["</s>"],
+        eos_token_id=vocab["</s>"],
+        pad_token_id=vocab["<pad>"],
+        tie_word_embeddings=False,
+    )
+    torch.manual_seed(seed)
+    model = GPT2LMHeadModel(config).eval()
+    with torch.no_grad():
+        # Logit token đặc biệt = 0: greedy decode luôn chọn một từ thay vì kết thúc ngay
+        model.lm_head.weight[:3] = 0.0
+        model.lm_head.weight[3:] *= 50.0
+    model.save_pretrained(str(model_dir))
+    return model_dir
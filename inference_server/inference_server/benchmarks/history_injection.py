@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark: số token và độ trễ của phần history inject vào ROUTER_PROMPT
+theo độ dài hội thoại, so sánh full history với relevance-selected history.
+
+Usage:
+    python -m benchmarks.history_injection --turns 10 50 100 200 500
+    python -m benchmarks.history_injection --embedder hashing   # offline
+    python -m benchmarks.history_injection --tokenizer MidWin/Medfinetune
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.config import get_settings  # noqa: E402
+from src.memory import SessionMemoryManager  # noqa: E402
+from src.prompts import ROUTER_PROMPT  # noqa: E402
+
+TOPICS = [
+    ("đau đầu", "Đau đầu kéo dài nên theo dõi huyết áp, ngủ đủ giấc và đi khám nếu không đỡ."),
+    ("tiểu đường", "Tiểu đường cần kiểm soát đường huyết, chế độ ăn ít đường bột và tập luyện đều."),
+    ("cao huyết áp", "Cao huyết áp nên giảm muối, tập thể dục và dùng thuốc theo chỉ định."),
+    ("mất ngủ", "Mất ngủ cần giữ giờ ngủ cố định, hạn chế cà phê và màn hình buổi tối."),
+    ("đau dạ dày", "Đau dạ dày nên ăn đúng bữa, tránh đồ cay và khám nội soi nếu kéo dài."),
+    ("dị ứng", "Dị ứng cần tránh dị nguyên, có thể dùng thuốc kháng histamine theo chỉ định."),
+]
+
+
+class HashingEmbedder:
+    """Embedder offline (hashing trick) khi không tải được sentence-transformers."""
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def embed_one(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype="float32")
+        for token in re.findall(r"\w+", text.lower()):
+            vec[hash(token) % self.dim] += 1.0
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+
+def _token_counter(tokenizer_id: str | None):
+    if tokenizer_id:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(tokenizer_id)
+        return lambda text: len(tokenizer(text)["input_ids"])
+    return lambda text: len(re.findall(r"\w+|[^\w\s]", text))
+
+
+def run(turns_list, embedder, count_tokens, seed: int = 0):
+    settings = get_settings()
+    rng = random.Random(seed)
+    question = "Cơn đau đầu của tôi có liên quan tới huyết áp không?"
+    rows = []
+    for n_turns in turns_list:
+        manager = SessionMemoryManager(settings, embedder=embedder)
+        save_start = time.perf_counter()
+        for i in range(n_turns):
+            topic, answer = rng.choice(TOPICS)
+            manager.save_exchange("bench", f"Lượt {i}: tôi muốn hỏi về {topic}", answer)
+        save_ms = (time.perf_counter() - save_start) * 1000 / max(n_turns, 1)
+
+        start = time.perf_counter()
+        full_history = manager.get_history_text("bench")
+        full_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        selected_history = manager.get_relevant_history("bench", question)
+        selected_ms = (time.perf_counter() - start) * 1000
+
+        full_prompt = ROUTER_PROMPT.format(history=full_history, recent_context="", question=question)
+        selected_prompt = ROUTER_PROMPT.format(
+            history=selected_history, recent_context="", question=question
+        )
+        rows.append(
+            {
+                "turns": n_turns,
+                "history_top_k": settings.history_top_k,
+                "full_prompt_tokens": count_tokens(full_prompt),
+                "selected_prompt_tokens": count_tokens(selected_prompt),
+                "full_history_ms": round(full_ms, 3),
+                "selected_history_ms": round(selected_ms, 3),
+                "save_exchange_ms_per_turn": round(save_ms, 3),
+            }
+        )
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, nargs="+", default=[5, 20, 50, 100, 200, 500])
+    parser.add_argument("--embedder", choices=["model", "hashing"], default="model")
+    parser.add_argument("--tokenizer", default=None, help="HF tokenizer id (mặc định: đếm xấp xỉ)")
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    embedder = HashingEmbedder() if args.embedder == "hashing" else None
+    rows = run(args.turns, embedder, _token_counter(args.tokenizer))
+
+    print(f"{'turns':>6} {'full_tok':>9} {'sel_tok':>8} {'full_ms':>8} {'sel_ms':>8} {'save_ms':>8}")
+    for row in rows:
+        print(
+            f"{row['turns']:>6} {row['full_prompt_tokens']:>9} {row['selected_prompt_tokens']:>8} "
+            f"{row['full_history_ms']:>8.2f} {row['selected_history_ms']:>8.2f} "
+            f"{row['save_exchange_ms_per_turn']:>8.2f}"
+        )
+    if args.output:
+        args.output.write_text(json.dumps(rows, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
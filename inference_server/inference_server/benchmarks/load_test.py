@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Load test end-to-end cho POST /v1/chat/completions.
+
+Mặc định chạy in-process (httpx ASGITransport) với FakeEngine + SyntheticRetriever,
+nên không cần GPU, vllm hay asset HF. Truyền --url để bắn vào server thật.
+Câu hỏi lấy từ test_questions.txt: phần đầu là câu hỏi đơn, các phần sau
+(ngăn bởi dòng ----/////) là kịch bản hội thoại nhiều lượt trong cùng session.
+
+Báo cáo throughput, latency phía client và p50/p95/p99 của từng stage
+(response["timings_ms"]). Có thể lưu JSON và so sánh với baseline.
+
+Usage:
+    python -m benchmarks.load_test --requests 200 --concurrency 16
+    python -m benchmarks.load_test --mix single=0.5,conversation=0.5 --token-latency-ms 5
+    python -m benchmarks.load_test --output results.json
+    python -m benchmarks.load_test --concurrency 64 --scheduler-max-running 8 --scheduler-max-queue 24
+    python -m benchmarks.load_test --baseline benchmarks/baseline_load_test.json --tolerance 0.2
+    python -m benchmarks.load_test --url http://localhost:8080 --requests 50
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src.batch_qa import split_question_sections  # noqa: E402
+
+QUESTIONS_FILE = ROOT / "test_questions.txt"
+PERCENTILES = (50, 95, 99)
+# Metric dạng "càng thấp càng tốt" được so với baseline; throughput thì ngược lại
+LATENCY_KEYS = ("p50", "p95", "p99")
+
+
+def load_question_sets(path: Path = QUESTIONS_FILE) -> Dict[str, List]:
+    """Tách test_questions.txt thành câu hỏi đơn và các kịch bản hội thoại."""
+    sections = split_question_sections(path.read_text(encoding="utf-8"))
+    single = sections[0] if sections else []
+    return {"single": single, "conversation": sections[1:]}
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1.0)
+    unknown = set(mix) - {"single", "conversation"}
+    if unknown:
+        raise ValueError(f"Unknown request mix entries: {sorted(unknown)}")
+    return mix
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[rank]
+
+
+def summarize(values: Sequence[float]) -> Dict[str, float]:
+    summary = {f"p{p}": round(percentile(values, p), 3) for p in PERCENTILES}
+    summary["mean"] = round(sum(values) / len(values), 3) if values else 0.0
+    summary["count"] = len(values)
+    return summary
+
+
+@dataclass
+class LoadTestResult:
+    requests: int = 0
+    errors: int = 0
+    duration_s: float = 0.0
+    latencies_ms: List[float] = field(default_factory=list)
+    stage_ms: Dict[str, List[float]] = field(default_factory=dict)
+    status_codes: Dict[str, int] = field(default_factory=dict)
+
+    def record(self, status: int, latency_ms: float, timings: Optional[Dict[str, float]]) -> None:
+        self.requests += 1
+        self.status_codes[str(status)] = self.status_codes.get(str(status), 0) + 1
+        if status != 200:
+            self.errors += 1
+            return
+        self.latencies_ms.append(latency_ms)
+        for stage, value in (timings or {}).items():
+            self.stage_ms.setdefault(stage, []).append(value)
+
+    def report(self) -> Dict:
+        ok = self.requests - self.errors
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "status_codes": self.status_codes,
+            "duration_s": round(self.duration_s, 3),
+            "throughput_rps": round(ok / self.duration_s, 3) if self.duration_s else 0.0,
+            "latency_ms": summarize(self.latencies_ms),
+            "stages_ms": {stage: summarize(v) for stage, v in sorted(self.stage_ms.items())},
+        }
+
+
+def in_process_env(args: argparse.Namespace) -> Dict[str, str]:
+    """Biến môi trường của profile mock mà build_in_process_app đặt trước khi import src.api."""
+    return {
+        "GENERATION_BACKEND": "mock",
+        "RAG_ENABLED": "false",
+        "MEMORY_BACKEND": "builtin",
+        "WARMUP_ENABLED": "false",
+        "SEMANTIC_CACHE_ENABLED": "true" if args.semantic_cache else "false",
+        "HISTORY_SELECTION_ENABLED": "false",
+    }
+
+
+def build_in_process_app(args: argparse.Namespace):
+    """Import src.api với profile mock rồi inject FakeEngine + SyntheticRetriever."""
+    os.environ.update(in_process_env(args))
+    from benchmarks.fakes import FakeEngine, SyntheticRetriever
+    from src import api
+    from src.model_loader import set_engine
+    from src.scheduler import RequestScheduler
+
+    set_engine(
+        FakeEngine(
+            token_latency_ms=args.token_latency_ms,
+            answer_tokens=args.answer_tokens,
+            router_tokens=args.router_tokens,
+            slots=args.engine_slots,
+            confidence_range=getattr(args, "confidence_range", None),
+            low_span_rate=getattr(args, "low_span_rate", 0.0),
+        )
+    )
+    api.pipeline.retriever = SyntheticRetriever(latency_ms=args.retrieval_latency_ms)
+    # FakeEngine không giới hạn song song nên mặc định tắt scheduler để so được với baseline
+    max_running = getattr(args, "scheduler_max_running", 0)
+    api.pipeline.scheduler = (
+        RequestScheduler(max_running=max_running, max_queue=args.scheduler_max_queue) if max_running else None
+    )
+    return api.app
+
+
+def build_workload(args: argparse.Namespace, question_sets: Dict[str, List]) -> List[List[str]]:
+    """Danh sách 'job', mỗi job là chuỗi câu hỏi gửi tuần tự trong một session."""
+    rng = random.Random(args.seed)
+    mix = {k: v for k, v in parse_mix(args.mix).items() if question_sets.get(k)}
+    names, weights = list(mix), list(mix.values())
+    jobs: List[List[str]] = []
+    remaining = args.requests
+    while remaining > 0:
+        kind = rng.choices(names, weights=weights, k=1)[0]
+        if kind == "single":
+            turns = [rng.choice(question_sets["single"])]
+        else:
+            turns = list(rng.choice(question_sets["conversation"]))
+        turns = turns[:remaining]
+        jobs.append(turns)
+        remaining -= len(turns)
+    return jobs
+
+
+async def run_load_test(
+    client: httpx.AsyncClient,
+    jobs: List[List[str]],
+    *,
+    concurrency: int,
+    max_new_tokens: Optional[int] = None,
+    client_timeout_s: Optional[float] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> LoadTestResult:
+    """client_timeout_s: client bỏ request sau chừng đó giây (ghi status 598) như backend hết timeout."""
+    result = LoadTestResult()
+    queue: asyncio.Queue = asyncio.Queue()
+    for job_id, job in enumerate(jobs):
+        queue.put_nowait((job_id, job))
+
+    async def worker() -> None:
+        while True:
+            try:
+                job_id, turns = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            session_id = f"loadtest-{job_id}"
+            for question in turns:
+                payload = {"question": question, "session_id": session_id}
+                if max_new_tokens:
+                    payload["max_new_tokens"] = max_new_tokens
+                started = time.perf_counter()
+                try:
+                    response = await asyncio.wait_for(
+                        client.post("/v1/chat/completions", json=payload, headers=headers),
+                        timeout=client_timeout_s,
+                    )
+                    status = response.status_code
+                    timings = response.json().get("timings_ms") if status == 200 else None
+                except asyncio.TimeoutError:
+                    status, timings = 598, None
+                except httpx.HTTPError:
+                    status, timings = 599, None
+                result.record(status, (time.perf_counter() - started) * 1000, timings)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    result.duration_s = time.perf_counter() - started
+    return result
+
+
+def compare_to_baseline(
+    report: Dict, baseline: Dict, tolerance: float, *, min_delta_ms: float = 1.0
+) -> List[str]:
+    """
+    Trả về danh sách regression vượt quá tolerance (tỉ lệ, vd 0.2 = 20%).
+    Chênh lệch tuyệt đối < min_delta_ms bị bỏ qua để stage rất nhanh không gây nhiễu.
+    """
+    regressions = []
+    base_rps = baseline.get("throughput_rps") or 0.0
+    if base_rps and report["throughput_rps"] < base_rps * (1 - tolerance):
+        regressions.append(
+            f"throughput_rps {report['throughput_rps']:.2f} < baseline {base_rps:.2f} (-{tolerance:.0%})"
+        )
+    sections = [("latency_ms", report["latency_ms"], baseline.get("latency_ms", {}))]
+    for stage, stats in report["stages_ms"].items():
+        sections.append((f"stages_ms.{stage}", stats, baseline.get("stages_ms", {}).get(stage, {})))
+    for label, current, base in sections:
+        for key in LATENCY_KEYS:
+            value = current.get(key, 0.0)
+            if (
+                key in base
+                and base[key] > 0
+                and value > base[key] * (1 + tolerance)
+                and value - base[key] >= min_delta_ms
+            ):
+                regressions.append(
+                    f"{label}.{key} {current[key]:.2f} ms > baseline {base[key]:.2f} ms (+{tolerance:.0%})"
+                )
+    if report["errors"] > baseline.get("errors", 0):
+        regressions.append(f"errors {report['errors']} > baseline {baseline.get('errors', 0)}")
+    return regressions
+
+
+def print_report(report: Dict) -> None:
+    print(
+        f"requests={report['requests']} errors={report['errors']} "
+        f"duration={report['duration_s']:.2f}s throughput={report['throughput_rps']:.2f} req/s"
+    )
+    print(f"{'stage':<16}{'p50':>10}{'p95':>10}{'p99':>10}{'mean':>10}")
+    rows = [("client", report["latency_ms"])] + list(report["stages_ms"].items())
+    for name, stats in rows:
+        print(f"{name:<16}{stats['p50']:>10.2f}{stats['p95']:>10.2f}{stats['p99']:>10.2f}{stats['mean']:>10.2f}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="Server thật; bỏ trống để chạy in-process")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", default="single=0.7,conversation=0.3")
+    parser.add_argument("--questions", type=Path, default=QUESTIONS_FILE)
+    parser.add_argument("--max-new-tokens", type=int, default=None)
+    parser.add_argument("--token-latency-ms", type=float, default=2.0)
+    parser.add_argument("--answer-tokens", type=int, default=64)
+    parser.add_argument("--router-tokens", type=int, default=48)
+    parser.add_argument("--engine-slots", type=int, default=None, help="Số request sinh đồng thời của FakeEngine")
+    parser.add_argument("--retrieval-latency-ms", type=float, default=10.0)
+    parser.add_argument("--semantic-cache", action="store_true")
+    parser.add_argument("--scheduler-max-running", type=int, default=0, help="Bật scheduler (0 = tắt)")
+    parser.add_argument("--scheduler-max-queue", type=int, default=24)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--baseline", type=Path, default=None)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--min-delta-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    jobs = build_workload(args, load_question_sets(args.questions))
+    if args.url:
+        transport, base_url = None, args.url.rstrip("/")
+    else:
+        transport, base_url = httpx.ASGITransport(app=build_in_process_app(args)), "http://loadtest"
+
+    async def _run() -> LoadTestResult:
+        async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=args.timeout) as client:
+            return await run_load_test(
+                client, jobs, concurrency=args.concurrency, max_new_tokens=args.max_new_tokens
+            )
+
+    report = asyncio.run(_run()).report()
+    report["config"] = {
+        key: getattr(args, key)
+        for key in (
+            "url", "requests", "concurrency", "mix", "max_new_tokens", "token_latency_ms",
+            "answer_tokens", "router_tokens", "engine_slots", "retrieval_latency_ms", "scheduler_max_running", "seed",
+        )
+    }
+    print_report(report)
+
+    if args.output:
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Saved results to {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare_to_baseline(
+            report, baseline, args.tolerance, min_delta_ms=args.min_delta_ms
+        )
+        if regressions:
+            print("❌ Regressions vs baseline:")
+            for line in regressions:
+                print(f"   - {line}")
+            return 1
+        print(f"✅ Within {args.tolerance:.0%} of baseline {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
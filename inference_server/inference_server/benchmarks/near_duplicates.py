@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Benchmark gộp abstract gần trùng lặp (RAG_DEDUP_*): replay bộ câu hỏi qua pipeline
+(FakeEngine có chi phí prefill theo số token prompt + PubMedRetriever thật) trên corpus
+tổng hợp có các cụm errata/tái bản, so sánh: không dedup, dedup không bù (over-fetch 1×)
+và dedup + bù từ candidate over-fetch: số token prompt sinh câu trả lời, latency stage
+generation, số document trùng / khác nhau trong context.
+
+Usage:
+    python -m benchmarks.near_duplicates
+    python -m benchmarks.near_duplicates --clusters 20000 --dup-fraction 0.5 --prefill-ms-per-token 0.05
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.load_test import load_question_sets, summarize  # noqa: E402
+from benchmarks.synthetic_corpus import (  # noqa: E402
+    DATASET_DIRNAME,
+    ENCODER_DIRNAME,
+    INDEX_FILE,
+    VOCAB,
+    write_stub_encoder,
+)
+
+_VARIANT_PREFIXES = ("Erratum:", "Republished:", "Conference abstract:", "Corrigendum:")
+PMID_START = 20_000_000
+
+
+def write_near_duplicate_corpus(
+    out_dir: Path,
+    *,
+    clusters: int,
+    dup_fraction: float,
+    max_variants: int,
+    abstract_words: int,
+    dim: int,
+    noise: float,
+    seed: int,
+) -> Dict:
+    """
+    Mỗi cụm = 1 abstract gốc + (với xác suất dup_fraction) 1..max_variants bản sao
+    có tiền tố tiêu đề và vài từ bị thay; vector của bản sao = vector gốc + nhiễu nhỏ.
+    """
+    import faiss
+    import pyarrow as pa
+
+    rng = np.random.default_rng(seed)
+    vocab = np.array(VOCAB)
+    titles: List[str] = []
+    abstracts: List[str] = []
+    cluster_ids: List[int] = []
+    vectors: List[np.ndarray] = []
+    for cluster in range(clusters):
+        words = vocab[rng.integers(0, len(vocab), abstract_words)]
+        title = " ".join(vocab[rng.integers(0, len(vocab), 8)])
+        base = rng.standard_normal(dim).astype(np.float32)
+        copies = 1
+        if rng.random() < dup_fraction:
+            copies += int(rng.integers(1, max_variants + 1))
+        for copy in range(copies):
+            variant = words.copy()
+            prefix = ""
+            if copy:
+                prefix = f"{_VARIANT_PREFIXES[copy % len(_VARIANT_PREFIXES)]} "
+                variant[rng.integers(0, abstract_words)] = vocab[rng.integers(0, len(vocab))]
+            titles.append(prefix + title)
+            abstracts.append(" ".join(variant))
+            cluster_ids.append(cluster)
+            vectors.append(base + noise * rng.standard_normal(dim).astype(np.float32) * (copy > 0))
+
+    order = rng.permutation(len(titles))  # bản sao không nằm liền nhau trong corpus
+    table = pa.table(
+        {
+            "title": pa.array([titles[i] for i in order]),
+            "abstract": pa.array([abstracts[i] for i in order]),
+            "PMID": pa.array(np.arange(PMID_START, PMID_START + len(order), dtype=np.int64)),
+        }
+    )
+    dataset_dir = out_dir / DATASET_DIRNAME
+    dataset_dir.mkdir(parents=True, exist_ok=True)
+    with pa.OSFile(str(dataset_dir / "data-00000-of-00001.arrow"), "wb") as sink:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    matrix = np.stack([vectors[i] for i in order]).astype(np.float32)
+    faiss.normalize_L2(matrix)
+    index = faiss.IndexFlatIP(dim)
+    index.add(matrix)
+    faiss.write_index(index, str(out_dir / INDEX_FILE))
+    write_stub_encoder(out_dir / ENCODER_DIRNAME, dim, seed=seed)
+    return {
+        "rows": len(order),
+        "clusters": clusters,
+        "cluster_of_pmid": {str(PMID_START + n): cluster_ids[i] for n, i in enumerate(order)},
+    }
+
+
+VARIANTS = {
+    "off": {"RAG_DEDUP_ENABLED": False},
+    "dedup": {"RAG_DEDUP_ENABLED": True, "RAG_DEDUP_OVERFETCH": 1.0},
+    "dedup+backfill": {"RAG_DEDUP_ENABLED": True},
+}
+
+
+def replay(corpus_dir: Path, cluster_of_pmid: Dict[str, int], variant: str, args: argparse.Namespace) -> Dict:
+    from benchmarks.fakes import FakeEngine
+    from src.config import Settings
+    from src.model_loader import set_engine
+    from src.pipeline import MedAssistantPipeline
+
+    engine = FakeEngine(
+        token_latency_ms=args.token_latency_ms,
+        answer_tokens=args.answer_tokens,
+        prefill_ms_per_token=args.prefill_ms_per_token,
+    )
+    set_engine(engine)
+    settings = Settings(
+        RAG_CACHE_DIR=corpus_dir,
+        MEDCPT_ENCODER_ID=str(corpus_dir / ENCODER_DIRNAME),
+        GENERATION_BACKEND="mock",
+        MEMORY_BACKEND="builtin",
+        SEMANTIC_CACHE_ENABLED=False,
+        HISTORY_SELECTION_ENABLED=False,
+        RAG_ACCESS_STATS_ENABLED=False,
+        RAG_PRELOAD_ENABLED=False,
+        RAG_SCORE_THRESHOLD=-1.0,  # vector tổng hợp: giữ mọi hit để so sánh công bằng
+        NOISE_KEYWORDS=(),  # vocab tổng hợp có "vaccine"
+        RAG_TOP_K=args.top_k,
+        MAX_CONTEXT_CHARS=args.max_context_chars,
+        **VARIANTS[variant],
+    )
+    pipeline = MedAssistantPipeline(settings)
+    question_sets = load_question_sets()
+    sessions = [[q] for q in question_sets["single"]] + question_sets["conversation"]
+
+    generation_ms: List[float] = []
+    duplicate_docs: List[int] = []
+    distinct_docs: List[int] = []
+    for n, turns in enumerate(sessions):
+        for question in turns:
+            response = pipeline.ask(question, session_id=f"replay-{variant}-{n}")
+            generation_ms.append(response["timings_ms"].get("generation", 0.0))
+            clusters = Counter(cluster_of_pmid.get(str(d["pmid"])) for d in response["context_docs"])
+            distinct_docs.append(len(clusters))
+            duplicate_docs.append(sum(count - 1 for count in clusters.values()))
+    return {
+        "variant": variant,
+        "requests": len(generation_ms),
+        "prompt_tokens": summarize(engine.answer_prompt_tokens),
+        "generation_ms": summarize(generation_ms),
+        "duplicate_docs_per_request": round(float(np.mean(duplicate_docs)), 3),
+        "distinct_docs_per_request": round(float(np.mean(distinct_docs)), 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clusters", type=int, default=5_000)
+    parser.add_argument("--dup-fraction", type=float, default=0.4)
+    parser.add_argument("--max-variants", type=int, default=4)
+    parser.add_argument("--abstract-words", type=int, default=180)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--max-context-chars", type=int, default=4500)
+    parser.add_argument("--token-latency-ms", type=float, default=1.0)
+    parser.add_argument("--answer-tokens", type=int, default=64)
+    parser.add_argument("--prefill-ms-per-token", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    os.environ.update({"GENERATION_BACKEND": "mock", "MEMORY_BACKEND": "builtin"})
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = Path(tmp)
+        corpus = write_near_duplicate_corpus(
+            corpus_dir,
+            clusters=args.clusters,
+            dup_fraction=args.dup_fraction,
+            max_variants=args.max_variants,
+            abstract_words=args.abstract_words,
+            dim=args.dim,
+            noise=args.noise,
+            seed=args.seed,
+        )
+        print(f"Corpus: {corpus['rows']} rows in {corpus['clusters']} clusters")
+        results = [replay(corpus_dir, corpus["cluster_of_pmid"], variant, args) for variant in VARIANTS]
+
+    print(f"{'variant':<16}{'prompt tok mean':>17}{'gen p50 ms':>12}{'gen p95 ms':>12}{'dup docs':>10}{'distinct':>10}")
+    for row in results:
+        print(
+            f"{row['variant']:<16}{row['prompt_tokens']['mean']:>17.1f}{row['generation_ms']['p50']:>12.2f}"
+            f"{row['generation_ms']['p95']:>12.2f}{row['duplicate_docs_per_request']:>10.2f}"
+            f"{row['distinct_docs_per_request']:>10.2f}"
+        )
+    before = results[0]["prompt_tokens"]["mean"]
+    for row in results[1:]:
+        after = row["prompt_tokens"]["mean"]
+        print(f"Prompt tokens {row['variant']} vs off: {100 * (after - before) / before:+.1f}%")
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Benchmark backend encode query MedCPT (torch / torch_int8 / onnx / onnx_int8):
+latency từng query và RSS ở 1, 4, 16 threads, cộng parity so với torch fp32
+(cosine + top-k overlap).
+
+Mỗi cặp (backend, threads) chạy trong process riêng để số thread và RSS đo được sạch.
+
+Usage:
+    python -m benchmarks.query_encoder
+    python -m benchmarks.query_encoder --model .cache/synthetic/demo/encoder --backends torch torch_int8 onnx
+    python -m benchmarks.query_encoder --corpus-dir .cache/rag/pubmed_ds_embedded --corpus-size 5000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.load_test import load_question_sets, summarize  # noqa: E402
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status", encoding="utf-8") as handle:
+        for line in handle:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024.0
+    return 0.0
+
+
+def _queries() -> List[str]:
+    sets = load_question_sets()
+    return sets["single"] + [turn for turns in sets["conversation"] for turn in turns]
+
+
+def _settings(args: argparse.Namespace, backend: str, threads: int):
+    from src.config import Settings
+
+    return Settings(
+        MEDCPT_ENCODER_ID=args.model,
+        QUERY_ENCODER_BACKEND=backend,
+        QUERY_ENCODER_THREADS=threads,
+        QUERY_ENCODER_ONNX_DIR=args.onnx_dir,
+    )
+
+
+def worker(args: argparse.Namespace) -> Dict:
+    """Chạy trong subprocess: load một backend và đo latency/RSS."""
+    import torch
+
+    from src.query_encoder import build_query_encoder
+
+    torch.set_num_threads(args.threads)
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    encoder = build_query_encoder(_settings(args, args.backend, args.threads))
+    load_ms = (time.perf_counter() - started) * 1000
+    queries = _queries()
+    for query in queries[:5]:
+        encoder.encode_one(query)
+    latencies = []
+    for i in range(args.iterations):
+        started = time.perf_counter()
+        encoder.encode_one(queries[i % len(queries)])
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        "backend": args.backend,
+        "threads": args.threads,
+        "load_ms": round(load_ms, 1),
+        "rss_mb": round(rss_mb() - rss_before, 1),
+        "latency_ms": summarize(latencies),
+    }
+
+
+def _corpus_texts(args: argparse.Namespace) -> List[str]:
+    if not args.corpus_dir:
+        return _queries()
+    import pyarrow as pa
+
+    texts: List[str] = []
+    for path in sorted(Path(args.corpus_dir).glob("data-*.arrow")):
+        with pa.memory_map(str(path)) as source:
+            table = pa.ipc.open_stream(source).read_all()
+        for title, abstract in zip(table["title"].to_pylist(), table["abstract"].to_pylist()):
+            texts.append(f"{title} {abstract}")
+            if len(texts) >= args.corpus_size:
+                return texts
+    return texts
+
+
+def parity(args: argparse.Namespace, backends: List[str]) -> Dict[str, Dict]:
+    from src.query_encoder import build_query_encoder, parity_report
+
+    reference = build_query_encoder(_settings(args, "torch", 0))
+    corpus = _corpus_texts(args)
+    reports = {}
+    for backend in backends:
+        if backend == "torch":
+            continue
+        candidate = build_query_encoder(_settings(args, backend, 0))
+        reports[backend] = parity_report(
+            reference, candidate, _queries(), corpus_texts=corpus, top_k=args.top_k
+        )
+    return reports
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="ncbi/MedCPT-Query-Encoder")
+    parser.add_argument("--backends", nargs="+", default=["torch", "torch_int8", "onnx", "onnx_int8"])
+    parser.add_argument("--threads-list", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--onnx-dir", type=Path, default=None)
+    parser.add_argument("--corpus-dir", type=Path, default=None, help="Thư mục data-*.arrow để đo top-k overlap")
+    parser.add_argument("--corpus-size", type=int, default=2000)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--backend", default="torch", help=argparse.SUPPRESS)
+    parser.add_argument("--threads", type=int, default=1, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.onnx_dir is None:
+            args.onnx_dir = Path(tmp)
+        # Export/quantize ONNX một lần trước khi đo để không tính vào load_ms của worker
+        parity_reports = parity(args, args.backends)
+        rows = []
+        for backend in args.backends:
+            for threads in args.threads_list:
+                cmd = [
+                    sys.executable, "-m", "benchmarks.query_encoder", "--worker",
+                    "--model", args.model, "--backend", backend, "--threads", str(threads),
+                    "--iterations", str(args.iterations), "--onnx-dir", str(args.onnx_dir),
+                ]
+                proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True, check=True)
+                rows.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    print(f"{'backend':<12}{'threads':>8}{'p50 ms':>9}{'p95 ms':>9}{'RSS MB':>9}{'load ms':>10}")
+    for row in rows:
+        lat = row["latency_ms"]
+        print(
+            f"{row['backend']:<12}{row['threads']:>8}{lat['p50']:>9.2f}{lat['p95']:>9.2f}"
+            f"{row['rss_mb']:>9.1f}{row['load_ms']:>10.1f}"
+        )
+    print("\nParity vs torch fp32:")
+    for backend, report in parity_reports.items():
+        print(f"  {backend:<10} " + " ".join(f"{k}={v:.4f}" for k, v in report.items() if k != "queries"))
+
+    if args.output:
+        args.output.write_text(json.dumps({"runs": rows, "parity": parity_reports}, indent=2), encoding="utf-8")
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
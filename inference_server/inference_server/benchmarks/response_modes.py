@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Thời gian serialize và số byte trên đường truyền của /v1/chat/completions theo response_mode.
+
+Response thật được sinh bằng pipeline in-process (FakeEngine + SyntheticRetriever với abstract
+dài --abstract-chars ký tự), sau đó:
+- serialize: đường cũ (validate ChatResponse + JSONResponse json stdlib) so với FastJSONResponse
+  cho từng mode full/compact/ids, kèm kích thước sau gzip (RESPONSE_GZIP_LEVEL);
+- wire: gửi request qua ASGI với Accept-Encoding: gzip và đo byte thực nhận.
+
+Usage:
+    python -m benchmarks.response_modes
+    python -m benchmarks.response_modes --top-k 10 --abstract-chars 2000 --output response_modes.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gzip
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.load_test import build_in_process_app, load_question_sets  # noqa: E402
+
+MODES = ("full", "compact", "ids")
+
+
+def _timed(fn, results: List[Dict], repeat: int) -> float:
+    """Micro-giây trung bình cho một response."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for result in results:
+            fn(result)
+    return (time.perf_counter() - started) / (repeat * len(results)) * 1e6
+
+
+def serialization_rows(results: List[Dict], args: argparse.Namespace) -> List[Dict]:
+    from fastapi.responses import JSONResponse
+
+    from src.api import _RESPONSE_FIELDS, ChatResponse
+    from src.responses import FastJSONResponse, shape_response
+
+    def legacy(result: Dict) -> bytes:
+        return JSONResponse(ChatResponse.model_validate(result).model_dump(mode="json")).body
+
+    variants = {"legacy_full": legacy}
+    for mode in MODES:
+        variants[mode] = lambda result, mode=mode: FastJSONResponse(
+            shape_response(result, mode, fields=_RESPONSE_FIELDS, abstract_chars=args.compact_abstract_chars)
+        ).body
+
+    rows = []
+    for name, fn in variants.items():
+        bodies = [fn(result) for result in results]
+        rows.append(
+            {
+                "variant": name,
+                "serialize_us": round(_timed(fn, results, args.repeat), 1),
+                "bytes": round(sum(map(len, bodies)) / len(bodies)),
+                "gzip_bytes": round(
+                    sum(len(gzip.compress(body, compresslevel=args.gzip_level)) for body in bodies) / len(bodies)
+                ),
+            }
+        )
+    return rows
+
+
+async def wire_rows(app, questions: List[str], args: argparse.Namespace) -> List[Dict]:
+    rows = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://modes", timeout=60.0) as client:
+        for mode in MODES:
+            wire, decoded, latencies = [], [], []
+            for i, question in enumerate(questions):
+                started = time.perf_counter()
+                response = await client.post(
+                    "/v1/chat/completions",
+                    json={"question": question, "session_id": f"wire-{mode}-{i}", "top_k": args.top_k, "response_mode": mode},
+                    headers={"Accept-Encoding": "gzip"},
+                )
+                latencies.append((time.perf_counter() - started) * 1000.0)
+                response.raise_for_status()
+                wire.append(response.num_bytes_downloaded)
+                decoded.append(len(response.content))
+            rows.append(
+                {
+                    "mode": mode,
+                    "wire_bytes": round(sum(wire) / len(wire)),
+                    "decoded_bytes": round(sum(decoded) / len(decoded)),
+                    "latency_ms_mean": round(sum(latencies) / len(latencies), 2),
+                }
+            )
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=Path, default=ROOT / "test_questions.txt")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--abstract-chars", type=int, default=1500)
+    parser.add_argument("--compact-abstract-chars", type=int, default=240)
+    parser.add_argument("--gzip-level", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    app = build_in_process_app(
+        argparse.Namespace(
+            semantic_cache=False, token_latency_ms=0.0, answer_tokens=160, router_tokens=48,
+            engine_slots=None, retrieval_latency_ms=0.0,
+        )
+    )
+    from benchmarks.fakes import SyntheticRetriever
+    from src import api
+
+    api.pipeline.retriever = SyntheticRetriever(latency_ms=0.0, abstract_chars=args.abstract_chars)
+    questions = load_question_sets(args.questions)["single"]
+    results = [api.pipeline.ask(q, f"serialize-{i}", top_k=args.top_k) for i, q in enumerate(questions)]
+
+    serialization = serialization_rows(results, args)
+    wire = asyncio.run(wire_rows(app, questions, args))
+
+    print(f"{'variant':<13}{'serialize µs':>14}{'bytes':>9}{'gzip':>8}")
+    for row in serialization:
+        print(f"{row['variant']:<13}{row['serialize_us']:>14.1f}{row['bytes']:>9}{row['gzip_bytes']:>8}")
+    print(f"\n{'mode':<13}{'wire bytes':>12}{'decoded':>10}{'latency ms':>12}")
+    for row in wire:
+        print(f"{row['mode']:<13}{row['wire_bytes']:>12}{row['decoded_bytes']:>10}{row['latency_ms_mean']:>12.2f}")
+
+    if args.output:
+        config = {key: getattr(args, key) for key in vars(args) if key not in ("output", "questions")}
+        args.output.write_text(
+            json.dumps({"config": config, "serialization": serialization, "wire": wire}, indent=2), encoding="utf-8"
+        )
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark: PubMedRetriever trên corpus tổng hợp với số row tăng dần
+(load dataset mapping / FAISS / encoder, rồi latency encode + search + fetch).
+
+Corpus được sinh bởi benchmarks.synthetic_corpus vào --work-dir/rows-<N>
+và được tái sử dụng giữa các lần chạy nếu manifest khớp.
+
+Usage:
+    python -m benchmarks.retrieval_scaling --sizes 10000 100000
+    python -m benchmarks.retrieval_scaling --sizes 10000 100000 1000000 5000000 --index ivf --work-dir /data/syn
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.load_test import load_question_sets, summarize  # noqa: E402
+from benchmarks.synthetic_corpus import generate_corpus  # noqa: E402
+from src.config import Settings  # noqa: E402
+from src.retriever import PubMedRetriever  # noqa: E402
+
+
+def ensure_corpus(work_dir: Path, rows: int, args: argparse.Namespace) -> Dict:
+    out_dir = work_dir / f"rows-{rows}"
+    manifest_path = out_dir / "manifest.json"
+    wanted = {"rows": rows, "dim": args.dim, "index_type": args.index, "shard_dist": args.shard_dist}
+    if manifest_path.exists():
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        if all(manifest.get(key) == value for key, value in wanted.items()):
+            return manifest
+    print(f"Generating {rows} rows into {out_dir} ...")
+    return generate_corpus(
+        out_dir,
+        rows=rows,
+        dim=args.dim,
+        rows_per_shard=args.rows_per_shard,
+        shard_dist=args.shard_dist,
+        index_type=args.index,
+        seed=args.seed,
+    )
+
+
+def bench_size(manifest: Dict, questions: List[str], args: argparse.Namespace) -> Dict:
+    env = manifest["env"]
+    settings = Settings(
+        RAG_CACHE_DIR=env["RAG_CACHE_DIR"],
+        RAG_DATASET_DIRNAME=env["RAG_DATASET_DIRNAME"],
+        RAG_INDEX_FILE=env["RAG_INDEX_FILE"],
+        MEDCPT_ENCODER_ID=env["MEDCPT_ENCODER_ID"],
+        RAG_ACCESS_STATS_ENABLED=False,
+        RAG_PRELOAD_ENABLED=False,
+    )
+    retriever = PubMedRetriever(settings, load=False)
+    load = {}
+    for name, fn in (
+        ("dataset", retriever.load_dataset),
+        ("faiss_index", retriever.load_index),
+        ("query_encoder", retriever.load_encoder),
+    ):
+        started = time.perf_counter()
+        fn()
+        load[name] = round((time.perf_counter() - started) * 1000, 2)
+    assert retriever.available, "retriever not available after loading synthetic assets"
+
+    stages: Dict[str, List[float]] = {"encode": [], "search": [], "fetch": [], "total": []}
+    for i in range(args.queries):
+        question = questions[i % len(questions)]
+        t0 = time.perf_counter()
+        vector = retriever.encode_query(question).reshape(1, -1)
+        t1 = time.perf_counter()
+        distances, indices = retriever.index.search(vector, args.top_k)
+        t2 = time.perf_counter()
+        docs = retriever.docs_for_indices(indices[0], distances[0])
+        t3 = time.perf_counter()
+        assert len(docs) == args.top_k
+        stages["encode"].append((t1 - t0) * 1000)
+        stages["search"].append((t2 - t1) * 1000)
+        stages["fetch"].append((t3 - t2) * 1000)
+        stages["total"].append((t3 - t0) * 1000)
+
+    return {
+        "rows": manifest["rows"],
+        "shards": manifest["shards"],
+        "index_type": manifest["index_type"],
+        "load_ms": load,
+        "query_ms": {name: summarize(values) for name, values in stages.items()},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--work-dir", type=Path, default=Path(".cache") / "synthetic")
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--rows-per-shard", type=int, default=50_000)
+    parser.add_argument("--shard-dist", choices=("uniform", "lognormal"), default="lognormal")
+    parser.add_argument("--index", choices=("flat", "ivf"), default="flat")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    questions = load_question_sets()["single"]
+    results = [bench_size(ensure_corpus(args.work_dir, rows, args), questions, args) for rows in args.sizes]
+
+    print(
+        f"{'rows':>10}{'shards':>8}{'load ds':>10}{'load idx':>10}"
+        f"{'encode p50':>12}{'search p50':>12}{'fetch p50':>11}{'total p95':>11}"
+    )
+    for row in results:
+        q = row["query_ms"]
+        print(
+            f"{row['rows']:>10}{row['shards']:>8}{row['load_ms']['dataset']:>10.1f}"
+            f"{row['load_ms']['faiss_index']:>10.1f}{q['encode']['p50']:>12.3f}"
+            f"{q['search']['p50']:>12.3f}{q['fetch']['p50']:>11.3f}{q['total']['p95']:>11.3f}"
+        )
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
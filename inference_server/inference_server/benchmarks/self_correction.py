@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Tần suất kích hoạt và chi phí latency của self-correction theo ngưỡng confidence.
+
+Load test in-process với FakeEngine có xác suất token rải trong --confidence-range
+(kèm đoạn token confidence thấp với tỉ lệ --low-span-rate), so sánh: tắt self-correction
+và SELF_CORRECTION_MIN_CONFIDENCE = từng giá trị trong --thresholds. Verify được gom batch
+(SELF_CORRECTION_BATCH_SIZE / SELF_CORRECTION_BATCH_WAIT_MS) giữa các request đồng thời.
+
+Usage:
+    python -m benchmarks.self_correction
+    python -m benchmarks.self_correction --thresholds 0.6 0.8 --concurrency 32 --output self_correction.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+from typing import Dict, Optional
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.load_test import (  # noqa: E402
+    build_in_process_app,
+    build_workload,
+    load_question_sets,
+    run_load_test,
+)
+
+
+def run_variant(args: argparse.Namespace, threshold: Optional[float]) -> Dict:
+    app = build_in_process_app(args)
+    from src import api
+    from src.self_correction import VerificationBatcher
+
+    settings = api.pipeline.settings
+    api.pipeline.verifier = None
+    if threshold is not None:
+        settings.self_correction_min_confidence = threshold
+        settings.self_correction_max_low_span = args.max_low_span
+        api.pipeline.verifier = VerificationBatcher(
+            max_batch=args.batch_size,
+            wait_s=args.batch_wait_ms / 1000.0,
+            max_new_tokens=settings.self_correction_max_new_tokens,
+        )
+    jobs = build_workload(args, load_question_sets(args.questions))
+
+    async def _run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://selfcorrect", timeout=120.0) as client:
+            return await run_load_test(client, jobs, concurrency=args.concurrency)
+
+    report = asyncio.run(_run()).report()
+    ok = report["requests"] - report["errors"]
+    verify = report["stages_ms"].get("self_correction", {})
+    return {
+        "threshold": threshold,
+        "requests": report["requests"],
+        "errors": report["errors"],
+        "triggered": verify.get("count", 0),
+        "trigger_rate": round(verify.get("count", 0) / ok, 4) if ok else 0.0,
+        "throughput_rps": report["throughput_rps"],
+        "latency_ms": report["latency_ms"],
+        "self_correction_ms": verify,
+        "batching": api.pipeline.verifier.stats() if api.pipeline.verifier else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.6, 0.7, 0.8])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", default="single=0.7,conversation=0.3")
+    parser.add_argument("--questions", type=Path, default=ROOT / "test_questions.txt")
+    parser.add_argument("--token-latency-ms", type=float, default=2.0)
+    parser.add_argument("--answer-tokens", type=int, default=128)
+    parser.add_argument("--router-tokens", type=int, default=48)
+    parser.add_argument("--retrieval-latency-ms", type=float, default=10.0)
+    parser.add_argument("--confidence-range", type=float, nargs=2, default=[0.4, 0.95])
+    parser.add_argument("--low-span-rate", type=float, default=0.2)
+    parser.add_argument("--max-low-span", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--batch-wait-ms", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+    args.engine_slots = None
+    args.semantic_cache = False
+    args.confidence_range = tuple(args.confidence_range)
+
+    rows = [run_variant(args, threshold) for threshold in [None, *args.thresholds]]
+    print(f"{'threshold':<11}{'trigger':>9}{'p50 ms':>9}{'p95 ms':>9}{'verify p50':>12}{'batch':>7}{'req/s':>8}")
+    for row in rows:
+        label = "off" if row["threshold"] is None else f"{row['threshold']:.2f}"
+        batch = row["batching"]["mean_batch_size"] if row["batching"] else 0.0
+        print(
+            f"{label:<11}{row['trigger_rate']:>9.1%}{row['latency_ms']['p50']:>9.1f}{row['latency_ms']['p95']:>9.1f}"
+            f"{row['self_correction_ms'].get('p50', 0.0):>12.1f}{batch:>7.1f}{row['throughput_rps']:>8.1f}"
+        )
+
+    if args.output:
+        config = {key: getattr(args, key) for key in vars(args) if key not in ("output", "questions")}
+        args.output.write_text(json.dumps({"config": config, "runs": rows}, indent=2), encoding="utf-8")
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Benchmark: latency của 100 query đầu tiên sau deploy, có và không có preload
+các shard nóng (theo shard_access_stats.json của lần chạy trước).
+
+Replay một query log (JSONL, mỗi dòng {"indices": [...]} là kết quả FAISS)
+qua PubMedRetriever.docs_for_indices, nên không cần encoder/FAISS thật.
+Không truyền --dataset-dir thì tạo shard arrow tổng hợp trong thư mục tạm.
+
+Usage:
+    python -m benchmarks.shard_preload
+    python -m benchmarks.shard_preload --shards 40 --rows-per-shard 5000 --queries 100
+    python -m benchmarks.shard_preload --dataset-dir .cache/rag/pubmed_ds_embedded --log queries.jsonl
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.config import Settings  # noqa: E402
+from src.retriever import PubMedRetriever  # noqa: E402
+
+
+def write_shards(dataset_dir: Path, shards: int, rows_per_shard: int, abstract_chars: int) -> None:
+    import pyarrow as pa
+
+    dataset_dir.mkdir(parents=True, exist_ok=True)
+    filler = ("lorem ipsum dolor sit amet " * (abstract_chars // 27 + 1))[:abstract_chars]
+    pmid = 10_000_000
+    for shard in range(shards):
+        table = pa.table(
+            {
+                "title": [f"Synthetic article {shard}-{i}" for i in range(rows_per_shard)],
+                "abstract": [filler] * rows_per_shard,
+                "PMID": list(range(pmid, pmid + rows_per_shard)),
+            }
+        )
+        pmid += rows_per_shard
+        path = dataset_dir / f"data-{shard:05d}-of-{shards:05d}.arrow"
+        with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def synthetic_log(total_rows: int, rows_per_shard: int, queries: int, top_k: int, seed: int) -> List[List[int]]:
+    """Phân bố Zipf theo shard: vài shard nhận phần lớn truy cập."""
+    rng = random.Random(seed)
+    shards = max(1, total_rows // rows_per_shard)
+    order = list(range(shards))
+    rng.shuffle(order)
+    weights = [1.0 / (rank + 1) ** 1.2 for rank in range(shards)]
+    log = []
+    for _ in range(queries):
+        indices = []
+        for shard in rng.choices(order, weights=weights, k=top_k):
+            indices.append(shard * rows_per_shard + rng.randrange(rows_per_shard))
+        log.append(indices)
+    return log
+
+
+def drop_page_cache(dataset_dir: Path) -> bool:
+    """Mô phỏng deploy mới: bỏ các shard khỏi page cache (POSIX_FADV_DONTNEED)."""
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for path in dataset_dir.glob("data-*.arrow"):
+        fd = os.open(str(path), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    return True
+
+
+def _make_retriever(cache_dir: Path, dirname: str, preload: bool, cache_size: int) -> PubMedRetriever:
+    settings = Settings(
+        RAG_CACHE_DIR=cache_dir,
+        RAG_DATASET_DIRNAME=dirname,
+        RAG_PRELOAD_ENABLED=preload,
+        RAG_SHARD_CACHE_SIZE=cache_size,
+        RAG_ACCESS_STATS_FLUSH_SECONDS=-1,  # chỉ flush thủ công trong benchmark
+    )
+    retriever = PubMedRetriever(settings, load=False)
+    retriever.load_dataset()
+    return retriever
+
+
+def replay(retriever: PubMedRetriever, log: List[List[int]]) -> List[float]:
+    latencies = []
+    for indices in log:
+        started = time.perf_counter()
+        retriever.docs_for_indices(indices, [1.0] * len(indices))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    ordered = sorted(latencies)
+    return {
+        "total_ms": round(sum(ordered), 2),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset-dir", type=Path, default=None)
+    parser.add_argument("--log", type=Path, default=None, help="JSONL query log ({\"indices\": [...]})")
+    parser.add_argument("--shards", type=int, default=40)
+    parser.add_argument("--rows-per-shard", type=int, default=5000)
+    parser.add_argument("--abstract-chars", type=int, default=1200)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--history-queries", type=int, default=2000, help="Số query của 'lần deploy trước'")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--cache-size", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        if args.dataset_dir is None:
+            dataset_dir = tmp_dir / "pubmed_ds_embedded"
+            write_shards(dataset_dir, args.shards, args.rows_per_shard, args.abstract_chars)
+        else:
+            dataset_dir = args.dataset_dir.resolve()
+        # Stats lưu trong cache dir riêng, dataset được symlink vào
+        cache_dir = tmp_dir / "rag_cache"
+        cache_dir.mkdir()
+        (cache_dir / dataset_dir.name).symlink_to(dataset_dir, target_is_directory=True)
+
+        # "Deploy trước": replay lịch sử để tích lũy stats rồi flush ra disk
+        previous = _make_retriever(cache_dir, dataset_dir.name, preload=False, cache_size=args.cache_size)
+        if args.log:
+            lines = args.log.read_text(encoding="utf-8").splitlines()
+            log = [json.loads(line)["indices"] for line in lines if line.strip()]
+        else:
+            log = synthetic_log(
+                previous._total_rows,
+                args.rows_per_shard,
+                args.history_queries + args.queries,
+                args.top_k,
+                args.seed,
+            )
+        history, first_queries = log[: -args.queries], log[-args.queries:]
+        replay(previous, history or first_queries)
+        previous.flush_access_stats()
+
+        results = {}
+        for name, preload in (("cold", False), ("preloaded", True)):
+            drop_page_cache(dataset_dir)
+            retriever = _make_retriever(cache_dir, dataset_dir.name, preload=preload, cache_size=args.cache_size)
+            started = time.perf_counter()
+            if retriever.preload_thread is not None:
+                # Đo preload riêng: trên server nó chạy trong background lúc warmup
+                retriever.preload_thread.join()
+            preload_ms = (time.perf_counter() - started) * 1000
+            summary = summarize(replay(retriever, first_queries))
+            summary["preload_ms"] = round(preload_ms, 2)
+            summary["cached_shards_before_queries"] = len(retriever._file_cache) if preload else 0
+            results[name] = summary
+
+    print(f"First {len(first_queries)} queries (top_k={args.top_k}, shard cache={args.cache_size}):")
+    print(f"{'mode':<12}{'total ms':>10}{'mean':>9}{'p50':>9}{'p95':>9}{'max':>9}{'preload ms':>12}")
+    for name, row in results.items():
+        print(
+            f"{name:<12}{row['total_ms']:>10.1f}{row['mean_ms']:>9.3f}{row['p50_ms']:>9.3f}"
+            f"{row['p95_ms']:>9.3f}{row['max_ms']:>9.3f}{row['preload_ms']:>12.1f}"
+        )
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
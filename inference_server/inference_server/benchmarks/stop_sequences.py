@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Đo số token sinh ra rồi bị postprocess_answer vứt bỏ: hiện tại (sinh đến max_new_tokens
+hoặc EOS) so với khi engine dừng tại STOP_MARKERS / section header lặp
+(ENGINE_STOP_ENABLED) và trần max_new_tokens theo intent (MAX_NEW_TOKENS_BY_INTENT).
+
+Corpus là JSONL các draft thô của engine ({"draft", "intent"?, "question"?}):
+- `--record` sinh corpus bằng engine đang cấu hình (GENERATION_BACKEND), không stop
+  string, max_new_tokens = MAX_NEW_TOKENS, cho các câu hỏi trong test_questions.txt.
+- Không có `--drafts`: dùng corpus tổng hợp mô phỏng các kiểu lỗi đã gặp (lặp "Kế hoạch
+  đề xuất:"/"Tài liệu tham khảo:" đến hết budget, sinh tiếp "### Question:", "Note:",
+  code fence) — chỉ để kiểm tra logic, số liệu thật phải đo trên corpus record.
+
+Token đếm bằng --tokenizer (HF, vd. model của engine) hoặc ước lượng ký tự / 4.
+
+Usage:
+    python -m benchmarks.stop_sequences
+    GENERATION_BACKEND=vllm python -m benchmarks.stop_sequences --record --drafts drafts.jsonl
+    python -m benchmarks.stop_sequences --drafts drafts.jsonl --tokenizer <MODEL_ID> --output stop.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.load_test import load_question_sets, percentile  # noqa: E402
+from src.config import get_settings  # noqa: E402
+from src.utils import STOP_MARKERS, SINGLE_SECTION_HEADERS, postprocess_answer, repeated_section_index  # noqa: E402
+
+DEFAULT_INTENT = "GENERAL_MEDICAL_QA"
+
+_BODY = [
+    "Tiểu đường type 2 là tình trạng cơ thể đề kháng insulin khiến đường huyết tăng kéo dài.",
+    "Nguyên nhân thường gặp gồm thừa cân, ít vận động và yếu tố di truyền trong gia đình [1].",
+    "Chẩn đoán dựa trên đường huyết lúc đói, HbA1c hoặc nghiệm pháp dung nạp glucose.",
+    "Cần phân biệt với tiểu đường type 1 và các nguyên nhân tăng đường huyết thứ phát.",
+    "Điều trị bắt đầu bằng thay đổi lối sống, sau đó có thể dùng metformin theo chỉ định [2].",
+    "Theo dõi định kỳ chức năng thận, mắt và bàn chân để phát hiện biến chứng sớm.",
+    "Nếu có triệu chứng khát nhiều, tiểu nhiều, sụt cân bất thường, hãy đi khám sớm.",
+]
+_PLAN = [
+    "- Khám bác sĩ nội tiết để được đánh giá và xét nghiệm HbA1c.",
+    "- Ăn giảm đường bột tinh chế, tăng rau xanh.",
+    "- Vận động ít nhất 150 phút mỗi tuần.",
+    "- Tự theo dõi đường huyết tại nhà nếu được hướng dẫn.",
+]
+_REFS = ["[1] Risk factors for type 2 diabetes. PMID: 31234567", "[2] Metformin as first-line therapy. PMID: 32345678"]
+_TAILS = {
+    "question": "\n### Question: Tôi có cần kiêng hoàn toàn tinh bột không?\n### Answer: Không cần kiêng hoàn toàn, ",
+    "note": "\nNote: The answer above is translated from the English source and may be incomplete. ",
+    "code": "\n```python\ndef check_glucose(value):\n    return value > 126\n",
+}
+
+
+class TokenCounter:
+    """Đếm/cắt token bằng tokenizer HF nếu có, không thì ước lượng ký tự / 4."""
+
+    def __init__(self, tokenizer_id: Optional[str] = None):
+        self.tokenizer = None
+        if tokenizer_id:
+            from transformers import AutoTokenizer
+
+            self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_id)
+
+    def count(self, text: str) -> int:
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, add_special_tokens=False))
+        return (len(text) + 3) // 4
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if self.tokenizer is not None:
+            ids = self.tokenizer.encode(text, add_special_tokens=False)
+            return self.tokenizer.decode(ids[:max_tokens]) if len(ids) > max_tokens else text
+        return text[: max_tokens * 4]
+
+
+def synthetic_drafts(n: int, max_tokens: int, seed: int) -> List[Dict]:
+    """Draft mô phỏng: câu trả lời đúng cấu trúc, một phần kèm đuôi lỗi kéo dài đến max_tokens."""
+    rng = random.Random(seed)
+    counter = TokenCounter()
+    drafts = []
+    for _ in range(n):
+        answer = " ".join(rng.sample(_BODY, rng.randint(3, len(_BODY))))
+        sections = "\nKế hoạch đề xuất:\n" + "\n".join(rng.sample(_PLAN, rng.randint(2, 4)))
+        sections += "\nTài liệu tham khảo:\n" + "\n".join(_REFS)
+        text = answer + sections
+        failure = rng.choices(["clean", "repeat", "question", "note", "code"], weights=[4, 3, 1, 1, 1])[0]
+        if failure != "clean":
+            tail = sections if failure == "repeat" else _TAILS[failure] + " ".join(_BODY)
+            # Không gặp EOS: lặp đuôi đến hết max_new_tokens như draft thật bị cắt ở budget
+            while counter.count(text) < max_tokens:
+                text += tail
+            text = counter.truncate(text, max_tokens)
+        drafts.append({"intent": DEFAULT_INTENT, "draft": text, "failure": failure})
+    return drafts
+
+
+def record_drafts(path: Path, limit: int) -> int:
+    """Sinh draft thô (không stop string) cho câu hỏi trong test_questions.txt."""
+    from src.model_loader import generate_batch_with_confidence
+    from src.pipeline import MedAssistantPipeline
+
+    settings = get_settings()
+    pipeline = MedAssistantPipeline(settings)
+    sets = load_question_sets()
+    questions = (sets["single"] + [q for turns in sets["conversation"] for q in turns])[:limit]
+    contexts = [pipeline._retrieve_context(q, None, None)[0] or "Khong co tai lieu lien quan." for q in questions]
+    outputs = generate_batch_with_confidence(
+        [pipeline._answer_prompt(q, c) for q, c in zip(questions, contexts)],
+        max_new_tokens=settings.max_new_tokens,
+        temperature=settings.temperature,
+    )
+    with path.open("w", encoding="utf-8") as f:
+        for question, (draft, _) in zip(questions, outputs):
+            f.write(json.dumps({"question": question, "intent": DEFAULT_INTENT, "draft": draft}, ensure_ascii=False) + "\n")
+    return len(questions)
+
+
+def engine_stop_prefix(text: str) -> str:
+    """Phần draft engine còn sinh khi dừng tại stop string (không gồm marker) hoặc ngay sau header lặp."""
+    cut = len(text)
+    for marker in STOP_MARKERS:
+        idx = text.find(marker)
+        if idx != -1:
+            cut = min(cut, idx)
+    repeat_idx = repeated_section_index(text)
+    if repeat_idx != -1:
+        header = next(h for h in SINGLE_SECTION_HEADERS if text.startswith(h, repeat_idx))
+        cut = min(cut, repeat_idx + len(header))
+    return text[:cut]
+
+
+def analyze(drafts: List[Dict], counter: TokenCounter) -> Dict:
+    settings = get_settings()
+    rows = []
+    for record in drafts:
+        draft = record["draft"]
+        intent = record.get("intent") or DEFAULT_INTENT
+        budget = min(settings.max_new_tokens_by_intent.get(intent, settings.max_new_tokens), settings.max_new_tokens)
+        answer = postprocess_answer(draft)
+        prefix = engine_stop_prefix(draft)
+        budget_cut = counter.count(prefix) > budget
+        if budget_cut:
+            prefix = counter.truncate(prefix, budget)
+        new_answer = postprocess_answer(prefix)
+        rows.append(
+            {
+                "generated_before": counter.count(draft),
+                "kept_before": counter.count(answer),
+                "generated_after": counter.count(prefix),
+                "kept_after": counter.count(new_answer),
+                "same_answer": new_answer == answer,
+                "budget_cut": budget_cut,
+            }
+        )
+
+    def _side(when: str) -> Dict:
+        generated = [r[f"generated_{when}"] for r in rows]
+        discarded = sum(r[f"generated_{when}"] - r[f"kept_{when}"] for r in rows)
+        return {
+            "generated_tokens": sum(generated),
+            "discarded_tokens": discarded,
+            "discarded_fraction": round(discarded / max(1, sum(generated)), 4),
+            "generated_p50": percentile(generated, 50),
+            "generated_p95": percentile(generated, 95),
+        }
+
+    return {
+        "drafts": len(rows),
+        "before": _side("before"),
+        "after": _side("after"),
+        "same_answer": sum(r["same_answer"] for r in rows),
+        "budget_cut": sum(r["budget_cut"] for r in rows),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drafts", type=Path, default=None, help="JSONL draft thô; mặc định: corpus tổng hợp")
+    parser.add_argument("--record", action="store_true", help="sinh corpus --drafts bằng engine đang cấu hình")
+    parser.add_argument("--limit", type=int, default=200, help="số câu hỏi khi --record")
+    parser.add_argument("--synthetic", type=int, default=500, help="số draft tổng hợp")
+    parser.add_argument("--tokenizer", default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    if args.record:
+        if args.drafts is None:
+            parser.error("--record needs --drafts")
+        print(f"Recorded {record_drafts(args.drafts, args.limit)} drafts to {args.drafts}")
+        return
+
+    counter = TokenCounter(args.tokenizer)
+    if args.drafts:
+        lines = args.drafts.read_text(encoding="utf-8").splitlines()
+        drafts = [json.loads(line) for line in lines if line.strip()]
+        source = str(args.drafts)
+    else:
+        drafts = synthetic_drafts(args.synthetic, get_settings().max_new_tokens, args.seed)
+        source = "synthetic"
+
+    report = {"source": source, **analyze(drafts, counter)}
+    print(f"{report['drafts']} drafts ({source})")
+    print(f"{'':<8}{'generated':>11}{'discarded':>11}{'fraction':>10}{'p50':>7}{'p95':>7}")
+    for when in ("before", "after"):
+        side = report[when]
+        print(
+            f"{when:<8}{side['generated_tokens']:>11}{side['discarded_tokens']:>11}"
+            f"{side['discarded_fraction']:>10.1%}{side['generated_p50']:>7}{side['generated_p95']:>7}"
+        )
+    print(f"same final answer: {report['same_answer']}/{report['drafts']}, cut by intent budget: {report['budget_cut']}")
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Sinh corpus PubMed tổng hợp + FAISS index + MedCPT encoder stub để chạy
+PubMedRetriever hoàn toàn offline (không cần MidWin/pubmed-medcpt-faiss).
+
+Layout output (đúng như _ensure_dataset/_ensure_faiss và lazy loader mong đợi):
+
+    <out>/
+    ├── pubmed_ds_embedded/data-00000-of-000NN.arrow   # cột title/abstract/PMID (arrow stream)
+    ├── faiss_index.bin                               # IndexFlatIP / IVF trên vector chuẩn hóa
+    ├── encoder/                                      # BERT nhỏ random + vocab (MEDCPT_ENCODER_ID)
+    ├── manifest.json
+    └── synthetic.env                                 # RAG_CACHE_DIR=..., MEDCPT_ENCODER_ID=...
+
+Usage:
+    python -m benchmarks.synthetic_corpus --out .cache/synthetic --rows 100000
+    python -m benchmarks.synthetic_corpus --out /data/syn5m --rows 5000000 --index ivf --shard-dist lognormal
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+DATASET_DIRNAME = "pubmed_ds_embedded"
+INDEX_FILE = "faiss_index.bin"
+ENCODER_DIRNAME = "encoder"
+
+_TERMS = (
+    "diabetes hypertension insulin glucose cardiovascular stroke asthma migraine headache "
+    "obesity cholesterol kidney liver cancer chemotherapy infection antibiotic vaccine "
+    "pregnancy pediatric elderly depression anxiety sleep nutrition exercise metformin "
+    "statin aspirin inflammation arthritis osteoporosis thyroid anemia dementia"
+).split()
+_FILLER = (
+    "patients study trial cohort randomized outcomes risk treatment therapy clinical "
+    "significant associated reduced increased compared baseline follow-up analysis "
+    "results methods conclusion evidence dose adverse effects mortality incidence"
+).split()
+VOCAB = tuple(_TERMS + _FILLER)
+
+
+def shard_sizes(rows: int, mean_rows: int, dist: str, rng: np.random.Generator) -> List[int]:
+    """Kích thước từng shard: uniform (bằng nhau) hoặc lognormal (lệch như dữ liệu thật)."""
+    if rows <= 0:
+        raise ValueError("rows must be positive")
+    if dist == "uniform":
+        count = max(1, -(-rows // mean_rows))
+        sizes = [rows // count] * count
+        for i in range(rows - sum(sizes)):
+            sizes[i] += 1
+        return sizes
+    if dist != "lognormal":
+        raise ValueError(f"Unknown shard size distribution: {dist}")
+    sizes: List[int] = []
+    remaining = rows
+    while remaining > 0:
+        size = int(rng.lognormal(mean=np.log(mean_rows), sigma=0.6))
+        size = max(1, min(remaining, size))
+        sizes.append(size)
+        remaining -= size
+    return sizes
+
+
+def _text_pool(size: int, words: int, rng: np.random.Generator) -> List[str]:
+    vocab = np.array(VOCAB)
+    picks = rng.integers(0, len(vocab), size=(size, words))
+    return [" ".join(vocab[row]) for row in picks]
+
+
+def write_dataset(
+    dataset_dir: Path,
+    sizes: List[int],
+    *,
+    abstract_words: int,
+    rng: np.random.Generator,
+    pool_size: int = 4096,
+    pmid_start: int = 10_000_000,
+) -> None:
+    """Ghi shard arrow (stream format như datasets.save_to_disk)."""
+    import pyarrow as pa
+
+    dataset_dir.mkdir(parents=True, exist_ok=True)
+    abstracts = pa.array(_text_pool(pool_size, abstract_words, rng), type=pa.string())
+    titles = pa.array(_text_pool(pool_size, 8, rng), type=pa.string())
+    total = len(sizes)
+    offset = 0
+    for shard, size in enumerate(sizes):
+        picks = pa.array(rng.integers(0, pool_size, size=size))
+        table = pa.table(
+            {
+                "title": titles.take(picks),
+                "abstract": abstracts.take(picks),
+                "PMID": pa.array(np.arange(pmid_start + offset, pmid_start + offset + size, dtype=np.int64)),
+            }
+        )
+        path = dataset_dir / f"data-{shard:05d}-of-{total:05d}.arrow"
+        with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=65_536)
+        offset += size
+
+
+def write_index(
+    path: Path,
+    rows: int,
+    dim: int,
+    *,
+    index_type: str,
+    rng: np.random.Generator,
+    chunk_rows: int = 262_144,
+    nlist: Optional[int] = None,
+) -> None:
+    """FAISS inner-product index trên vector ngẫu nhiên đã chuẩn hóa L2 (giống MedCPT + normalize_L2)."""
+    import faiss
+
+    def _chunk(n: int) -> np.ndarray:
+        vectors = rng.standard_normal((n, dim), dtype=np.float32)
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dim)
+    elif index_type == "ivf":
+        nlist = nlist or max(1, min(65_536, int(4 * np.sqrt(rows))))
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(_chunk(min(rows, max(nlist * 39, 10_000))))
+        index.nprobe = min(nlist, 16)
+    else:
+        raise ValueError(f"Unknown index type: {index_type}")
+
+    added = 0
+    while added < rows:
+        n = min(chunk_rows, rows - added)
+        index.add(_chunk(n))
+        added += n
+    faiss.write_index(index, str(path))
+
+
+def write_stub_encoder(encoder_dir: Path, dim: int, *, seed: int = 0) -> None:
+    """BERT 1 layer random (hidden_size = dim) + WordPiece vocab, load được bằng AutoModel/AutoTokenizer."""
+    import torch
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    encoder_dir.mkdir(parents=True, exist_ok=True)
+    specials = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+    chars = sorted(set("abcdefghijklmnopqrstuvwxyz0123456789àáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹđ"))
+    vocab = specials + sorted(set(_TERMS + _FILLER)) + chars + [f"##{c}" for c in chars]
+    vocab_path = encoder_dir / "vocab.txt"
+    vocab_path.write_text("\n".join(vocab) + "\n", encoding="utf-8")
+    tokenizer = BertTokenizerFast(vocab_file=str(vocab_path), do_lower_case=True)
+    tokenizer.save_pretrained(str(encoder_dir))
+
+    heads = 4 if dim % 4 == 0 else 1
+    config = BertConfig(
+        vocab_size=len(vocab),
+        hidden_size=dim,
+        num_hidden_layers=1,
+        num_attention_heads=heads,
+        intermediate_size=dim * 2,
+        max_position_embeddings=128,
+    )
+    torch.manual_seed(seed)
+    BertModel(config).eval().save_pretrained(str(encoder_dir))
+
+
+def generate_corpus(
+    out_dir: Path,
+    *,
+    rows: int,
+    dim: int = 64,
+    rows_per_shard: int = 50_000,
+    shard_dist: str = "uniform",
+    abstract_words: int = 60,
+    index_type: str = "flat",
+    with_encoder: bool = True,
+    seed: int = 0,
+) -> Dict:
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    timings: Dict[str, float] = {}
+
+    sizes = shard_sizes(rows, rows_per_shard, shard_dist, rng)
+    started = time.perf_counter()
+    write_dataset(out_dir / DATASET_DIRNAME, sizes, abstract_words=abstract_words, rng=rng)
+    timings["dataset_s"] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    write_index(out_dir / INDEX_FILE, rows, dim, index_type=index_type, rng=rng)
+    timings["index_s"] = round(time.perf_counter() - started, 3)
+
+    encoder_dir = out_dir / ENCODER_DIRNAME
+    if with_encoder:
+        started = time.perf_counter()
+        write_stub_encoder(encoder_dir, dim, seed=seed)
+        timings["encoder_s"] = round(time.perf_counter() - started, 3)
+
+    env = {
+        "RAG_CACHE_DIR": str(out_dir.resolve()),
+        "RAG_DATASET_DIRNAME": DATASET_DIRNAME,
+        "RAG_INDEX_FILE": INDEX_FILE,
+    }
+    if with_encoder:
+        env["MEDCPT_ENCODER_ID"] = str(encoder_dir.resolve())
+    (out_dir / "synthetic.env").write_text(
+        "".join(f"{key}={value}\n" for key, value in env.items()), encoding="utf-8"
+    )
+    manifest = {
+        "rows": rows,
+        "dim": dim,
+        "shards": len(sizes),
+        "shard_dist": shard_dist,
+        "shard_rows": {"min": min(sizes), "max": max(sizes), "mean": round(rows / len(sizes), 1)},
+        "index_type": index_type,
+        "abstract_words": abstract_words,
+        "seed": seed,
+        "env": env,
+        "timings": timings,
+    }
+    (out_dir / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    return manifest
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", type=Path, required=True)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--dim", type=int, default=64, help="768 để giống MedCPT thật")
+    parser.add_argument("--rows-per-shard", type=int, default=50_000)
+    parser.add_argument("--shard-dist", choices=("uniform", "lognormal"), default="uniform")
+    parser.add_argument("--abstract-words", type=int, default=60)
+    parser.add_argument("--index", choices=("flat", "ivf"), default="flat")
+    parser.add_argument("--no-encoder", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    manifest = generate_corpus(
+        args.out,
+        rows=args.rows,
+        dim=args.dim,
+        rows_per_shard=args.rows_per_shard,
+        shard_dist=args.shard_dist,
+        abstract_words=args.abstract_words,
+        index_type=args.index,
+        with_encoder=not args.no_encoder,
+        seed=args.seed,
+    )
+    print(json.dumps(manifest, indent=2))
+    print(f"Dùng với server: set -a; source {args.out / 'synthetic.env'}; set +a")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Fixture dùng chung cho test: môi trường mock cô lập theo từng test và pipeline trên FakeEngine."""
+
+import sys
+from argparse import Namespace
+from pathlib import Path
+
+import pyarrow as pa
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from benchmarks.fakes import FakeEngine, HashEmbedder, SyntheticRetriever
+from benchmarks.load_test import build_in_process_app, in_process_env
+from src import memory as memory_module
+from src import model_loader
+from src import pipeline as pipeline_module
+from src.config import Settings, get_settings
+from src.pipeline import MedAssistantPipeline
+
+
+@pytest.fixture(autouse=True)
+def mock_environment(monkeypatch):
+    """Backend mock + memory builtin; settings cache, engine và EWMA token được đặt lại sau mỗi test."""
+    monkeypatch.setenv("GENERATION_BACKEND", "mock")
+    monkeypatch.setenv("MEMORY_BACKEND", "builtin")
+    monkeypatch.setattr(model_loader, "_backend_cache", None)
+    monkeypatch.setattr(model_loader, "_token_seconds", None)
+    get_settings.cache_clear()
+    yield
+    get_settings.cache_clear()
+
+
+@pytest.fixture
+def make_pipeline():
+    """
+    Factory make_pipeline(engine=None, **settings): pipeline lazy_load trên engine giả (mặc định
+    FakeEngine không trễ) và SyntheticRetriever. RAG, semantic cache và history selection tắt
+    trừ khi được override.
+    """
+
+    def _make(engine=None, **overrides) -> MedAssistantPipeline:
+        model_loader.set_engine(engine or FakeEngine(token_latency_ms=0.0))
+        settings = Settings(
+            **{
+                "RAG_ENABLED": False,
+                "SEMANTIC_CACHE_ENABLED": False,
+                "HISTORY_SELECTION_ENABLED": False,
+                **overrides,
+            }
+        )
+        pipeline = MedAssistantPipeline(settings, lazy_load=True)
+        pipeline.retriever = SyntheticRetriever(latency_ms=0.0)
+        return pipeline
+
+    return _make
+
+
+@pytest.fixture
+def hash_embedder(monkeypatch) -> HashEmbedder:
+    """Thay embedder của semantic cache và history selection bằng HashEmbedder (không load model)."""
+    embedder = HashEmbedder()
+    monkeypatch.setattr(pipeline_module, "get_history_embedder", lambda: embedder)
+    monkeypatch.setattr(memory_module, "get_history_embedder", lambda: embedder)
+    return embedder
+
+
+@pytest.fixture
+def write_shards():
+    """
+    Factory write_shards(dataset_dir, shards): mỗi shard là list (title, abstract, pmid), ghi thành
+    data-0000n-of-0000N.arrow dạng IPC stream như datasets. Shard có title kiểu list thì mọi
+    title/abstract của shard đó được ghi thành list<string>.
+    """
+
+    def _write(dataset_dir: Path, shards) -> None:
+        dataset_dir.mkdir(parents=True)
+        for n, rows in enumerate(shards):
+            list_valued = any(isinstance(title, list) for title, _, _ in rows)
+            wrap = (lambda v: v if isinstance(v, list) else [v]) if list_valued else (lambda v: v)
+            table = pa.table(
+                {
+                    "title": [wrap(t) for t, _, _ in rows],
+                    "abstract": [wrap(a) for _, a, _ in rows],
+                    "PMID": [p for _, _, p in rows],
+                }
+            )
+            path = dataset_dir / f"data-{n:05d}-of-{len(shards):05d}.arrow"
+            with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+
+    return _write
+
+
+@pytest.fixture
+def in_process_app(monkeypatch):
+    """
+    Factory in_process_app(**args): app FastAPI của src.api trên FakeEngine qua build_in_process_app.
+    Env của profile mock được đặt bằng monkeypatch nên tự trả lại sau test; args mặc định
+    không trễ, tắt semantic cache.
+    """
+
+    def _build(**overrides):
+        args = Namespace(
+            **{
+                "semantic_cache": False,
+                "token_latency_ms": 0.0,
+                "answer_tokens": 32,
+                "router_tokens": 8,
+                "engine_slots": None,
+                "retrieval_latency_ms": 0.0,
+                **overrides,
+            }
+        )
+        for name, value in in_process_env(args).items():
+            monkeypatch.setenv(name, value)
+        get_settings.cache_clear()
+        return build_in_process_app(args)
+
+    return _build
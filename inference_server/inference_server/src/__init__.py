@@ -1,7 +1,14 @@
 """Inference server package for Med LLaVA pipeline."""
 
 from .config import get_settings, Settings
-from .pipeline import MedAssistantPipeline
 
 __all__ = ["get_settings", "Settings", "MedAssistantPipeline"]
 
+
+def __getattr__(name):
+    # Import pipeline khi cần để `import src.<module>` không kéo theo cả stack inference
+    if name == "MedAssistantPipeline":
+        from .pipeline import MedAssistantPipeline
+
+        return MedAssistantPipeline
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,23 +1,72 @@
 from __future__ import annotations
 
+import asyncio
+import hmac
 import logging
-from typing import Any, Dict
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Literal, Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from pydantic import BaseModel, Field
 
 from .config import get_settings
+from .deadline import CLIENT_DISCONNECTED, Deadline, DeadlineExceeded
+from .memory_report import MemoryReporter, format_report_line
 from .pipeline import MedAssistantPipeline
+from .profiling import PROFILE_HEADER, RequestProfiler
+from .responses import FastJSONResponse, shape_response
+from .scheduler import QueueFullError
 
 logger = logging.getLogger(__name__)
+TIMEOUT_HEADER = "X-Request-Timeout"
+PROFILE_ID_HEADER = "X-Profile-Id"
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
 settings = get_settings()
-pipeline = MedAssistantPipeline(settings)
+pipeline = MedAssistantPipeline(settings, lazy_load=True)
+# None khi profiling tắt: request không đi qua profiler
+profiler = RequestProfiler.from_settings(settings)
+memory_reporter = MemoryReporter(pipeline, tracemalloc_frames=settings.memory_tracemalloc_frames)
+
+
+async def _log_memory_periodically(interval_s: float) -> None:
+    while True:
+        await asyncio.sleep(interval_s)
+        try:
+            report = await run_in_threadpool(memory_reporter.report)
+            logger.info(format_report_line(report))
+        except Exception as exc:  # báo cáo lỗi không được làm chết task
+            logger.warning("Memory report failed: %s", exc)
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    memory_reporter.start()
+    # Load dataset/FAISS/encoder/engine song song; WARMUP_ENABLED=false -> load xong mới nhận request
+    pipeline.warmup(background=settings.warmup_enabled)
+    memory_log = None
+    if settings.memory_report_interval_s > 0:
+        memory_log = asyncio.create_task(_log_memory_periodically(settings.memory_report_interval_s))
+    yield
+    if memory_log is not None:
+        memory_log.cancel()
+    pipeline.retriever.flush_access_stats()
+
 
 app = FastAPI(
     title="Med LLaVA Inference API",
     version="0.1.0",
     description="GPU inference server with LangChain memory + self-correction.",
+    lifespan=lifespan,
 )
+if settings.response_gzip_min_bytes > 0:
+    app.add_middleware(
+        GZipMiddleware,
+        minimum_size=settings.response_gzip_min_bytes,
+        compresslevel=settings.response_gzip_level,
+    )
 
 
 class ChatRequest(BaseModel):
@@ -25,11 +74,13 @@ class ChatRequest(BaseModel):
     session_id: str = Field(default="default", max_length=128)
     max_new_tokens: int | None = Field(default=None, ge=64, le=1024)
     top_k: int | None = Field(default=None, ge=1, le=10)
+    # None -> RESPONSE_MODE; compact/ids bỏ bớt field nặng khi client chỉ đọc answer
+    response_mode: Literal["full", "compact", "ids"] | None = None
 
 
 class ChatResponse(BaseModel):
     answer: str
-    draft: str
+    draft: str | None = None
     confidence: float
     verdict: str
     citations: list[str]
@@ -42,6 +93,10 @@ class ChatResponse(BaseModel):
     sanitized_user_prompt: str | None = None
     output_guard_flagged: bool | None = None
     tool_params: Dict[str, Any] | None = None
+    cache_hit: bool | None = None
+    deadline_truncated: bool | None = None
+    verified: bool | None = None
+    timings_ms: Dict[str, float] | None = None
 
 
 @app.get("/")
@@ -53,7 +108,12 @@ def root() -> Dict[str, Any]:
         "description": "GPU inference server with LangChain memory + self-correction.",
         "endpoints": {
             "health": "/health",
+            "liveness": "/health/live",
+            "readiness": "/health/ready",
             "chat": "/v1/chat/completions",
+            "metrics": "/metrics",
+            "profiles": "/admin/profiles",
+            "memory": "/admin/memory",
             "docs": "/docs",
             "openapi": "/openapi.json",
         },
@@ -61,23 +121,154 @@ def root() -> Dict[str, Any]:
 
 
 @app.get("/health")
-def health_check() -> Dict[str, str]:
+def health_check() -> Dict[str, Any]:
     status = "ok" if pipeline.retriever.available else "degraded"
-    return {"status": status, "model_id": settings.model_id}
+    return {
+        "status": status,
+        "model_id": settings.model_id,
+        "semantic_cache": pipeline.semantic_cache_stats(),
+        "scheduler": pipeline.scheduler.stats() if pipeline.scheduler else None,
+        "self_correction": pipeline.verifier.stats() if pipeline.verifier else None,
+    }
+
+
+@app.get("/health/live")
+def liveness() -> Dict[str, str]:
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+def readiness() -> JSONResponse:
+    snapshot = pipeline.readiness.snapshot()
+    return JSONResponse(snapshot, status_code=200 if snapshot["ready"] else 503)
+
+
+@app.get("/metrics")
+def metrics() -> PlainTextResponse:
+    body = pipeline.scheduler.render_prometheus() if pipeline.scheduler else ""
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
+def _require_admin(http_request: Request) -> None:
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled (set ADMIN_TOKEN)")
+    token = http_request.headers.get(ADMIN_TOKEN_HEADER) or ""
+    if not hmac.compare_digest(token.encode("utf-8"), settings.admin_token.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@app.get("/admin/memory")
+def memory_report(http_request: Request, tracemalloc_top: int | None = None) -> Dict[str, Any]:
+    """Byte ước lượng theo thành phần; tracemalloc_top > 0 kèm diff với lần gọi trước."""
+    _require_admin(http_request)
+    top = settings.memory_tracemalloc_top if tracemalloc_top is None else tracemalloc_top
+    return memory_reporter.report(tracemalloc_top=top)
 
 
-@app.post("/v1/chat/completions", response_model=ChatResponse)
-def chat_completion(request: ChatRequest) -> Dict[str, Any]:
+@app.get("/admin/profiles")
+def list_profiles(http_request: Request) -> Dict[str, Any]:
+    _require_admin(http_request)
+    return {
+        "enabled": profiler is not None,
+        "profiles": profiler.list_profiles() if profiler else [],
+    }
+
+
+@app.get("/admin/profiles/{name}")
+def download_profile(name: str, http_request: Request) -> FileResponse:
+    _require_admin(http_request)
+    path = profiler.path_for(name) if profiler else None
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Profile {name!r} not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
+
+
+def _request_deadline(http_request: Request) -> Optional[Deadline]:
+    if not settings.request_deadline_enabled:
+        return None
+    timeout_s = settings.request_timeout_s
+    header = http_request.headers.get(TIMEOUT_HEADER)
+    if header:
+        try:
+            requested = float(header)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=f"Invalid {TIMEOUT_HEADER} header") from exc
+        if requested > 0:
+            timeout_s = min(requested, timeout_s) if timeout_s > 0 else requested
+    return Deadline(timeout_s)
+
+
+async def _run_watching_disconnect(
+    fn: Callable[[], Any], deadline: Optional[Deadline], http_request: Request
+) -> Any:
+    """Chạy pipeline trong threadpool; client ngắt kết nối thì cancel deadline để pipeline dừng."""
+    task = asyncio.ensure_future(run_in_threadpool(fn))
+    if deadline is None:
+        return await task
     try:
-        result = pipeline.ask(
+        while not task.done():
+            await asyncio.wait({task}, timeout=settings.disconnect_poll_s)
+            if not task.done() and await http_request.is_disconnected():
+                deadline.cancel(CLIENT_DISCONNECTED)
+    except asyncio.CancelledError:
+        # Server huỷ handler (client đóng kết nối): thread pipeline vẫn chạy nên phải báo dừng
+        deadline.cancel(CLIENT_DISCONNECTED)
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        raise
+    return task.result()
+
+
+_RESPONSE_FIELDS = tuple(ChatResponse.model_fields)
+
+
+# Schema chỉ để document: response được serialize thẳng, không validate lại qua ChatResponse
+@app.post(
+    "/v1/chat/completions",
+    response_model=None,
+    response_class=FastJSONResponse,
+    responses={200: {"model": ChatResponse}},
+)
+async def chat_completion(request: ChatRequest, http_request: Request) -> FastJSONResponse:
+    deadline = _request_deadline(http_request)
+
+    def ask() -> Dict[str, Any]:
+        return pipeline.ask(
             question=request.question,
             session_id=request.session_id,
             max_new_tokens=request.max_new_tokens,
             top_k=request.top_k,
+            deadline=deadline,
+        )
+
+    try:
+        profile_id = None
+        if profiler is not None and profiler.should_profile(http_request.headers.get(PROFILE_HEADER)):
+            result, profile_id = await _run_watching_disconnect(lambda: profiler.run(ask), deadline, http_request)
+        else:
+            result = await _run_watching_disconnect(ask, deadline, http_request)
+        response = FastJSONResponse(
+            shape_response(
+                result,
+                request.response_mode or settings.response_mode,
+                fields=_RESPONSE_FIELDS,
+                abstract_chars=settings.response_compact_abstract_chars,
+            )
         )
-        return result
+        if profile_id:
+            response.headers[PROFILE_ID_HEADER] = profile_id
+        return response
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except DeadlineExceeded as exc:
+        # 499: client đã đóng kết nối (quy ước nginx); 504: hết budget
+        status = 499 if exc.reason == CLIENT_DISCONNECTED else 504
+        raise HTTPException(status_code=status, detail=str(exc)) from exc
+    except QueueFullError as exc:
+        raise HTTPException(
+            status_code=429,
+            detail=str(exc),
+            headers={"Retry-After": str(int(exc.retry_after_s))},
+        ) from exc
     except Exception as exc:
         import traceback
         error_msg = str(exc)
@@ -0,0 +1,24 @@
+"""Đọc các shard data-*.arrow của pubmed_ds_embedded (dùng chung cho retriever, BM25, SimHash, docstore)."""
+from __future__ import annotations
+
+from pathlib import Path
+
+
+def read_arrow_table(arrow_file: Path):
+    """Đọc một shard arrow với memory mapping (RecordBatchFile hoặc stream format)."""
+    import pyarrow as pa
+
+    with pa.memory_map(str(arrow_file)) as source:
+        try:
+            return pa.ipc.open_file(source).read_all()
+        except (pa.lib.ArrowInvalid, ValueError, TypeError):
+            # Không phải RecordBatchFile: datasets ghi shard dạng stream
+            source.seek(0)
+            return pa.ipc.open_stream(source).read_all()
+
+
+def join_text(value) -> str:
+    """Một số shard lưu title/abstract dạng list đoạn văn."""
+    if isinstance(value, list):
+        return " ".join(str(x) for x in value)
+    return value or ""
@@ -0,0 +1,21 @@
+"""Backend sinh text (GENERATION_BACKEND): vllm, transformers, mock."""
+from .base import (
+    Generation,
+    GenerationBackend,
+    SamplingConfig,
+    available_backends,
+    build_backend,
+    register_backend,
+)
+from .engine import EngineBackend
+from . import mock, transformers_backend, vllm_backend  # noqa: F401  (đăng ký backend)
+
+__all__ = [
+    "EngineBackend",
+    "Generation",
+    "GenerationBackend",
+    "SamplingConfig",
+    "available_backends",
+    "build_backend",
+    "register_backend",
+]
@@ -0,0 +1,144 @@
+"""
+Interface backend sinh text và registry chọn backend theo GENERATION_BACKEND.
+
+Backend nhận SamplingConfig (không phụ thuộc vLLM/transformers) và trả Generation
+(text + xác suất từng token đã chọn). Backend mới đăng ký bằng @register_backend("tên");
+builder chỉ import thư viện nặng khi được gọi.
+"""
+from __future__ import annotations
+
+import queue
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+from ..config import Settings
+from ..utils import enforce_stop_tokens
+
+ShouldStop = Callable[[], bool]
+StopWhen = Callable[[str], bool]
+
+
+@dataclass
+class SamplingConfig:
+    max_new_tokens: int
+    temperature: float = 0.0
+    repetition_penalty: float = 1.0
+    stop: Optional[List[str]] = None
+
+
+@dataclass
+class Generation:
+    """Text sinh ra + xác suất từng token (đã chọn), dùng cho confidence và low-confidence span."""
+
+    text: str
+    token_probs: List[float] = field(default_factory=list)
+
+    @property
+    def confidence(self) -> float:
+        return sum(self.token_probs) / len(self.token_probs) if self.token_probs else 0.0
+
+
+class GenerationBackend(ABC):
+    """
+    generate_batch là bắt buộc (abstract: backend thiếu nó lỗi ngay khi khởi tạo); generate và stream có cài đặt mặc định dựa trên nó.
+
+    - should_stop(): backend có supports_should_stop thì abort giữa lúc decode, prompt bị
+      abort trả Generation("") (như vLLM: request bị abort không có output).
+    - stop_when(text): backend có supports_stop_when thì gọi trên text tích lũy sau mỗi bước
+      decode và dừng sequence khi trả True.
+    - stop: text trả về không chứa stop string (cắt tại lần xuất hiện đầu tiên).
+    Backend không hỗ trợ callback nào thì bỏ qua nó; caller tự kiểm tra sau khi gọi.
+    """
+
+    name = "base"
+    supports_should_stop = False
+    supports_stop_when = False
+
+    @abstractmethod
+    def generate_batch(
+        self,
+        prompts: Sequence[str],
+        params: SamplingConfig,
+        *,
+        should_stop: Optional[ShouldStop] = None,
+        stop_when: Optional[StopWhen] = None,
+    ) -> List[Generation]:
+        ...
+
+    def generate(self, prompt: str, params: SamplingConfig, **kwargs) -> Generation:
+        return self.generate_batch([prompt], params, **kwargs)[0]
+
+    def stream(
+        self, prompt: str, params: SamplingConfig, *, should_stop: Optional[ShouldStop] = None
+    ) -> Iterator[str]:
+        """
+        Các đoạn text mới theo thứ tự, ghép lại bằng generate(). Backend có stop_when thì
+        stream theo từng bước decode, không thì trả cả câu một lần.
+        """
+        if not self.supports_stop_when:
+            yield self.generate(prompt, params, should_stop=should_stop).text
+            return
+        yield from _stream_with_stop_when(self, prompt, params, should_stop)
+
+
+def _stream_with_stop_when(
+    backend: GenerationBackend, prompt: str, params: SamplingConfig, should_stop: Optional[ShouldStop]
+) -> Iterator[str]:
+    """Chạy generate ở thread riêng, stop_when nhận text tích lũy mỗi bước và đẩy ra queue."""
+    updates: "queue.Queue" = queue.Queue()
+    closed = threading.Event()
+
+    def _on_text(text: str) -> bool:
+        updates.put(("text", text))
+        return False
+
+    def _should_stop() -> bool:
+        return closed.is_set() or (should_stop is not None and should_stop())
+
+    def _run() -> None:
+        try:
+            result = backend.generate(prompt, params, should_stop=_should_stop, stop_when=_on_text)
+            updates.put(("done", result.text))
+        except BaseException as exc:  # noqa: BLE001
+            updates.put(("error", exc))
+
+    threading.Thread(target=_run, name=f"{backend.name}-stream", daemon=True).start()
+    emitted = ""
+    try:
+        while True:
+            kind, value = updates.get()
+            if kind == "error":
+                raise value
+            text = enforce_stop_tokens(value, params.stop) if kind == "text" else value
+            if len(text) > len(emitted) and text.startswith(emitted):
+                yield text[len(emitted):]
+                emitted = text
+            if kind == "done":
+                return
+    finally:
+        # Consumer bỏ dở stream: abort generation đang chạy
+        closed.set()
+
+
+_BACKENDS: Dict[str, Callable[[Settings], GenerationBackend]] = {}
+
+
+def register_backend(name: str):
+    def _decorator(builder: Callable[[Settings], GenerationBackend]):
+        _BACKENDS[name] = builder
+        return builder
+
+    return _decorator
+
+
+def available_backends() -> List[str]:
+    return sorted(_BACKENDS)
+
+
+def build_backend(settings: Settings, name: Optional[str] = None) -> GenerationBackend:
+    name = name or settings.generation_backend
+    if name not in _BACKENDS:
+        raise ValueError(f"Unknown GENERATION_BACKEND {name!r}, expected one of {available_backends()}")
+    return _BACKENDS[name](settings)
@@ -0,0 +1,63 @@
+"""
+Backend trên một engine có interface `vllm.LLM.generate(prompts, sampling_params)` trả
+RequestOutput: vLLM thật (SteppedVLLMEngine), MockEngine và FakeEngine của benchmark.
+"""
+from __future__ import annotations
+
+import math
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from ..utils import enforce_stop_tokens
+from .base import Generation, GenerationBackend, SamplingConfig, ShouldStop, StopWhen
+
+
+class EngineBackend(GenerationBackend):
+    def __init__(self, engine: Any, *, sampling_params_factory: Callable[..., Any], name: str = "engine"):
+        self.engine = engine
+        self.name = name
+        self._sampling_params = sampling_params_factory
+        self.supports_should_stop = getattr(engine, "supports_should_stop", False)
+        self.supports_stop_when = getattr(engine, "supports_stop_when", False)
+
+    def generate_batch(
+        self,
+        prompts: Sequence[str],
+        params: SamplingConfig,
+        *,
+        should_stop: Optional[ShouldStop] = None,
+        stop_when: Optional[StopWhen] = None,
+    ) -> List[Generation]:
+        prompts = list(prompts)
+        if not prompts:
+            return []
+        sampling_params = self._sampling_params(
+            temperature=params.temperature,
+            max_tokens=params.max_new_tokens,
+            repetition_penalty=params.repetition_penalty,
+            logprobs=1,
+            stop=list(params.stop) if params.stop else None,
+        )
+        engine_kwargs: Dict[str, Any] = {}
+        if should_stop is not None and self.supports_should_stop:
+            engine_kwargs["should_stop"] = should_stop
+        if stop_when is not None and self.supports_stop_when:
+            engine_kwargs["stop_when"] = stop_when
+        outputs = self.engine.generate(prompts, sampling_params, use_tqdm=False, **engine_kwargs)
+
+        # Output map lại theo prompt: prompt bị abort không có output
+        by_prompt: Dict[str, List[Any]] = {}
+        for output in outputs:
+            by_prompt.setdefault(output.prompt, []).append(output)
+        results = []
+        for prompt in prompts:
+            if not by_prompt.get(prompt):
+                results.append(Generation(""))
+                continue
+            completion = by_prompt[prompt].pop(0).outputs[0]
+            probs = []
+            for token_dict in completion.logprobs or []:
+                for _, logprob_obj in token_dict.items():
+                    probs.append(math.exp(float(logprob_obj.logprob)))
+                    break
+            results.append(Generation(enforce_stop_tokens(completion.text, params.stop), probs))
+        return results
@@ -0,0 +1,76 @@
+"""Backend "mock": engine giả trả output cùng shape với vLLM, không cần model."""
+from __future__ import annotations
+
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from ..config import Settings
+from .base import register_backend
+from .engine import EngineBackend
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _MockLogprob:
+    logprob: float
+
+
+@dataclass
+class _MockCompletion:
+    text: str
+    logprobs: List[Dict[int, _MockLogprob]] = field(default_factory=list)
+
+
+@dataclass
+class _MockRequestOutput:
+    prompt: str
+    outputs: List[_MockCompletion]
+
+
+@dataclass
+class MockSamplingParams:
+    temperature: float = 0.7
+    max_tokens: int = 16
+    repetition_penalty: float = 1.0
+    logprobs: Optional[int] = None
+    stop: Optional[List[str]] = None
+
+
+class MockEngine:
+    """
+    Engine giả (GENERATION_BACKEND=mock) trả output cùng shape với vLLM,
+    dùng cho tooling, test và deployment CPU không có GPU/vllm.
+    """
+
+    supports_should_stop = True
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.token_latency_s = settings.mock_token_latency_ms / 1000.0
+
+    def generate(self, prompts, sampling_params, use_tqdm: bool = False, should_stop=None):
+        results = []
+        for prompt in prompts:
+            words = ["Đây", "là", "câu", "trả", "lời", "mô", "phỏng."]
+            n_tokens = max(1, min(sampling_params.max_tokens, len(words)))
+            for i in range(n_tokens):
+                if should_stop is not None and should_stop():
+                    n_tokens = i
+                    break
+                if self.token_latency_s:
+                    time.sleep(self.token_latency_s)
+            completion = _MockCompletion(
+                text=" ".join(words[:n_tokens]),
+                logprobs=[{0: _MockLogprob(-0.1)} for _ in range(n_tokens)],
+            )
+            results.append(_MockRequestOutput(prompt=prompt, outputs=[completion]))
+        return results
+
+
+@register_backend("mock")
+def _build_mock_backend(settings: Settings) -> EngineBackend:
+    logger.info("Using mock generation backend")
+    return EngineBackend(MockEngine(settings), sampling_params_factory=MockSamplingParams, name="mock")
@@ -0,0 +1,148 @@
+"""
+Backend "transformers": AutoModelForCausalLM chạy trên CPU, cho máy không có GPU/vllm.
+
+Prompt được pad bên trái để batch chung một lần model.generate; should_stop, stop_when và
+stop string được kiểm tra sau mỗi bước decode bằng StoppingCriteria. Prompt dài hơn
+max_model_len bị từ chối (ValueError) như backend vllm, không bị cắt mất system prompt;
+max_new_tokens được giới hạn cho vừa phần context còn lại.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from typing import List, Optional, Sequence
+
+from ..config import Settings
+from ..utils import enforce_stop_tokens
+from .base import Generation, GenerationBackend, SamplingConfig, ShouldStop, StopWhen, register_backend
+
+logger = logging.getLogger(__name__)
+
+
+class TransformersBackend(GenerationBackend):
+    name = "transformers"
+    supports_should_stop = True
+    supports_stop_when = True
+
+    def __init__(
+        self,
+        model_id: str,
+        *,
+        dtype: str = "float32",
+        num_threads: int = 0,
+        max_model_len: int = 2048,
+        revision: Optional[str] = None,
+        cache_dir: Optional[str] = None,
+        token: Optional[str] = None,
+    ):
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        logger.info("Loading transformers model %s on CPU", model_id)
+        self.tokenizer = AutoTokenizer.from_pretrained(
+            model_id, revision=revision, cache_dir=cache_dir, token=token
+        )
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.model = AutoModelForCausalLM.from_pretrained(
+            model_id, revision=revision, cache_dir=cache_dir, token=token, torch_dtype=getattr(torch, dtype)
+        ).eval()
+        self.max_model_len = max_model_len
+        # model.generate không chia sẻ an toàn giữa các thread: batch là cách tận dụng CPU
+        self._lock = threading.Lock()
+
+    def generate_batch(
+        self,
+        prompts: Sequence[str],
+        params: SamplingConfig,
+        *,
+        should_stop: Optional[ShouldStop] = None,
+        stop_when: Optional[StopWhen] = None,
+    ) -> List[Generation]:
+        import torch
+        from transformers import StoppingCriteriaList
+
+        prompts = list(prompts)
+        if not prompts:
+            return []
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True)
+        prompt_len = inputs["input_ids"].shape[1]
+        if prompt_len >= self.max_model_len:
+            raise ValueError(
+                f"The prompt (length {prompt_len}) is longer than the maximum model length of {self.max_model_len}."
+            )
+        criteria = _StopCriteria(self.tokenizer, prompt_len, params.stop, should_stop, stop_when)
+        kwargs = {
+            "max_new_tokens": min(params.max_new_tokens, self.max_model_len - prompt_len),
+            "do_sample": params.temperature > 0,
+            "repetition_penalty": params.repetition_penalty,
+            "stopping_criteria": StoppingCriteriaList([criteria]),
+            "pad_token_id": self.tokenizer.pad_token_id,
+            "output_scores": True,
+            "return_dict_in_generate": True,
+        }
+        if params.temperature > 0:
+            kwargs["temperature"] = params.temperature
+        with self._lock, torch.inference_mode():
+            output = self.model.generate(**inputs, **kwargs)
+            if criteria.aborted:
+                return [Generation("") for _ in prompts]
+            scores = self.model.compute_transition_scores(output.sequences, output.scores, normalize_logits=True)
+
+        end_ids = {self.tokenizer.eos_token_id, self.tokenizer.pad_token_id}
+        results = []
+        for row, sequence in enumerate(output.sequences[:, prompt_len:].tolist()):
+            token_ids: List[int] = []
+            probs: List[float] = []
+            for token_id, prob in zip(sequence, scores[row].exp().tolist()):
+                if token_id in end_ids:
+                    break
+                token_ids.append(token_id)
+                probs.append(prob)
+            text = self.tokenizer.decode(token_ids, skip_special_tokens=True)
+            results.append(Generation(enforce_stop_tokens(text, params.stop), probs))
+        return results
+
+
+class _StopCriteria:
+    """StoppingCriteria trả tensor bool theo từng sequence (transformers >= 4.39)."""
+
+    def __init__(self, tokenizer, prompt_len: int, stop, should_stop, stop_when):
+        self.tokenizer = tokenizer
+        self.prompt_len = prompt_len
+        self.stop = list(stop or [])
+        self.should_stop = should_stop
+        self.stop_when = stop_when
+        self.aborted = False
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+
+        batch = input_ids.shape[0]
+        if self.should_stop is not None and self.should_stop():
+            self.aborted = True
+            return torch.ones(batch, dtype=torch.bool, device=input_ids.device)
+        if not (self.stop or self.stop_when):
+            return torch.zeros(batch, dtype=torch.bool, device=input_ids.device)
+        texts = self.tokenizer.batch_decode(input_ids[:, self.prompt_len:], skip_special_tokens=True)
+        done = [
+            any(marker in text for marker in self.stop) or (self.stop_when is not None and self.stop_when(text))
+            for text in texts
+        ]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+@register_backend("transformers")
+def _build_transformers_backend(settings: Settings) -> TransformersBackend:
+    return TransformersBackend(
+        settings.cpu_model_id or settings.model_id,
+        dtype=settings.cpu_dtype,
+        num_threads=settings.cpu_threads,
+        max_model_len=settings.max_model_len,
+        revision=None if settings.cpu_model_id else settings.model_revision,
+        cache_dir=str(settings.model_cache_dir),
+        token=settings.hf_token,
+    )
@@ -0,0 +1,173 @@
+"""Backend "vllm" (GPU): vllm.LLM được điều khiển bởi một thread step duy nhất."""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import uuid
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Tuple
+
+from ..config import Settings
+from .base import register_backend
+from .engine import EngineBackend
+
+if TYPE_CHECKING:  # vllm chỉ được import khi thực sự dùng
+    from vllm import LLM as VLLMEngine
+
+logger = logging.getLogger(__name__)
+
+
+class SteppedVLLMEngine:
+    """
+    Bọc vllm.LLM: một thread duy nhất gọi llm_engine.step(), các thread request chỉ
+    add_request rồi chờ kết quả. Request của nhiều thread vẫn được batch chung, và
+    request có should_stop() = True (hết deadline, client ngắt) được abort_request
+    ngay giữa lúc decode thay vì sinh hết max_tokens. Tương tự, stop_when(text) = True
+    trên text đang sinh (vd. section header bị lặp) thì trả phần đã sinh và abort phần còn lại.
+    Lỗi của add_request (vd. prompt dài hơn max_model_len) hay step() được lưu làm kết quả
+    của request tương ứng và generate() raise lại: thread step không bao giờ chết vì một request.
+    """
+
+    supports_should_stop = True
+    supports_stop_when = True
+
+    def __init__(self, llm: VLLMEngine, *, poll_s: float = 0.02):
+        self.llm = llm
+        self._llm_engine = llm.llm_engine
+        self._poll_s = poll_s
+        self._cond = threading.Condition()
+        # request_id -> RequestOutput hoặc Exception (None khi chưa xong)
+        self._results: Dict[str, Any] = {}
+        self._stop_when: Dict[str, Callable[[str], bool]] = {}
+        self._incoming: List[Tuple[str, str, Any]] = []
+        self._aborts: List[str] = []
+        self._thread = threading.Thread(target=self._step_loop, name="vllm-step", daemon=True)
+        self._thread.start()
+
+    def __getattr__(self, name: str):
+        return getattr(self.llm, name)
+
+    def generate(
+        self, prompts, sampling_params, use_tqdm: bool = False, should_stop=None, stop_when=None
+    ):
+        if isinstance(prompts, str):
+            prompts = [prompts]
+        request_ids = [uuid.uuid4().hex for _ in prompts]
+        with self._cond:
+            for request_id, prompt in zip(request_ids, prompts):
+                self._results[request_id] = None
+                if stop_when is not None:
+                    self._stop_when[request_id] = stop_when
+                self._incoming.append((request_id, prompt, sampling_params))
+            self._cond.notify_all()
+            while any(self._results[r] is None for r in request_ids):
+                # Một prompt lỗi thì cả lời gọi lỗi (như LLM.generate): abort các prompt còn lại
+                failed = any(isinstance(self._results[r], Exception) for r in request_ids)
+                if failed or (should_stop is not None and should_stop()):
+                    self._aborts.extend(r for r in request_ids if self._results[r] is None)
+                    self._cond.notify_all()
+                    break
+                self._cond.wait(timeout=self._poll_s if should_stop is not None else None)
+            for request_id in request_ids:
+                self._stop_when.pop(request_id, None)
+            results = [self._results.pop(r) for r in request_ids]
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        # Request bị abort không có output; caller kiểm tra deadline sau khi gọi
+        return [output for output in results if output is not None]
+
+    def _fail(self, request_ids, exc: Exception) -> None:
+        with self._cond:
+            for request_id in request_ids:
+                if request_id in self._results and self._results[request_id] is None:
+                    self._results[request_id] = exc
+            self._cond.notify_all()
+
+    def _step_loop(self) -> None:
+        engine = self._llm_engine
+        in_flight = set()  # request đã add vào engine, chưa xong/abort
+        while True:
+            with self._cond:
+                while not (self._incoming or self._aborts or engine.has_unfinished_requests()):
+                    self._cond.wait()
+                incoming, self._incoming = self._incoming, []
+                aborts, self._aborts = self._aborts, []
+            for request_id, prompt, params in incoming:
+                try:
+                    engine.add_request(request_id, prompt, params)
+                except Exception as exc:  # noqa: BLE001
+                    # vd. ValueError khi prompt dài hơn max_model_len: chỉ request này lỗi
+                    self._fail([request_id], exc)
+                else:
+                    in_flight.add(request_id)
+            if aborts:
+                engine.abort_request(aborts)
+                in_flight.difference_update(aborts)
+            if not engine.has_unfinished_requests():
+                continue
+            try:
+                outputs = engine.step()
+            except Exception as exc:  # noqa: BLE001
+                # Trạng thái các request đang chạy không còn tin được: báo lỗi và abort tất cả
+                logger.exception("vLLM step failed; failing %d in-flight requests", len(in_flight))
+                failed = list(in_flight)
+                in_flight.clear()
+                self._fail(failed, exc)
+                try:
+                    engine.abort_request(failed)
+                except Exception:  # noqa: BLE001
+                    logger.exception("vLLM abort after failed step also failed")
+                continue
+            with self._cond:
+                for output in outputs:
+                    request_id = output.request_id
+                    if output.finished:
+                        in_flight.discard(request_id)
+                    if request_id not in self._results or self._results[request_id] is not None:
+                        continue
+                    if output.finished:
+                        self._results[request_id] = output
+                        continue
+                    stop_when = self._stop_when.get(request_id)
+                    if stop_when is not None and stop_when(output.outputs[0].text):
+                        # Giữ text đã sinh làm kết quả, abort ở vòng lặp kế tiếp
+                        self._results[request_id] = output
+                        self._aborts.append(request_id)
+                self._cond.notify_all()
+
+
+def load_vllm_engine(settings: Settings) -> SteppedVLLMEngine:
+    from vllm import LLM as VLLMEngine
+
+    if settings.hf_token:
+        os.environ["HUGGING_FACE_HUB_TOKEN"] = settings.hf_token
+
+    logger.info("Loading VLLM engine for %s", settings.model_id)
+    quantization: Dict[str, Any] = {}
+    if settings.vllm_quantization:
+        quantization["quantization"] = settings.vllm_quantization
+        # Model quantize sẵn bằng bitsandbytes bắt buộc load_format="bitsandbytes"
+        if settings.vllm_quantization == "bitsandbytes":
+            quantization["load_format"] = "bitsandbytes"
+    engine = VLLMEngine(
+        model=settings.model_id,
+        tokenizer=settings.model_id,
+        trust_remote_code=True,
+        download_dir=str(settings.model_cache_dir),
+        revision=settings.model_revision,
+        dtype=settings.dtype,
+        gpu_memory_utilization=settings.gpu_memory_utilization,
+        tensor_parallel_size=settings.tensor_parallel_size,
+        enforce_eager=settings.vllm_enforce_eager,
+        max_model_len=settings.max_model_len,
+        **quantization,
+    )
+    return SteppedVLLMEngine(engine)
+
+
+@register_backend("vllm")
+def _build_vllm_backend(settings: Settings) -> EngineBackend:
+    from vllm import SamplingParams
+
+    return EngineBackend(load_vllm_engine(settings), sampling_params_factory=SamplingParams, name="vllm")
@@ -0,0 +1,233 @@
+"""
+Trả lời offline hàng loạt câu hỏi qua MedAssistantPipeline.ask_batch.
+
+Input:
+- .jsonl: mỗi dòng {"question": ..., "id"?: ..., "session_id"?: ...}; thiếu session_id
+  thì mỗi câu là một session riêng.
+- .txt: định dạng test_questions.txt — phần đầu là câu hỏi đơn, các phần sau
+  (ngăn bởi dòng ----/////) là hội thoại nhiều lượt trong cùng session.
+
+Mỗi batch lấy lượt kế tiếp của tối đa --batch-size session khác nhau, nên các lượt
+hội thoại vẫn chạy tuần tự còn câu hỏi độc lập được gộp để router, retrieval và
+sinh câu trả lời đi thành một lời gọi engine. Kết quả ghi nối tiếp vào JSONL và
+fsync sau mỗi batch; chạy lại cùng --output sẽ bỏ qua id đã xong (record có
+"error" được chạy lại) và nạp lại lịch sử hội thoại trước khi tiếp tục.
+
+Usage:
+    python -m src.batch_qa --input test_questions.txt --output results.jsonl
+    python -m src.batch_qa --input questions.jsonl --output results.jsonl --batch-size 64
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+_SEPARATOR = re.compile(r"^[-/=]{5,}\s*$")
+_NUMBERED = re.compile(r"^\d+\.\s*")
+
+
+@dataclass
+class BatchItem:
+    id: str
+    question: str
+    session_id: str
+
+
+def split_question_sections(text: str) -> List[List[str]]:
+    """Tách file câu hỏi dạng test_questions.txt thành các phần (bỏ dòng trống, dòng '→', số thứ tự)."""
+    sections: List[List[str]] = [[]]
+    for raw in text.splitlines():
+        line = raw.strip()
+        if _SEPARATOR.match(line):
+            sections.append([])
+            continue
+        if not line or line.startswith("→"):
+            continue
+        sections[-1].append(_NUMBERED.sub("", line))
+    return [s for s in sections if s]
+
+
+def read_items(path: Path) -> List[BatchItem]:
+    path = Path(path)
+    items: List[BatchItem] = []
+    if path.suffix == ".jsonl":
+        with path.open(encoding="utf-8") as handle:
+            for line_no, line in enumerate(handle, start=1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                item_id = str(record.get("id", f"q{line_no:05d}"))
+                items.append(
+                    BatchItem(item_id, record["question"], str(record.get("session_id") or f"batch-{item_id}"))
+                )
+    else:
+        sections = split_question_sections(path.read_text(encoding="utf-8"))
+        for section_no, section in enumerate(sections):
+            for question in section:
+                item_id = f"q{len(items) + 1:05d}"
+                session_id = f"batch-{item_id}" if section_no == 0 else f"batch-conv{section_no}"
+                items.append(BatchItem(item_id, question, session_id))
+    ids = [item.id for item in items]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"Duplicate question ids in {path}")
+    return items
+
+
+def plan_batches(items: Sequence[BatchItem], batch_size: int) -> Iterator[List[BatchItem]]:
+    """Mỗi batch lấy lượt kế tiếp của tối đa batch_size session, giữ thứ tự lượt trong session."""
+    queues: "OrderedDict[str, List[BatchItem]]" = OrderedDict()
+    for item in items:
+        queues.setdefault(item.session_id, []).append(item)
+    while queues:
+        batch = []
+        for session_id in list(queues)[: max(1, batch_size)]:
+            batch.append(queues[session_id].pop(0))
+            if not queues[session_id]:
+                del queues[session_id]
+        # Session vừa chạy xuống cuối hàng để session khác cũng có lượt
+        for item in batch:
+            if item.session_id in queues:
+                queues.move_to_end(item.session_id)
+        yield batch
+
+
+def load_checkpoint(path: Path) -> Dict[str, Dict]:
+    """
+    Đọc record đã ghi (record sau ghi đè record trước cùng id). Dòng cuối bị cắt dở
+    (process chết giữa lúc ghi) được truncate để lần ghi tiếp theo nối tiếp đúng chỗ.
+    """
+    path = Path(path)
+    records: Dict[str, Dict] = {}
+    if not path.exists():
+        return records
+    valid_bytes = 0
+    with path.open("rb") as handle:
+        for line in handle:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            records[str(record["id"])] = record
+            valid_bytes += len(line)
+    if valid_bytes < path.stat().st_size:
+        logger.warning("Batch QA: truncating partial record at byte %d of %s", valid_bytes, path)
+        with path.open("r+b") as handle:
+            handle.truncate(valid_bytes)
+    return records
+
+
+def to_record(item: BatchItem, response: Dict) -> Dict:
+    return {
+        "id": item.id,
+        "session_id": item.session_id,
+        "question": item.question,
+        "answer": response.get("answer"),
+        "confidence": response.get("confidence"),
+        "intent": response.get("intent"),
+        "action": response.get("action"),
+        "warning": response.get("warning"),
+        "output_guard_flagged": response.get("output_guard_flagged"),
+        "cache_hit": response.get("cache_hit"),
+        "context_pmids": [doc.get("pmid") for doc in response.get("context_docs") or []],
+        "trace_id": response.get("trace_id"),
+        "timings_ms": response.get("timings_ms"),
+    }
+
+
+def _answer_batch(pipeline, batch: List[BatchItem], **kwargs) -> List[Dict]:
+    try:
+        responses = pipeline.ask_batch([(item.question, item.session_id) for item in batch], **kwargs)
+        return [to_record(item, response) for item, response in zip(batch, responses)]
+    except Exception as exc:  # noqa: BLE001
+        if len(batch) == 1:
+            logger.exception("Batch QA: %s failed", batch[0].id)
+            item = batch[0]
+            return [{"id": item.id, "session_id": item.session_id, "question": item.question, "error": str(exc)}]
+        # Chạy lại từng câu để một câu lỗi không làm hỏng cả batch
+        logger.warning("Batch QA: batch of %d failed (%s), retrying one by one", len(batch), exc)
+        records = []
+        for item in batch:
+            records.extend(_answer_batch(pipeline, [item], **kwargs))
+        return records
+
+
+def run_batch(
+    pipeline,
+    items: Sequence[BatchItem],
+    output: Path,
+    *,
+    batch_size: int = 32,
+    max_new_tokens: Optional[int] = None,
+    top_k: Optional[int] = None,
+) -> Dict:
+    """Chạy các item chưa có kết quả trong output, trả về thống kê (questions/sec tính trên phần vừa chạy)."""
+    output = Path(output)
+    completed = load_checkpoint(output)
+    done = {item_id for item_id, record in completed.items() if "error" not in record}
+    # Nạp lại lịch sử của các lượt đã xong để lượt hội thoại tiếp theo có đúng context
+    for item in items:
+        if item.id in done:
+            pipeline.memory_manager.save_exchange(item.session_id, item.question, completed[item.id]["answer"])
+    pending = [item for item in items if item.id not in done]
+    if done:
+        logger.info("Batch QA: resuming, %d done, %d pending", len(items) - len(pending), len(pending))
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    answered = errors = 0
+    started = time.perf_counter()
+    with output.open("a", encoding="utf-8") as handle:
+        for batch in plan_batches(pending, batch_size):
+            records = _answer_batch(pipeline, batch, max_new_tokens=max_new_tokens, top_k=top_k)
+            for record in records:
+                handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+                errors += "error" in record
+            handle.flush()
+            os.fsync(handle.fileno())
+            answered += len(records)
+            logger.info("Batch QA: %d/%d answered", answered, len(pending))
+    elapsed = time.perf_counter() - started
+    return {
+        "total": len(items),
+        "skipped": len(items) - len(pending),
+        "answered": answered,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "questions_per_s": round(answered / elapsed, 3) if elapsed > 0 else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", type=Path, required=True, help="File .jsonl hoặc .txt")
+    parser.add_argument("--output", type=Path, required=True, help="JSONL kết quả (kiêm checkpoint)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-new-tokens", type=int, default=None)
+    parser.add_argument("--top-k", type=int, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    from .pipeline import MedAssistantPipeline
+
+    stats = run_batch(
+        MedAssistantPipeline(),
+        read_items(args.input),
+        args.output,
+        batch_size=args.batch_size,
+        max_new_tokens=args.max_new_tokens,
+        top_k=args.top_k,
+    )
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from functools import lru_cache
 from pathlib import Path
-from typing import Tuple
+from typing import Dict, Tuple
 
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -22,7 +22,20 @@ class Settings(BaseSettings):
     model_cache_dir: Path = Field(
         default=Path(".cache") / "models", alias="MODEL_CACHE_DIR"
     )
+    # "vllm" (GPU), "transformers" (CPU, Hugging Face) hoặc "mock" (test, không cần model)
+    generation_backend: str = Field(default="vllm", alias="GENERATION_BACKEND")
+    mock_token_latency_ms: float = Field(default=0.0, alias="MOCK_TOKEN_LATENCY_MS")
+    # Độ dài context tối đa (prompt + output) của mọi backend
+    max_model_len: int = Field(default=2048, alias="MAX_MODEL_LEN")
+    vllm_enforce_eager: bool = Field(default=True, alias="VLLM_ENFORCE_EAGER")
+    # MODEL_ID mặc định đã quantize sẵn bitsandbytes NF4; "" cho checkpoint không quantize
+    vllm_quantization: str = Field(default="bitsandbytes", alias="VLLM_QUANTIZATION")
+    # Backend transformers: checkpoint không quantize (mặc định dùng MODEL_ID), số thread torch (0 = mặc định)
+    cpu_model_id: str | None = Field(default=None, alias="CPU_MODEL_ID")
+    cpu_threads: int = Field(default=0, alias="CPU_THREADS")
+    cpu_dtype: str = Field(default="float32", alias="CPU_DTYPE")
 
+    rag_enabled: bool = Field(default=True, alias="RAG_ENABLED")
     rag_repo_id: str = Field(
         default="MidWin/pubmed-medcpt-faiss", alias="RAG_REPO_ID"
     )
@@ -45,19 +58,78 @@ class Settings(BaseSettings):
     rag_local_index_path: str | None = Field(
         default=None, alias="RAG_LOCAL_INDEX_PATH"
     )
+    rag_shard_cache_size: int = Field(default=10, alias="RAG_SHARD_CACHE_SIZE")
+    # Docstore nén theo block (python -m src.docstore): có file thì lấy document từ đây
+    # thay vì đọc shard Arrow; cache RAG_DOCSTORE_CACHE_BLOCKS block đã giải nén
+    rag_docstore_enabled: bool = Field(default=True, alias="RAG_DOCSTORE_ENABLED")
+    rag_docstore_file: str = Field(default="pubmed_docstore.bin", alias="RAG_DOCSTORE_FILE")
+    rag_docstore_cache_blocks: int = Field(default=512, alias="RAG_DOCSTORE_CACHE_BLOCKS")
+    rag_access_stats_enabled: bool = Field(default=True, alias="RAG_ACCESS_STATS_ENABLED")
+    rag_access_stats_flush_seconds: float = Field(
+        default=60.0, alias="RAG_ACCESS_STATS_FLUSH_SECONDS"
+    )
+    rag_preload_enabled: bool = Field(default=True, alias="RAG_PRELOAD_ENABLED")
+    rag_preload_budget_mb: float = Field(default=1024.0, alias="RAG_PRELOAD_BUDGET_MB")
     medcpt_encoder_id: str = Field(
         default="ncbi/MedCPT-Query-Encoder", alias="MEDCPT_ENCODER_ID"
     )
+    # "torch" | "torch_int8" | "onnx" | "onnx_int8" (xem src/query_encoder.py)
+    query_encoder_backend: str = Field(default="torch", alias="QUERY_ENCODER_BACKEND")
+    query_encoder_threads: int = Field(default=0, alias="QUERY_ENCODER_THREADS")  # 0 = mặc định runtime
+    query_encoder_max_length: int = Field(default=64, alias="QUERY_ENCODER_MAX_LENGTH")
+    query_encoder_onnx_dir: Path | None = Field(default=None, alias="QUERY_ENCODER_ONNX_DIR")
+    # BM25 inverted index (python -m src.lexical_index) dùng khi dense retrieval không dùng được
+    # hoặc để fuse (RRF) với kết quả dense theo keywords của router
+    rag_bm25_enabled: bool = Field(default=True, alias="RAG_BM25_ENABLED")
+    rag_bm25_dirname: str = Field(default="bm25_index", alias="RAG_BM25_DIRNAME")
+    rag_bm25_max_postings: int = Field(default=2_000, alias="RAG_BM25_MAX_POSTINGS")
+    rag_bm25_min_score: float = Field(default=1.0, alias="RAG_BM25_MIN_SCORE")
+    rag_hybrid_enabled: bool = Field(default=False, alias="RAG_HYBRID_ENABLED")
+    rag_hybrid_candidates: int = Field(default=50, alias="RAG_HYBRID_CANDIDATES")
+    # Số query encode dense đồng thời tối đa; vượt quá thì trả lời bằng BM25 (0 = không giới hạn).
+    # Không có BM25 index thì chờ slot tối đa RAG_DENSE_WAIT_S giây thay vì trả về không có tài liệu
+    rag_dense_max_concurrency: int = Field(default=0, alias="RAG_DENSE_MAX_CONCURRENCY")
+    rag_dense_wait_s: float = Field(default=10.0, alias="RAG_DENSE_WAIT_S")
+    # Gộp abstract gần trùng lặp (SimHash, xem src/dedup.py) và bù từ candidate over-fetch
+    rag_dedup_enabled: bool = Field(default=True, alias="RAG_DEDUP_ENABLED")
+    rag_dedup_max_hamming: int = Field(default=10, alias="RAG_DEDUP_MAX_HAMMING")
+    rag_dedup_overfetch: float = Field(default=2.0, alias="RAG_DEDUP_OVERFETCH")
+    rag_dedup_signatures_file: str = Field(
+        default="simhash_signatures.npy", alias="RAG_DEDUP_SIGNATURES_FILE"
+    )
     rag_top_k: int = Field(default=5, alias="RAG_TOP_K")
     rag_score_threshold: float = Field(
         default=0.5, alias="RAG_SCORE_THRESHOLD"  # Tăng ngưỡng để lọc bớt tài liệu không liên quan
     )
     max_context_chars: int = Field(default=4500, alias="MAX_CONTEXT_CHARS")
+    # "langchain" (ConversationBufferMemory) hoặc "builtin" (không cần langchain)
+    memory_backend: str = Field(default="langchain", alias="MEMORY_BACKEND")
+    # Số session giữ trong RAM (LRU, bỏ cả lịch sử của session cũ nhất đang rảnh); 0 = không giới hạn
+    memory_max_sessions: int = Field(default=0, alias="MEMORY_MAX_SESSIONS")
     history_embedding_model: str = Field(
         default="sentence-transformers/all-MiniLM-L6-v2",
         alias="HISTORY_EMBEDDING_MODEL",
     )
     history_top_k: int = Field(default=3, alias="HISTORY_TOP_K")
+    history_selection_enabled: bool = Field(
+        default=True, alias="HISTORY_SELECTION_ENABLED"
+    )
+    history_answer_max_chars: int = Field(
+        default=400, alias="HISTORY_ANSWER_MAX_CHARS"
+    )
+    # Tắt mặc định: HISTORY_EMBEDDING_MODEL mặc định là model tiếng Anh, nên bật kèm model đa ngôn ngữ
+    semantic_cache_enabled: bool = Field(
+        default=False, alias="SEMANTIC_CACHE_ENABLED"
+    )
+    semantic_cache_threshold: float = Field(
+        default=0.92, alias="SEMANTIC_CACHE_THRESHOLD"
+    )
+    semantic_cache_max_entries: int = Field(
+        default=2048, alias="SEMANTIC_CACHE_MAX_ENTRIES"
+    )
+    semantic_cache_ttl_seconds: float = Field(
+        default=3600.0, alias="SEMANTIC_CACHE_TTL_SECONDS"
+    )
     noise_keywords: Tuple[str, ...] = Field(
         default=(
             "covid", "sars-cov-2", "sars", "coronavirus", "pandemic", "vaccin",
@@ -85,6 +157,20 @@ class Settings(BaseSettings):
         default=1.15, alias="REPETITION_PENALTY"
     )
     max_new_tokens: int = Field(default=1024, alias="MAX_NEW_TOKENS")
+    # Trần max_new_tokens của câu trả lời theo intent router (JSON trong env); intent
+    # không có trong bảng dùng MAX_NEW_TOKENS
+    max_new_tokens_by_intent: Dict[str, int] = Field(
+        default={
+            "GENERAL_MEDICAL_QA": 768,
+            "USER_INPUT_ANALYSIS": 768,
+            "PERSONAL_DB_QUERY": 512,
+            "CONTEXT_FOLLOWUP": 384,
+        },
+        alias="MAX_NEW_TOKENS_BY_INTENT",
+    )
+    # Truyền STOP_MARKERS làm stop string và dừng khi section header lặp ngay lúc decode,
+    # thay vì sinh hết rồi để postprocess_answer cắt bỏ
+    engine_stop_enabled: bool = Field(default=True, alias="ENGINE_STOP_ENABLED")
     gpu_memory_utilization: float = Field(
         default=0.7, alias="GPU_MEMORY_UTILIZATION"  # Match working test code
     )
@@ -96,6 +182,70 @@ class Settings(BaseSettings):
         default=True, alias="ENABLE_SAFETY_GUARD"
     )
 
+    warmup_enabled: bool = Field(default=True, alias="WARMUP_ENABLED")
+    warmup_max_workers: int = Field(default=4, alias="WARMUP_MAX_WORKERS")
+    warmup_prompts: Tuple[str, ...] = Field(
+        default=(
+            "Bệnh tiểu đường type 2 là gì?",
+            "Tôi bị đau đầu 3 ngày nay, có sao không?",
+        ),
+        alias="WARMUP_PROMPTS",
+    )
+
+    # Self-correction (SELF_CORRECTION_PROMPT) chỉ chạy khi draft có confidence trung bình
+    # < MIN_CONFIDENCE hoặc có đoạn >= MAX_LOW_SPAN token liên tiếp với xác suất < LOW_TOKEN_PROB;
+    # các request cùng lúc được gom batch trong BATCH_WAIT_MS
+    self_correction_enabled: bool = Field(default=False, alias="SELF_CORRECTION_ENABLED")
+    self_correction_min_confidence: float = Field(default=0.6, alias="SELF_CORRECTION_MIN_CONFIDENCE")
+    self_correction_low_token_prob: float = Field(default=0.3, alias="SELF_CORRECTION_LOW_TOKEN_PROB")
+    self_correction_max_low_span: int = Field(default=8, alias="SELF_CORRECTION_MAX_LOW_SPAN")
+    self_correction_max_new_tokens: int = Field(default=384, alias="SELF_CORRECTION_MAX_NEW_TOKENS")
+    self_correction_batch_size: int = Field(default=16, alias="SELF_CORRECTION_BATCH_SIZE")
+    self_correction_batch_wait_ms: float = Field(default=10.0, alias="SELF_CORRECTION_BATCH_WAIT_MS")
+
+    # Admission control + hàng đợi ưu tiên trước engine (src/scheduler.py). Tổng
+    # max_running + max_queue + emergency_queue nên <= threadpool của FastAPI (40)
+    scheduler_enabled: bool = Field(default=True, alias="SCHEDULER_ENABLED")
+    scheduler_max_running: int = Field(default=8, alias="SCHEDULER_MAX_RUNNING")
+    scheduler_max_queue: int = Field(default=24, alias="SCHEDULER_MAX_QUEUE")
+    scheduler_emergency_queue: int = Field(default=8, alias="SCHEDULER_EMERGENCY_QUEUE")
+    scheduler_max_per_session: int = Field(default=4, alias="SCHEDULER_MAX_PER_SESSION")
+    scheduler_min_retry_after_s: float = Field(default=1.0, alias="SCHEDULER_MIN_RETRY_AFTER_S")
+
+    # Deadline mỗi request (src/deadline.py): header X-Request-Timeout (giây, không vượt
+    # REQUEST_TIMEOUT_S) hoặc REQUEST_TIMEOUT_S; client ngắt kết nối cũng huỷ request
+    request_deadline_enabled: bool = Field(default=True, alias="REQUEST_DEADLINE_ENABLED")
+    request_timeout_s: float = Field(default=120.0, alias="REQUEST_TIMEOUT_S")  # 0 = không giới hạn
+    # Ước lượng ms/token ban đầu (sau đó lấy EWMA đo được) để cắt max_new_tokens cho vừa deadline
+    deadline_token_ms: float = Field(default=30.0, alias="DEADLINE_TOKEN_MS")
+    deadline_min_answer_tokens: int = Field(default=32, alias="DEADLINE_MIN_ANSWER_TOKENS")
+    deadline_reserve_s: float = Field(default=0.2, alias="DEADLINE_RESERVE_S")
+    disconnect_poll_s: float = Field(default=0.1, alias="DISCONNECT_POLL_S")
+
+    # Response của /v1/chat/completions: "full" | "compact" | "ids" khi request không chỉ định
+    response_mode: str = Field(default="full", alias="RESPONSE_MODE")
+    response_compact_abstract_chars: int = Field(default=240, alias="RESPONSE_COMPACT_ABSTRACT_CHARS")
+    # Nén gzip response lớn hơn ngưỡng (byte) khi client gửi Accept-Encoding: gzip; 0 = tắt
+    response_gzip_min_bytes: int = Field(default=1024, alias="RESPONSE_GZIP_MIN_BYTES")
+    response_gzip_level: int = Field(default=6, alias="RESPONSE_GZIP_LEVEL")
+
+    # Profile request (src/profiling.py): header X-Profile: 1 (khi PROFILE_HEADER_ENABLED) hoặc
+    # lấy mẫu ngẫu nhiên PROFILE_SAMPLE_RATE; cả hai tắt thì không có overhead
+    profile_sample_rate: float = Field(default=0.0, alias="PROFILE_SAMPLE_RATE")
+    profile_header_enabled: bool = Field(default=False, alias="PROFILE_HEADER_ENABLED")
+    profile_mode: str = Field(default="cprofile", alias="PROFILE_MODE")  # "cprofile" | "sample"
+    profile_sample_interval_ms: float = Field(default=5.0, alias="PROFILE_SAMPLE_INTERVAL_MS")
+    profile_dir: Path = Field(default=Path(".cache") / "profiles", alias="PROFILE_DIR")
+    profile_max_files: int = Field(default=50, alias="PROFILE_MAX_FILES")
+    # Báo cáo bộ nhớ theo thành phần (src/memory_report.py): log mỗi MEMORY_REPORT_INTERVAL_S
+    # giây (0 = tắt); MEMORY_TRACEMALLOC_FRAMES > 0 bật tracemalloc lúc khởi động để
+    # /admin/memory trả top-N dòng code tăng bộ nhớ giữa hai lần gọi (làm chậm mọi allocation)
+    memory_report_interval_s: float = Field(default=600.0, alias="MEMORY_REPORT_INTERVAL_S")
+    memory_tracemalloc_frames: int = Field(default=0, alias="MEMORY_TRACEMALLOC_FRAMES")
+    memory_tracemalloc_top: int = Field(default=10, alias="MEMORY_TRACEMALLOC_TOP")
+    # Token cho các endpoint /admin/* (header X-Admin-Token); None = tắt các endpoint này
+    admin_token: str | None = Field(default=None, alias="ADMIN_TOKEN")
+
     server_host: str = Field(default="0.0.0.0", alias="SERVER_HOST")
     server_port: int = Field(default=8080, alias="SERVER_PORT")
     log_level: str = Field(default="info", alias="LOG_LEVEL")
@@ -0,0 +1,56 @@
+"""
+Deadline cho từng request chat.
+
+Budget lấy từ header X-Request-Timeout (giây) hoặc REQUEST_TIMEOUT_S. Pipeline gọi
+check() giữa các stage; scheduler và engine nhận `should_stop` để bỏ chờ slot / abort
+generation đang chạy khi hết giờ hoặc client ngắt kết nối (API gọi cancel()).
+"""
+from __future__ import annotations
+
+import math
+import threading
+import time
+from typing import Callable, Optional
+
+TIMEOUT = "timeout"
+CLIENT_DISCONNECTED = "client_disconnected"
+
+
+class DeadlineExceeded(RuntimeError):
+    """Request dừng giữa chừng; reason là TIMEOUT hoặc CLIENT_DISCONNECTED."""
+
+    def __init__(self, stage: str, reason: str = TIMEOUT):
+        super().__init__(f"Request stopped before {stage}: {reason}")
+        self.stage = stage
+        self.reason = reason
+
+
+class Deadline:
+    def __init__(self, timeout_s: Optional[float], *, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self.timeout_s = timeout_s if timeout_s and timeout_s > 0 else None
+        self._expires_at = clock() + self.timeout_s if self.timeout_s else math.inf
+        self._cancelled = threading.Event()
+        self.reason: Optional[str] = None
+
+    def remaining(self) -> float:
+        if self._cancelled.is_set():
+            return 0.0
+        return max(0.0, self._expires_at - self._clock())
+
+    def cancel(self, reason: str = CLIENT_DISCONNECTED) -> None:
+        if not self._cancelled.is_set():
+            self.reason = reason
+            self._cancelled.set()
+
+    def should_stop(self) -> bool:
+        if self._cancelled.is_set():
+            return True
+        if self._clock() >= self._expires_at:
+            self.cancel(TIMEOUT)
+            return True
+        return False
+
+    def check(self, stage: str) -> None:
+        if self.should_stop():
+            raise DeadlineExceeded(stage, self.reason or TIMEOUT)
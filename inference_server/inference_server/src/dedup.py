@@ -0,0 +1,114 @@
+"""
+Gộp abstract gần trùng lặp (errata, tái bản, bản hội nghị) khi retrieve.
+
+Mỗi document có một SimHash 64 bit trên shingle 3 từ của title + abstract.
+Hai document có khoảng cách Hamming <= RAG_DEDUP_MAX_HAMMING được coi là một:
+chỉ giữ bản có rank cao nhất, chỗ trống được bù bằng candidate over-fetch
+(top_k × RAG_DEDUP_OVERFETCH).
+
+Signatures được tính offline cho toàn corpus (uint64 theo global row, đọc bằng mmap):
+    python -m src.dedup --dataset-dir .cache/rag/pubmed_ds_embedded --out .cache/rag/simhash_signatures.npy
+Không có file thì retriever tính SimHash từ text của các candidate lúc query.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import logging
+import time
+from pathlib import Path
+from typing import Callable, List, Sequence, Tuple, TypeVar
+
+import numpy as np
+
+from .lexical_index import iter_shard_texts, tokenize
+
+logger = logging.getLogger(__name__)
+
+SHINGLE_SIZE = 3
+_BITS = np.arange(64, dtype=np.uint64)
+
+T = TypeVar("T")
+
+
+def _shingles(tokens: List[str], size: int) -> List[str]:
+    if len(tokens) <= size:
+        return [" ".join(tokens)] if tokens else []
+    return [" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)]
+
+
+def simhash(text: str, *, shingle_size: int = SHINGLE_SIZE) -> int:
+    shingles = _shingles(tokenize(text), shingle_size)
+    if not shingles:
+        return 0
+    digests = b"".join(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest() for s in shingles)
+    hashes = np.frombuffer(digests, dtype=np.uint64)
+    bits = (hashes[:, None] >> _BITS) & np.uint64(1)
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(shingles)
+    return int(np.sum(np.where(votes > 0, np.uint64(1) << _BITS, np.uint64(0)), dtype=np.uint64))
+
+
+def hamming(a: int, b: int) -> int:
+    return (int(a) ^ int(b)).bit_count()
+
+
+def collapse_near_duplicates(
+    items: Sequence[T],
+    signature: Callable[[T], int],
+    *,
+    max_distance: int,
+    limit: int,
+) -> Tuple[List[T], int]:
+    """
+    Duyệt items theo rank, bỏ item gần trùng (Hamming <= max_distance) với item đã giữ.
+    Dừng khi đủ limit item. Trả về (items giữ lại, số item bị gộp).
+    """
+    kept: List[T] = []
+    kept_signatures: List[int] = []
+    dropped = 0
+    for item in items:
+        if len(kept) >= limit:
+            break
+        sig = signature(item)
+        if any(hamming(sig, other) <= max_distance for other in kept_signatures):
+            dropped += 1
+            continue
+        kept.append(item)
+        kept_signatures.append(sig)
+    return kept, dropped
+
+
+def build_signatures(dataset_dir: Path, out_path: Path) -> int:
+    """SimHash cho mọi row theo thứ tự global (cùng thứ tự FAISS/BM25), ghi ra .npy uint64."""
+    arrow_files = sorted(Path(dataset_dir).glob("data-*.arrow"))
+    if not arrow_files:
+        raise FileNotFoundError(f"No data-*.arrow shards in {dataset_dir}")
+    started = time.perf_counter()
+    parts = []
+    for arrow_file in arrow_files:
+        parts.append(np.fromiter((simhash(text) for text in iter_shard_texts(arrow_file)), dtype=np.uint64))
+        logger.info("SimHash: %s (%d docs)", arrow_file.name, len(parts[-1]))
+    signatures = np.concatenate(parts)
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_suffix(".tmp.npy")
+    np.save(tmp_path, signatures)
+    tmp_path.replace(out_path)
+    logger.info(
+        "SimHash signatures: %d docs in %.1fs -> %s",
+        len(signatures), time.perf_counter() - started, out_path,
+    )
+    return len(signatures)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Tính SimHash signatures cho các shard data-*.arrow")
+    parser.add_argument("--dataset-dir", type=Path, required=True)
+    parser.add_argument("--out", type=Path, required=True)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    build_signatures(args.dataset_dir, args.out)
+
+
+if __name__ == "__main__":
+    main()
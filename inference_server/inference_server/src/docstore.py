@@ -0,0 +1,281 @@
+"""
+Document store nén theo block cho truy cập ngẫu nhiên theo FAISS id, thay cho việc đọc
+lazy các shard Arrow của datasets (chỉ cần title/abstract/PMID của vài row mỗi query).
+
+Layout file (mặc định <RAG_CACHE_DIR>/pubmed_docstore.bin, little-endian):
+
+    header      # magic, version, codec, num_docs, num_blocks, offset các bảng (_HEADER)
+    blocks      # mỗi block: nhiều record liên tiếp, nén zstd (hoặc zlib) cả block
+    block table # num_blocks x (file offset u64, compressed bytes u32, raw bytes u32)
+    doc table   # num_docs x (block u32, offset trong block đã giải nén u32), index = FAISS id
+
+Record: PMID i64, độ dài title u32, độ dài abstract u32, rồi title + abstract UTF-8.
+Cả file được mmap; lấy k document = k lần đọc doc table + tối đa k lần giải nén block
+(block vừa giải nén nằm trong LRU cache, document cùng block chỉ giải nén một lần).
+
+Build offline từ các shard data-*.arrow (cùng thứ tự row với FAISS index):
+    python -m src.docstore --dataset-dir .cache/rag/pubmed_ds_embedded --out .cache/rag/pubmed_docstore.bin
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .arrow_shards import join_text, read_arrow_table
+
+try:  # zstandard là optional: không có thì build bằng zlib (đọc file zstd vẫn cần zstandard)
+    import zstandard
+except ImportError:  # pragma: no cover - phụ thuộc môi trường
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"MEDDOCS\x00"
+STORE_VERSION = 1
+CODEC_ZSTD = 1
+CODEC_ZLIB = 2
+CODECS = {"zstd": CODEC_ZSTD, "zlib": CODEC_ZLIB}
+# magic, version, codec, num_docs, num_blocks, block_table_offset, doc_table_offset
+_HEADER = struct.Struct("<8sIIQQQQ")
+_RECORD = struct.Struct("<qII")
+_DOC_ENTRY = struct.Struct("<II")
+_BLOCK_DTYPE = np.dtype([("offset", "<u8"), ("size", "<u4"), ("raw_size", "<u4")])
+_DOC_DTYPE = np.dtype([("block", "<u4"), ("offset", "<u4")])
+
+
+def iter_shard_rows(arrow_file: Path) -> Iterator[Tuple[str, str, int]]:
+    """(title, abstract, PMID) theo thứ tự row của shard."""
+    columns = read_arrow_table(arrow_file).select(["title", "abstract", "PMID"])
+    for batch in columns.to_batches(max_chunksize=8192):
+        titles, abstracts, pmids = (batch.column(i).to_pylist() for i in range(3))
+        for title, abstract, pmid in zip(titles, abstracts, pmids):
+            yield join_text(title), join_text(abstract), int(pmid or 0)
+
+
+def _compressor(codec: int, level: int):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("codec zstd cần zstandard (pip install zstandard)")
+        return zstandard.ZstdCompressor(level=level).compress
+    return lambda data: zlib.compress(data, min(level, 9))
+
+
+def build_docstore(
+    rows: Iterable[Tuple[str, str, int]],
+    out_path: Path,
+    *,
+    block_bytes: int = 16 * 1024,
+    codec: Optional[str] = None,
+    level: int = 9,
+) -> Dict:
+    """
+    Ghi rows (theo thứ tự FAISS id) thành docstore. RAM bị chặn bởi một block và block
+    table; doc table được ghi ra file tạm rồi nối vào cuối. Ghi file tạm rồi rename.
+    """
+    codec_name = codec or ("zstd" if zstandard is not None else "zlib")
+    codec_id = CODECS[codec_name]
+    compress = _compressor(codec_id, level)
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+
+    blocks: List[Tuple[int, int, int]] = []
+    num_docs = 0
+    raw_total = 0
+    fd, tmp_name = tempfile.mkstemp(dir=out_path.parent, prefix=out_path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as out, tempfile.TemporaryFile() as doc_table:
+            out.write(b"\x00" * _HEADER.size)
+            block = bytearray()
+
+            def flush() -> None:
+                nonlocal raw_total
+                if not block:
+                    return
+                payload = compress(bytes(block))
+                blocks.append((out.tell(), len(payload), len(block)))
+                out.write(payload)
+                raw_total += len(block)
+                block.clear()
+
+            for title, abstract, pmid in rows:
+                title_bytes, abstract_bytes = title.encode("utf-8"), abstract.encode("utf-8")
+                if block and len(block) + _RECORD.size + len(title_bytes) + len(abstract_bytes) > block_bytes:
+                    flush()
+                doc_table.write(_DOC_ENTRY.pack(len(blocks), len(block)))
+                block += _RECORD.pack(pmid, len(title_bytes), len(abstract_bytes))
+                block += title_bytes
+                block += abstract_bytes
+                num_docs += 1
+            flush()
+
+            block_table_offset = out.tell()
+            out.write(np.array(blocks, dtype=_BLOCK_DTYPE).tobytes())
+            doc_table_offset = out.tell()
+            doc_table.seek(0)
+            while chunk := doc_table.read(8 * 1024 * 1024):
+                out.write(chunk)
+            out.seek(0)
+            out.write(
+                _HEADER.pack(
+                    MAGIC, STORE_VERSION, codec_id, num_docs, len(blocks), block_table_offset, doc_table_offset
+                )
+            )
+        os.replace(tmp_name, out_path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+    size = out_path.stat().st_size
+    meta = {
+        "version": STORE_VERSION,
+        "codec": codec_name,
+        "level": level,
+        "num_docs": num_docs,
+        "num_blocks": len(blocks),
+        "block_bytes": block_bytes,
+        "raw_bytes": raw_total,
+        "file_bytes": size,
+        "ratio": round(raw_total / max(size, 1), 2),
+        "build_seconds": round(time.perf_counter() - started, 2),
+    }
+    logger.info("Docstore: %d docs, %d blocks, %.1f MB -> %s", num_docs, len(blocks), size / 1e6, out_path)
+    return meta
+
+
+class DocStore:
+    """Đọc docstore qua mmap; thread-safe, cache tối đa cache_blocks block đã giải nén (LRU)."""
+
+    def __init__(self, path: Path, *, cache_blocks: int = 512):
+        self.path = Path(path)
+        with open(self.path, "rb") as handle:
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, codec, num_docs, num_blocks, block_offset, doc_offset = _HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != STORE_VERSION:
+            self._mmap.close()
+            raise ValueError(f"{self.path} is not a docstore v{STORE_VERSION} file")
+        if codec == CODEC_ZSTD and zstandard is None:
+            self._mmap.close()
+            raise RuntimeError(f"{self.path} dùng zstd, cần zstandard (pip install zstandard)")
+        self.codec = codec
+        self.num_docs = num_docs
+        self.blocks = np.frombuffer(self._mmap, dtype=_BLOCK_DTYPE, count=num_blocks, offset=block_offset)
+        self.docs = np.frombuffer(self._mmap, dtype=_DOC_DTYPE, count=num_docs, offset=doc_offset)
+        self.cache_blocks = max(1, cache_blocks)
+        self._cache: "OrderedDict[int, bytes]" = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()  # ZstdDecompressor không dùng chung giữa các thread
+        self.decompressions = 0
+
+    @classmethod
+    def exists(cls, path: Path) -> bool:
+        path = Path(path)
+        if not path.is_file():
+            return False
+        with open(path, "rb") as handle:
+            return handle.read(len(MAGIC)) == MAGIC
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    def _decompress(self, data: bytes) -> bytes:
+        if self.codec == CODEC_ZLIB:
+            return zlib.decompress(data)
+        decompressor = getattr(self._local, "zstd", None)
+        if decompressor is None:
+            decompressor = self._local.zstd = zstandard.ZstdDecompressor()
+        return decompressor.decompress(data)
+
+    def _block(self, block_id: int) -> bytes:
+        with self._lock:
+            raw = self._cache.get(block_id)
+            if raw is not None:
+                self._cache.move_to_end(block_id)
+                return raw
+        offset, size, raw_size = self.blocks[block_id].item()
+        # Giải nén ngoài lock; hai thread cùng miss thì cùng giải nén (rẻ hơn chờ nhau)
+        raw = self._decompress(self._mmap[offset:offset + size])
+        if len(raw) != raw_size:
+            raise ValueError(f"Corrupt docstore block {block_id} in {self.path}")
+        with self._lock:
+            self.decompressions += 1
+            if block_id not in self._cache:
+                self._cache[block_id] = raw
+                self._cache_bytes += len(raw)
+                while len(self._cache) > self.cache_blocks:
+                    _, evicted = self._cache.popitem(last=False)
+                    self._cache_bytes -= len(evicted)
+        return raw
+
+    def get(self, doc_id: int) -> Optional[Dict]:
+        """{"title", "abstract", "PMID"} của FAISS id; None nếu ngoài phạm vi."""
+        if doc_id < 0 or doc_id >= self.num_docs:
+            return None
+        block_id, offset = self.docs[doc_id].item()
+        raw = self._block(block_id)
+        pmid, title_len, abstract_len = _RECORD.unpack_from(raw, offset)
+        start = offset + _RECORD.size
+        title = raw[start:start + title_len].decode("utf-8")
+        abstract = raw[start + title_len:start + title_len + abstract_len].decode("utf-8")
+        return {"title": title, "abstract": abstract, "PMID": pmid}
+
+    def get_many(self, doc_ids: Sequence[int]) -> List[Optional[Dict]]:
+        return [self.get(int(doc_id)) for doc_id in doc_ids]
+
+    def memory_stats(self) -> Dict:
+        with self._lock:
+            return {"bytes": self._cache_bytes, "count": len(self._cache), "max_blocks": self.cache_blocks}
+
+    def close(self) -> None:
+        # mmap chỉ đóng được khi không còn numpy view nào trỏ vào
+        self.blocks = self.docs = None
+        self._mmap.close()
+
+
+def build_from_shards(dataset_dir: Path, out_path: Path, **kwargs) -> Dict:
+    dataset_dir = Path(dataset_dir)
+    arrow_files = sorted(dataset_dir.glob("data-*.arrow"))
+    if not arrow_files:
+        raise FileNotFoundError(f"No data-*.arrow shards in {dataset_dir}")
+
+    def rows() -> Iterator[Tuple[str, str, int]]:
+        for arrow_file in arrow_files:
+            yield from iter_shard_rows(arrow_file)
+            logger.info("Docstore: packed %s", arrow_file.name)
+
+    meta = build_docstore(rows(), out_path, **kwargs)
+    meta["shards"] = [f.name for f in arrow_files]
+    return meta
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build docstore nén theo block từ các shard data-*.arrow")
+    parser.add_argument("--dataset-dir", type=Path, required=True)
+    parser.add_argument("--out", type=Path, required=True)
+    parser.add_argument("--block-kb", type=int, default=16)
+    parser.add_argument("--codec", choices=sorted(CODECS), default=None)
+    parser.add_argument("--level", type=int, default=9)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    meta = build_from_shards(
+        args.dataset_dir, args.out, block_bytes=args.block_kb * 1024, codec=args.codec, level=args.level
+    )
+    print(json.dumps(meta, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Embedding helper dùng chung cho semantic cache và history retrieval.
+
+Model `history_embedding_model` (mặc định all-MiniLM-L6-v2) chỉ được load
+khi thực sự cần encode lần đầu tiên.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Sequence
+
+import numpy as np
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryEmbedder:
+    """Wrapper quanh SentenceTransformer, trả về vector đã chuẩn hóa L2 (float32)."""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+
+                    logger.info("Loading history embedding model %s", self.model_name)
+                    self._model = SentenceTransformer(self.model_name, device="cpu")
+        return self._model
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        model = self._load()
+        vectors = model.encode(
+            list(texts),
+            batch_size=32,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
+        return np.asarray(vectors, dtype="float32")
+
+    def embed_one(self, text: str) -> np.ndarray:
+        return self.embed([text])[0]
+
+
+class EmbeddingBackoff:
+    """
+    Theo dõi lỗi embedding liên tiếp (thread-safe). Lỗi đầu tiên chỉ bỏ qua lần gọi đó; từ lỗi
+    thứ hai liên tiếp thì ngưng embed base_s, 2*base_s, 4*base_s... (tối đa max_s) để embedder
+    không load được không làm chậm mọi request. Một lần thành công đặt lại chuỗi lỗi.
+    """
+
+    def __init__(
+        self,
+        base_s: float = 1.0,
+        max_s: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.base_s = base_s
+        self.max_s = max_s
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.streak = 0
+        self.retry_at = 0.0
+
+    def ready(self) -> bool:
+        with self._lock:
+            return self._clock() >= self.retry_at
+
+    def failed(self) -> tuple[int, float]:
+        """Ghi nhận một lỗi; trả về (số lỗi liên tiếp, số giây ngưng thử)."""
+        with self._lock:
+            self.failures += 1
+            self.streak += 1
+            backoff = 0.0
+            if self.streak > 1:
+                backoff = min(self.base_s * 2 ** (self.streak - 2), self.max_s)
+            self.retry_at = self._clock() + backoff
+            return self.streak, backoff
+
+    def succeeded(self) -> None:
+        with self._lock:
+            self.streak = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "embed_failures": self.failures,
+                "embed_failure_streak": self.streak,
+                "embed_backoff_s": round(max(0.0, self.retry_at - self._clock()), 3),
+            }
+
+
+_embedder: Optional[HistoryEmbedder] = None
+_embedder_lock = threading.Lock()
+
+
+def get_history_embedder() -> HistoryEmbedder:
+    # lru_cache không chặn hai thread cùng tạo (và cùng load model) lúc miss đầu tiên
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = HistoryEmbedder(get_settings().history_embedding_model)
+    return _embedder
@@ -0,0 +1,269 @@
+"""
+BM25 inverted index trên title/abstract, build offline từ các shard data-*.arrow
+và đọc bằng memory mapping (np.load mmap_mode="r") nên gần như không tốn RAM.
+
+Layout thư mục index (mặc định <RAG_CACHE_DIR>/bm25_index):
+
+    meta.json        # num_docs, avgdl, num_buckets, k1, b
+    offsets.npy      # int64 (num_buckets + 1): postings của bucket t nằm ở [offsets[t], offsets[t+1])
+    doc_ids.npy      # uint32: global row index (cùng thứ tự với FAISS index)
+    tfs.npy          # uint16: term frequency
+    doc_lens.npy     # uint16: số token của từng document
+
+Term được hash (crc32) vào num_buckets bucket thay vì giữ vocab, nên không cần
+dict term -> id trong RAM. Postings của mỗi bucket được sắp theo impact BM25
+giảm dần; lúc query chỉ đọc max_postings phần tử đầu của mỗi term, giữ latency
+bị chặn kể cả với term rất phổ biến.
+
+Build:
+    python -m src.lexical_index --dataset-dir .cache/rag/pubmed_ds_embedded --out .cache/rag/bm25_index
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import re
+import shutil
+import tempfile
+import time
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+from .arrow_shards import join_text, read_arrow_table
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset(
+    (
+        "a an and are as at be by for from has have in is it its of on or that the this to was "
+        "were with we our not no but which these those than then there their been also can may "
+        "la va cua co cho khong nhung mot cac duoc voi toi ban thi bi gi nay"
+    ).split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = _TOKEN_RE.findall((text or "").lower())
+    return [t for t in tokens if len(t) > 1 and t not in _STOPWORDS]
+
+
+def term_bucket(term: str, num_buckets: int) -> int:
+    return zlib.crc32(term.encode("utf-8")) % num_buckets
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """RRF: score(d) = sum 1 / (k + rank). Trả về (doc_id, score) giảm dần."""
+    scores: dict = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class LexicalIndex:
+    def __init__(self, path: Path, *, max_postings: int = 2_000):
+        self.path = Path(path)
+        meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported BM25 index version {meta.get('version')} at {self.path}")
+        self.num_docs = int(meta["num_docs"])
+        self.avgdl = float(meta["avgdl"])
+        self.num_buckets = int(meta["num_buckets"])
+        self.k1 = float(meta["k1"])
+        self.b = float(meta["b"])
+        self.max_postings = max_postings
+        self.offsets = np.load(self.path / "offsets.npy", mmap_mode="r")
+        self.doc_ids = np.load(self.path / "doc_ids.npy", mmap_mode="r")
+        self.tfs = np.load(self.path / "tfs.npy", mmap_mode="r")
+        self.doc_lens = np.load(self.path / "doc_lens.npy", mmap_mode="r")
+
+    @classmethod
+    def exists(cls, path: Path) -> bool:
+        return (Path(path) / "meta.json").exists()
+
+    def disk_bytes(self) -> int:
+        return sum(f.stat().st_size for f in self.path.iterdir() if f.is_file())
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        """(global row index, BM25 score) của top_k document, score giảm dần."""
+        buckets = {term_bucket(t, self.num_buckets) for t in tokenize(query)}
+        if not buckets or top_k <= 0:
+            return []
+        doc_parts, score_parts = [], []
+        for bucket in buckets:
+            start, end = int(self.offsets[bucket]), int(self.offsets[bucket + 1])
+            df = end - start
+            if df == 0:
+                continue
+            end = min(end, start + self.max_postings)
+            docs = np.asarray(self.doc_ids[start:end])
+            tf = np.asarray(self.tfs[start:end], dtype=np.float32)
+            dl = np.asarray(self.doc_lens[docs], dtype=np.float32)
+            idf = np.log1p((self.num_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * dl / self.avgdl)
+            doc_parts.append(docs)
+            score_parts.append(idf * tf * (self.k1 + 1.0) / (tf + norm))
+        if not doc_parts:
+            return []
+        docs = np.concatenate(doc_parts)
+        scores = np.concatenate(score_parts)
+        unique, inverse = np.unique(docs, return_inverse=True)
+        totals = np.bincount(inverse, weights=scores)
+        k = min(top_k, len(unique))
+        top = np.argpartition(-totals, k - 1)[:k]
+        top = top[np.argsort(-totals[top], kind="stable")]
+        return [(int(unique[i]), float(totals[i])) for i in top]
+
+
+def iter_shard_texts(arrow_file: Path) -> Iterator[str]:
+    table = read_arrow_table(arrow_file)
+    for batch in table.select(["title", "abstract"]).to_batches(max_chunksize=8192):
+        for title, abstract in zip(batch.column(0).to_pylist(), batch.column(1).to_pylist()):
+            yield f"{join_text(title)} {join_text(abstract)}"
+
+
+def _postings_for_texts(
+    texts: Iterable[str], first_doc: int, num_buckets: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    buckets: List[int] = []
+    docs: List[int] = []
+    tfs: List[int] = []
+    lens: List[int] = []
+    doc_id = first_doc
+    for text in texts:
+        tokens = tokenize(text)
+        lens.append(min(len(tokens), 65_535))
+        counts = Counter(term_bucket(t, num_buckets) for t in tokens)
+        buckets.extend(counts.keys())
+        tfs.extend(min(c, 65_535) for c in counts.values())
+        docs.extend([doc_id] * len(counts))
+        doc_id += 1
+    return (
+        np.asarray(buckets, dtype=np.uint32),
+        np.asarray(docs, dtype=np.uint32),
+        np.asarray(tfs, dtype=np.uint16),
+        np.asarray(lens, dtype=np.uint16),
+    )
+
+
+def build_index(
+    dataset_dir: Path,
+    out_dir: Path,
+    *,
+    num_buckets: int = 1 << 22,
+    k1: float = 1.2,
+    b: float = 0.75,
+    sort_chunk: int = 20_000_000,
+) -> dict:
+    """
+    Build 2 pass, RAM bị chặn bởi một shard + sort_chunk postings:
+    1) tokenize từng shard -> postings tạm (bucket, doc, tf) ra file .npy
+    2) scatter vào mảng postings cuối (memmap) theo offsets, rồi sắp từng khối bucket theo impact
+    """
+    dataset_dir, out_dir = Path(dataset_dir), Path(out_dir)
+    arrow_files = sorted(dataset_dir.glob("data-*.arrow"))
+    if not arrow_files:
+        raise FileNotFoundError(f"No data-*.arrow shards in {dataset_dir}")
+    out_dir.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+
+    counts = np.zeros(num_buckets, dtype=np.int64)
+    doc_lens: List[np.ndarray] = []
+    num_docs = 0
+    with tempfile.TemporaryDirectory(dir=out_dir) as tmp:
+        parts: List[Path] = []
+        for shard_no, arrow_file in enumerate(arrow_files):
+            buckets, docs, tfs, lens = _postings_for_texts(
+                iter_shard_texts(arrow_file), num_docs, num_buckets
+            )
+            order = np.argsort(buckets, kind="stable")
+            part = Path(tmp) / f"part-{shard_no:05d}.npz"
+            np.savez(part, buckets=buckets[order], docs=docs[order], tfs=tfs[order])
+            parts.append(part)
+            counts += np.bincount(buckets, minlength=num_buckets)
+            doc_lens.append(lens)
+            num_docs += len(lens)
+            logger.info("BM25: tokenized %s (%d docs)", arrow_file.name, len(lens))
+
+        all_lens = np.concatenate(doc_lens)
+        avgdl = float(all_lens.mean()) if num_docs else 0.0
+        np.save(out_dir / "doc_lens.npy", all_lens)
+        offsets = np.zeros(num_buckets + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        np.save(out_dir / "offsets.npy", offsets)
+        total = int(offsets[-1])
+        doc_ids = np.lib.format.open_memmap(out_dir / "doc_ids.npy", mode="w+", dtype=np.uint32, shape=(total,))
+        tf_out = np.lib.format.open_memmap(out_dir / "tfs.npy", mode="w+", dtype=np.uint16, shape=(total,))
+
+        cursor = offsets[:-1].copy()
+        for part in parts:
+            with np.load(part) as data:
+                buckets, docs, tfs = data["buckets"], data["docs"], data["tfs"]
+            if not len(buckets):
+                continue
+            # Vị trí trong bucket = cursor[bucket] + thứ tự của entry trong nhóm cùng bucket
+            first = np.searchsorted(buckets, buckets, side="left")
+            pos = cursor[buckets] + (np.arange(len(buckets)) - first)
+            doc_ids[pos] = docs
+            tf_out[pos] = tfs
+            cursor += np.bincount(buckets, minlength=num_buckets)
+
+        # Sắp postings mỗi bucket theo impact giảm dần (đọc top max_postings lúc query)
+        start_bucket = 0
+        while start_bucket < num_buckets:
+            end_bucket = int(np.searchsorted(offsets, offsets[start_bucket] + sort_chunk, side="right")) - 1
+            end_bucket = min(num_buckets, max(end_bucket, start_bucket + 1))
+            lo, hi = int(offsets[start_bucket]), int(offsets[end_bucket])
+            if hi > lo:
+                docs = np.asarray(doc_ids[lo:hi])
+                tf = np.asarray(tf_out[lo:hi], dtype=np.float32)
+                dl = all_lens[docs].astype(np.float32)
+                impact = tf / (tf + k1 * (1.0 - b + b * dl / max(avgdl, 1e-6)))
+                owner = np.repeat(
+                    np.arange(start_bucket, end_bucket), np.diff(offsets[start_bucket:end_bucket + 1])
+                )
+                order = np.lexsort((-impact, owner))
+                doc_ids[lo:hi] = docs[order]
+                tf_out[lo:hi] = tf_out[lo:hi][order]
+            start_bucket = end_bucket
+        doc_ids.flush()
+        tf_out.flush()
+        del doc_ids, tf_out
+
+    meta = {
+        "version": INDEX_VERSION,
+        "num_docs": num_docs,
+        "avgdl": avgdl,
+        "num_buckets": num_buckets,
+        "k1": k1,
+        "b": b,
+        "postings": total,
+        "shards": [f.name for f in arrow_files],
+        "build_seconds": round(time.perf_counter() - started, 2),
+    }
+    (out_dir / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    logger.info("BM25 index: %d docs, %d postings -> %s", num_docs, total, out_dir)
+    return meta
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build BM25 index từ các shard data-*.arrow")
+    parser.add_argument("--dataset-dir", type=Path, required=True)
+    parser.add_argument("--out", type=Path, required=True)
+    parser.add_argument("--num-buckets", type=int, default=1 << 22)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.out.exists() and LexicalIndex.exists(args.out):
+        shutil.rmtree(args.out)
+    print(json.dumps(build_index(args.dataset_dir, args.out, num_buckets=args.num_buckets), indent=2))
+
+
+if __name__ == "__main__":
+    main()
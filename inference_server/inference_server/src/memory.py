@@ -7,13 +7,94 @@ Memory module theo chuẩn LangChain pattern:
 """
 from __future__ import annotations
 
-from typing import Dict
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
 
-from langchain.memory import ConversationBufferMemory
+import numpy as np
 
-from .config import get_settings
+from .config import Settings, get_settings
+from .embeddings import EmbeddingBackoff, HistoryEmbedder, get_history_embedder
+from .memory_report import estimate_bytes
 from .utils import format_history
 
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Message:
+    type: str
+    content: str
+
+
+class SimpleBufferMemory:
+    """
+    Buffer memory tối giản (MEMORY_BACKEND=builtin), cùng interface
+    load_memory_variables/save_context với ConversationBufferMemory.
+    """
+
+    def __init__(self, memory_key: str = "history"):
+        self.memory_key = memory_key
+        self.messages: List[_Message] = []
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, List[_Message]]:
+        return {self.memory_key: list(self.messages)}
+
+    def save_context(self, inputs: Dict[str, str], outputs: Dict[str, str]) -> None:
+        self.messages.append(_Message("human", inputs["input"]))
+        self.messages.append(_Message("ai", outputs["output"]))
+
+    def clear(self) -> None:
+        self.messages.clear()
+
+
+@dataclass
+class SessionTurnIndex:
+    """
+    Vector index các lượt hỏi-đáp của một session.
+    Mỗi lượt chỉ được embed một lần lúc save_exchange.
+    """
+
+    questions: List[str] = field(default_factory=list)
+    answers: List[str] = field(default_factory=list)
+    vectors: Optional[np.ndarray] = None  # (capacity, dim), chỉ dùng [:size]
+    embedded: List[bool] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    def add(self, question: str, answer: str, vector: Optional[np.ndarray]) -> None:
+        position = len(self.questions)
+        self.questions.append(question)
+        self.answers.append(answer)
+        self.embedded.append(vector is not None)
+        if vector is None:
+            return
+        if self.vectors is None:
+            self.vectors = np.zeros((16, vector.shape[0]), dtype="float32")
+        elif position >= self.vectors.shape[0]:
+            grown = np.zeros((self.vectors.shape[0] * 2, self.vectors.shape[1]), dtype="float32")
+            grown[: self.vectors.shape[0]] = self.vectors
+            self.vectors = grown
+        self.vectors[position] = vector
+
+    def top_k(self, query_vector: np.ndarray, k: int, exclude_last: bool = True) -> List[int]:
+        """Vị trí (theo thứ tự thời gian) của k lượt liên quan nhất."""
+        limit = len(self.questions) - (1 if exclude_last else 0)
+        if limit <= 0 or k <= 0 or self.vectors is None:
+            return []
+        positions = np.flatnonzero(np.asarray(self.embedded[:limit], dtype=bool))
+        if positions.size == 0:
+            return []
+        scores = self.vectors[positions] @ query_vector
+        if positions.size > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            positions = positions[best]
+        return sorted(int(p) for p in positions)
+
 
 class SessionMemoryManager:
     """
@@ -23,35 +104,130 @@ class SessionMemoryManager:
     - get_memory(session_id) -> Lấy hoặc tạo memory cho session
     - load_memory_variables() -> Retrieve lịch sử (tự động bởi LangChain)
     - save_context() -> Update lịch sử (tự động bởi LangChain)
+
+    Concurrency (worker thread của FastAPI gọi song song):
+    - _lock chỉ bảo vệ các dict _sessions/_turn_indexes/_session_locks/_pins (giữ rất ngắn).
+    - Dữ liệu của một session (memory + turn index) chỉ được đọc/ghi khi giữ
+      session_lock(session_id), nên một lượt save_exchange luôn thêm cặp hỏi-đáp vào cả
+      hai nơi một cách nguyên tử.
+    - Pipeline giữ session_lock suốt một lượt hỏi (đọc history -> sinh -> lưu), các lượt
+      cùng session chạy tuần tự còn các session khác chạy song song.
+    - Lock của session chỉ được lấy ra qua pin_session(): số pin tăng dưới _lock trước khi
+      trả lock, nên session đang được dùng hoặc chờ lock không bao giờ bị bỏ.
+
+    Giới hạn RAM (tuỳ chọn, MEMORY_MAX_SESSIONS > 0): giữ tối đa MEMORY_MAX_SESSIONS session,
+    thứ tự LRU theo session_lock()/get_memory(). Vượt quá thì bỏ session ít dùng nhất không
+    có pin, kèm toàn bộ lịch sử hội thoại của nó.
     """
     
-    def __init__(self):
-        self.settings = get_settings()
-        self._sessions: Dict[str, ConversationBufferMemory] = {}
+    def __init__(
+        self, settings: Settings | None = None, *, embedder: Optional[HistoryEmbedder] = None
+    ):
+        self.settings = settings or get_settings()
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Any] = {}
+        self._turn_indexes: Dict[str, SessionTurnIndex] = {}
+        # Thứ tự key = thứ tự LRU của session (mới dùng nhất ở cuối)
+        self._session_locks: "OrderedDict[str, threading.RLock]" = OrderedDict()
+        self._pins: Dict[str, int] = {}  # số người đang giữ hoặc chờ lock của session
+        self._embedder = embedder
+        self._embed_backoff = EmbeddingBackoff()
+
+    @contextmanager
+    def pin_session(self, session_id: str) -> Iterator[threading.RLock]:
+        """Giữ session khỏi bị bỏ trong lúc dùng; trả về lock (chưa acquire) của session."""
+        with self._lock:
+            lock = self._touch_locked(session_id)
+            self._pins[session_id] = self._pins.get(session_id, 0) + 1
+        try:
+            yield lock
+        finally:
+            with self._lock:
+                self._pins[session_id] -= 1
+                if not self._pins[session_id]:
+                    del self._pins[session_id]
+
+    @contextmanager
+    def session_lock(self, session_id: str) -> Iterator[threading.RLock]:
+        with self.pin_session(session_id) as lock, lock:
+            yield lock
 
-    def get_memory(self, session_id: str) -> ConversationBufferMemory:
+    def _touch_locked(self, session_id: str) -> threading.RLock:
+        lock = self._session_locks.get(session_id)
+        if lock is not None:
+            self._session_locks.move_to_end(session_id)
+            return lock
+        lock = self._session_locks[session_id] = threading.RLock()
+        limit = self.settings.memory_max_sessions
+        if limit > 0 and len(self._session_locks) > limit:
+            self._evict_locked(len(self._session_locks) - limit, keep=session_id)
+        return lock
+
+    def _evict_locked(self, count: int, keep: str) -> None:
+        """Bỏ tối đa count session cũ nhất không có pin (trừ session keep vừa được tạo)."""
+        evicted = []
+        for session_id in self._session_locks:
+            if len(evicted) >= count:
+                break
+            if session_id != keep and session_id not in self._pins:
+                evicted.append(session_id)
+        for session_id in evicted:
+            del self._session_locks[session_id]
+            self._sessions.pop(session_id, None)
+            self._turn_indexes.pop(session_id, None)
+
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        """None khi embedding lỗi hoặc đang backoff -> lượt đó chọn history theo thời gian."""
+        if not self._embed_backoff.ready():
+            return None
+        try:
+            embedder = self._embedder or get_history_embedder()
+            vector = embedder.embed_one(text)
+        except Exception as exc:
+            streak, backoff = self._embed_backoff.failed()
+            logger.warning(
+                "History embedding failed (%d in a row, retry in %.0fs), using recency only: %s",
+                streak,
+                backoff,
+                exc,
+            )
+            return None
+        self._embed_backoff.succeeded()
+        return vector
+
+    def get_memory(self, session_id: str):
         """
         Retrieve: Lấy memory instance cho session_id.
         Tạo mới nếu chưa tồn tại.
         """
-        if session_id not in self._sessions:
-            memory = ConversationBufferMemory(
-                memory_key="history",
-                return_messages=True,
-                ai_prefix="Bác sĩ AI",
-                human_prefix="Bệnh nhân",
-                max_token_limit=2000,  # Giới hạn token để tránh quá dài
-            )
+        with self._lock:
+            self._touch_locked(session_id)
+            memory = self._sessions.get(session_id)
+            if memory is not None:
+                return memory
+            if self.settings.memory_backend == "builtin":
+                memory = SimpleBufferMemory(memory_key="history")
+            else:
+                from langchain.memory import ConversationBufferMemory
+
+                memory = ConversationBufferMemory(
+                    memory_key="history",
+                    return_messages=True,
+                    ai_prefix="Bác sĩ AI",
+                    human_prefix="Bệnh nhân",
+                    max_token_limit=2000,  # Giới hạn token để tránh quá dài
+                )
             self._sessions[session_id] = memory
-        return self._sessions[session_id]
+            return memory
 
     def get_history_text(self, session_id: str) -> str:
         """
         Inject: Format lịch sử thành text để inject vào prompt.
         """
-        memory = self.get_memory(session_id)
         # load_memory_variables() là bước Retrieve của LangChain
-        history_messages = memory.load_memory_variables({}).get("history", [])
+        with self.session_lock(session_id):
+            memory = self.get_memory(session_id)
+            history_messages = memory.load_memory_variables({}).get("history", [])
         if not history_messages:
             return "Chưa có lịch sử hội thoại."
         return format_history(history_messages)
@@ -61,20 +237,66 @@ class SessionMemoryManager:
         Update: Lưu câu hỏi và câu trả lời vào memory.
         LangChain tự động quản lý việc lưu trữ.
         """
-        memory = self.get_memory(session_id)
-        # save_context() là bước Update của LangChain
-        memory.save_context(
-            {"input": question.strip()},
-            {"output": answer.strip()}
-        )
+        short_answer = answer.strip()[: self.settings.history_answer_max_chars]
+        vector = None
+        if self.settings.history_selection_enabled:
+            # Embed ngoài lock: chỉ phần ghi cần nguyên tử
+            vector = self._embed(f"{question.strip()}\n{short_answer}")
+        with self.session_lock(session_id):
+            # save_context() là bước Update của LangChain
+            memory = self.get_memory(session_id)
+            memory.save_context(
+                {"input": question.strip()},
+                {"output": answer.strip()}
+            )
+            if self.settings.history_selection_enabled:
+                with self._lock:
+                    turn_index = self._turn_indexes.setdefault(session_id, SessionTurnIndex())
+                turn_index.add(question.strip(), short_answer, vector)
+
+    def get_relevant_history(
+        self, session_id: str, query: str, top_k: Optional[int] = None
+    ) -> str:
+        """
+        Inject (có chọn lọc): chỉ lấy top_k lượt liên quan nhất với câu hỏi hiện tại
+        cộng với lượt gần nhất, giữ prompt có kích thước cố định dù session rất dài.
+        """
+        if not self.settings.history_selection_enabled:
+            return self.get_history_text(session_id)
+
+        with self.session_lock(session_id):
+            with self._lock:
+                turn_index = self._turn_indexes.get(session_id)
+            if turn_index is None or len(turn_index) == 0:
+                return "Chưa có lịch sử hội thoại."
+            return self._select_history(turn_index, query, top_k)
+
+    def _select_history(self, turn_index: SessionTurnIndex, query: str, top_k: Optional[int]) -> str:
+        k = self.settings.history_top_k if top_k is None else top_k
+        last = len(turn_index) - 1
+        if len(turn_index) <= k + 1:
+            positions = list(range(len(turn_index)))
+        else:
+            query_vector = self._embed(query)
+            if query_vector is not None:
+                positions = turn_index.top_k(query_vector, k)
+            else:
+                positions = list(range(last - k, last))
+            positions.append(last)
+
+        lines = []
+        for pos in positions:
+            lines.append(f"Bệnh nhân: {turn_index.questions[pos]}")
+            lines.append(f"Bác sĩ AI: {turn_index.answers[pos]}")
+        return "\n".join(lines)
 
     def get_recent_context(self, session_id: str, max_exchanges: int = 3) -> str:
         """
         Lấy N cuộc trao đổi gần nhất để làm context cho câu hỏi hiện tại.
         Giúp model hiểu context mà không cần ghép câu hỏi phức tạp.
         """
-        memory = self.get_memory(session_id)
-        messages = memory.load_memory_variables({}).get("history", [])
+        with self.session_lock(session_id):
+            messages = self.get_memory(session_id).load_memory_variables({}).get("history", [])
         
         if not messages:
             return ""
@@ -99,10 +321,37 @@ class SessionMemoryManager:
         return "\n".join(formatted_lines) if formatted_lines else ""
 
     def reset(self, session_id: str) -> None:
-        """Xóa memory của một session cụ thể."""
-        if session_id in self._sessions:
-            del self._sessions[session_id]
+        """Xóa memory của một session cụ thể (chờ lượt đang chạy của session đó xong)."""
+        with self.session_lock(session_id), self._lock:
+            self._sessions.pop(session_id, None)
+            self._turn_indexes.pop(session_id, None)
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """Số session/lượt và byte ước lượng của memory + turn index (không giữ lock khi đo)."""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            turn_indexes = list(self._turn_indexes.values())
+            locks = len(self._session_locks)
+        turns = 0
+        for memory in sessions:
+            messages = getattr(memory, "messages", None)
+            if messages is None:  # ConversationBufferMemory
+                messages = memory.chat_memory.messages
+            turns += len(messages) // 2
+        session_bytes = estimate_bytes(sessions)
+        index_bytes = estimate_bytes(turn_indexes)
+        return {
+            "bytes": session_bytes + index_bytes,
+            "count": len(sessions),
+            "turns": turns,
+            "locks": locks,
+            "memory_bytes": session_bytes,
+            "turn_index_bytes": index_bytes,
+            "max_sessions": self.settings.memory_max_sessions,
+        }
 
     def clear(self) -> None:
         """Xóa tất cả session memory."""
-        self._sessions.clear()
+        with self._lock:
+            self._sessions.clear()
+            self._turn_indexes.clear()
@@ -0,0 +1,136 @@
+"""
+Ước lượng bộ nhớ theo thành phần để tìm nguyên nhân RSS tăng dần.
+
+MemoryReporter.report() gom memory_stats() của các thành phần pipeline: sessions + turn
+index (SessionMemoryManager), shard Arrow trong cache (nbytes) hoặc docstore (mmap + cache
+block), FAISS index, query encoder,
+BM25/SimHash (mmap) và semantic cache. Byte của thành phần mmap (mapped=True) chỉ vào RSS
+khi trang được đọc nên tính riêng trong mapped_bytes. Khi tracemalloc được bật
+(MEMORY_TRACEMALLOC_FRAMES > 0), mỗi lần gọi report(tracemalloc_top=N) so snapshot hiện tại
+với snapshot lần gọi trước và trả top-N dòng code tăng bộ nhớ nhiều nhất.
+"""
+from __future__ import annotations
+
+import gc
+import sys
+import threading
+import tracemalloc
+from pathlib import Path
+from types import FunctionType, ModuleType
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+_SKIP_TYPES = (type, ModuleType, FunctionType, threading.Thread)
+_ATOMIC_TYPES = (str, bytes, bytearray, int, float, bool, complex, type(None))
+
+
+def estimate_bytes(obj: Any) -> int:
+    """
+    Tổng sys.getsizeof của obj và mọi object nó tham chiếu (gc.get_referents), mỗi object
+    đếm một lần; numpy array tính theo nbytes. Chỉ là ước lượng: không gồm bộ nhớ
+    của extension C không báo qua getsizeof.
+    """
+    seen = set()
+    total = 0
+    pending = [obj]
+    while pending:
+        item = pending.pop()
+        if id(item) in seen or isinstance(item, _SKIP_TYPES):
+            continue
+        seen.add(id(item))
+        if isinstance(item, np.ndarray):
+            # View (vd. mmap, slice) không sở hữu buffer
+            total += sys.getsizeof(item) + (item.nbytes if item.base is None else 0)
+            continue
+        total += sys.getsizeof(item)
+        if not isinstance(item, _ATOMIC_TYPES):
+            # get_referents thay vì vars(): không tạo __dict__ cho instance chưa có dict riêng
+            pending.extend(gc.get_referents(item))
+    return total
+
+
+def process_rss_bytes() -> Optional[int]:
+    """RSS hiện tại của process (Linux /proc); None nếu không đọc được."""
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        return None
+    return None
+
+
+class MemoryReporter:
+    def __init__(self, pipeline, *, tracemalloc_frames: int = 0):
+        self.pipeline = pipeline
+        self.tracemalloc_frames = tracemalloc_frames
+        self._lock = threading.Lock()
+        self._last_snapshot: Optional[tracemalloc.Snapshot] = None
+
+    def start(self) -> None:
+        """Bật tracemalloc (nếu cấu hình); gọi sớm để theo dõi được allocation từ lúc khởi động."""
+        if self.tracemalloc_frames > 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(self.tracemalloc_frames)
+
+    def components(self) -> Dict[str, Dict[str, Any]]:
+        pipeline = self.pipeline
+        components: Dict[str, Dict[str, Any]] = {"sessions": pipeline.memory_manager.memory_stats()}
+        components.update(pipeline.retriever.memory_stats())
+        if pipeline.semantic_cache is not None:
+            components["semantic_cache"] = pipeline.semantic_cache.memory_stats()
+        return components
+
+    def report(self, tracemalloc_top: int = 0) -> Dict[str, Any]:
+        components = self.components()
+        report: Dict[str, Any] = {
+            "rss_bytes": process_rss_bytes(),
+            "estimated_bytes": sum(c["bytes"] for c in components.values() if not c.get("mapped")),
+            "mapped_bytes": sum(c["bytes"] for c in components.values() if c.get("mapped")),
+            "components": components,
+        }
+        if tracemalloc_top > 0 and tracemalloc.is_tracing():
+            report["tracemalloc"] = self._tracemalloc_diff(tracemalloc_top)
+        return report
+
+    def _tracemalloc_diff(self, top: int) -> Dict[str, Any]:
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            )
+        )
+        with self._lock:
+            previous, self._last_snapshot = self._last_snapshot, snapshot
+        traced, peak = tracemalloc.get_traced_memory()
+        if previous is None:
+            # Lần gọi đầu chỉ có baseline: trả top theo kích thước hiện tại
+            stats = snapshot.statistics("lineno")[:top]
+            top_lines = [_stat_row(stat, diff=False) for stat in stats]
+        else:
+            stats = snapshot.compare_to(previous, "lineno")[:top]
+            top_lines = [_stat_row(stat, diff=True) for stat in stats]
+        return {"baseline": previous is None, "traced_bytes": traced, "peak_bytes": peak, "top": top_lines}
+
+
+def _stat_row(stat, *, diff: bool) -> Dict[str, Any]:
+    frame = stat.traceback[0]
+    row = {"location": f"{frame.filename}:{frame.lineno}", "bytes": stat.size, "count": stat.count}
+    if diff:
+        row.update(bytes_diff=stat.size_diff, count_diff=stat.count_diff)
+    return row
+
+
+def format_report_line(report: Dict[str, Any]) -> str:
+    """Một dòng log: RSS và byte ước lượng của từng thành phần (MB)."""
+    parts: List[str] = []
+    rss = report.get("rss_bytes")
+    parts.append(f"rss={rss / 2**20:.1f}MB" if rss is not None else "rss=?")
+    parts.append(f"estimated={report['estimated_bytes'] / 2**20:.1f}MB")
+    for name, component in report["components"].items():
+        extra = ""
+        if "count" in component:
+            extra = f"/{component['count']}"
+        mapped = "(mmap)" if component.get("mapped") else ""
+        parts.append(f"{name}={component['bytes'] / 2**20:.1f}MB{mapped}{extra}")
+    return "Memory: " + " ".join(parts)
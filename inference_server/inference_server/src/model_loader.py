@@ -1,97 +1,139 @@
 from __future__ import annotations
 
 import logging
-import os
-from typing import Iterable, Optional, Tuple
-import math
-
-from langchain_core.language_models.llms import LLM
-from vllm import LLM as VLLMEngine
-from vllm import SamplingParams
-
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from .backends import EngineBackend, Generation, GenerationBackend, SamplingConfig, build_backend
+from .backends.mock import MockEngine, MockSamplingParams  # noqa: F401  (re-export)
+from .backends.vllm_backend import SteppedVLLMEngine  # noqa: F401  (re-export)
 from .config import Settings, get_settings
-from .utils import enforce_stop_tokens
 
 logger = logging.getLogger(__name__)
 
 
-_engine_cache: Optional[VLLMEngine] = None
-
-
-def _build_vllm_engine(settings: Settings) -> VLLMEngine:
-    global _engine_cache
-    if _engine_cache is not None:
-        return _engine_cache
-    
-    if settings.hf_token:
-        os.environ["HUGGING_FACE_HUB_TOKEN"] = settings.hf_token
-
-    logger.info("Loading VLLM engine for %s", settings.model_id)
-    # Model is pre-quantized with bitsandbytes NF4, matching the working test code
-    # Must use load_format="bitsandbytes" when quantization="bitsandbytes"
-    engine = VLLMEngine(
-        model=settings.model_id,
-        tokenizer=settings.model_id,
-        trust_remote_code=True,
-        download_dir=str(settings.model_cache_dir),
-        revision=settings.model_revision,
-        dtype=settings.dtype,
-        gpu_memory_utilization=settings.gpu_memory_utilization,
-        tensor_parallel_size=settings.tensor_parallel_size,
-        enforce_eager=True,
-        max_model_len=2048,  # Match working test code (was 4096)
-        quantization="bitsandbytes",  # Model is pre-quantized with bitsandbytes
-        load_format="bitsandbytes",  # Required when using bitsandbytes quantization
+_backend_cache: Optional[GenerationBackend] = None
+_backend_lock = threading.Lock()
+# EWMA thời gian (giây) sinh một token, dùng để cắt max_new_tokens cho vừa deadline
+_token_seconds: Optional[float] = None
+_token_seconds_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _langchain_adapter_class():
+    """Class adapter được tạo lần đầu dùng để tránh import langchain lúc load module."""
+    from langchain_core.language_models.llms import LLM
+    from langchain_core.outputs import GenerationChunk
+
+    class BackendLangChainAdapter(LLM):
+        def __init__(self, backend: GenerationBackend, settings: Settings):
+            super().__init__()
+            self._backend = backend  # Use private attribute to avoid serialization issues
+            self._settings = settings  # Also make settings private
+
+        @property
+        def _llm_type(self) -> str:
+            return f"medassist_{self._backend.name}"
+
+        @property
+        def _identifying_params(self) -> dict:
+            """Return identifying parameters to avoid serialization issues."""
+            return {
+                "model_type": self._llm_type,
+                "model_id": self._settings.model_id,
+            }
+
+        def _sampling(self, stop: Optional[Iterable[str]], kwargs: dict) -> SamplingConfig:
+            return _sampling_config(
+                self._settings, kwargs.get("temperature"), kwargs.get("max_new_tokens"), stop
+            )
+
+        def _call(
+            self,
+            prompt: str,
+            stop: Optional[Iterable[str]] = None,
+            run_manager=None,
+            **kwargs,
+        ) -> str:
+            return self._backend.generate(prompt, self._sampling(stop, kwargs)).text
+
+        def _stream(
+            self,
+            prompt: str,
+            stop: Optional[Iterable[str]] = None,
+            run_manager=None,
+            **kwargs,
+        ) -> Iterator[GenerationChunk]:
+            for text in self._backend.stream(prompt, self._sampling(stop, kwargs)):
+                if run_manager is not None:
+                    run_manager.on_llm_new_token(text)
+                yield GenerationChunk(text=text)
+
+    return BackendLangChainAdapter
+
+
+def get_backend() -> GenerationBackend:
+    global _backend_cache
+    if _backend_cache is not None:
+        return _backend_cache
+    # Warmup thread và request đầu tiên có thể gọi đồng thời: chỉ load model một lần
+    with _backend_lock:
+        if _backend_cache is None:
+            _backend_cache = build_backend(get_settings())
+    return _backend_cache
+
+
+def set_backend(backend: GenerationBackend) -> None:
+    global _backend_cache
+    with _backend_lock:
+        _backend_cache = backend
+
+
+def get_engine():
+    """Engine kiểu vLLM bên dưới backend (backend không bọc engine thì trả chính backend)."""
+    backend = get_backend()
+    return getattr(backend, "engine", backend)
+
+
+def set_engine(engine) -> None:
+    """Thay engine đang dùng (benchmark/test inject fake engine cùng interface vLLM)."""
+    set_backend(EngineBackend(engine, sampling_params_factory=MockSamplingParams))
+
+
+def get_langchain_llm():
+    return _langchain_adapter_class()(get_backend(), get_settings())
+
+
+def _sampling_config(
+    settings: Settings,
+    temperature: float | None,
+    max_new_tokens: int | None,
+    stop: Optional[Iterable[str]],
+) -> SamplingConfig:
+    return SamplingConfig(
+        max_new_tokens=max_new_tokens if max_new_tokens is not None else settings.max_new_tokens,
+        temperature=temperature if temperature is not None else settings.temperature,
+        repetition_penalty=settings.repetition_penalty,
+        stop=list(stop) if stop else None,
     )
-    _engine_cache = engine
-    return engine
-
-
-class VLLMLangChainAdapter(LLM):
-    def __init__(self, engine: VLLMEngine, settings: Settings):
-        super().__init__()
-        self._engine = engine  # Use private attribute to avoid serialization issues
-        self._settings = settings  # Also make settings private
-
-    @property
-    def _llm_type(self) -> str:
-        return "custom_vllm"
-    
-    @property
-    def _identifying_params(self) -> dict:
-        """Return identifying parameters to avoid serialization issues."""
-        return {
-            "model_type": "custom_vllm",
-            "model_id": self._settings.model_id,
-        }
-
-    def _call(
-        self,
-        prompt: str,
-        stop: Optional[Iterable[str]] = None,
-        run_manager=None,
-        **kwargs,
-    ) -> str:
-        temperature = kwargs.get("temperature", self._settings.temperature)
-        max_tokens = kwargs.get("max_new_tokens", self._settings.max_new_tokens)
-        text, _ = generate_with_confidence(
-            prompt=prompt,
-            temperature=temperature,
-            max_new_tokens=max_tokens,
-            stop=stop,
-        )
-        return text
-
-
-def get_engine() -> VLLMEngine:
-    settings = get_settings()
-    return _build_vllm_engine(settings)
-
-
-def get_langchain_llm() -> VLLMLangChainAdapter:
-    settings = get_settings()
-    engine = get_engine()
-    return VLLMLangChainAdapter(engine, settings)
+
+
+def estimated_seconds_per_token() -> float:
+    """Thời gian sinh một token quan sát được gần đây (chưa có thì lấy DEADLINE_TOKEN_MS)."""
+    if _token_seconds is None:
+        return get_settings().deadline_token_ms / 1000.0
+    return _token_seconds
+
+
+def _observe_token_seconds(elapsed_s: float, tokens: int) -> None:
+    global _token_seconds
+    if tokens <= 0:
+        return
+    sample = elapsed_s / tokens
+    with _token_seconds_lock:
+        _token_seconds = sample if _token_seconds is None else 0.8 * _token_seconds + 0.2 * sample
 
 
 def generate_with_confidence(
@@ -99,32 +141,61 @@ def generate_with_confidence(
     temperature: float | None = None,
     max_new_tokens: int | None = None,
     stop: Optional[Iterable[str]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+    stop_when: Optional[Callable[[str], bool]] = None,
 ) -> Tuple[str, float]:
-    settings = get_settings()
-    engine = get_engine()
-    sampling_params = SamplingParams(
-        temperature=temperature
-        if temperature is not None
-        else settings.temperature,
-        max_tokens=max_new_tokens
-        if max_new_tokens is not None
-        else settings.max_new_tokens,
-        repetition_penalty=settings.repetition_penalty,
-        logprobs=1,
+    return generate_batch_with_confidence(
+        [prompt], temperature=temperature, max_new_tokens=max_new_tokens, stop=stop,
+        should_stop=should_stop, stop_when=stop_when,
+    )[0]
+
+
+def generate_batch_with_confidence(
+    prompts: List[str],
+    temperature: float | None = None,
+    max_new_tokens: int | None = None,
+    stop: Optional[Iterable[str]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+    stop_when: Optional[Callable[[str], bool]] = None,
+) -> List[Tuple[str, float]]:
+    """
+    Sinh cho nhiều prompt trong một lần gọi backend (vLLM/transformers tự batch các sequence).
+    stop: truyền vào backend làm stop string (và cắt lại trên text trả về).
+    should_stop: backend hỗ trợ thì abort giữa chừng; prompt bị abort trả ("", 0.0).
+    stop_when(text): backend hỗ trợ thì dừng sequence ngay khi điều kiện đúng trên text đang sinh.
+    """
+    generations = generate_batch_with_details(
+        prompts, temperature=temperature, max_new_tokens=max_new_tokens, stop=stop,
+        should_stop=should_stop, stop_when=stop_when,
     )
-    outputs = engine.generate([prompt], sampling_params, use_tqdm=False)
-    output = outputs[0]
-    generated_text = output.outputs[0].text
-    if stop:
-        generated_text = enforce_stop_tokens(generated_text, stop)
-
-    token_logprobs = output.outputs[0].logprobs
-    probs = []
-    for token_dict in token_logprobs:
-        for _, logprob_obj in token_dict.items():
-            probs.append(math.exp(float(logprob_obj.logprob)))
-            break
-
-    avg_conf = sum(probs) / len(probs) if probs else 0.0
-    return generated_text, avg_conf
+    return [(generation.text, generation.confidence) for generation in generations]
+
 
+def generate_batch_with_details(
+    prompts: List[str],
+    temperature: float | None = None,
+    max_new_tokens: int | None = None,
+    stop: Optional[Iterable[str]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+    stop_when: Optional[Callable[[str], bool]] = None,
+) -> List[Generation]:
+    """Như generate_batch_with_confidence nhưng giữ xác suất từng token."""
+    backend = get_backend()
+    params = _sampling_config(get_settings(), temperature, max_new_tokens, stop)
+    started = time.perf_counter()
+    generations = backend.generate_batch(prompts, params, should_stop=should_stop, stop_when=stop_when)
+    tokens = max((len(generation.token_probs) for generation in generations), default=0)
+    _observe_token_seconds(time.perf_counter() - started, tokens)
+    return generations
+
+
+def stream_generate(
+    prompt: str,
+    temperature: float | None = None,
+    max_new_tokens: int | None = None,
+    stop: Optional[Iterable[str]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> Iterator[str]:
+    """Các đoạn text mới theo thứ tự sinh; ghép lại bằng text của generate_with_confidence."""
+    params = _sampling_config(get_settings(), temperature, max_new_tokens, stop)
+    return get_backend().stream(prompt, params, should_stop=should_stop)
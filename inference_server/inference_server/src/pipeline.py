@@ -1,15 +1,44 @@
 from __future__ import annotations
 
 import logging
+import threading
+import time
 import uuid
-from typing import Dict, List, Optional
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 
 from .config import Settings, get_settings
+from .deadline import TIMEOUT, Deadline, DeadlineExceeded
+from .embeddings import EmbeddingBackoff, get_history_embedder
 from .memory import SessionMemoryManager
-from .model_loader import generate_with_confidence
+from .model_loader import (
+    Generation,
+    estimated_seconds_per_token,
+    generate_batch_with_confidence,
+    generate_batch_with_details,
+    generate_with_confidence,
+    get_backend,
+)
 from .prompts import GEMINI_SYSTEM_PROMPT, ROUTER_PROMPT
 from .retriever import PubMedRetriever
+from .scheduler import RequestScheduler, Ticket
+from .self_correction import (
+    VerificationBatcher,
+    cited_markers,
+    needs_self_correction,
+    parse_verification,
+    self_correction_prompt,
+)
+from .semantic_cache import (
+    SemanticResponseCache,
+    build_cache_namespace,
+    cache_scope,
+    question_terms,
+)
 from .utils import (
+    STOP_MARKERS,
+    has_repeated_section,
     postprocess_answer,
     safe_json_loads,
     safety_guard,
@@ -19,15 +48,91 @@ from .utils import (
     output_guard,
     has_data_exfil_request,
 )
+from .warmup import ReadinessTracker, Stage, run_stages, start_background
 
 logger = logging.getLogger(__name__)
 
+ROUTER_MAX_NEW_TOKENS = 400
+
+
+class StageTimer:
+    """Thời gian (ms) từng stage của một request, trả về trong response["timings_ms"]."""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+
+    def finish(self) -> Dict[str, float]:
+        timings = {name: round(value, 3) for name, value in self.timings.items()}
+        timings["total"] = round((time.perf_counter() - self._started) * 1000, 3)
+        return timings
+
 
 class MedAssistantPipeline:
-    def __init__(self, settings: Settings | None = None):
+    def __init__(self, settings: Settings | None = None, *, lazy_load: bool = False):
         self.settings = settings or get_settings()
-        self.retriever = PubMedRetriever(self.settings)
-        self.memory_manager = SessionMemoryManager()
+        # lazy_load=True: asset RAG/engine được load bởi warmup() thay vì trong __init__
+        self.retriever = PubMedRetriever(self.settings, load=not lazy_load)
+        self.memory_manager = SessionMemoryManager(self.settings)
+        self.readiness = ReadinessTracker()
+        self.semantic_cache: SemanticResponseCache | None = None
+        if self.settings.semantic_cache_enabled:
+            self.semantic_cache = SemanticResponseCache.from_settings(self.settings)
+        self._cache_namespace = build_cache_namespace(self.settings)
+        self._cache_embed_backoff = EmbeddingBackoff()
+        self.scheduler: RequestScheduler | None = None
+        if self.settings.scheduler_enabled:
+            self.scheduler = RequestScheduler.from_settings(self.settings)
+        self.verifier: VerificationBatcher | None = None
+        if self.settings.self_correction_enabled:
+            self.verifier = VerificationBatcher.from_settings(self.settings)
+
+    def warmup_stages(self) -> List[Stage]:
+        """
+        Stage 1: load các asset độc lập song song (dataset mapping, FAISS, encoder, engine).
+        Stage 2: warm encoder và engine bằng prompt đại diện.
+        RAG là optional (lỗi -> degraded), engine là bắt buộc để ready.
+        """
+        load_stage: Stage = [("engine", get_backend, True)]
+        warm_stage: Stage = [("warmup_engine", self._warm_engine, True)]
+        if self.settings.rag_enabled:
+            load_stage[:0] = [
+                ("dataset", self.retriever.load_dataset, False),
+                ("bm25_index", self.retriever.load_lexical, False),
+                ("dedup_signatures", self.retriever.load_signatures, False),
+                ("faiss_index", self.retriever.load_index, False),
+                ("query_encoder", self.retriever.load_encoder, False),
+            ]
+            warm_stage.insert(0, ("warmup_encoder", self._warm_encoder, False))
+        return [load_stage, warm_stage]
+
+    def _warm_encoder(self) -> None:
+        if self.retriever.encoder is None:
+            raise RuntimeError("Query encoder not loaded")
+        for prompt in self.settings.warmup_prompts:
+            self.retriever.encode_query(prompt)
+
+    def _warm_engine(self) -> None:
+        for prompt in self.settings.warmup_prompts:
+            generate_with_confidence(prompt, temperature=0.0, max_new_tokens=8)
+
+    def warmup(self, *, background: bool = True) -> Optional[threading.Thread]:
+        stages = self.warmup_stages()
+        if background:
+            return start_background(
+                stages, self.readiness, max_workers=self.settings.warmup_max_workers
+            )
+        run_stages(stages, self.readiness, max_workers=self.settings.warmup_max_workers)
+        return None
 
     def _default_plan(self, question: str) -> Dict:
         base = {
@@ -60,7 +165,7 @@ class MedAssistantPipeline:
             return []
 
         filtered = [
-            d for d in docs if d.get("score", 0.0) >= self.settings.rag_score_threshold
+            d for d in docs if d.get("score", 0.0) >= self._score_threshold(d)
         ]
         if not filtered:
             return []
@@ -82,6 +187,12 @@ class MedAssistantPipeline:
 
         return cleaned_docs
 
+    def _score_threshold(self, doc: Dict) -> float:
+        # Score BM25 và cosine không cùng thang đo
+        if doc.get("retrieval") == "bm25":
+            return self.settings.rag_bm25_min_score
+        return self.settings.rag_score_threshold
+
     def _build_context(self, docs: List[Dict]) -> str:
         if not docs:
             return "Khong co tai lieu lien quan."
@@ -104,45 +215,83 @@ class MedAssistantPipeline:
         question: str,
         db_query_spec: Optional[Dict],
         top_k: Optional[int],
+        turn: Optional["_Turn"] = None,
     ) -> tuple[str, List[Dict]]:
-        if not self.retriever.available:
+        if not (self.retriever.available or self.retriever.lexical_available):
             return "", []
 
-        retrieval_query = question
-        if db_query_spec and isinstance(db_query_spec, dict):
-            keywords = db_query_spec.get("keywords") or []
-            if keywords:
-                retrieval_query = f"{question} {' '.join(keywords)}"
-
         docs = self.retriever.retrieve(
-            retrieval_query, top_k or self.settings.rag_top_k
+            question, top_k or self.settings.rag_top_k, keywords=self._keywords(db_query_spec)
         )
+        if turn is not None:
+            self._note_retrieval(turn, docs)
         rag_docs = self._filter_docs(docs, question)
         context_text = self._build_context(rag_docs)
         return context_text, rag_docs
 
+    def _retrieval_mode(self, plan: Dict) -> str:
+        """Chế độ retrieval request sẽ dùng: "dense", "bm25" hoặc "none" (không SEARCH_DB/RAG chưa sẵn sàng)."""
+        if plan.get("action") != "SEARCH_DB":
+            return "none"
+        if self.retriever.available:
+            return "dense"
+        if self.retriever.lexical_available:
+            return "bm25"
+        return "none"
+
+    @staticmethod
+    def _note_retrieval(turn: "_Turn", docs: List[Dict]) -> None:
+        """Dense bị bỏ qua giữa chừng (quá tải): context không khớp chế độ ghi trong cache scope."""
+        if turn.retrieval_mode == "dense" and not any("retrieval" not in doc for doc in docs):
+            turn.retrieval_degraded = True
+
+    @staticmethod
+    def _keywords(db_query_spec: Optional[Dict]) -> List[str]:
+        if db_query_spec and isinstance(db_query_spec, dict):
+            return [str(k) for k in db_query_spec.get("keywords") or [] if k]
+        return []
+
     def _route_and_plan(
-        self, question: str, history_text: str, recent_context: str
+        self, question: str, history_text: str, recent_context: str, *, deadline: Optional[Deadline] = None
     ) -> Dict:
+        router_prompt = self._router_prompt(question, history_text, recent_context)
+        if router_prompt is None:
+            return self._exfil_plan(question)
+        router_text, _ = generate_with_confidence(
+            router_prompt,
+            temperature=0.0,
+            max_new_tokens=ROUTER_MAX_NEW_TOKENS,
+            should_stop=deadline.should_stop if deadline else None,
+        )
+        if deadline:
+            deadline.check("router")
+        return self._plan_from_router_text(question, router_text)
+
+    def _exfil_plan(self, question: str) -> Dict:
         plan = self._default_plan(question)
-        if has_data_exfil_request(question):
-            plan.update(
-                {
-                    "intent": "OUT_OF_SCOPE",
-                    "action": "REPLY_LOCALLY",
-                    "local_reply_content": "Xin loi, toi khong the cung cap ho so hoac danh sach dinh danh. Vui long dat cau hoi khac.",
-                }
-            )
-            return plan
+        plan.update(
+            {
+                "intent": "OUT_OF_SCOPE",
+                "action": "REPLY_LOCALLY",
+                "local_reply_content": "Xin loi, toi khong the cung cap ho so hoac danh sach dinh danh. Vui long dat cau hoi khac.",
+            }
+        )
+        return plan
 
-        router_prompt = ROUTER_PROMPT.format(
+    def _router_prompt(
+        self, question: str, history_text: str, recent_context: str
+    ) -> Optional[str]:
+        """Prompt cho router; None nếu câu hỏi bị chặn trước (yêu cầu lấy dữ liệu)."""
+        if has_data_exfil_request(question):
+            return None
+        return ROUTER_PROMPT.format(
             history=history_text or "Chua co lich su.",
             recent_context=recent_context or "Chua co context gan.",
             question=question,
         )
-        router_text, _ = generate_with_confidence(
-            router_prompt, temperature=0.0, max_new_tokens=400
-        )
+
+    def _plan_from_router_text(self, question: str, router_text: str) -> Dict:
+        plan = self._default_plan(question)
         router_json = safe_json_loads(router_text)
 
         if router_json and isinstance(router_json, dict):
@@ -174,22 +323,63 @@ class MedAssistantPipeline:
         sanitized_question: str,
         context_text: str,
         *,
-        max_new_tokens: Optional[int] = None,
-    ) -> tuple[str, str, float, bool]:
-        prompt = (
+        max_tokens: int,
+        deadline: Optional[Deadline] = None,
+    ) -> Generation:
+        [generation] = generate_batch_with_details(
+            [self._answer_prompt(sanitized_question, context_text)],
+            max_new_tokens=max_tokens,
+            temperature=self.settings.temperature,
+            should_stop=deadline.should_stop if deadline else None,
+            **self._answer_stop_kwargs(),
+        )
+        if deadline:
+            deadline.check("generation")
+        return generation
+
+    @staticmethod
+    def _answer_prompt(sanitized_question: str, context_text: str) -> str:
+        return (
             f"{GEMINI_SYSTEM_PROMPT}\n\n"
             f"[Sanitized question]\n{sanitized_question}\n\n"
             f"[Context]\n{context_text}\n"
             "Tra loi ngan gon bang tieng Viet; neu thong tin thieu, hoi lai mot cau ro rang."
         )
-        draft, confidence = generate_with_confidence(
-            prompt,
-            max_new_tokens=min(
-                max_new_tokens or self.settings.max_new_tokens,
-                self.settings.max_new_tokens,
-            ),
-            temperature=self.settings.temperature,
+
+    def _answer_max_tokens(self, max_new_tokens: Optional[int], intent: Optional[str] = None) -> int:
+        """max_new_tokens của request, không vượt trần theo intent và MAX_NEW_TOKENS."""
+        budget = min(
+            self.settings.max_new_tokens_by_intent.get(intent or "", self.settings.max_new_tokens),
+            self.settings.max_new_tokens,
         )
+        return min(max_new_tokens or budget, budget)
+
+    def _answer_stop_kwargs(self) -> Dict:
+        """Dừng decode tại STOP_MARKERS / section header lặp — phần postprocess_answer sẽ cắt bỏ."""
+        if not self.settings.engine_stop_enabled:
+            return {}
+        return {"stop": STOP_MARKERS, "stop_when": has_repeated_section}
+
+    def _fit_to_deadline(self, turn: "_Turn", max_tokens: int) -> int:
+        """Cắt max_new_tokens cho vừa thời gian còn lại; quá ít token thì dừng luôn."""
+        if turn.deadline is None or turn.deadline.timeout_s is None:
+            return max_tokens
+        available_s = turn.deadline.remaining() - self.settings.deadline_reserve_s
+        fit = int(available_s / estimated_seconds_per_token())
+        if fit >= max_tokens:
+            return max_tokens
+        if fit < min(max_tokens, self.settings.deadline_min_answer_tokens):
+            turn.deadline.cancel(TIMEOUT)
+            turn.deadline.check("generation")
+        logger.info(
+            "[Pipeline] trace_id=%s max_new_tokens %d -> %d to fit deadline", turn.trace_id, max_tokens, fit
+        )
+        turn.deadline_truncated = True
+        return fit
+
+    def _postprocess_draft(
+        self, draft: str, confidence: float, sanitized_question: str, context_text: str
+    ) -> tuple[str, str, float, bool]:
         processed_draft = suppress_unmentioned_terms(
             postprocess_answer(draft),
             f"{sanitized_question}\n{context_text}",
@@ -198,6 +388,86 @@ class MedAssistantPipeline:
         guarded_answer, flagged = output_guard(processed_draft)
         return guarded_answer, processed_draft, confidence, flagged
 
+    def _should_self_correct(self, turn: "_Turn", generation: Generation) -> bool:
+        """Chỉ duyệt lại draft confidence thấp, và khi deadline còn đủ cho output verify."""
+        if self.verifier is None or not needs_self_correction(generation, self.settings):
+            return False
+        if turn.deadline is not None and turn.deadline.timeout_s is not None:
+            needed_s = (
+                self.settings.self_correction_max_new_tokens * estimated_seconds_per_token()
+                + self.settings.deadline_reserve_s
+            )
+            if turn.deadline.remaining() < needed_s:
+                logger.info("[Pipeline] trace_id=%s skip self-correction: deadline too close", turn.trace_id)
+                return False
+        return True
+
+    def _apply_verification(
+        self, turn: "_Turn", generated: tuple, verifier_text: str, context_text: str
+    ) -> tuple[str, str, float, bool]:
+        """verdict/citations từ bác sĩ giám sát; final_answer thay câu trả lời, draft giữ nguyên."""
+        verification = parse_verification(verifier_text, len(turn.rag_docs))
+        if verification is None:
+            logger.warning("[Pipeline] trace_id=%s self-correction returned no valid JSON", turn.trace_id)
+            return generated
+        turn.verdict = verification.verdict
+        turn.citations = verification.citations
+        turn.verified = True
+        answer, draft, confidence, flagged = generated
+        if verification.final_answer:
+            answer, _, _, corrected_flag = self._postprocess_draft(
+                verification.final_answer, confidence, turn.sanitized_question, context_text
+            )
+            flagged = flagged or corrected_flag
+        return answer, draft, confidence, flagged
+
+    def _semantic_cache_scope(
+        self,
+        plan: Dict,
+        session_id: str,
+        recent_context: str,
+        warning: Optional[str],
+        top_k: Optional[int],
+        max_new_tokens: Optional[int],
+    ) -> Optional[str]:
+        """
+        Chỉ cache câu hỏi GENERAL_MEDICAL_QA không có lịch sử hội thoại. Scope gồm cả
+        action và chế độ retrieval: câu trả lời sinh lúc RAG chưa sẵn sàng (warmup, degraded)
+        không được phục vụ lại khi dense retrieval đã hoạt động.
+        """
+        if self.semantic_cache is None or warning or recent_context:
+            return None
+        if plan.get("intent") != "GENERAL_MEDICAL_QA":
+            return None
+        scope = cache_scope(plan.get("intent"), session_id)
+        return (
+            f"{scope}|action={plan.get('action')}|retrieval={self._retrieval_mode(plan)}"
+            f"|top_k={top_k}|max_new_tokens={max_new_tokens}"
+        )
+
+    def _embed_for_cache(self, sanitized_question: str):
+        """Lỗi embedding chỉ bỏ qua cache cho request đó (ngưng thử theo EmbeddingBackoff)."""
+        if not self._cache_embed_backoff.ready():
+            return None
+        try:
+            vector = get_history_embedder().embed_one(sanitized_question)
+        except Exception as exc:
+            streak, backoff = self._cache_embed_backoff.failed()
+            logger.warning(
+                "Semantic cache skipped, embedding failed (%d in a row, retry in %.0fs): %s",
+                streak,
+                backoff,
+                exc,
+            )
+            return None
+        self._cache_embed_backoff.succeeded()
+        return vector
+
+    def semantic_cache_stats(self) -> Optional[Dict[str, Any]]:
+        if self.semantic_cache is None:
+            return None
+        return {**self.semantic_cache.stats(), **self._cache_embed_backoff.stats()}
+
     def _build_response(
         self,
         answer: str,
@@ -211,13 +481,18 @@ class MedAssistantPipeline:
         output_flag: bool = False,
         sanitized_prompt: Optional[str] = None,
         tool_params: Optional[Dict] = None,
+        verdict: str = "pass",
+        citations: Optional[List[str]] = None,
     ) -> Dict:
+        """citations mặc định: các [n] trong câu trả lời có tài liệu tương ứng."""
+        if citations is None:
+            citations = cited_markers(answer, len(rag_docs))
         return {
             "answer": answer,
             "draft": draft,
             "confidence": confidence,
-            "verdict": "pass",
-            "citations": [],
+            "verdict": verdict,
+            "citations": citations,
             "context_docs": rag_docs,
             "warning": warning,
             "intent": plan.get("intent"),
@@ -236,61 +511,334 @@ class MedAssistantPipeline:
         *,
         max_new_tokens: Optional[int] = None,
         top_k: Optional[int] = None,
+        deadline: Optional[Deadline] = None,
     ) -> Dict:
+        """
+        deadline: kiểm tra giữa các stage, bỏ chờ slot và abort generation khi hết giờ
+        hoặc bị cancel (DeadlineExceeded); max_new_tokens bị cắt cho vừa thời gian còn lại.
+        """
         if not question or not question.strip():
             raise ValueError("Question must not be empty.")
 
-        question = question.strip()
-        trace_id = str(uuid.uuid4())
-        warning = safety_guard(question) if self.settings.enable_safety_guard else None
+        timer = StageTimer()
+        turn = self._new_turn(question.strip(), session_id)
+        turn.deadline = deadline
+        with self._admission(turn), self._session_turn(turn, timer):
+            response = self._ask(turn, timer, max_new_tokens=max_new_tokens, top_k=top_k)
+        if turn.deadline_truncated:
+            response["deadline_truncated"] = True
+        response["timings_ms"] = timer.finish()
+        return response
 
-        history_text = self.memory_manager.get_history_text(session_id)
-        recent_context = self.memory_manager.get_recent_context(
-            session_id, max_exchanges=2
+    @contextmanager
+    def _admission(self, turn: "_Turn") -> Iterator[None]:
+        """Admit request vào scheduler (QueueFullError nếu quá tải); không bật thì bỏ qua."""
+        if self.scheduler is None:
+            yield
+            return
+        with self.scheduler.admit(turn.session_id, emergency=bool(turn.warning)) as ticket:
+            turn.ticket = ticket
+            yield
+
+    @contextmanager
+    def _session_turn(self, turn: "_Turn", timer: StageTimer) -> Iterator[None]:
+        """
+        Giữ lock của session suốt lượt hỏi: các lượt cùng session_id chạy tuần tự, lượt sau
+        luôn thấy history của lượt trước. Lock lấy sau admission nên số lượt chờ của một
+        session bị giới hạn bởi SCHEDULER_MAX_PER_SESSION; chỉ ghi stage "session_wait" khi phải chờ.
+        """
+        with self.memory_manager.pin_session(turn.session_id) as lock:
+            if not lock.acquire(blocking=False):
+                with timer.stage("session_wait"):
+                    while not lock.acquire(timeout=self.settings.disconnect_poll_s):
+                        self._check_deadline(turn, "session_wait")
+            try:
+                yield
+            finally:
+                lock.release()
+
+    @staticmethod
+    def _check_deadline(turn: "_Turn", stage: str) -> None:
+        if turn.deadline is not None:
+            turn.deadline.check(stage)
+
+    @contextmanager
+    def _engine_slot(self, turn: "_Turn", timer: StageTimer) -> Iterator[None]:
+        """Chờ slot engine theo lane của request; thời gian chờ ghi vào stage "queue"."""
+        if turn.ticket is None:
+            yield
+            return
+        with timer.stage("queue"):
+            acquired = turn.ticket.acquire(turn.deadline.should_stop if turn.deadline else None)
+        if not acquired:
+            turn.deadline.check("queue")
+        try:
+            yield
+        finally:
+            turn.ticket.release()
+
+    def _ask(
+        self,
+        turn: "_Turn",
+        timer: StageTimer,
+        *,
+        max_new_tokens: Optional[int] = None,
+        top_k: Optional[int] = None,
+    ) -> Dict:
+        question = turn.question
+        with timer.stage("history"):
+            self._load_history(turn)
+
+        logger.info("[Pipeline] trace_id=%s question=%s", turn.trace_id, question[:120])
+        self._check_deadline(turn, "router")
+        with self._engine_slot(turn, timer), timer.stage("router"):
+            turn.plan = self._route_and_plan(
+                question, turn.history_text, turn.recent_context, deadline=turn.deadline
+            )
+
+        self._apply_plan(turn, top_k, max_new_tokens)
+        if turn.ticket is not None and turn.plan.get("intent") == "EMERGENCY":
+            turn.ticket.escalate()
+        if turn.response is None:
+            with timer.stage("cache_lookup"):
+                self._lookup_cache(turn)
+        if turn.response is not None:
+            return turn.response
+
+        if turn.plan.get("action") == "SEARCH_DB":
+            self._check_deadline(turn, "retrieval")
+            with timer.stage("retrieval"):
+                turn.context_text, turn.rag_docs = self._retrieve_context(
+                    question, turn.plan.get("db_query_spec"), top_k, turn
+                )
+        elif turn.plan.get("intent") == "CONTEXT_FOLLOWUP":
+            turn.context_text = turn.recent_context or turn.history_text
+
+        sanitized_context, context_redacted = self._sanitized_context(turn)
+        self._check_deadline(turn, "generation")
+        with self._engine_slot(turn, timer), timer.stage("generation"):
+            generation = self._call_gemini(
+                turn.sanitized_question,
+                sanitized_context,
+                max_tokens=self._fit_to_deadline(
+                    turn, self._answer_max_tokens(max_new_tokens, turn.plan.get("intent"))
+                ),
+                deadline=turn.deadline,
+            )
+        generated = self._postprocess_draft(
+            generation.text, generation.confidence, turn.sanitized_question, sanitized_context
         )
+        if self._should_self_correct(turn, generation):
+            prompt = self_correction_prompt(turn.sanitized_question, sanitized_context, generated[1])
+            try:
+                with self._engine_slot(turn, timer), timer.stage("self_correction"):
+                    verifier_text = self.verifier.verify(
+                        prompt, should_stop=turn.deadline.should_stop if turn.deadline else None
+                    )
+                self._check_deadline(turn, "self_correction")
+            except DeadlineExceeded as exc:
+                if exc.reason != TIMEOUT:
+                    raise
+                # Hết giờ khi chờ slot hoặc giữa lúc verify: trả draft thay vì 504
+                verifier_text = ""
+            except Exception:  # noqa: BLE001
+                # Verify là bước tuỳ chọn: lỗi engine không được làm hỏng draft đã có
+                logger.exception("[Pipeline] trace_id=%s self-correction failed, returning draft", turn.trace_id)
+                verifier_text = ""
+            generated = self._apply_verification(turn, generated, verifier_text, sanitized_context)
+        return self._finish_turn(turn, *generated, context_redacted=context_redacted)
+
+    def ask_batch(
+        self,
+        items: Sequence[Tuple[str, str]],
+        *,
+        max_new_tokens: Optional[int] = None,
+        top_k: Optional[int] = None,
+    ) -> List[Dict]:
+        """
+        Trả lời nhiều (question, session_id) trong một lượt cho chạy offline: router,
+        retrieval và sinh câu trả lời đều gọi một lần cho cả batch. Mỗi session chỉ
+        được có một câu trong batch (các lượt hội thoại phải chạy ở batch sau).
+        """
+        sessions = [session_id for _, session_id in items]
+        if len(set(sessions)) != len(sessions):
+            raise ValueError("ask_batch needs distinct session_ids within one batch")
+        if any(not question or not question.strip() for question, _ in items):
+            raise ValueError("Question must not be empty.")
 
-        logger.info("[Pipeline] trace_id=%s question=%s", trace_id, question[:120])
-        plan = self._route_and_plan(question, history_text, recent_context)
+        turns = [self._new_turn(question.strip(), session_id) for question, session_id in items]
+        for turn in turns:
+            turn.defer_exchange = True
+        with ExitStack() as stack:
+            # Thứ tự cố định để hai batch không giữ lock chéo nhau
+            for session_id in sorted(sessions):
+                stack.enter_context(self.memory_manager.session_lock(session_id))
+            return self._ask_batch(turns, max_new_tokens=max_new_tokens, top_k=top_k)
+
+    def _ask_batch(
+        self,
+        turns: List["_Turn"],
+        *,
+        max_new_tokens: Optional[int] = None,
+        top_k: Optional[int] = None,
+    ) -> List[Dict]:
+        timer = StageTimer()
+        with timer.stage("history"):
+            for turn in turns:
+                self._load_history(turn)
+
+        with timer.stage("router"):
+            prompts = {
+                i: self._router_prompt(t.question, t.history_text, t.recent_context)
+                for i, t in enumerate(turns)
+            }
+            routed = [i for i, prompt in prompts.items() if prompt is not None]
+            outputs = generate_batch_with_confidence(
+                [prompts[i] for i in routed], temperature=0.0, max_new_tokens=ROUTER_MAX_NEW_TOKENS
+            ) if routed else []
+            router_texts = {i: text for i, (text, _) in zip(routed, outputs)}
+            for i, turn in enumerate(turns):
+                if i in router_texts:
+                    turn.plan = self._plan_from_router_text(turn.question, router_texts[i])
+                else:
+                    turn.plan = self._exfil_plan(turn.question)
+
+        pending: List[_Turn] = []
+        with timer.stage("cache_lookup"):
+            for turn in turns:
+                self._apply_plan(turn, top_k, max_new_tokens)
+                if turn.response is None:
+                    self._lookup_cache(turn)
+                if turn.response is None:
+                    pending.append(turn)
+
+        with timer.stage("retrieval"):
+            search = [t for t in pending if t.plan.get("action") == "SEARCH_DB"]
+            if search and (self.retriever.available or self.retriever.lexical_available):
+                keywords = [self._keywords(t.plan.get("db_query_spec")) for t in search]
+                batch_docs = self.retriever.retrieve_batch(
+                    [t.question for t in search], top_k or self.settings.rag_top_k, keywords=keywords
+                )
+                for turn, docs in zip(search, batch_docs):
+                    self._note_retrieval(turn, docs)
+                    turn.rag_docs = self._filter_docs(docs, turn.question)
+                    turn.context_text = self._build_context(turn.rag_docs)
+            for turn in pending:
+                if turn.plan.get("action") != "SEARCH_DB" and turn.plan.get("intent") == "CONTEXT_FOLLOWUP":
+                    turn.context_text = turn.recent_context or turn.history_text
+
+        with timer.stage("generation"):
+            # Mỗi nhóm max_new_tokens (theo intent) là một lần gọi engine
+            groups: Dict[int, List[_Turn]] = {}
+            for turn in pending:
+                budget = self._answer_max_tokens(max_new_tokens, turn.plan.get("intent"))
+                groups.setdefault(budget, []).append(turn)
+            # [turn, context, redacted, generation, (answer, draft, confidence, flagged)]
+            finished: List[list] = []
+            for budget, group in groups.items():
+                contexts = [self._sanitized_context(turn) for turn in group]
+                generations = generate_batch_with_details(
+                    [
+                        self._answer_prompt(turn.sanitized_question, context)
+                        for turn, (context, _) in zip(group, contexts)
+                    ],
+                    max_new_tokens=budget,
+                    temperature=self.settings.temperature,
+                    **self._answer_stop_kwargs(),
+                )
+                for turn, (context, redacted), generation in zip(group, contexts, generations):
+                    generated = self._postprocess_draft(
+                        generation.text, generation.confidence, turn.sanitized_question, context
+                    )
+                    finished.append([turn, context, redacted, generation, generated])
+
+        verify = [entry for entry in finished if self._should_self_correct(entry[0], entry[3])]
+        if verify:
+            with timer.stage("self_correction"):
+                outputs = generate_batch_with_confidence(
+                    [
+                        self_correction_prompt(turn.sanitized_question, context, generated[1])
+                        for turn, context, _, _, generated in verify
+                    ],
+                    temperature=0.0,
+                    max_new_tokens=self.settings.self_correction_max_new_tokens,
+                )
+                for entry, (verifier_text, _) in zip(verify, outputs):
+                    turn, context, _, _, generated = entry
+                    entry[4] = self._apply_verification(turn, generated, verifier_text, context)
+        for turn, _, redacted, _, generated in finished:
+            self._finish_turn(turn, *generated, context_redacted=redacted)
+
+        # Chỉ ghi history khi cả batch đã xong: batch lỗi được chạy lại từng câu mà không ghi trùng
+        for turn in turns:
+            self.memory_manager.save_exchange(turn.session_id, turn.question, turn.exchange_answer)
+
+        timings = timer.finish()
+        timings["batch_size"] = len(turns)
+        responses = []
+        for turn in turns:
+            turn.response["timings_ms"] = timings
+            responses.append(turn.response)
+        return responses
+
+    def _new_turn(self, question: str, session_id: str) -> "_Turn":
+        warning = safety_guard(question) if self.settings.enable_safety_guard else None
+        return _Turn(question=question, session_id=session_id, trace_id=str(uuid.uuid4()), warning=warning)
+
+    def _load_history(self, turn: "_Turn") -> None:
+        turn.history_text = self.memory_manager.get_relevant_history(turn.session_id, turn.question)
+        turn.recent_context = self.memory_manager.get_recent_context(
+            turn.session_id, max_exchanges=2
+        )
 
+    def _reply_early(self, turn: "_Turn", answer: str, draft: str, output_flag: bool, **kwargs) -> None:
+        turn.response = self._build_response(
+            answer,
+            draft,
+            turn.plan.get("confidence", 0.0),
+            turn.plan,
+            [],
+            turn.warning,
+            turn.trace_id,
+            output_flag=output_flag,
+            **kwargs,
+        )
+        self._save_exchange(turn, answer)
+
+    def _save_exchange(self, turn: "_Turn", answer: str) -> None:
+        if turn.defer_exchange:
+            turn.exchange_answer = answer
+            return
+        self.memory_manager.save_exchange(turn.session_id, turn.question, answer)
+
+    def _apply_plan(
+        self, turn: "_Turn", top_k: Optional[int], max_new_tokens: Optional[int]
+    ) -> None:
+        """Xử lý các nhánh trả lời ngay (không cần retrieval/generation) và chuẩn bị prompt."""
+        plan, warning, question = turn.plan, turn.warning, turn.question
         if warning:
             plan["intent"] = plan.get("intent") or "EMERGENCY"
             plan["action"] = "REPLY_LOCALLY"
             plan["local_reply_content"] = warning
 
-        if plan.get("needs_patient_db") and session_id == "default":
+        if plan.get("needs_patient_db") and turn.session_id == "default":
             answer = "Ban can dang nhap/xac thuc de xem thong tin ca nhan."
-            response = self._build_response(
-                answer,
-                answer,
-                plan.get("confidence", 0.0),
-                plan,
-                [],
-                warning,
-                trace_id,
-                output_flag=True,
-                sanitized_prompt=question,
-            )
-            self.memory_manager.save_exchange(session_id, question, answer)
-            return response
+            self._reply_early(turn, answer, answer, True, sanitized_prompt=question)
+            return
 
         if plan.get("action") == "REPLY_LOCALLY":
             answer = plan.get("local_reply_content") or ""
             guarded_answer, flagged = output_guard(answer)
-            response = self._build_response(
+            self._reply_early(
+                turn,
                 guarded_answer,
                 answer,
-                plan.get("confidence", 0.0),
-                plan,
-                [],
-                warning,
-                trace_id,
-                output_flag=flagged,
+                flagged,
                 sanitized_prompt=plan.get("gemini_payload_spec", {}).get(
                     "sanitized_user_prompt"
                 ),
             )
-            self.memory_manager.save_exchange(session_id, question, guarded_answer)
-            return response
+            return
 
         if plan.get("action") == "CALL_ADMIN_TOOL":
             tool_params = plan.get("tool_params") or {}
@@ -299,58 +847,156 @@ class MedAssistantPipeline:
                 f"Toi da ghi nhan yeu cau '{tool_name}'. He thong se xu ly va thong bao cho ban."
             )
             guarded_answer, flagged = output_guard(local_reply)
-            response = self._build_response(
+            self._reply_early(
+                turn,
                 guarded_answer,
                 local_reply,
-                plan.get("confidence", 0.0),
-                plan,
-                [],
-                warning,
-                trace_id,
-                output_flag=flagged,
+                flagged,
                 sanitized_prompt=plan.get("gemini_payload_spec", {}).get(
                     "sanitized_user_prompt"
                 ),
                 tool_params=tool_params,
             )
-            self.memory_manager.save_exchange(session_id, question, guarded_answer)
-            return response
+            return
 
         sanitized_question, user_redacted = sanitize_text_for_gemini(question)
         plan["gemini_payload_spec"]["sanitized_user_prompt"] = sanitized_question
         plan["gemini_payload_spec"]["is_pii_removed"] = user_redacted
+        turn.sanitized_question = sanitized_question
+        turn.user_redacted = user_redacted
+        turn.retrieval_mode = self._retrieval_mode(plan)
+        turn.cache_key_scope = self._semantic_cache_scope(
+            plan, turn.session_id, turn.recent_context, warning, top_k, max_new_tokens
+        )
 
-        context_text = ""
-        rag_docs: List[Dict] = []
-        if plan.get("action") == "SEARCH_DB":
-            context_text, rag_docs = self._retrieve_context(
-                question, plan.get("db_query_spec"), top_k
-            )
-        elif plan.get("intent") == "CONTEXT_FOLLOWUP":
-            context_text = recent_context or history_text
-
+    def _lookup_cache(self, turn: "_Turn") -> None:
+        if turn.cache_key_scope is not None:
+            turn.cache_vector = self._embed_for_cache(turn.sanitized_question)
+        if turn.cache_vector is None or self.semantic_cache is None:
+            return
+        cached = self.semantic_cache.lookup(
+            turn.cache_vector,
+            turn.cache_key_scope,
+            namespace=self._cache_namespace,
+            terms=question_terms(turn.sanitized_question),
+        )
+        if cached is None:
+            return
+        logger.info(
+            "[Pipeline] trace_id=%s semantic cache hit (similarity=%.3f)",
+            turn.trace_id,
+            cached["cache_similarity"],
+        )
+        response = self._build_response(
+            cached["answer"],
+            cached["draft"],
+            cached["confidence"],
+            turn.plan,
+            cached["context_docs"],
+            turn.warning,
+            turn.trace_id,
+            output_flag=cached["output_guard_flagged"] or turn.user_redacted,
+            sanitized_prompt=turn.sanitized_question,
+            verdict=cached["verdict"],
+            citations=cached["citations"],
+        )
+        if cached["verified"]:
+            response["verified"] = True
+        response["cache_hit"] = True
+        self._save_exchange(turn, response["answer"])
+        turn.response = response
+
+    @staticmethod
+    def _sanitized_context(turn: "_Turn") -> Tuple[str, bool]:
         sanitized_context, context_redacted = sanitize_context_payload(
-            context_text or ""
+            turn.context_text or ""
         )
+        return sanitized_context or "Khong co du lieu lien quan.", context_redacted
 
-        answer, draft, confidence, flagged = self._call_gemini(
-            sanitized_question,
-            sanitized_context or "Khong co du lieu lien quan.",
-            max_new_tokens=max_new_tokens,
-        )
-        if warning and warning not in answer:
-            answer = f"{warning}\n\n{answer}"
+    def _finish_turn(
+        self,
+        turn: "_Turn",
+        answer: str,
+        draft: str,
+        confidence: float,
+        flagged: bool,
+        *,
+        context_redacted: bool,
+    ) -> Dict:
+        if turn.warning and turn.warning not in answer:
+            answer = f"{turn.warning}\n\n{answer}"
 
         response = self._build_response(
             answer,
             draft,
             confidence,
-            plan,
-            rag_docs,
-            warning,
-            trace_id,
-            output_flag=flagged or user_redacted or context_redacted,
-            sanitized_prompt=sanitized_question,
+            turn.plan,
+            turn.rag_docs,
+            turn.warning,
+            turn.trace_id,
+            output_flag=flagged or turn.user_redacted or context_redacted,
+            sanitized_prompt=turn.sanitized_question,
+            verdict=turn.verdict,
+            citations=turn.citations,
         )
-        self.memory_manager.save_exchange(session_id, question, answer)
+        if turn.verified:
+            response["verified"] = True
+        if turn.cache_vector is not None and self.semantic_cache is not None:
+            # Câu trả lời bị cắt cho vừa deadline hoặc sinh với retrieval kém hơn chế độ của
+            # scope không được phục vụ lại cho các câu hỏi khác
+            if not (turn.deadline_truncated or turn.retrieval_degraded):
+                self._store_cache(turn, answer, draft, confidence, flagged or context_redacted)
+            response["cache_hit"] = False
+        self._save_exchange(turn, answer)
+        turn.response = response
         return response
+
+    def _store_cache(
+        self, turn: "_Turn", answer: str, draft: str, confidence: float, flagged: bool
+    ) -> None:
+        self.semantic_cache.store(
+            turn.cache_vector,
+            {
+                "answer": answer,
+                "draft": draft,
+                "confidence": confidence,
+                "context_docs": turn.rag_docs,
+                "output_guard_flagged": flagged,
+                "verdict": turn.verdict,
+                "citations": turn.citations,
+                "verified": turn.verified,
+            },
+            turn.cache_key_scope,
+            namespace=self._cache_namespace,
+            terms=question_terms(turn.sanitized_question),
+        )
+
+
+@dataclass
+class _Turn:
+    """Trạng thái một câu hỏi giữa các stage (dùng chung cho ask và ask_batch)."""
+
+    question: str
+    session_id: str
+    trace_id: str
+    warning: Optional[str] = None
+    history_text: str = ""
+    recent_context: str = ""
+    plan: Dict = field(default_factory=dict)
+    sanitized_question: str = ""
+    user_redacted: bool = False
+    cache_key_scope: Optional[str] = None
+    cache_vector: Any = None
+    retrieval_mode: str = "none"  # chế độ retrieval lúc lập kế hoạch (xem _retrieval_mode)
+    retrieval_degraded: bool = False  # dense bị bỏ qua khi retrieve: không lưu cache
+    context_text: str = ""
+    rag_docs: List[Dict] = field(default_factory=list)
+    ticket: Optional[Ticket] = None  # set khi request đi qua scheduler (ask)
+    deadline: Optional[Deadline] = None
+    deadline_truncated: bool = False
+    verdict: str = "pass"
+    citations: Optional[List[str]] = None  # None: lấy các [n] trong câu trả lời
+    verified: bool = False  # đã qua self-correction
+    response: Optional[Dict] = None  # set khi request đã có câu trả lời
+    defer_exchange: bool = False  # ask_batch: giữ câu trả lời, ghi history khi cả batch xong
+    exchange_answer: Optional[str] = None
@@ -0,0 +1,181 @@
+"""
+Profile từng request được chọn (opt-in) để xem thời gian Python trong pipeline.ask.
+
+Request được profile khi có header X-Profile: 1 (PROFILE_HEADER_ENABLED) hoặc được chọn
+ngẫu nhiên theo PROFILE_SAMPLE_RATE. Hai chế độ (PROFILE_MODE):
+- cprofile: cProfile của thread chạy pipeline, file .prof đọc bằng pstats/snakeviz.
+- sample: thread phụ lấy stack của thread pipeline mỗi PROFILE_SAMPLE_INTERVAL_MS, file
+  .folded (định dạng collapsed stack của flamegraph.pl/speedscope), overhead thấp hơn.
+Chỉ thread gọi pipeline được profile (thread step của vLLM thì không). File đặt tên theo
+trace_id trong PROFILE_DIR, chỉ giữ PROFILE_MAX_FILES file mới nhất. Cả hai điều kiện tắt
+thì API không tạo profiler, request không qua code path nào của module này.
+"""
+from __future__ import annotations
+
+import cProfile
+import logging
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .config import Settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_MODES = ("cprofile", "sample")
+_NAME_PATTERN = re.compile(r"^[\w.-]+\.(prof|folded)$")
+
+
+class _CProfileCapture:
+    suffix = ".prof"
+
+    def __init__(self):
+        self._profile = cProfile.Profile()
+
+    def start(self) -> None:
+        self._profile.enable()
+
+    def stop(self) -> None:
+        self._profile.disable()
+
+    def dump(self, path: Path) -> None:
+        self._profile.dump_stats(str(path))
+
+
+class _StackSampler:
+    """Lấy stack của một thread theo chu kỳ bằng sys._current_frames()."""
+
+    suffix = ".folded"
+
+    def __init__(self, thread_id: int, interval_s: float):
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def dump(self, path: Path) -> None:
+        lines = [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+        path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+class RequestProfiler:
+    def __init__(
+        self,
+        directory: Path,
+        *,
+        sample_rate: float = 0.0,
+        header_enabled: bool = False,
+        mode: str = "cprofile",
+        max_files: int = 50,
+        sample_interval_ms: float = 5.0,
+        rng: Callable[[], float] = random.random,
+    ):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown PROFILE_MODE {mode!r}, expected one of {PROFILE_MODES}")
+        self.directory = Path(directory)
+        self.sample_rate = sample_rate
+        self.header_enabled = header_enabled
+        self.mode = mode
+        self.max_files = max(1, max_files)
+        self.sample_interval_s = sample_interval_ms / 1000.0
+        self._rng = rng
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> Optional["RequestProfiler"]:
+        """None khi tắt hẳn (PROFILE_SAMPLE_RATE = 0 và không nhận header)."""
+        if settings.profile_sample_rate <= 0 and not settings.profile_header_enabled:
+            return None
+        return cls(
+            settings.profile_dir,
+            sample_rate=settings.profile_sample_rate,
+            header_enabled=settings.profile_header_enabled,
+            mode=settings.profile_mode,
+            max_files=settings.profile_max_files,
+            sample_interval_ms=settings.profile_sample_interval_ms,
+        )
+
+    def should_profile(self, header: Optional[str]) -> bool:
+        if self.header_enabled and header and header.strip().lower() in ("1", "true", "yes"):
+            return True
+        return self.sample_rate > 0 and self._rng() < self.sample_rate
+
+    def run(self, fn: Callable[[], Dict[str, Any]]) -> Tuple[Dict[str, Any], str]:
+        """Chạy fn (trong thread hiện tại) dưới profiler; trả (kết quả, tên file profile)."""
+        if self.mode == "cprofile":
+            capture = _CProfileCapture()
+        else:
+            capture = _StackSampler(threading.get_ident(), self.sample_interval_s)
+        result: Optional[Dict[str, Any]] = None
+        capture.start()
+        try:
+            result = fn()
+        finally:
+            capture.stop()
+            trace_id = result.get("trace_id") if isinstance(result, dict) else None
+            name = self._write(capture, trace_id or f"failed-{uuid.uuid4().hex[:12]}")
+        return result, name
+
+    def _write(self, capture, key: str) -> str:
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{key}{capture.suffix}"
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            capture.dump(self.directory / name)
+            for stale in self._files()[self.max_files:]:
+                stale.unlink(missing_ok=True)
+        logger.info("Saved request profile %s", name)
+        return name
+
+    def _files(self) -> List[Path]:
+        if not self.directory.exists():
+            return []
+        files = [p for p in self.directory.iterdir() if _NAME_PATTERN.match(p.name)]
+        return sorted(files, key=lambda p: p.stat().st_mtime, reverse=True)
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        """Profile mới nhất trước."""
+        profiles = []
+        for path in self._files():
+            stat = path.stat()
+            profiles.append(
+                {
+                    "name": path.name,
+                    "mode": "cprofile" if path.suffix == ".prof" else "sample",
+                    "bytes": stat.st_size,
+                    "created_at": round(stat.st_mtime, 3),
+                }
+            )
+        return profiles
+
+    def path_for(self, name: str) -> Optional[Path]:
+        """Đường dẫn của profile; None nếu tên không hợp lệ hoặc không tồn tại."""
+        if not _NAME_PATTERN.match(name):
+            return None
+        path = self.directory / name
+        return path if path.is_file() else None
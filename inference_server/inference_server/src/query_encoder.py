@@ -0,0 +1,291 @@
+"""
+Backend encode query MedCPT (CLS embedding, chuẩn hóa L2) chọn qua QUERY_ENCODER_BACKEND:
+
+- torch:      AutoModel full precision (GPU nếu có, mặc định như trước)
+- torch_int8: torch dynamic int8 quantization các lớp Linear (CPU)
+- onnx:       graph ONNX export một lần vào QUERY_ENCODER_ONNX_DIR, chạy bằng onnxruntime
+- onnx_int8:  như onnx, weight được quantize dynamic int8 bằng onnxruntime.quantization
+
+parity_report() so sánh một backend với encoder tham chiếu (cosine + top-k overlap).
+"""
+from __future__ import annotations
+
+import inspect
+import logging
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .config import Settings
+
+if TYPE_CHECKING:
+    import faiss
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "torch_int8", "onnx", "onnx_int8")
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype="float32")
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class QueryEncoder(ABC):
+    """encode(texts) -> ma trận (n, dim) float32 đã chuẩn hóa L2."""
+
+    backend = "base"
+
+    def __init__(self, model_id: str, *, max_length: int = 64):
+        from transformers import AutoTokenizer
+
+        self.model_id = model_id
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_id)
+
+    def _tokenize(self, texts: Sequence[str], tensor_type: str):
+        return self.tokenizer(
+            list(texts),
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors=tensor_type,
+        )
+
+    @abstractmethod
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        ...
+
+    def encode_one(self, text: str) -> np.ndarray:
+        return self.encode([text])[0]
+
+    def memory_bytes(self) -> int:
+        """Byte của weight model (không gồm tokenizer Rust và workspace của runtime)."""
+        return 0
+
+
+class TorchQueryEncoder(QueryEncoder):
+    def __init__(
+        self,
+        model_id: str,
+        *,
+        quantize: bool = False,
+        max_length: int = 64,
+        num_threads: int = 0,
+    ):
+        import torch
+        from transformers import AutoModel
+
+        super().__init__(model_id, max_length=max_length)
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        device = "cuda" if torch.cuda.is_available() and not quantize else "cpu"
+        self.device = torch.device(device)
+        model = AutoModel.from_pretrained(model_id).to(self.device)
+        model.eval()
+        if quantize:
+            # Dynamic int8: weight Linear lưu int8, activation quantize lúc chạy (chỉ CPU)
+            model = torch.ao.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        self.backend = "torch_int8" if quantize else "torch"
+        self.model = model
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        import torch
+
+        inputs = self._tokenize(texts, "pt").to(self.device)
+        with torch.inference_mode():
+            cls_emb = self.model(**inputs).last_hidden_state[:, 0, :]
+        return _normalize(cls_emb.float().cpu().numpy())
+
+    def memory_bytes(self) -> int:
+        # Linear int8 (quantize_dynamic) lưu (weight, bias) thành tuple trong state_dict
+        total = 0
+        pending = list(self.model.state_dict().values())
+        while pending:
+            value = pending.pop()
+            if isinstance(value, tuple):
+                pending.extend(value)
+            elif hasattr(value, "element_size"):
+                total += value.numel() * value.element_size()
+        return total
+
+
+def _cls_module(model):
+    """Bọc model để graph ONNX chỉ trả về CLS embedding (output nhỏ, không có hidden states)."""
+    import torch
+
+    class ClsEncoder(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            outputs = self.inner(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                token_type_ids=token_type_ids,
+            )
+            return outputs.last_hidden_state[:, 0, :]
+
+    return ClsEncoder(model).eval()
+
+
+def export_onnx(model_id: str, onnx_path: Path, *, opset: int = 17) -> Path:
+    """Export MedCPT query encoder sang ONNX (batch/seq động)."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    onnx_path = Path(onnx_path)
+    onnx_path.parent.mkdir(parents=True, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    # Export bằng attention "eager" để graph không phụ thuộc kernel SDPA
+    model = AutoModel.from_pretrained(model_id, attn_implementation="eager").eval()
+    sample = tokenizer(["đau đầu kéo dài"], return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    if "token_type_ids" not in sample:
+        sample["token_type_ids"] = torch.zeros_like(sample["input_ids"])
+    kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        kwargs["dynamo"] = False
+    logger.info("Exporting %s to ONNX at %s", model_id, onnx_path)
+    with torch.inference_mode():
+        torch.onnx.export(
+            _cls_module(model),
+            tuple(sample[name] for name in names),
+            str(onnx_path),
+            input_names=names,
+            output_names=["cls_embedding"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in names},
+            opset_version=opset,
+            **kwargs,
+        )
+    return onnx_path
+
+
+def quantize_onnx(onnx_path: Path, output_path: Path) -> Path:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(str(onnx_path), str(output_path), weight_type=QuantType.QInt8)
+    return output_path
+
+
+class OnnxQueryEncoder(QueryEncoder):
+    def __init__(
+        self,
+        model_id: str,
+        onnx_dir: Path,
+        *,
+        quantize: bool = False,
+        max_length: int = 64,
+        num_threads: int = 0,
+    ):
+        try:
+            import onnxruntime as ort
+        except ImportError as exc:  # pragma: no cover - phụ thuộc môi trường
+            raise RuntimeError(
+                "QUERY_ENCODER_BACKEND=onnx cần onnxruntime (pip install onnxruntime onnx)"
+            ) from exc
+
+        super().__init__(model_id, max_length=max_length)
+        onnx_dir = Path(onnx_dir)
+        slug = model_id.strip("/").replace("/", "__")
+        fp32_path = onnx_dir / f"{slug}.onnx"
+        if not fp32_path.exists():
+            export_onnx(model_id, fp32_path)
+        model_path = fp32_path
+        if quantize:
+            model_path = onnx_dir / f"{slug}.int8.onnx"
+            if not model_path.exists():
+                quantize_onnx(fp32_path, model_path)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            str(model_path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = [i.name for i in self.session.get_inputs()]
+        self.model_path = model_path
+        self.backend = "onnx_int8" if quantize else "onnx"
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        inputs = self._tokenize(texts, "np")
+        feeds = {}
+        for name in self._input_names:
+            if name in inputs:
+                feeds[name] = inputs[name].astype("int64")
+            else:
+                feeds[name] = np.zeros_like(inputs["input_ids"], dtype="int64")
+        (cls_emb,) = self.session.run(None, feeds)
+        return _normalize(cls_emb)
+
+    def memory_bytes(self) -> int:
+        # onnxruntime load toàn bộ initializer vào RAM: xấp xỉ bằng kích thước file
+        return Path(self.model_path).stat().st_size
+
+
+def build_query_encoder(settings: Settings, backend: Optional[str] = None) -> QueryEncoder:
+    backend = backend or settings.query_encoder_backend
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown QUERY_ENCODER_BACKEND {backend!r}, expected one of {BACKENDS}")
+    common = {
+        "max_length": settings.query_encoder_max_length,
+        "num_threads": settings.query_encoder_threads,
+    }
+    if backend.startswith("onnx"):
+        onnx_dir = settings.query_encoder_onnx_dir or Path(settings.rag_cache_dir) / "onnx"
+        return OnnxQueryEncoder(
+            settings.medcpt_encoder_id, onnx_dir, quantize=backend == "onnx_int8", **common
+        )
+    return TorchQueryEncoder(
+        settings.medcpt_encoder_id, quantize=backend == "torch_int8", **common
+    )
+
+
+def parity_report(
+    reference: QueryEncoder,
+    candidate: QueryEncoder,
+    queries: Sequence[str],
+    *,
+    index: Optional["faiss.Index"] = None,
+    corpus_texts: Optional[Sequence[str]] = None,
+    top_k: int = 10,
+) -> Dict[str, float]:
+    """
+    Cosine giữa embedding của hai encoder cho từng query và overlap top-k
+    khi search trên FAISS index (hoặc trên corpus_texts embed bằng encoder tham chiếu).
+    """
+    ref = reference.encode(queries)
+    cand = candidate.encode(queries)
+    cosines = np.sum(ref * cand, axis=1)
+
+    if index is not None:
+        _, ref_ids = index.search(ref, top_k)
+        _, cand_ids = index.search(cand, top_k)
+    elif corpus_texts:
+        corpus = reference.encode(corpus_texts)
+        k = min(top_k, len(corpus))
+        ref_ids = np.argsort(-(ref @ corpus.T), axis=1)[:, :k]
+        cand_ids = np.argsort(-(cand @ corpus.T), axis=1)[:, :k]
+    else:
+        ref_ids = cand_ids = None
+
+    report = {
+        "queries": len(queries),
+        "cosine_mean": float(np.mean(cosines)),
+        "cosine_min": float(np.min(cosines)),
+    }
+    if ref_ids is not None:
+        overlaps: List[float] = [
+            len(set(r.tolist()) & set(c.tolist())) / max(1, len(r)) for r, c in zip(ref_ids, cand_ids)
+        ]
+        report[f"top{top_k}_overlap_mean"] = float(np.mean(overlaps))
+        report[f"top{top_k}_overlap_min"] = float(np.min(overlaps))
+    return report
@@ -0,0 +1,73 @@
+"""
+Rút gọn và serialize response của /v1/chat/completions.
+
+RESPONSE_MODES:
+- full: đủ mọi field của ChatResponse (mặc định, tương thích client cũ).
+- compact: bỏ draft, router_plan, sanitized_user_prompt, tool_params và field None;
+  abstract trong context_docs cắt còn RESPONSE_COMPACT_ABSTRACT_CHARS ký tự.
+- ids: như compact nhưng context_docs chỉ còn pmid/rank/score.
+
+Response được serialize thẳng bằng orjson (nếu có) thay vì qua validate Pydantic + json stdlib.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, Iterable
+
+from fastapi.responses import JSONResponse
+
+try:  # orjson là optional: không có thì dùng json stdlib
+    import orjson
+except ImportError:  # pragma: no cover - phụ thuộc môi trường
+    orjson = None
+
+RESPONSE_MODES = ("full", "compact", "ids")
+_HEAVY_FIELDS = ("draft", "router_plan", "sanitized_user_prompt", "tool_params")
+_ID_FIELDS = ("pmid", "rank", "score")
+
+
+def shape_response(
+    result: Dict[str, Any], mode: str, *, fields: Iterable[str], abstract_chars: int = 240
+) -> Dict[str, Any]:
+    """Chỉ giữ các field của schema (fields); field thiếu trong result là None ở mode full."""
+    if mode not in RESPONSE_MODES:
+        raise ValueError(f"Unknown response_mode {mode!r}, expected one of {RESPONSE_MODES}")
+    if mode == "full":
+        return {name: result.get(name) for name in fields}
+    shaped = {
+        name: result[name]
+        for name in fields
+        if name not in _HEAVY_FIELDS and result.get(name) is not None
+    }
+    docs = result.get("context_docs") or []
+    if mode == "ids":
+        shaped["context_docs"] = [{key: doc[key] for key in _ID_FIELDS if key in doc} for doc in docs]
+    else:
+        shaped["context_docs"] = [_compact_doc(doc, abstract_chars) for doc in docs]
+    return shaped
+
+
+def _compact_doc(doc: Dict[str, Any], abstract_chars: int) -> Dict[str, Any]:
+    compact = dict(doc)
+    abstract = compact.get("abstract") or ""
+    if len(abstract) > abstract_chars:
+        compact["abstract"] = abstract[:abstract_chars].rstrip() + "…"
+    return compact
+
+
+def _default(value: Any) -> Any:
+    # numpy scalar/array và kiểu lạ khác (Path, set...)
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if isinstance(value, (set, tuple)):
+        return list(value)
+    return str(value)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON UTF-8 không escape, orjson nếu được cài (nhanh hơn json stdlib nhiều lần)."""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
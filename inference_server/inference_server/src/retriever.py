@@ -1,122 +1,205 @@
 from __future__ import annotations
 
+import bisect
 import logging
+import math
+import os
 import tarfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
 
-import faiss
 import numpy as np
-import torch
-from datasets import load_from_disk
-from huggingface_hub import hf_hub_download, snapshot_download
-from transformers import AutoModel, AutoTokenizer
 
+from .arrow_shards import join_text, read_arrow_table
 from .config import Settings, get_settings
+from .dedup import collapse_near_duplicates, simhash
+from .docstore import DocStore
+from .lexical_index import LexicalIndex, reciprocal_rank_fusion
+from .shard_stats import ShardAccessStats
+
+if TYPE_CHECKING:  # faiss/torch/transformers/datasets chỉ import khi load asset RAG
+    import faiss
 
 logger = logging.getLogger(__name__)
 
+Hit = Tuple[int, float, str]  # (global row, score, "dense" | "bm25")
+
+
+@dataclass
+class _ShardLoad:
+    table: object = None
+    error: Optional[BaseException] = None
+    done: threading.Event = field(default_factory=threading.Event)
+
 
 class PubMedRetriever:
-    def __init__(self, settings: Settings | None = None):
+    def __init__(self, settings: Settings | None = None, *, load: bool = True):
         self.settings = settings or get_settings()
         self.cache_dir = Path(self.settings.rag_cache_dir)
         self.cache_dir.mkdir(parents=True, exist_ok=True)
 
         self.pubmed_ds = None
+        self.docstore: DocStore | None = None
+        self._docstore_lock = threading.Lock()
         self.index = None
+        self.tokenizer = None
+        self.encoder = None
+        self.query_encoder = None
+        self.lexical: LexicalIndex | None = None
+        self.signatures: np.ndarray | None = None
         self.available = False
+        self.lexical_available = False
+        self._dense_slots: threading.BoundedSemaphore | None = None
+        if self.settings.rag_dense_max_concurrency > 0:
+            self._dense_slots = threading.BoundedSemaphore(self.settings.rag_dense_max_concurrency)
+        self._dataset_ready = False
         # Cache files đã mở ở class level để tái sử dụng giữa các lần retrieve
-        self._file_cache = {}  # arrow_file -> table
-        self._max_cache_size = 10  # Giới hạn số files trong cache để tránh tốn RAM
+        self._file_cache: "OrderedDict[Path, object]" = OrderedDict()  # arrow_file -> table (LRU)
+        self._max_cache_size = self.settings.rag_shard_cache_size  # Giới hạn số files trong cache để tránh tốn RAM
+        self._cache_lock = threading.Lock()
+        self._loading: Dict[Path, _ShardLoad] = {}  # shard đang được một thread đọc từ disk
+        self.access_stats: ShardAccessStats | None = None
+        self.preload_thread: threading.Thread | None = None
+        if self.settings.rag_access_stats_enabled:
+            self.access_stats = ShardAccessStats(
+                self.cache_dir / "shard_access_stats.json",
+                flush_seconds=self.settings.rag_access_stats_flush_seconds,
+            )
+            self.access_stats.load()
 
-        try:
-            dataset_path = self._ensure_dataset()
-            logger.info(f"Đang load dataset từ: {dataset_path}")
-            # Load dataset với ignore_metadata để tránh lỗi format cũ
+        if load and self.settings.rag_enabled:
+            # Load tuần tự (giữ hành vi cũ cho scripts); server dùng load song song qua warmup
             try:
-                logger.debug("Thử load dataset với load_from_disk()...")
-                self.pubmed_ds = load_from_disk(str(dataset_path))
-                logger.info(f"Dataset đã load thành công: {self.pubmed_ds.num_rows} rows")
-            except Exception as load_exc:
-                # Nếu load thất bại do metadata, thử load từ arrow files trực tiếp
-                # Đây là expected behavior khi metadata format không tương thích
-                logger.debug("Load với metadata thất bại (expected), chuyển sang lazy loading từ arrow files: %s", load_exc)
-                from datasets import Dataset
-                import pyarrow as pa
-                arrow_files = sorted(list(Path(dataset_path).glob("data-*.arrow")))
-                if arrow_files:
-                    # Tối ưu: Load dataset với memory mapping (mmap) để không tốn RAM
-                    # Chỉ load metadata và mapping, data sẽ được đọc từ disk khi cần
-                    logger.info("Đang load dataset với memory mapping (lazy loading)...")
-                    from datasets import Dataset
-                    import pyarrow as pa
-                    
-                    # Tạo mapping index -> file để truy cập nhanh
-                    self._index_to_file = {}
-                    self._file_row_counts = {}
-                    current_idx = 0
-                    
-                    for arrow_file in sorted(arrow_files):
-                        try:
-                            # Đọc metadata để biết số rows
-                            # Sử dụng open_file() thay vì open_stream() cho RecordBatchFile format
-                            mmap = pa.memory_map(str(arrow_file))
-                            try:
-                                # Thử open_file() trước (cho RecordBatchFile format)
-                                reader = pa.ipc.open_file(mmap)
-                                table = reader.read_all()
-                            except (pa.lib.ArrowInvalid, ValueError, TypeError):
-                                # Nếu không được, thử open_stream() (cho stream format)
-                                mmap.close()
-                                mmap = pa.memory_map(str(arrow_file))
-                                reader = pa.ipc.open_stream(mmap)
-                                table = reader.read_all()
-                            mmap.close()
-                            
-                            num_rows = len(table)
-                            self._index_to_file[current_idx] = (arrow_file, current_idx)
-                            self._file_row_counts[arrow_file] = num_rows
-                            current_idx += num_rows
-                            logger.debug(f"Đã load metadata từ {arrow_file.name}: {num_rows} rows")
-                        except Exception as e:
-                            logger.warning(f"Không thể đọc metadata từ {arrow_file}: {e}", exc_info=True)
-                            continue
-                    
-                    self._dataset_path = dataset_path
-                    self._arrow_files = sorted(arrow_files)
-                    self._total_rows = current_idx
-                    self._lazy_dataset = True
-                    logger.info(f"Dataset mapping đã sẵn sàng: {self._total_rows} rows từ {len(arrow_files)} files")
-                else:
-                    raise load_exc
-            
-            logger.info("Đang load FAISS index...")
-            self.index = self._ensure_faiss()
-            logger.info(f"FAISS index đã load: {self.index.ntotal} vectors")
-            self.available = True
-            if hasattr(self, '_lazy_dataset') and self._lazy_dataset:
-                logger.info(
-                    "Loaded PubMed dataset mapping (%s rows) & FAISS index (lazy loading).",
-                    self._total_rows,
-                )
-            else:
-                logger.info(
-                    "Loaded PubMed dataset (%s rows) & FAISS index.",
-                    self.pubmed_ds.num_rows if self.pubmed_ds else 0,
-                )
-        except Exception as exc:
-            logger.warning("RAG assets unavailable: %s", exc)
+                self.load_dataset()
+                self.load_lexical()
+                self.load_signatures()
+                self.load_index()
+            except Exception as exc:
+                logger.warning("RAG assets unavailable: %s", exc)
+            self.load_encoder()
+
+    def _refresh_available(self) -> None:
+        self.available = (
+            self._dataset_ready and self.index is not None and self.encoder is not None
+        )
+        self.lexical_available = self._dataset_ready and self.lexical is not None
+
+    def load_dataset(self) -> None:
+        """Mở docstore nếu đã build, không thì load dataset (in-memory) hoặc mapping index -> arrow file (lazy loading)."""
+        docstore_path = self.cache_dir / self.settings.rag_docstore_file
+        if self.settings.rag_docstore_enabled and DocStore.exists(docstore_path):
+            self.docstore = DocStore(docstore_path, cache_blocks=self.settings.rag_docstore_cache_blocks)
+            logger.info("Docstore đã mở: %d docs từ %s", len(self.docstore), docstore_path)
+            self._dataset_ready = True
+            self._refresh_available()
+            self._verify_docstore()
+            return
+        self._load_arrow_dataset()
 
-        device_str = "cuda" if torch.cuda.is_available() else "cpu"
-        self.device = torch.device(device_str)
-        self.tokenizer = AutoTokenizer.from_pretrained(
-            self.settings.medcpt_encoder_id
+    def _verify_docstore(self) -> None:
+        """
+        Docstore build từ dataset cũ sẽ map FAISS id sang nhầm abstract: khi cả docstore và
+        FAISS index đã load mà số document khác ntotal thì bỏ docstore, đọc shard Arrow.
+        """
+        with self._docstore_lock:
+            docstore, index = self.docstore, self.index
+            if docstore is None or index is None or len(docstore) == index.ntotal:
+                return
+            # Không close(): thread khác có thể đang đọc, mmap được đóng khi docstore được gc
+            self.docstore = None
+            self._dataset_ready = False
+            self._refresh_available()
+        logger.error(
+            "Docstore %s có %d docs nhưng FAISS index có %d vectors (build lại bằng python -m src.docstore); "
+            "chuyển sang đọc shard Arrow",
+            docstore.path,
+            len(docstore),
+            index.ntotal,
         )
-        self.encoder = AutoModel.from_pretrained(
-            self.settings.medcpt_encoder_id
-        ).to(self.device)
-        self.encoder.eval()
+        try:
+            self._load_arrow_dataset()
+        except Exception as exc:
+            logger.error("Không load được shard Arrow sau khi bỏ docstore: %s", exc)
+
+    def _load_arrow_dataset(self) -> None:
+        dataset_path = self._ensure_dataset()
+        logger.info(f"Đang load dataset từ: {dataset_path}")
+        # Load dataset với ignore_metadata để tránh lỗi format cũ
+        try:
+            from datasets import load_from_disk
+
+            logger.debug("Thử load dataset với load_from_disk()...")
+            self.pubmed_ds = load_from_disk(str(dataset_path))
+            logger.info(f"Dataset đã load thành công: {self.pubmed_ds.num_rows} rows")
+        except Exception as load_exc:
+            # Nếu load thất bại do metadata, thử load từ arrow files trực tiếp
+            # Đây là expected behavior khi metadata format không tương thích
+            logger.debug("Load với metadata thất bại (expected), chuyển sang lazy loading từ arrow files: %s", load_exc)
+            arrow_files = sorted(list(Path(dataset_path).glob("data-*.arrow")))
+            if not arrow_files:
+                raise load_exc
+            # Tối ưu: Load dataset với memory mapping (mmap) để không tốn RAM
+            # Chỉ load metadata và mapping, data sẽ được đọc từ disk khi cần
+            logger.info("Đang load dataset với memory mapping (lazy loading)...")
+
+            # Tạo mapping index -> file để truy cập nhanh
+            self._index_to_file = {}
+            self._file_row_counts = {}
+            current_idx = 0
+
+            for arrow_file in sorted(arrow_files):
+                try:
+                    # Đọc metadata để biết số rows
+                    num_rows = len(read_arrow_table(arrow_file))
+                    self._index_to_file[current_idx] = (arrow_file, current_idx)
+                    self._file_row_counts[arrow_file] = num_rows
+                    current_idx += num_rows
+                    logger.debug(f"Đã load metadata từ {arrow_file.name}: {num_rows} rows")
+                except Exception as e:
+                    logger.warning(f"Không thể đọc metadata từ {arrow_file}: {e}", exc_info=True)
+                    continue
+
+            self._dataset_path = dataset_path
+            self._arrow_files = [f for f in sorted(arrow_files) if f in self._file_row_counts]
+            # Row bắt đầu của từng shard (cùng thứ tự _arrow_files) để bisect
+            self._shard_starts = list(self._index_to_file)
+            self._total_rows = current_idx
+            self._lazy_dataset = True
+            logger.info(f"Dataset mapping đã sẵn sàng: {self._total_rows} rows từ {len(arrow_files)} files")
+            self.start_preload()
+        self._dataset_ready = True
+        self._refresh_available()
+
+    def load_index(self) -> None:
+        logger.info("Đang load FAISS index...")
+        self.index = self._ensure_faiss()
+        logger.info(f"FAISS index đã load: {self.index.ntotal} vectors")
+        self._refresh_available()
+        self._verify_docstore()
+
+    def load_lexical(self) -> None:
+        """Mở BM25 index (memory-mapped) nếu đã được build vào RAG cache dir."""
+        if not self.settings.rag_bm25_enabled:
+            return
+        index_dir = self.cache_dir / self.settings.rag_bm25_dirname
+        if not LexicalIndex.exists(index_dir):
+            logger.info("Không có BM25 index tại %s (build: python -m src.lexical_index)", index_dir)
+            return
+        self.lexical = LexicalIndex(index_dir, max_postings=self.settings.rag_bm25_max_postings)
+        logger.info("BM25 index đã load: %d docs", self.lexical.num_docs)
+        self._refresh_available()
+
+    def load_encoder(self) -> None:
+        from .query_encoder import build_query_encoder
+
+        self.query_encoder = build_query_encoder(self.settings)
+        self.tokenizer = self.query_encoder.tokenizer
+        self.encoder = self.query_encoder
+        logger.info("Query encoder backend: %s", self.query_encoder.backend)
+        self._refresh_available()
 
     def _ensure_dataset(self) -> Path:
         dataset_dir = self.cache_dir / self.settings.rag_dataset_dirname
@@ -124,6 +207,7 @@ class PubMedRetriever:
             return dataset_dir
 
         logger.info("Downloading dataset folder from Hugging Face…")
+        from huggingface_hub import snapshot_download
         
         # Download toàn bộ folder pubmed_ds_embedded từ repo
         snapshot_download(
@@ -143,9 +227,13 @@ class PubMedRetriever:
         return dataset_dir
 
     def _ensure_faiss(self) -> faiss.Index:
+        import faiss
+
         index_path = self.cache_dir / self.settings.rag_index_file
         if not index_path.exists():
             logger.info("Downloading FAISS index…")
+            from huggingface_hub import hf_hub_download
+
             hf_hub_download(
                 repo_id=self.settings.rag_repo_id,
                 filename=self.settings.rag_index_file,
@@ -156,213 +244,357 @@ class PubMedRetriever:
         return faiss.read_index(str(index_path))
 
     def encode_query(self, query: str) -> np.ndarray:
-        inputs = self.tokenizer(
-            query,
-            padding=True,
-            truncation=True,
-            max_length=64,
-            return_tensors="pt",
-        ).to(self.device)
-        with torch.no_grad():
-            outputs = self.encoder(**inputs)
-            cls_emb = outputs.last_hidden_state[:, 0, :]
-        vec = cls_emb[0].cpu().numpy().astype("float32")
-        faiss.normalize_L2(vec.reshape(1, -1))
-        return vec
+        return self.query_encoder.encode_one(query)
 
-    def _get_doc_by_index(self, idx: int) -> Dict | None:
-        """Lấy document theo index, sử dụng lazy loading với memory mapping."""
-        if hasattr(self, '_lazy_dataset') and self._lazy_dataset:
-            # Tìm file chứa index này
-            import pyarrow as pa
-            current_idx = 0
-            for arrow_file in self._arrow_files:
-                num_rows = self._file_row_counts.get(arrow_file, 0)
-                if idx < current_idx + num_rows:
-                    # Index nằm trong file này
-                    local_idx = idx - current_idx
-                    try:
-                        # Kiểm tra cache trước
-                        if hasattr(self, '_file_cache') and arrow_file in self._file_cache:
-                            table = self._file_cache[arrow_file]
-                        else:
-                            # Đọc file với memory mapping (không load toàn bộ vào RAM)
-                            mmap = pa.memory_map(str(arrow_file))
-                            try:
-                                # Thử open_file() trước (cho RecordBatchFile format)
-                                reader = pa.ipc.open_file(mmap)
-                                table = reader.read_all()
-                            except (pa.lib.ArrowInvalid, ValueError, TypeError):
-                                # Nếu không được, thử open_stream() (cho stream format)
-                                mmap.close()
-                                mmap = pa.memory_map(str(arrow_file))
-                                reader = pa.ipc.open_stream(mmap)
-                                table = reader.read_all()
-                            mmap.close()
-                            # Lưu vào cache
-                            if hasattr(self, '_file_cache'):
-                                if len(self._file_cache) >= self._max_cache_size:
-                                    oldest_file = next(iter(self._file_cache))
-                                    del self._file_cache[oldest_file]
-                                self._file_cache[arrow_file] = table
-                        
-                        if local_idx < len(table):
-                            # Lấy row từ table bằng slice
-                            row_slice = table.slice(local_idx, 1)
-                            # Lấy giá trị từ các columns
-                            title_val = row_slice["title"][0]
-                            abstract_val = row_slice["abstract"][0]
-                            pmid_val = row_slice["PMID"][0]
-                            
-                            # Convert sang Python types
-                            if hasattr(title_val, "as_py"):
-                                title = title_val.as_py()
-                            else:
-                                title = str(title_val)
-                            
-                            if hasattr(abstract_val, "as_py"):
-                                abstract = abstract_val.as_py()
-                            else:
-                                abstract = str(abstract_val)
-                            
-                            if hasattr(pmid_val, "as_py"):
-                                pmid = pmid_val.as_py()
-                            else:
-                                pmid = int(pmid_val)
-                            
-                            # Xử lý nếu title/abstract là list
-                            if isinstance(title, list):
-                                title = " ".join(str(x) for x in title) if title else ""
-                            if isinstance(abstract, list):
-                                abstract = " ".join(str(x) for x in abstract) if abstract else ""
-                            
-                            return {
-                                "title": title,
-                                "abstract": abstract,
-                                "PMID": pmid,
-                            }
-                    except Exception as e:
-                        logger.warning(f"Lỗi khi đọc file {arrow_file}: {e}", exc_info=True)
-                        return None
-                current_idx += num_rows
+    def _read_arrow_table(self, arrow_file: Path):
+        """Đọc một shard từ disk (tách riêng để test thay được)."""
+        return read_arrow_table(arrow_file)
+
+    def _get_table(self, arrow_file: Path):
+        """
+        Lấy shard từ cache (LRU), đọc từ disk nếu chưa có. Mọi truy cập _file_cache đều
+        giữ _cache_lock; nhiều thread cùng miss một shard thì chỉ một thread đọc disk
+        (single-flight), các thread khác chờ kết quả của nó thay vì đọc trùng.
+        """
+        with self._cache_lock:
+            table = self._file_cache.get(arrow_file)
+            if table is not None:
+                self._file_cache.move_to_end(arrow_file)
+                return table
+            load = self._loading.get(arrow_file)
+            owner = load is None
+            if owner:
+                load = self._loading[arrow_file] = _ShardLoad()
+        if not owner:
+            load.done.wait()
+            if load.error is not None:
+                raise load.error
+            return load.table
+        try:
+            load.table = self._read_arrow_table(arrow_file)
+        except BaseException as exc:
+            load.error = exc
+            raise
+        finally:
+            with self._cache_lock:
+                del self._loading[arrow_file]
+                if load.error is None:
+                    self._file_cache[arrow_file] = load.table
+                    while len(self._file_cache) > self._max_cache_size:
+                        self._file_cache.popitem(last=False)
+            load.done.set()
+        return load.table
+
+    def _locate(self, idx: int) -> Tuple[Path, int] | None:
+        """Tìm shard chứa global index và vị trí local trong shard."""
+        if idx < 0 or idx >= self._total_rows:
             return None
-        else:
-            # Dataset đã load vào memory
-            if idx < 0 or (self.pubmed_ds is not None and idx >= len(self.pubmed_ds)):
+        pos = bisect.bisect_right(self._shard_starts, idx) - 1
+        arrow_file = self._arrow_files[pos]
+        return arrow_file, idx - self._shard_starts[pos]
+
+    @staticmethod
+    def _row_from_table(table, local_idx: int) -> Dict | None:
+        if local_idx >= len(table):
+            return None
+        # Lấy row từ table bằng slice
+        row_slice = table.slice(local_idx, 1)
+        title_val = row_slice["title"][0]
+        abstract_val = row_slice["abstract"][0]
+        pmid_val = row_slice["PMID"][0]
+
+        # Convert sang Python types
+        title = title_val.as_py() if hasattr(title_val, "as_py") else str(title_val)
+        abstract = abstract_val.as_py() if hasattr(abstract_val, "as_py") else str(abstract_val)
+        pmid = pmid_val.as_py() if hasattr(pmid_val, "as_py") else int(pmid_val)
+
+        return {"title": join_text(title), "abstract": join_text(abstract), "PMID": pmid}
+
+    def _get_doc_by_index(self, idx: int) -> Dict | None:
+        """Lấy document theo index: docstore, hoặc lazy loading shard Arrow với memory mapping."""
+        if self.docstore is not None:
+            return self.docstore.get(int(idx))
+        if getattr(self, "_lazy_dataset", False):
+            location = self._locate(int(idx))
+            if location is None:
                 return None
-            row = self.pubmed_ds[int(idx)]
-            return {
-                "title": row.get("title", ""),
-                "abstract": row.get("abstract", ""),
-                "PMID": row.get("PMID", ""),
-            }
+            arrow_file, local_idx = location
+            if self.access_stats is not None:
+                self.access_stats.record(arrow_file.name, local_idx)
+            try:
+                table = self._get_table(arrow_file)
+            except Exception as e:
+                logger.warning(f"Lỗi khi đọc file {arrow_file}: {e}", exc_info=True)
+                return None
+            return self._row_from_table(table, local_idx)
 
-    def retrieve(self, question: str, top_k: int) -> List[Dict]:
-        if not self.available or self.index is None:
-            return []
+        # Dataset đã load vào memory
+        if idx < 0 or (self.pubmed_ds is not None and idx >= len(self.pubmed_ds)):
+            return None
+        row = self.pubmed_ds[int(idx)]
+        return {
+            "title": row.get("title", ""),
+            "abstract": row.get("abstract", ""),
+            "PMID": row.get("PMID", ""),
+        }
 
-        query_vec = self.encode_query(question).reshape(1, -1)
-        distances, indices = self.index.search(query_vec, top_k)
+    def docs_for_indices(self, indices, distances, sources: Optional[Sequence[str]] = None) -> List[Dict]:
+        """Map kết quả FAISS/BM25 (indices, scores) sang documents theo rank."""
         docs: List[Dict] = []
-        
-        # Sử dụng class-level cache, chỉ cache trong scope này nếu cần
-        cached_files = self._file_cache.copy() if hasattr(self, '_file_cache') else {}
-        
-        for rank, (idx, score) in enumerate(zip(indices[0], distances[0]), 1):
+        for rank, (idx, score) in enumerate(zip(indices, distances), 1):
             if idx < 0:
                 continue
-            
-            if hasattr(self, '_lazy_dataset') and self._lazy_dataset:
-                # Lazy loading: tìm file và đọc
-                current_idx = 0
-                found = False
-                for arrow_file in self._arrow_files:
-                    num_rows = self._file_row_counts.get(arrow_file, 0)
-                    if idx < current_idx + num_rows:
-                        local_idx = idx - current_idx
-                        # Cache file đã mở
-                        if arrow_file not in cached_files:
-                            try:
-                                import pyarrow as pa
-                                mmap = pa.memory_map(str(arrow_file))
-                                try:
-                                    # Thử open_file() trước (cho RecordBatchFile format)
-                                    reader = pa.ipc.open_file(mmap)
-                                    table = reader.read_all()
-                                except (pa.lib.ArrowInvalid, ValueError, TypeError):
-                                    # Nếu không được, thử open_stream() (cho stream format)
-                                    mmap.close()
-                                    mmap = pa.memory_map(str(arrow_file))
-                                    reader = pa.ipc.open_stream(mmap)
-                                    table = reader.read_all()
-                                mmap.close()
-                                cached_files[arrow_file] = table
-                                # Cập nhật class-level cache (với giới hạn size)
-                                if hasattr(self, '_file_cache'):
-                                    if len(self._file_cache) >= self._max_cache_size:
-                                        # Xóa file cũ nhất (FIFO)
-                                        oldest_file = next(iter(self._file_cache))
-                                        del self._file_cache[oldest_file]
-                                    self._file_cache[arrow_file] = table
-                            except Exception as e:
-                                logger.warning(f"Lỗi khi đọc file {arrow_file}: {e}", exc_info=True)
-                                break
-                        
-                        table = cached_files[arrow_file]
-                        if local_idx < len(table):
-                            # Lấy row từ table bằng slice
-                            row_slice = table.slice(local_idx, 1)
-                            # Lấy giá trị từ các columns
-                            title_val = row_slice["title"][0]
-                            abstract_val = row_slice["abstract"][0]
-                            pmid_val = row_slice["PMID"][0]
-                            
-                            # Convert sang Python types
-                            if hasattr(title_val, "as_py"):
-                                title = title_val.as_py()
-                            else:
-                                title = str(title_val)
-                            
-                            if hasattr(abstract_val, "as_py"):
-                                abstract = abstract_val.as_py()
-                            else:
-                                abstract = str(abstract_val)
-                            
-                            if hasattr(pmid_val, "as_py"):
-                                pmid = pmid_val.as_py()
-                            else:
-                                pmid = int(pmid_val)
-                            
-                            # Xử lý nếu title/abstract là list
-                            if isinstance(title, list):
-                                title = " ".join(str(x) for x in title) if title else ""
-                            if isinstance(abstract, list):
-                                abstract = " ".join(str(x) for x in abstract) if abstract else ""
-                            
-                            docs.append({
-                                "title": title,
-                                "abstract": abstract,
-                                "pmid": str(pmid) if pmid else "",
-                                "score": float(score),
-                                "rank": rank,
-                            })
-                            found = True
-                        break
-                    current_idx += num_rows
-                if not found:
-                    continue
-            else:
-                # Dataset đã load vào memory
-                if idx < 0 or (self.pubmed_ds is not None and idx >= len(self.pubmed_ds)):
-                    continue
-                row = self.pubmed_ds[int(idx)]
-                docs.append({
-                    "title": row.get("title", ""),
-                    "abstract": row.get("abstract", ""),
-                    "pmid": row.get("PMID", ""),
-                    "score": float(score),
-                    "rank": rank,
-                })
-        
+            row = self._get_doc_by_index(int(idx))
+            if row is None:
+                continue
+            pmid = row["PMID"]
+            if self.docstore is not None or getattr(self, "_lazy_dataset", False):
+                pmid = str(pmid) if pmid else ""
+            doc = {
+                "title": row["title"],
+                "abstract": row["abstract"],
+                "pmid": pmid,
+                "score": float(score),
+                "rank": rank,
+            }
+            if sources is not None and sources[rank - 1] != "dense":
+                doc["retrieval"] = sources[rank - 1]
+            docs.append(doc)
         return docs
 
+    def _hits_to_docs(self, hits: List[Hit]) -> List[Dict]:
+        return self.docs_for_indices(
+            [row for row, _, _ in hits], [score for _, score, _ in hits], [src for _, _, src in hits]
+        )
+
+    def encode_queries(self, queries: Sequence[str]) -> np.ndarray:
+        return self.query_encoder.encode(queries)
+
+    def _dense_hits_batch(self, queries: Sequence[str], top_k: int) -> List[List[Hit]]:
+        # Một lần encode + một lần FAISS search cho cả batch
+        query_vecs = self.encode_queries(queries)
+        distances, indices = self.index.search(query_vecs, top_k)
+        return [
+            [(int(i), float(d), "dense") for i, d in zip(row_ids, row_scores) if i >= 0]
+            for row_ids, row_scores in zip(indices, distances)
+        ]
+
+    def _dense_hits(self, question: str, top_k: int) -> List[Hit]:
+        query_vec = self.encode_query(question).reshape(1, -1)
+        distances, indices = self.index.search(query_vec, top_k)
+        return [(int(i), float(d), "dense") for i, d in zip(indices[0], distances[0]) if i >= 0]
+
+    def _lexical_hits(self, query: str, top_k: int) -> List[Hit]:
+        if not self.lexical_available:
+            return []
+        return [(row, score, "bm25") for row, score in self.lexical.search(query, top_k)]
+
+    def retrieve_dense(self, question: str, top_k: int) -> List[Dict]:
+        return self._hits_to_docs(self._dense_hits(question, top_k))
+
+    def retrieve_lexical(self, query: str, top_k: int) -> List[Dict]:
+        return self._hits_to_docs(self._lexical_hits(query, top_k))
+
+    def retrieve(
+        self, question: str, top_k: int, *, keywords: Optional[Sequence[str]] = None
+    ) -> List[Dict]:
+        """
+        Dense (MedCPT + FAISS) khi sẵn sàng; nếu RAG_HYBRID_ENABLED thì fuse (RRF) với BM25
+        theo keywords của router. Khi dense không dùng được (asset lỗi hoặc quá
+        RAG_DENSE_MAX_CONCURRENCY query đồng thời) thì fallback sang BM25; không có BM25 index
+        thì chờ slot dense (tối đa RAG_DENSE_WAIT_S).
+        Cuối cùng gộp các document gần trùng lặp (SimHash), bù chỗ trống từ candidate over-fetch.
+        """
+        return self.retrieve_batch([question], top_k, keywords=[keywords or []])[0]
+
+    def retrieve_batch(
+        self,
+        questions: Sequence[str],
+        top_k: int,
+        *,
+        keywords: Optional[Sequence[Sequence[str]]] = None,
+    ) -> List[List[Dict]]:
+        """Như retrieve() cho nhiều câu hỏi; phần dense encode/search một lần cho cả batch."""
+        keyword_queries = [" ".join(k) if k else "" for k in (keywords or [[]] * len(questions))]
+        queries = [f"{q} {k}".strip() for q, k in zip(questions, keyword_queries)]
+        fetch_k = top_k
+        if self.settings.rag_dedup_enabled:
+            fetch_k = max(top_k, math.ceil(top_k * self.settings.rag_dedup_overfetch))
+
+        batch_hits: List[List[Hit]] | None = None
+        dense_ready = self.available and self.index is not None
+        if dense_ready and self._dense_slots is not None and not self._acquire_dense_slot():
+            dense_ready = False
+        elif dense_ready:
+            hybrid = self.settings.rag_hybrid_enabled and self.lexical_available
+            if hybrid:
+                fetch_k = max(fetch_k, self.settings.rag_hybrid_candidates)
+            try:
+                if len(queries) == 1:
+                    batch_hits = [self._dense_hits(queries[0], fetch_k)]
+                else:
+                    batch_hits = self._dense_hits_batch(queries, fetch_k)
+            finally:
+                if self._dense_slots is not None:
+                    self._dense_slots.release()
+            if hybrid:
+                batch_hits = [
+                    self._fuse(hits, self._lexical_hits(k or q, fetch_k))
+                    for hits, q, k in zip(batch_hits, questions, keyword_queries)
+                ]
+
+        if batch_hits is None:
+            batch_hits = [self._lexical_hits(query, fetch_k) for query in queries]
+        return [self._hits_to_docs(self._collapse_duplicates(hits, top_k)) for hits in batch_hits]
+
+    def _acquire_dense_slot(self) -> bool:
+        """Slot dense: có BM25 thì không chờ (fallback ngay), không có thì chờ có timeout."""
+        if self._dense_slots.acquire(blocking=False):
+            return True
+        if self.lexical_available:
+            logger.info("Dense retrieval quá tải, fallback BM25")
+            return False
+        if self._dense_slots.acquire(timeout=self.settings.rag_dense_wait_s):
+            return True
+        logger.warning(
+            "Dense retrieval quá tải hơn %.1fs và không có BM25 index, bỏ qua retrieval",
+            self.settings.rag_dense_wait_s,
+        )
+        return False
+
+    @staticmethod
+    def _fuse(dense: List[Hit], lexical: List[Hit]) -> List[Hit]:
+        by_row = {hit[0]: hit for hit in lexical}
+        by_row.update({hit[0]: hit for hit in dense})  # giữ score cosine cho doc có ở cả hai
+        fused = reciprocal_rank_fusion([[hit[0] for hit in dense], [hit[0] for hit in lexical]])
+        return [by_row[row] for row, _ in fused]
+
+    def load_signatures(self) -> None:
+        """Mở SimHash signatures precomputed (python -m src.dedup) nếu có."""
+        path = self.cache_dir / self.settings.rag_dedup_signatures_file
+        if not self.settings.rag_dedup_enabled or not path.exists():
+            return
+        self.signatures = np.load(path, mmap_mode="r")
+        logger.info("SimHash signatures đã load: %d docs", len(self.signatures))
+
+    def _signature(self, row: int) -> int:
+        if self.signatures is not None and row < len(self.signatures):
+            return int(self.signatures[row])
+        doc = self._get_doc_by_index(row)
+        return simhash(f"{doc['title']} {doc['abstract']}") if doc else 0
+
+    def _collapse_duplicates(self, hits: List[Hit], top_k: int) -> List[Hit]:
+        if not self.settings.rag_dedup_enabled:
+            return hits[:top_k]
+        kept, dropped = collapse_near_duplicates(
+            hits,
+            lambda hit: self._signature(hit[0]),
+            max_distance=self.settings.rag_dedup_max_hamming,
+            limit=top_k,
+        )
+        if dropped:
+            logger.debug("Gộp %d document gần trùng lặp", dropped)
+        return kept
+
+    def memory_stats(self) -> Dict[str, Dict]:
+        """
+        Byte ước lượng của từng thành phần RAG. Shard Arrow (memory_map), docstore, BM25 và
+        SimHash signatures là mmap (mapped=True): chỉ trang đã đọc mới nằm trong RSS.
+        """
+        with self._cache_lock:
+            tables = list(self._file_cache.values())
+        stats: Dict[str, Dict] = {
+            "shard_cache": {
+                "bytes": sum(getattr(table, "nbytes", 0) for table in tables),
+                "count": len(tables),
+                "max_shards": self._max_cache_size,
+                "mapped": True,
+            }
+        }
+        if self.docstore is not None:
+            stats["docstore"] = {"bytes": self.docstore.path.stat().st_size, "mapped": True}
+            stats["docstore_block_cache"] = self.docstore.memory_stats()
+        if self.index is not None:
+            # IndexFlat/IVF/PQ: code_size byte mỗi vector (không gồm overhead của inverted list)
+            code_size = getattr(self.index, "code_size", self.index.d * 4)
+            stats["faiss_index"] = {
+                "bytes": int(self.index.ntotal) * int(code_size),
+                "count": int(self.index.ntotal),
+                "dim": int(self.index.d),
+            }
+        if self.query_encoder is not None:
+            stats["query_encoder"] = {
+                "bytes": self.query_encoder.memory_bytes(),
+                "backend": self.query_encoder.backend,
+            }
+        if self.lexical is not None:
+            stats["lexical_index"] = {"bytes": self.lexical.disk_bytes(), "mapped": True}
+        if self.signatures is not None:
+            stats["dedup_signatures"] = {"bytes": int(self.signatures.nbytes), "mapped": True}
+        return stats
+
+    def preload_hot_shards(self) -> List[str]:
+        """
+        Đọc trước các shard được truy cập nhiều nhất (theo stats lần chạy trước)
+        vào _file_cache, giới hạn bởi số slot cache và RAG_PRELOAD_BUDGET_MB.
+        """
+        if self.access_stats is None or not getattr(self, "_lazy_dataset", False):
+            return []
+        by_name = {f.name: f for f in self._arrow_files}
+        budget = self.settings.rag_preload_budget_mb * 1024 * 1024
+        used = 0
+        loaded: List[str] = []
+        for name, _ in self.access_stats.hottest():
+            if len(loaded) >= self._max_cache_size:
+                break
+            arrow_file = by_name.get(name)
+            if arrow_file is None:
+                continue
+            size = arrow_file.stat().st_size
+            if used + size > budget:
+                continue
+            try:
+                _prefetch_file(arrow_file)
+                self._get_table(arrow_file)
+            except Exception as exc:
+                logger.warning("Preload shard %s thất bại: %s", name, exc)
+                continue
+            used += size
+            loaded.append(name)
+        if loaded:
+            logger.info(
+                "Preloaded %d hot shards (%.1f MB): %s", len(loaded), used / 1e6, ", ".join(loaded)
+            )
+        return loaded
+
+    def start_preload(self) -> threading.Thread | None:
+        if not self.settings.rag_preload_enabled or self.access_stats is None:
+            return None
+        thread = threading.Thread(target=self.preload_hot_shards, name="shard-preload", daemon=True)
+        thread.start()
+        self.preload_thread = thread
+        return thread
+
+    def flush_access_stats(self) -> None:
+        if self.access_stats is not None:
+            self.access_stats.flush()
+
+
+def _prefetch_file(path: Path, chunk_size: int = 8 * 1024 * 1024) -> None:
+    """
+    Đưa shard vào page cache trước khi query cần: madvise/fadvise WILLNEED rồi đọc
+    tuần tự (mmap của pyarrow là zero-copy nên bản thân _get_table không chạm vào data).
+    """
+    fd = os.open(str(path), os.O_RDONLY)
+    try:
+        if hasattr(os, "posix_fadvise"):
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            except OSError:
+                pass
+        buffer = bytearray(chunk_size)
+        with os.fdopen(os.dup(fd), "rb", buffering=0) as handle:
+            while handle.readinto(buffer):
+                pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,301 @@
+"""
+Admission control và xếp lịch dùng engine cho /v1/chat/completions.
+
+- Admission: mỗi request được admit() trước khi chạy pipeline. Số request đang xử lý
+  bị giới hạn ở max_running + max_queue (lane thường) cộng thêm emergency_queue chỉ
+  dành cho request khẩn cấp; mỗi session tối đa max_per_session request. Vượt quá ->
+  QueueFullError (API trả 429 + Retry-After ước lượng theo thời gian giữ slot trung bình).
+- Slot engine: router và sinh câu trả lời chờ một trong max_running slot. Khi slot trống,
+  lane "emergency" (safety_guard hoặc router trả intent EMERGENCY) được phục vụ trước;
+  trong mỗi lane các session được phục vụ xoay vòng nên một session gửi dồn không chặn
+  session khác.
+- stats() / render_prometheus(): độ sâu hàng đợi, số request đang chạy, histogram thời
+  gian chờ slot theo lane, số request bị từ chối theo lý do.
+"""
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+from .config import Settings
+
+EMERGENCY = "emergency"
+NORMAL = "normal"
+LANES = (EMERGENCY, NORMAL)
+# Bucket (giây) cho histogram thời gian chờ slot
+WAIT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class QueueFullError(RuntimeError):
+    """Request bị từ chối ở admission; retry_after_s dùng cho header Retry-After."""
+
+    def __init__(self, reason: str, retry_after_s: float):
+        super().__init__(f"Server busy ({reason}), retry after {retry_after_s:.0f}s")
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+
+class _Waiter:
+    __slots__ = ("ticket", "granted")
+
+    def __init__(self, ticket: "Ticket"):
+        self.ticket = ticket
+        self.granted = False
+
+
+class Ticket:
+    """Một request đã được admit; acquire()/release() (hoặc engine_slot()) quanh mỗi lần gọi engine."""
+
+    def __init__(self, scheduler: "RequestScheduler", session_id: str, lane: str):
+        self._scheduler = scheduler
+        self.session_id = session_id
+        self.lane = lane
+        self.wait_s = 0.0
+        self._held_since: Optional[float] = None
+
+    def escalate(self) -> None:
+        """Chuyển sang lane emergency cho các lần chờ slot tiếp theo (router trả EMERGENCY)."""
+        self.lane = EMERGENCY
+
+    def acquire(self, should_stop: Optional[Callable[[], bool]] = None) -> bool:
+        """Chờ slot engine; False nếu should_stop() trước khi tới lượt (không giữ slot)."""
+        started = self._scheduler._clock()
+        acquired = self._scheduler._acquire(self, should_stop)
+        self.wait_s += self._scheduler._clock() - started
+        if acquired:
+            self._held_since = self._scheduler._clock()
+        return acquired
+
+    def release(self) -> None:
+        held_s = self._scheduler._clock() - self._held_since
+        self._held_since = None
+        self._scheduler._release(held_s)
+
+    @contextmanager
+    def engine_slot(self) -> Iterator[None]:
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class RequestScheduler:
+    def __init__(
+        self,
+        *,
+        max_running: int = 8,
+        max_queue: int = 24,
+        emergency_queue: int = 8,
+        max_per_session: int = 4,
+        min_retry_after_s: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_running <= 0:
+            raise ValueError("max_running must be positive")
+        self.max_running = max_running
+        self.max_queue = max_queue
+        self.emergency_queue = emergency_queue
+        self.max_per_session = max_per_session
+        self.min_retry_after_s = min_retry_after_s
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._running = 0
+        self._in_flight = 0
+        self._per_session: Dict[str, int] = {}
+        # lane -> session_id -> các waiter theo thứ tự đến
+        self._lanes: Dict[str, "OrderedDict[str, Deque[_Waiter]]"] = {lane: OrderedDict() for lane in LANES}
+        self._waiting: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._admitted_total: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._rejected_total: Dict[str, int] = {}
+        self._escalated_total = 0
+        self._abandoned_total = 0
+        self._wait_buckets: Dict[str, List[int]] = {lane: [0] * len(WAIT_BUCKETS) for lane in LANES}
+        self._wait_sum: Dict[str, float] = {lane: 0.0 for lane in LANES}
+        self._wait_count: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._service_ewma_s = 0.0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "RequestScheduler":
+        return cls(
+            max_running=settings.scheduler_max_running,
+            max_queue=settings.scheduler_max_queue,
+            emergency_queue=settings.scheduler_emergency_queue,
+            max_per_session=settings.scheduler_max_per_session,
+            min_retry_after_s=settings.scheduler_min_retry_after_s,
+        )
+
+    # ------------------------------------------------------------------ admission
+    def _retry_after_locked(self) -> float:
+        # Thời gian ước lượng để hàng đợi hiện tại chạy hết qua max_running slot
+        queued = self._in_flight - self._running
+        estimate = self._service_ewma_s * max(1, queued) / self.max_running
+        return float(max(self.min_retry_after_s, math.ceil(estimate)))
+
+    def _reject_locked(self, reason: str) -> QueueFullError:
+        self._rejected_total[reason] = self._rejected_total.get(reason, 0) + 1
+        return QueueFullError(reason, self._retry_after_locked())
+
+    @contextmanager
+    def admit(self, session_id: str, *, emergency: bool = False) -> Iterator[Ticket]:
+        lane = EMERGENCY if emergency else NORMAL
+        with self._cond:
+            capacity = self.max_running + self.max_queue
+            if emergency:
+                capacity += self.emergency_queue
+            if self._in_flight >= capacity:
+                raise self._reject_locked("queue_full")
+            if not emergency and self._per_session.get(session_id, 0) >= self.max_per_session:
+                raise self._reject_locked("session_limit")
+            self._in_flight += 1
+            self._admitted_total[lane] += 1
+            self._per_session[session_id] = self._per_session.get(session_id, 0) + 1
+        ticket = Ticket(self, session_id, lane)
+        try:
+            yield ticket
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                if ticket.lane != lane:
+                    self._escalated_total += 1
+                remaining = self._per_session[session_id] - 1
+                if remaining:
+                    self._per_session[session_id] = remaining
+                else:
+                    del self._per_session[session_id]
+
+    # ------------------------------------------------------------------ engine slots
+    def _acquire(self, ticket: Ticket, should_stop: Optional[Callable[[], bool]] = None) -> bool:
+        started = self._clock()
+        with self._cond:
+            if self._running < self.max_running and not any(self._waiting.values()):
+                self._running += 1
+                self._record_wait_locked(ticket.lane, 0.0)
+                return True
+            lane, waiter = ticket.lane, _Waiter(ticket)
+            self._lanes[lane].setdefault(ticket.session_id, deque()).append(waiter)
+            self._waiting[lane] += 1
+            while not waiter.granted:
+                if should_stop is not None and should_stop():
+                    self._abandon_locked(lane, waiter)
+                    return False
+                self._cond.wait(timeout=0.05 if should_stop is not None else None)
+            self._record_wait_locked(lane, self._clock() - started)
+            return True
+
+    def _abandon_locked(self, lane: str, waiter: _Waiter) -> None:
+        queue = self._lanes[lane].get(waiter.ticket.session_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._lanes[lane][waiter.ticket.session_id]
+            self._waiting[lane] -= 1
+        self._abandoned_total += 1
+
+    def _release(self, held_s: float) -> None:
+        with self._cond:
+            self._running -= 1
+            self._service_ewma_s = held_s if not self._service_ewma_s else 0.8 * self._service_ewma_s + 0.2 * held_s
+            self._grant_locked()
+
+    def _grant_locked(self) -> None:
+        granted = False
+        while self._running < self.max_running:
+            waiter = self._next_waiter_locked()
+            if waiter is None:
+                break
+            waiter.granted = True
+            self._running += 1
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _next_waiter_locked(self) -> Optional[_Waiter]:
+        for lane in LANES:
+            sessions = self._lanes[lane]
+            if not sessions:
+                continue
+            session_id, queue = next(iter(sessions.items()))
+            waiter = queue.popleft()
+            if queue:
+                sessions.move_to_end(session_id)  # xoay vòng giữa các session
+            else:
+                del sessions[session_id]
+            self._waiting[lane] -= 1
+            return waiter
+        return None
+
+    def _record_wait_locked(self, lane: str, waited: float) -> None:
+        self._wait_sum[lane] += waited
+        self._wait_count[lane] += 1
+        for i, bound in enumerate(WAIT_BUCKETS):
+            if waited <= bound:
+                self._wait_buckets[lane][i] += 1
+
+    # ------------------------------------------------------------------ metrics
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "running": self._running,
+                "max_running": self.max_running,
+                "in_flight": self._in_flight,
+                "queue_depth": dict(self._waiting),
+                "admitted_total": dict(self._admitted_total),
+                "rejected_total": dict(self._rejected_total),
+                "escalated_total": self._escalated_total,
+                "abandoned_total": self._abandoned_total,
+                "wait_mean_ms": {
+                    lane: round(1000 * self._wait_sum[lane] / self._wait_count[lane], 3)
+                    if self._wait_count[lane] else 0.0
+                    for lane in LANES
+                },
+                "retry_after_s": self._retry_after_locked(),
+            }
+
+    def render_prometheus(self) -> str:
+        """Metrics dạng text exposition của Prometheus (cho GET /metrics)."""
+        with self._cond:
+            lines = [
+                "# HELP medassist_scheduler_running Engine slots in use.",
+                "# TYPE medassist_scheduler_running gauge",
+                f"medassist_scheduler_running {self._running}",
+                "# HELP medassist_scheduler_in_flight Admitted requests not yet finished.",
+                "# TYPE medassist_scheduler_in_flight gauge",
+                f"medassist_scheduler_in_flight {self._in_flight}",
+                "# HELP medassist_scheduler_queue_depth Requests waiting for an engine slot.",
+                "# TYPE medassist_scheduler_queue_depth gauge",
+            ]
+            lines += [f'medassist_scheduler_queue_depth{{lane="{lane}"}} {self._waiting[lane]}' for lane in LANES]
+            lines += [
+                "# HELP medassist_scheduler_admitted_total Requests admitted.",
+                "# TYPE medassist_scheduler_admitted_total counter",
+            ]
+            lines += [f'medassist_scheduler_admitted_total{{lane="{lane}"}} {self._admitted_total[lane]}' for lane in LANES]
+            lines += [
+                "# HELP medassist_scheduler_rejected_total Requests rejected with 429.",
+                "# TYPE medassist_scheduler_rejected_total counter",
+            ]
+            lines += [
+                f'medassist_scheduler_rejected_total{{reason="{reason}"}} {count}'
+                for reason, count in sorted(self._rejected_total.items())
+            ]
+            lines += [
+                "# HELP medassist_scheduler_abandoned_total Waits given up after the deadline or a disconnect.",
+                "# TYPE medassist_scheduler_abandoned_total counter",
+                f"medassist_scheduler_abandoned_total {self._abandoned_total}",
+                "# HELP medassist_scheduler_wait_seconds Time spent waiting for an engine slot.",
+                "# TYPE medassist_scheduler_wait_seconds histogram",
+            ]
+            for lane in LANES:
+                for bound, count in zip(WAIT_BUCKETS, self._wait_buckets[lane]):
+                    lines.append(f'medassist_scheduler_wait_seconds_bucket{{lane="{lane}",le="{bound}"}} {count}')
+                lines.append(
+                    f'medassist_scheduler_wait_seconds_bucket{{lane="{lane}",le="+Inf"}} {self._wait_count[lane]}'
+                )
+                lines.append(f'medassist_scheduler_wait_seconds_sum{{lane="{lane}"}} {self._wait_sum[lane]:.6f}')
+                lines.append(f'medassist_scheduler_wait_seconds_count{{lane="{lane}"}} {self._wait_count[lane]}')
+            return "\n".join(lines) + "\n"
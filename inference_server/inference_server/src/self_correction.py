@@ -0,0 +1,209 @@
+"""
+Self-correction có điều kiện bằng SELF_CORRECTION_PROMPT.
+
+Chỉ draft có confidence thấp (trung bình xác suất token < SELF_CORRECTION_MIN_CONFIDENCE
+hoặc một đoạn >= SELF_CORRECTION_MAX_LOW_SPAN token liên tiếp dưới
+SELF_CORRECTION_LOW_TOKEN_PROB) mới được duyệt lại, để không nhân đôi latency mọi câu.
+Verify của các request chạy song song được VerificationBatcher gom thành một lần gọi engine
+với output tối đa SELF_CORRECTION_MAX_NEW_TOKENS.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .config import Settings
+from .model_loader import Generation, generate_batch_with_confidence
+from .prompts import SELF_CORRECTION_PROMPT
+from .utils import safe_json_loads
+
+logger = logging.getLogger(__name__)
+
+VERDICTS = ("pass", "fail")
+_CITATION_PATTERN = re.compile(r"\[(\d+)\]")
+
+
+def longest_low_span(token_probs: Sequence[float], low_prob: float) -> int:
+    """Số token liên tiếp dài nhất có xác suất < low_prob."""
+    longest = current = 0
+    for prob in token_probs:
+        current = current + 1 if prob < low_prob else 0
+        longest = max(longest, current)
+    return longest
+
+
+def needs_self_correction(generation: Generation, settings: Settings) -> bool:
+    if not generation.token_probs:
+        return False
+    if generation.confidence < settings.self_correction_min_confidence:
+        return True
+    span = longest_low_span(generation.token_probs, settings.self_correction_low_token_prob)
+    return span >= settings.self_correction_max_low_span
+
+
+def cited_markers(text: str, n_docs: int) -> List[str]:
+    """Các "[n]" trong text có tài liệu tương ứng trong context (giữ thứ tự, bỏ trùng)."""
+    seen: List[str] = []
+    for match in _CITATION_PATTERN.finditer(text or ""):
+        marker = f"[{int(match.group(1))}]"
+        if 1 <= int(match.group(1)) <= n_docs and marker not in seen:
+            seen.append(marker)
+    return seen
+
+
+def self_correction_prompt(question: str, context: str, draft: str) -> str:
+    return SELF_CORRECTION_PROMPT.format(question=question, context=context, draft=draft)
+
+
+@dataclass
+class Verification:
+    verdict: str
+    final_answer: str
+    citations: List[str] = field(default_factory=list)
+
+
+def parse_verification(text: str, n_docs: int) -> Optional[Verification]:
+    """Parse JSON của bác sĩ giám sát; None nếu không đúng schema (giữ nguyên draft)."""
+    data = safe_json_loads(text)
+    if not isinstance(data, dict):
+        return None
+    verdict = str(data.get("verdict") or "").strip().lower()
+    if verdict not in VERDICTS:
+        return None
+    citations = data.get("citations")
+    if not isinstance(citations, list):
+        citations = []
+    return Verification(
+        verdict=verdict,
+        final_answer=str(data.get("final_answer") or "").strip(),
+        citations=cited_markers(" ".join(str(c) for c in citations), n_docs),
+    )
+
+
+@dataclass
+class _Pending:
+    prompt: str
+    text: str = ""
+    error: Optional[BaseException] = None
+    should_stop: Optional[Callable[[], bool]] = None
+    taken: bool = False  # đã nằm trong một batch đang chạy
+    done: bool = False
+    abandoned: bool = False  # caller đã bỏ chờ (should_stop), kết quả bị bỏ
+
+
+class VerificationBatcher:
+    """
+    Gom prompt verify của các thread đang chờ thành một lần generate. Thread có prompt chưa
+    được gom làm leader: chờ tối đa wait_s (hoặc đủ max_batch) rồi gọi engine cho cả nhóm.
+    Trong lúc batch đó chạy, thread khác đã có thể gom batch kế tiếp (engine tự batch tiếp).
+
+    should_stop (deadline/disconnect của request): caller bỏ chờ ngay khi True và nhận "";
+    generation của batch chỉ bị abort khi mọi request trong batch đều đã dừng, vì một lần
+    gọi engine chung không abort riêng từng prompt được.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_batch: int = 16,
+        wait_s: float = 0.01,
+        max_new_tokens: int = 384,
+        generate: Callable[..., List[Tuple[str, float]]] = generate_batch_with_confidence,
+        poll_s: float = 0.1,
+    ):
+        self.max_batch = max(1, max_batch)
+        self.poll_s = poll_s
+        self.wait_s = max(0.0, wait_s)
+        self.max_new_tokens = max_new_tokens
+        self._generate = generate
+        self._cond = threading.Condition()
+        self._pending: List[_Pending] = []
+        self._leader = False
+        self._batches = 0
+        self._verified = 0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "VerificationBatcher":
+        return cls(
+            max_batch=settings.self_correction_batch_size,
+            wait_s=settings.self_correction_batch_wait_ms / 1000.0,
+            max_new_tokens=settings.self_correction_max_new_tokens,
+            poll_s=settings.disconnect_poll_s,
+        )
+
+    def verify(self, prompt: str, should_stop: Optional[Callable[[], bool]] = None) -> str:
+        """Text verify của prompt; "" khi should_stop() (caller tự kiểm tra deadline sau khi gọi)."""
+        item = _Pending(prompt, should_stop=should_stop)
+        with self._cond:
+            self._pending.append(item)
+            self._cond.notify_all()
+            while not item.done:
+                if should_stop is not None and should_stop():
+                    item.abandoned = True
+                    if not item.taken:
+                        self._pending.remove(item)
+                    return ""
+                if self._leader or item.taken:
+                    self._cond.wait(self.poll_s if should_stop is not None else None)
+                    continue
+                self._leader = True
+                batch = self._collect_locked()
+                for pending in batch:
+                    pending.taken = True
+                self._leader = False
+                self._cond.notify_all()
+                self._cond.release()
+                try:
+                    self._run(batch)
+                finally:
+                    self._cond.acquire()
+                    for pending in batch:
+                        pending.done = True
+                    self._cond.notify_all()
+        if item.error is not None:
+            raise item.error
+        return item.text
+
+    def _collect_locked(self) -> List[_Pending]:
+        deadline = time.monotonic() + self.wait_s
+        while len(self._pending) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._cond.wait(remaining)
+        batch = self._pending[: self.max_batch]
+        del self._pending[: self.max_batch]
+        return batch
+
+    def _run(self, batch: List[_Pending]) -> None:
+        kwargs = {}
+        if all(pending.should_stop is not None for pending in batch):
+            kwargs["should_stop"] = lambda: all(p.abandoned or p.should_stop() for p in batch)
+        try:
+            outputs = self._generate(
+                [pending.prompt for pending in batch],
+                temperature=0.0,
+                max_new_tokens=self.max_new_tokens,
+                **kwargs,
+            )
+        except Exception as exc:  # noqa: BLE001
+            for pending in batch:
+                pending.error = exc
+            return
+        for pending, (text, _) in zip(batch, outputs):
+            pending.text = text
+        with self._cond:
+            self._batches += 1
+            self._verified += len(batch)
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            return {
+                "batches": self._batches,
+                "verified": self._verified,
+                "mean_batch_size": round(self._verified / self._batches, 3) if self._batches else 0.0,
+            }
@@ -0,0 +1,281 @@
+"""
+Semantic response cache cho các câu hỏi stateless.
+
+- Key: embedding của câu hỏi đã sanitize (history_embedding_model).
+- Hit khi cosine similarity >= threshold trong cùng scope và hai câu hỏi có cùng tập
+  từ nội dung (question_terms): câu hỏi chỉ khác tên thuốc hoặc liều vẫn có thể có
+  cosine rất cao, nhất là với model embedding tiếng Anh.
+- TTL + LRU eviction, giới hạn số entry.
+- Namespace (model + prompt version) thay đổi -> xóa toàn bộ cache.
+- Intent cá nhân luôn bị giới hạn trong session_id, không bao giờ chia sẻ chéo session.
+"""
+from __future__ import annotations
+
+import copy
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, FrozenSet, Optional
+
+import numpy as np
+
+from .config import Settings
+from .memory_report import estimate_bytes
+from .prompts import GEMINI_SYSTEM_PROMPT, PROMPT_VERSION
+
+logger = logging.getLogger(__name__)
+
+# Các intent phụ thuộc dữ liệu/ngữ cảnh của chính người dùng
+PERSONAL_INTENTS = frozenset(
+    {"PERSONAL_DB_QUERY", "USER_INPUT_ANALYSIS", "CONTEXT_FOLLOWUP"}
+)
+SHARED_SCOPE = "__shared__"
+# Từ đệm/xưng hô được phép khác nhau giữa hai câu hỏi cùng nghĩa. Không đưa vào đây
+# các từ đổi nghĩa câu hỏi (vd. "không", "nên", "bị").
+FILLER_WORDS = frozenset(
+    {
+        "ạ", "à", "nhé", "nhỉ", "ơi", "vậy", "xin", "cho", "hỏi", "bác", "sĩ",
+        "tôi", "mình", "em", "muốn", "biết", "the", "a", "an", "please",
+    }
+)
+_WORD_RE = re.compile(r"\w+")
+
+
+def question_terms(text: str) -> FrozenSet[str]:
+    """Tập từ nội dung (chữ thường, bỏ FILLER_WORDS); số và tên thuốc giữ nguyên."""
+    return frozenset(
+        word for word in _WORD_RE.findall(text.lower()) if word not in FILLER_WORDS
+    )
+
+
+def cache_scope(intent: Optional[str], session_id: str) -> str:
+    """Intent cá nhân -> scope theo session, còn lại dùng scope chung."""
+    if intent in PERSONAL_INTENTS:
+        return f"session:{session_id}"
+    return SHARED_SCOPE
+
+
+def build_cache_namespace(settings: Settings) -> str:
+    """Namespace đổi khi model, embedding model hoặc prompt thay đổi."""
+    prompt_hash = hashlib.sha1(GEMINI_SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+    return "|".join(
+        [
+            settings.model_id,
+            settings.model_revision or "",
+            settings.history_embedding_model,
+            PROMPT_VERSION,
+            prompt_hash,
+        ]
+    )
+
+
+@dataclass
+class _CacheEntry:
+    slot: int
+    scope: str
+    payload: Dict[str, Any]
+    created_at: float
+    terms: Optional[FrozenSet[str]] = None
+
+
+class SemanticResponseCache:
+    """Vector index (ma trận numpy, inner product) + LRU/TTL, thread-safe."""
+
+    def __init__(
+        self,
+        *,
+        threshold: float = 0.92,
+        max_entries: int = 2048,
+        ttl_seconds: float = 3600.0,
+        namespace: str = "",
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_entries <= 0:
+            raise ValueError("max_entries must be positive")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.namespace = namespace
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self._vectors: Optional[np.ndarray] = None  # (max_entries, dim)
+        self._entries: "OrderedDict[int, _CacheEntry]" = OrderedDict()  # slot -> entry (LRU order)
+        self._scope_slots: Dict[str, set] = {}
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "SemanticResponseCache":
+        return cls(
+            threshold=settings.semantic_cache_threshold,
+            max_entries=settings.semantic_cache_max_entries,
+            ttl_seconds=settings.semantic_cache_ttl_seconds,
+            namespace=build_cache_namespace(settings),
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _release(self, slot: int) -> None:
+        entry = self._entries.pop(slot, None)
+        if entry is not None:
+            slots = self._scope_slots.get(entry.scope)
+            if slots is not None:
+                slots.discard(slot)
+                if not slots:
+                    del self._scope_slots[entry.scope]
+        self._free_slots.append(slot)
+
+    def _expire_locked(self, now: float) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        expired = [
+            slot
+            for slot, entry in self._entries.items()
+            if now - entry.created_at > self.ttl_seconds
+        ]
+        for slot in expired:
+            self._release(slot)
+        self._expirations += len(expired)
+
+    def _check_namespace_locked(self, namespace: Optional[str]) -> None:
+        if namespace is None or namespace == self.namespace:
+            return
+        logger.info(
+            "Semantic cache namespace changed (%s -> %s), invalidating %d entries",
+            self.namespace,
+            namespace,
+            len(self._entries),
+        )
+        self._clear_locked()
+        self.namespace = namespace
+        self._invalidations += 1
+
+    def _clear_locked(self) -> None:
+        self._entries.clear()
+        self._scope_slots.clear()
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+
+    def lookup(
+        self,
+        vector: np.ndarray,
+        scope: str = SHARED_SCOPE,
+        *,
+        namespace: Optional[str] = None,
+        terms: Optional[FrozenSet[str]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Trả về bản sao payload của entry gần nhất vượt threshold; có terms thì chỉ
+        xét entry được store với cùng terms.
+        """
+        with self._lock:
+            self._check_namespace_locked(namespace)
+            self._expire_locked(self._clock())
+            slots = self._scope_slots.get(scope)
+            if not slots or self._vectors is None:
+                self._misses += 1
+                return None
+
+            query = np.asarray(vector, dtype="float32").reshape(-1)
+            candidates = np.fromiter(slots, dtype=np.int64, count=len(slots))
+            scores = self._vectors[candidates] @ query
+            best_slot, best_score = None, 0.0
+            for idx in np.argsort(-scores):
+                if scores[idx] < self.threshold:
+                    break
+                slot = int(candidates[idx])
+                if terms is None or self._entries[slot].terms == terms:
+                    best_slot, best_score = slot, float(scores[idx])
+                    break
+
+            if best_slot is None:
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(best_slot)
+            self._hits += 1
+            payload = copy.deepcopy(self._entries[best_slot].payload)
+            payload["cache_similarity"] = best_score
+            return payload
+
+    def store(
+        self,
+        vector: np.ndarray,
+        payload: Dict[str, Any],
+        scope: str = SHARED_SCOPE,
+        *,
+        namespace: Optional[str] = None,
+        terms: Optional[FrozenSet[str]] = None,
+    ) -> None:
+        query = np.asarray(vector, dtype="float32").reshape(-1)
+        with self._lock:
+            self._check_namespace_locked(namespace)
+            now = self._clock()
+            self._expire_locked(now)
+
+            if self._vectors is None or self._vectors.shape[1] != query.shape[0]:
+                self._vectors = np.zeros((self.max_entries, query.shape[0]), dtype="float32")
+                self._clear_locked()
+
+            if not self._free_slots:
+                # LRU: entry đầu tiên trong OrderedDict là entry ít dùng nhất
+                oldest_slot = next(iter(self._entries))
+                self._release(oldest_slot)
+                self._evictions += 1
+
+            slot = self._free_slots.pop()
+            self._vectors[slot] = query
+            self._entries[slot] = _CacheEntry(
+                slot=slot,
+                scope=scope,
+                payload=copy.deepcopy(payload),
+                created_at=now,
+                terms=terms,
+            )
+            self._scope_slots.setdefault(scope, set()).add(slot)
+            self._stores += 1
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._clear_locked()
+            self._invalidations += 1
+
+    def memory_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            vectors = self._vectors.nbytes if self._vectors is not None else 0
+            payloads = [entry.payload for entry in self._entries.values()]
+        payload_bytes = estimate_bytes(payloads)
+        return {
+            "bytes": vectors + payload_bytes,
+            "count": len(payloads),
+            "vector_bytes": vectors,
+            "payload_bytes": payload_bytes,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": (self._hits / lookups) if lookups else 0.0,
+                "stores": self._stores,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "invalidations": self._invalidations,
+                "threshold": self.threshold,
+                "namespace": self.namespace,
+            }
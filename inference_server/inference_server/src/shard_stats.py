@@ -0,0 +1,131 @@
+"""
+Thống kê truy cập theo shard (data-*.arrow) và theo dải row trong shard.
+
+- record() được gọi mỗi lần retriever đọc một document.
+- Định kỳ (flush_seconds) ghi ra JSON trong RAG cache dir (ghi atomic qua file tạm riêng
+  cho mỗi lần ghi). Chỉ thread nhận lượt flush dưới lock mới ghi, các thread đọc khác không chờ I/O.
+- Lần khởi động sau, retriever dùng hottest() để preload các shard nóng nhất.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STATS_VERSION = 1
+
+
+class ShardAccessStats:
+    def __init__(
+        self,
+        path: Path,
+        *,
+        row_bucket_size: int = 1024,
+        flush_seconds: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if row_bucket_size <= 0:
+            raise ValueError("row_bucket_size must be positive")
+        self.path = Path(path)
+        self.row_bucket_size = row_bucket_size
+        self.flush_seconds = flush_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # snapshot + replace theo thứ tự, bản mới không bị bản cũ đè
+        self._shards: Counter = Counter()  # shard name -> số lần truy cập
+        self._ranges: Counter = Counter()  # (shard name, bucket) -> số lần truy cập
+        self._dirty = 0
+        self._last_flush = clock()
+
+    def record(self, shard: str, local_idx: int) -> None:
+        with self._lock:
+            self._shards[shard] += 1
+            self._ranges[(shard, local_idx // self.row_bucket_size)] += 1
+            self._dirty += 1
+            now = self._clock()
+            due = self.flush_seconds >= 0 and now - self._last_flush >= self.flush_seconds
+            if due:
+                self._last_flush = now  # nhận lượt flush: thread khác thấy chưa tới hạn
+        if due:
+            self.flush()
+
+    def hottest(self, limit: Optional[int] = None) -> List[Tuple[str, int]]:
+        with self._lock:
+            return self._shards.most_common(limit)
+
+    def hottest_ranges(self, limit: Optional[int] = None) -> List[Tuple[str, int, int]]:
+        """(shard, row_start, count) của các dải row được đọc nhiều nhất."""
+        with self._lock:
+            return [
+                (shard, bucket * self.row_bucket_size, count)
+                for (shard, bucket), count in self._ranges.most_common(limit)
+            ]
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "version": STATS_VERSION,
+                "row_bucket_size": self.row_bucket_size,
+                "shards": dict(self._shards),
+                "ranges": {
+                    f"{shard}:{bucket}": count for (shard, bucket), count in self._ranges.items()
+                },
+            }
+
+    def flush(self) -> bool:
+        """Ghi thống kê ra disk nếu có thay đổi từ lần flush trước."""
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty:
+                    self._last_flush = self._clock()
+                    return False
+                self._dirty = 0
+                self._last_flush = self._clock()
+            payload = self.snapshot()
+            tmp_name = None
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                fd, tmp_name = tempfile.mkstemp(
+                    prefix=self.path.name + ".", suffix=".tmp", dir=self.path.parent
+                )
+                with os.fdopen(fd, "w", encoding="utf-8") as handle:
+                    json.dump(payload, handle)
+                os.replace(tmp_name, self.path)
+            except OSError as exc:
+                logger.warning("Không thể ghi shard access stats %s: %s", self.path, exc)
+                if tmp_name is not None:
+                    try:
+                        os.unlink(tmp_name)
+                    except OSError:
+                        pass
+                with self._lock:
+                    self._dirty += 1  # lần flush sau ghi lại
+                return False
+            return True
+
+    def load(self) -> bool:
+        """Nạp thống kê từ lần chạy trước (nếu có và cùng row_bucket_size)."""
+        if not self.path.exists():
+            return False
+        try:
+            payload = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as exc:
+            logger.warning("Shard access stats không đọc được (%s), bỏ qua", exc)
+            return False
+        if payload.get("version") != STATS_VERSION:
+            return False
+        with self._lock:
+            self._shards.update({k: int(v) for k, v in payload.get("shards", {}).items()})
+            if payload.get("row_bucket_size") == self.row_bucket_size:
+                for key, count in payload.get("ranges", {}).items():
+                    shard, _, bucket = key.rpartition(":")
+                    self._ranges[(shard, int(bucket))] += int(count)
+        return True
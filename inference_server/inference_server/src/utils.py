@@ -54,6 +54,9 @@ STOP_MARKERS = [
     "Thời gian xử lý",
 ]
 
+# Header chỉ được xuất hiện một lần; lần thứ hai trở đi bị postprocess_answer cắt bỏ
+SINGLE_SECTION_HEADERS = ("Kế hoạch đề xuất:", "Tài liệu tham khảo:")
+
 
 def safety_guard(question: str) -> str | None:
     q = question.lower().strip()
@@ -86,6 +89,23 @@ def remove_emoji(text: str) -> str:
     return emoji_pattern.sub("", text)
 
 
+def repeated_section_index(text: str) -> int:
+    """Vị trí header trong SINGLE_SECTION_HEADERS lặp lại sớm nhất; -1 nếu không có."""
+    positions = []
+    for header in SINGLE_SECTION_HEADERS:
+        first_idx = text.find(header)
+        if first_idx != -1:
+            second_idx = text.find(header, first_idx + 1)
+            if second_idx != -1:
+                positions.append(second_idx)
+    return min(positions) if positions else -1
+
+
+def has_repeated_section(text: str) -> bool:
+    """Stopping criterion cho engine: dừng decode khi một section header bị lặp."""
+    return repeated_section_index(text) != -1
+
+
 def postprocess_answer(raw_answer: str) -> str:
     txt = raw_answer or ""
 
@@ -107,21 +127,9 @@ def postprocess_answer(raw_answer: str) -> str:
     
     # Loại bỏ các phần lặp lại "Kế hoạch đề xuất" và "Tài liệu tham khảo"
     # Chỉ giữ lần đầu tiên của mỗi phần
-    if txt.count("Kế hoạch đề xuất:") > 1:
-        # Tìm vị trí lần xuất hiện thứ 2
-        first_idx = txt.find("Kế hoạch đề xuất:")
-        second_idx = txt.find("Kế hoạch đề xuất:", first_idx + 1)
-        if second_idx > 0:
-            # Loại bỏ từ lần xuất hiện thứ 2 trở đi
-            txt = txt[:second_idx].strip()
-    
-    if txt.count("Tài liệu tham khảo:") > 1:
-        # Tìm vị trí lần xuất hiện thứ 2
-        first_idx = txt.find("Tài liệu tham khảo:")
-        second_idx = txt.find("Tài liệu tham khảo:", first_idx + 1)
-        if second_idx > 0:
-            # Loại bỏ từ lần xuất hiện thứ 2 trở đi
-            txt = txt[:second_idx].strip()
+    second_idx = repeated_section_index(txt)
+    if second_idx > 0:
+        txt = txt[:second_idx].strip()
     
     # Loại bỏ các dòng đánh giá không cần thiết
     lines_to_remove = []
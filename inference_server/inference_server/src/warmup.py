@@ -0,0 +1,154 @@
+"""
+Background warmup: load các asset độc lập song song và theo dõi trạng thái
+readiness của từng component (dataset mapping, FAISS, MedCPT encoder, engine).
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+@dataclass
+class ComponentStatus:
+    name: str
+    required: bool = True
+    state: str = PENDING
+    started_at: Optional[float] = None
+    load_seconds: Optional[float] = None
+    error: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "required": self.required,
+            "load_seconds": None if self.load_seconds is None else round(self.load_seconds, 3),
+            "error": self.error,
+        }
+
+
+class ReadinessTracker:
+    """Thread-safe registry trạng thái load của các component."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._components: Dict[str, ComponentStatus] = {}
+        self._created_at = time.monotonic()
+        self._finished_at: Optional[float] = None
+        self._done = threading.Event()
+
+    def register(self, name: str, *, required: bool = True) -> None:
+        with self._lock:
+            self._components.setdefault(name, ComponentStatus(name, required=required))
+
+    def run(self, name: str, fn: Callable[[], Any]) -> bool:
+        """Chạy fn, ghi lại thời gian load; lỗi được ghi nhận thay vì raise."""
+        self.register(name)
+        with self._lock:
+            status = self._components[name]
+            status.state = LOADING
+            status.started_at = time.monotonic()
+        try:
+            fn()
+        except Exception as exc:
+            logger.warning("Warmup component %s failed: %s", name, exc)
+            with self._lock:
+                status.state = FAILED
+                status.error = f"{type(exc).__name__}: {exc}"
+                status.load_seconds = time.monotonic() - status.started_at
+            return False
+        with self._lock:
+            status.state = READY
+            status.load_seconds = time.monotonic() - status.started_at
+        logger.info("Warmup component %s ready in %.2fs", name, status.load_seconds)
+        return True
+
+    def mark_done(self) -> None:
+        with self._lock:
+            self._finished_at = time.monotonic()
+        self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def is_ready(self) -> bool:
+        """Ready khi mọi component bắt buộc đã READY."""
+        with self._lock:
+            return bool(self._components) and all(
+                c.state == READY for c in self._components.values() if c.required
+            )
+
+    def is_ready_component(self, name: str) -> bool:
+        with self._lock:
+            status = self._components.get(name)
+            return status is not None and status.state == READY
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            components = {name: c.as_dict() for name, c in self._components.items()}
+            finished = self._finished_at
+        ready = self.is_ready()
+        degraded = any(
+            c["state"] == FAILED and not c["required"] for c in components.values()
+        )
+        if ready:
+            status = "degraded" if degraded else "ready"
+        else:
+            status = "failed" if finished is not None else "starting"
+        return {
+            "status": status,
+            "ready": ready,
+            "startup_seconds": None if finished is None else round(finished - self._created_at, 3),
+            "components": components,
+        }
+
+
+Stage = List[Tuple[str, Callable[[], Any], bool]]  # (name, fn, required)
+
+
+def run_stages(
+    stages: Iterable[Stage],
+    tracker: ReadinessTracker,
+    *,
+    max_workers: int = 4,
+) -> None:
+    """Chạy từng stage tuần tự, các component trong một stage chạy song song."""
+    stages = [list(stage) for stage in stages]
+    for stage in stages:
+        for name, _, required in stage:
+            tracker.register(name, required=required)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="warmup") as pool:
+            for stage in stages:
+                futures = [pool.submit(tracker.run, name, fn) for name, fn, _ in stage]
+                for future in futures:
+                    future.result()
+    finally:
+        tracker.mark_done()
+
+
+def start_background(
+    stages: Iterable[Stage],
+    tracker: ReadinessTracker,
+    *,
+    max_workers: int = 4,
+) -> threading.Thread:
+    thread = threading.Thread(
+        target=run_stages,
+        args=(list(stages), tracker),
+        kwargs={"max_workers": max_workers},
+        name="warmup",
+        daemon=True,
+    )
+    thread.start()
+    return thread
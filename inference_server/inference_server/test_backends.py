@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Conformance test cho các backend sinh text: cùng một bộ kiểm tra cho mock, engine giả, transformers (CPU), vllm."""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from benchmarks.fakes import FakeEngine, write_stub_causal_lm
+from src import model_loader
+from src.backends import EngineBackend, GenerationBackend, SamplingConfig, build_backend
+from src.backends.mock import MockSamplingParams
+from src.config import Settings, get_settings
+
+PROMPTS = ["bệnh nhân nên theo dõi", "uống đủ nước và nghỉ ngơi", "bệnh nhân nên theo dõi"]
+
+
+def check_conformance(backend: GenerationBackend) -> None:
+    params = SamplingConfig(max_new_tokens=8)
+    generations = backend.generate_batch(PROMPTS, params)
+    assert len(generations) == len(PROMPTS) and backend.generate_batch([], params) == []
+    for generation in generations:
+        assert generation.text and 0 < len(generation.token_probs) <= params.max_new_tokens
+        assert all(0.0 < prob <= 1.0 for prob in generation.token_probs)
+    # Prompt trùng nhau vẫn có output riêng, temperature 0 thì deterministic
+    assert generations[0].text == generations[2].text == backend.generate(PROMPTS[0], params).text
+
+    short = backend.generate(PROMPTS[0], SamplingConfig(max_new_tokens=2))
+    assert 0 < len(short.token_probs) <= 2
+
+    full = generations[0].text
+    stop = full.split()[1]
+    stopped = backend.generate(PROMPTS[0], SamplingConfig(max_new_tokens=8, stop=[stop]))
+    assert stopped.text == full[: full.index(stop)]
+
+    assert "".join(backend.stream(PROMPTS[0], params)) == full
+
+    if backend.supports_should_stop:
+        aborted = backend.generate_batch(PROMPTS, params, should_stop=lambda: True)
+        assert [generation.text for generation in aborted] == [""] * len(PROMPTS)
+
+
+def test_mock_backend():
+    check_conformance(build_backend(Settings(GENERATION_BACKEND="mock")))
+
+
+def test_engine_backend_over_fake_engine():
+    engine = FakeEngine(token_latency_ms=0.5, answer_tokens=8)
+    check_conformance(EngineBackend(engine, sampling_params_factory=MockSamplingParams))
+
+
+def test_transformers_backend():
+    pytest.importorskip("transformers")
+    with tempfile.TemporaryDirectory() as tmp:
+        model_dir = write_stub_causal_lm(Path(tmp) / "stub-lm")
+        backend = build_backend(
+            Settings(GENERATION_BACKEND="transformers", CPU_MODEL_ID=str(model_dir), MAX_MODEL_LEN=512)
+        )
+        check_conformance(backend)
+        # stop_when được kiểm tra trong lúc decode, không phải sau khi sinh hết
+        seen = []
+        stopped = backend.generate(
+            PROMPTS[0], SamplingConfig(max_new_tokens=8), stop_when=lambda text: seen.append(text) or len(seen) == 3
+        )
+        assert len(seen) == 3 and len(stopped.token_probs) == 3
+        # Prompt vượt max_model_len bị từ chối như vllm thay vì cắt mất phần đầu (system prompt)
+        with pytest.raises(ValueError, match="maximum model length"):
+            backend.generate(" ".join(PROMPTS * 200), SamplingConfig(max_new_tokens=8))
+
+
+def test_vllm_backend():
+    pytest.importorskip("vllm")
+    model_id = os.environ.get("VLLM_CONFORMANCE_MODEL")
+    if not model_id:
+        pytest.skip("set VLLM_CONFORMANCE_MODEL to a small non-quantized checkpoint")
+    check_conformance(
+        build_backend(Settings(GENERATION_BACKEND="vllm", MODEL_ID=model_id, VLLM_QUANTIZATION=""))
+    )
+
+
+def test_registry_and_model_loader_wiring():
+    with pytest.raises(ValueError):
+        build_backend(Settings(), "tpu")
+
+    class Incomplete(GenerationBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):  # thiếu generate_batch: lỗi khi khởi tạo
+        Incomplete()
+
+    get_settings.cache_clear()
+    engine = FakeEngine(token_latency_ms=0.0, answer_tokens=8)
+    model_loader.set_engine(engine)
+    assert model_loader.get_engine() is engine
+    text, confidence = model_loader.generate_with_confidence(PROMPTS[0], temperature=0.0, max_new_tokens=8)
+    assert text and 0.0 < confidence <= 1.0
+    assert "".join(model_loader.stream_generate(PROMPTS[0], temperature=0.0, max_new_tokens=8)) == text
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Test CLI batch QA: lập batch theo session, ask_batch khớp đường tuần tự, checkpoint/resume."""
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src import pipeline as pipeline_module
+from src.batch_qa import BatchItem, _answer_batch, load_checkpoint, plan_batches, read_items, run_batch
+
+QUESTIONS = [
+    "Bác sĩ ơi, bệnh tiểu đường là gì?",
+    "Triệu chứng của cao huyết áp là gì?",
+    "Tôi bị đau đầu thường xuyên thì nên làm gì?",
+]
+
+
+def test_batches_keep_turn_order_within_session():
+    items = [BatchItem("c1", "a", "conv"), BatchItem("c2", "b", "conv")] + [
+        BatchItem(f"s{i}", "q", f"single-{i}") for i in range(3)
+    ]
+    batches = [[item.id for item in batch] for batch in plan_batches(items, 2)]
+    assert sum(batches, []).index("c1") < sum(batches, []).index("c2")
+    assert all(len(batch) <= 2 for batch in batches)
+    assert not any("c1" in batch and "c2" in batch for batch in batches)
+
+    sections = read_items(Path(__file__).parent / "test_questions.txt")
+    conversations = {item.session_id for item in sections if "conv" in item.session_id}
+    assert conversations and len({item.id for item in sections}) == len(sections)
+
+
+def test_ask_batch_matches_serial_ask(make_pipeline):
+    serial = make_pipeline()
+    expected = [serial.ask(q, f"serial-{i}") for i, q in enumerate(QUESTIONS)]
+    batched = make_pipeline().ask_batch([(q, f"batch-{i}") for i, q in enumerate(QUESTIONS)])
+    for one, many in zip(expected, batched):
+        assert many["answer"] == one["answer"]
+        assert many["intent"] == one["intent"]
+        assert [d["pmid"] for d in many["context_docs"]] == [d["pmid"] for d in one["context_docs"]]
+        assert many["timings_ms"]["batch_size"] == len(QUESTIONS)
+
+    # Hai câu cùng session trong một batch bị từ chối
+    with pytest.raises(ValueError):
+        make_pipeline().ask_batch([(QUESTIONS[0], "same"), (QUESTIONS[1], "same")])
+
+
+def test_failed_batch_retry_does_not_duplicate_history(make_pipeline, monkeypatch):
+    pipeline = make_pipeline()
+    items = [BatchItem("e", "Tôi bị đau ngực dữ dội", "emergency"), BatchItem("q", QUESTIONS[0], "qa")]
+    original = pipeline_module.generate_batch_with_details
+    calls = []
+
+    def flaky(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("engine error")
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(pipeline_module, "generate_batch_with_details", flaky)
+    records = _answer_batch(pipeline, items)
+    # Lượt cảnh báo khẩn trả lời ngay ở lần chạy batch đầu, nhưng history chỉ được ghi một lần
+    assert [r["id"] for r in records] == ["e", "q"] and not any("error" in r for r in records)
+    assert len(calls) == 2
+    for session_id in ("emergency", "qa"):
+        assert len(pipeline.memory_manager.get_memory(session_id).messages) == 2
+
+
+def test_resume_skips_completed_and_restores_history(make_pipeline, tmp_path):
+    items = [BatchItem(f"q{i}", q, "conv" if i < 2 else f"s{i}") for i, q in enumerate(QUESTIONS)]
+    output = tmp_path / "results.jsonl"
+    first = run_batch(make_pipeline(), items[:1], output, batch_size=8)
+    assert first["answered"] == 1
+    # Giả lập process chết giữa lúc ghi dòng tiếp theo
+    with output.open("a", encoding="utf-8") as handle:
+        handle.write('{"id": "q1", "answ')
+
+    pipeline = make_pipeline()
+    second = run_batch(pipeline, items, output, batch_size=8)
+    assert second["skipped"] == 1 and second["answered"] == 2 and second["errors"] == 0
+    records = load_checkpoint(output)
+    assert sorted(records) == ["q0", "q1", "q2"]
+    assert all(json.loads(line) for line in output.read_text(encoding="utf-8").splitlines())
+    assert QUESTIONS[0] in pipeline.memory_manager.get_recent_context("conv", max_exchanges=2)
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
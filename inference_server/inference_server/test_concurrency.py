@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Stress test đa luồng: hàng nghìn ask song song, lượt cùng session không xen kẽ, memory nhất quán."""
+
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from benchmarks.fakes import FakeEngine
+from src import model_loader
+from src.backends import EngineBackend, base, register_backend
+from src.backends.mock import MockSamplingParams
+from src.config import Settings, get_settings
+from src.retriever import PubMedRetriever
+
+SESSIONS = 100
+TURNS = 20
+WORKERS = 64
+
+
+def test_thousands_of_concurrent_asks_keep_sessions_consistent(make_pipeline, hash_embedder):
+    pipeline = make_pipeline(
+        FakeEngine(token_latency_ms=0.0, answer_tokens=24, router_tokens=8),
+        HISTORY_SELECTION_ENABLED=True,
+        HISTORY_TOP_K=2,
+        SCHEDULER_MAX_QUEUE=WORKERS,
+        SCHEDULER_MAX_PER_SESSION=TURNS,
+    )
+
+    # Đếm số lượt đang chạy của mỗi session ngay trong _ask (sau khi đã lấy session lock)
+    active = defaultdict(int)
+    overlaps = []
+    guard = threading.Lock()
+    inner_ask = pipeline._ask
+
+    def tracked_ask(turn, timer, **kwargs):
+        with guard:
+            active[turn.session_id] += 1
+            if active[turn.session_id] > 1:
+                overlaps.append(turn.session_id)
+        try:
+            time.sleep(0.0005)  # mở rộng cửa sổ race
+            return inner_ask(turn, timer, **kwargs)
+        finally:
+            with guard:
+                active[turn.session_id] -= 1
+
+    pipeline._ask = tracked_ask
+
+    # Các lượt của một session đứng liền nhau: nhiều worker tranh cùng một session
+    jobs = [(f"s{s}", f"Câu hỏi số {t} của phiên {s} về huyết áp?") for s in range(SESSIONS) for t in range(TURNS)]
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        responses = list(pool.map(lambda job: pipeline.ask(job[1], job[0]), jobs))
+
+    assert not overlaps
+    answers = {question: response["answer"] for (_, question), response in zip(jobs, responses)}
+    assert len(answers) == SESSIONS * TURNS and all(answers.values())
+    manager = pipeline.memory_manager
+    for s in range(SESSIONS):
+        messages = manager.get_memory(f"s{s}").messages
+        assert len(messages) == 2 * TURNS
+        # Từng cặp human/ai liền nhau và đúng câu trả lời của câu hỏi đó
+        for human, ai in zip(messages[::2], messages[1::2]):
+            assert (human.type, ai.type) == ("human", "ai")
+            assert ai.content == answers[human.content].strip()
+        turn_index = manager._turn_indexes[f"s{s}"]
+        assert turn_index.questions == [m.content for m in messages[::2]]
+        assert all(turn_index.embedded)
+
+
+def test_shard_cache_reads_each_missing_shard_once():
+    retriever = PubMedRetriever(Settings(RAG_ENABLED=False, RAG_SHARD_CACHE_SIZE=2, RAG_ACCESS_STATS_ENABLED=False))
+    reads = defaultdict(int)
+    lock = threading.Lock()
+
+    def slow_read(arrow_file):
+        with lock:
+            reads[arrow_file] += 1
+        time.sleep(0.02)
+        if arrow_file.name == "broken.arrow":
+            raise OSError("corrupt shard")
+        return f"table:{arrow_file.name}"
+
+    retriever._read_arrow_table = slow_read
+    files = [Path(f"data-{i}.arrow") for i in range(4)]
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        tables = list(pool.map(retriever._get_table, [files[i % 2] for i in range(64)]))
+    assert tables == [f"table:data-{i % 2}.arrow" for i in range(64)]
+    assert reads == {files[0]: 1, files[1]: 1}
+
+    # Eviction trong lúc nhiều thread đọc shard khác nhau: cache không vượt giới hạn
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        list(pool.map(retriever._get_table, [files[i % 4] for i in range(200)]))
+    assert len(retriever._file_cache) <= 2 and not retriever._loading
+
+    errors = []
+    broken = Path("broken.arrow")
+
+    def read_broken():
+        try:
+            retriever._get_table(broken)
+        except OSError as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=read_broken) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 8 and broken not in retriever._file_cache and not retriever._loading
+
+
+def test_backend_is_built_once_under_concurrent_first_use(monkeypatch):
+    builds = []
+    monkeypatch.setattr(base, "_BACKENDS", dict(base._BACKENDS))
+
+    @register_backend("slow_test")
+    def _build(settings):
+        builds.append(threading.current_thread().name)
+        time.sleep(0.05)
+        return EngineBackend(FakeEngine(token_latency_ms=0.0), sampling_params_factory=MockSamplingParams)
+
+    monkeypatch.setenv("GENERATION_BACKEND", "slow_test")
+    get_settings.cache_clear()
+    model_loader.set_backend(None)
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        backends = list(pool.map(lambda _: model_loader.get_backend(), range(32)))
+    assert len(builds) == 1 and all(backend is backends[0] for backend in backends)
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
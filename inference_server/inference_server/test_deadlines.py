@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""Test deadline/cancellation: hết giờ giữa các stage, bỏ chờ slot, abort generation, cắt max_new_tokens."""
+
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from benchmarks.fakes import FakeEngine
+from src import pipeline as pipeline_module
+from src.deadline import CLIENT_DISCONNECTED, TIMEOUT, Deadline, DeadlineExceeded
+from src.scheduler import RequestScheduler
+
+QUESTION = "Bệnh tiểu đường type 2 là gì?"
+RESERVE = {"DEADLINE_RESERVE_S": 0.1}
+
+
+class _ConstantEmbedder:
+    def embed_one(self, text):
+        return np.asarray([1.0, 0.0], dtype="float32")
+
+
+def test_deadline_expires_and_cancels():
+    now = [100.0]
+    deadline = Deadline(2.0, clock=lambda: now[0])
+    deadline.check("router")
+    now[0] += 1.5
+    assert 0.49 < deadline.remaining() < 0.51
+    now[0] += 1.0
+    try:
+        deadline.check("generation")
+    except DeadlineExceeded as exc:
+        assert exc.stage == "generation" and exc.reason == TIMEOUT
+    else:
+        raise AssertionError("deadline should have expired")
+
+    unlimited = Deadline(None)
+    assert not unlimited.should_stop()
+    unlimited.cancel()
+    assert unlimited.should_stop() and unlimited.reason == CLIENT_DISCONNECTED
+
+
+def test_waiting_for_slot_gives_up_at_deadline():
+    scheduler = RequestScheduler(max_running=1, max_queue=4)
+    with scheduler.admit("holder") as holder, holder.engine_slot():
+        with scheduler.admit("late") as ticket:
+            deadline = Deadline(0.05)
+            assert ticket.acquire(deadline.should_stop) is False
+    stats = scheduler.stats()
+    assert stats["queue_depth"]["normal"] == 0 and stats["abandoned_total"] == 1
+    assert stats["running"] == 0 and stats["in_flight"] == 0
+
+
+def test_generation_is_cut_to_fit_remaining_budget(make_pipeline):
+    pipeline = make_pipeline(FakeEngine(token_latency_ms=2.0, answer_tokens=400, router_tokens=48), **RESERVE)
+    response = pipeline.ask(QUESTION, "budget", max_new_tokens=400, deadline=Deadline(0.6))
+    assert response["deadline_truncated"] is True
+    assert 0 < len(response["draft"].split()) < 400
+
+    relaxed = pipeline.ask(QUESTION, "relaxed", max_new_tokens=64, deadline=Deadline(30.0))
+    assert "deadline_truncated" not in relaxed
+
+
+def test_truncated_answer_is_not_cached(make_pipeline, monkeypatch):
+    pipeline = make_pipeline(
+        FakeEngine(token_latency_ms=2.0, answer_tokens=400, router_tokens=48),
+        SEMANTIC_CACHE_ENABLED=True,
+        **RESERVE,
+    )
+    monkeypatch.setattr(pipeline_module, "get_history_embedder", lambda: _ConstantEmbedder())
+    truncated = pipeline.ask(QUESTION, "budget", max_new_tokens=400, deadline=Deadline(0.6))
+    assert truncated["deadline_truncated"] is True and truncated["cache_hit"] is False
+    assert len(pipeline.semantic_cache) == 0
+
+    full = pipeline.ask(QUESTION, "relaxed", max_new_tokens=400, deadline=Deadline(30.0))
+    assert full["cache_hit"] is False and "deadline_truncated" not in full
+    assert len(pipeline.semantic_cache) == 1
+
+
+def test_client_disconnect_aborts_in_flight_generation(make_pipeline):
+    engine = FakeEngine(token_latency_ms=5.0, answer_tokens=400, router_tokens=4)
+    pipeline = make_pipeline(engine, **RESERVE)
+    deadline = Deadline(None)
+    outcome = {}
+
+    def run():
+        started = time.perf_counter()
+        try:
+            pipeline.ask(QUESTION, "gone", max_new_tokens=400, deadline=deadline)
+        except DeadlineExceeded as exc:
+            outcome["reason"] = exc.reason
+        outcome["elapsed"] = time.perf_counter() - started
+
+    worker = threading.Thread(target=run)
+    worker.start()
+    time.sleep(0.2)
+    deadline.cancel(CLIENT_DISCONNECTED)
+    worker.join(timeout=5)
+
+    assert outcome["reason"] == CLIENT_DISCONNECTED
+    assert outcome["elapsed"] < 1.0  # 400 token × 5 ms = 2 s nếu không abort
+    assert engine.aborted == 1
+    assert pipeline.scheduler.stats()["in_flight"] == 0
+
+
+def test_api_cancels_deadline_when_client_disconnects():
+    from src.api import _run_watching_disconnect
+
+    class _Request:
+        def __init__(self):
+            self.polls = 0
+
+        async def is_disconnected(self):
+            self.polls += 1
+            return self.polls >= 2
+
+    deadline = Deadline(None)
+
+    def slow_pipeline():
+        while not deadline.should_stop():
+            time.sleep(0.005)
+        deadline.check("generation")
+
+    async def _run():
+        try:
+            await _run_watching_disconnect(slow_pipeline, deadline, _Request())
+        except DeadlineExceeded as exc:
+            return exc.reason
+
+    assert asyncio.run(_run()) == CLIENT_DISCONNECTED
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""Test docstore nén theo block: build từ shard arrow, đọc theo FAISS id, cache block, retriever dùng docstore."""
+
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src import docstore as docstore_module
+from src.config import Settings
+from src.docstore import DocStore, build_docstore, build_from_shards, iter_shard_rows
+from src.retriever import PubMedRetriever
+
+SHARDS = [
+    [
+        ("Metformin in type 2 diabetes", "Metformin lowers glucose in diabetes patients.", 100),
+        (["Aspirin", "and stroke"], ["Low dose aspirin.", "After ischemic stroke."], 101),
+    ],
+    [
+        ("Đái tháo đường thai kỳ", "Tầm soát glucose ở tuần 24–28." * 40, 102),
+        ("Sleep and depression", "", 103),
+        ("Diabetes diet", "Nutrition advice for diabetes.", 104),
+    ],
+]
+
+
+def _settings(cache_dir: Path) -> Settings:
+    return Settings(
+        RAG_CACHE_DIR=cache_dir, RAG_DATASET_DIRNAME="ds", RAG_ACCESS_STATS_ENABLED=False,
+        RAG_PRELOAD_ENABLED=False, RAG_DOCSTORE_CACHE_BLOCKS=2,
+    )
+
+
+def test_docstore_matches_arrow_rows_and_decompresses_each_block_once(write_shards):
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = Path(tmp)
+        write_shards(cache / "ds", SHARDS)
+        arrow = PubMedRetriever(_settings(cache), load=False)
+        arrow.load_dataset()
+        expected = [arrow._get_doc_by_index(i) for i in range(5)]
+
+        # block nhỏ: record dài chiếm block riêng, các record ngắn dùng chung block
+        meta = build_from_shards(cache / "ds", cache / "pubmed_docstore.bin", block_bytes=256, codec="zlib")
+        assert meta["num_docs"] == 5 and 1 < meta["num_blocks"] < 5 and meta["ratio"] > 1
+
+        store = DocStore(cache / "pubmed_docstore.bin", cache_blocks=8)
+        assert [store.get(i) for i in range(5)] == expected
+        assert store.get(1) == {"title": "Aspirin and stroke", "abstract": "Low dose aspirin. After ischemic stroke.", "PMID": 101}
+        assert store.get(-1) is None and store.get(5) is None
+        assert store.decompressions == meta["num_blocks"]  # mỗi block một lần, sau đó từ cache
+        store.get_many([4, 3, 0])
+        assert store.decompressions == meta["num_blocks"]
+
+        # Cache 1 block: k document ở các block khác nhau -> đúng k lần giải nén, không hơn
+        small = DocStore(cache / "pubmed_docstore.bin", cache_blocks=1)
+        docs = small.get_many([0, 2, 4])
+        assert small.decompressions <= 3 and [d["PMID"] for d in docs] == [100, 102, 104]
+        assert small.memory_stats()["count"] == 1
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(small.get, [i % 5 for i in range(200)]))
+        assert results == [expected[i % 5] for i in range(200)]
+        store.close()
+        small.close()
+
+
+def test_retriever_prefers_docstore_without_arrow_shards(write_shards):
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = Path(tmp)
+        write_shards(cache / "ds", SHARDS)
+        build_from_shards(cache / "ds", cache / "pubmed_docstore.bin", codec="zlib")
+        shutil.rmtree(cache / "ds")  # không còn shard: chỉ docstore
+
+        retriever = PubMedRetriever(_settings(cache), load=False)
+        retriever.load_dataset()
+        assert retriever.docstore is not None and not getattr(retriever, "_lazy_dataset", False)
+        docs = retriever.docs_for_indices([2, 0, 9], [0.9, 0.8, 0.7])
+        assert [d["pmid"] for d in docs] == ["102", "100"] and docs[0]["rank"] == 1
+        assert docs[0]["title"] == "Đái tháo đường thai kỳ"
+        stats = retriever.memory_stats()
+        assert stats["docstore"]["mapped"] and stats["docstore_block_cache"]["count"] >= 1
+
+
+def test_stale_docstore_is_dropped_for_arrow_shards(write_shards):
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = Path(tmp)
+        write_shards(cache / "ds", SHARDS)
+        # Docstore cũ: build từ dataset chỉ có shard đầu (2 docs), FAISS index có 5 vectors
+        build_docstore(iter_shard_rows(sorted((cache / "ds").glob("data-*.arrow"))[0]), cache / "pubmed_docstore.bin")
+
+        retriever = PubMedRetriever(_settings(cache), load=False)
+        retriever._ensure_faiss = lambda: SimpleNamespace(ntotal=5)
+        retriever.load_dataset()
+        assert retriever.docstore is not None  # chưa có index để so
+        retriever.load_index()
+        assert retriever.docstore is None and retriever._lazy_dataset
+        assert [d["pmid"] for d in retriever.docs_for_indices([4, 2], [0.9, 0.8])] == ["104", "102"]
+
+        # Index load trước dataset: kiểm tra lúc mở docstore
+        retriever = PubMedRetriever(_settings(cache), load=False)
+        retriever._ensure_faiss = lambda: SimpleNamespace(ntotal=5)
+        retriever.load_index()
+        retriever.load_dataset()
+        assert retriever.docstore is None and retriever._dataset_ready
+
+
+def test_codec_roundtrip_and_atomic_build():
+    rows = [(f"title {i}", "abstract " * i, i) for i in range(50)]
+    codecs = ["zlib"] + (["zstd"] if docstore_module.zstandard is not None else [])
+    with tempfile.TemporaryDirectory() as tmp:
+        for codec in codecs:
+            path = Path(tmp) / f"{codec}.bin"
+            build_docstore(rows, path, block_bytes=512, codec=codec)
+            store = DocStore(path)
+            assert [store.get(i)["abstract"] for i in range(50)] == ["abstract " * i for i in range(50)]
+            store.close()
+
+        def broken_rows():
+            yield ("ok", "ok", 1)
+            raise OSError("shard hỏng")
+
+        try:
+            build_docstore(broken_rows(), Path(tmp) / "broken.bin", codec="zlib")
+        except OSError:
+            pass
+        assert not DocStore.exists(Path(tmp) / "broken.bin")
+        assert not list(Path(tmp).glob("*.tmp"))
+        (Path(tmp) / "other.bin").write_bytes(b"not a docstore")
+        assert not DocStore.exists(Path(tmp) / "other.bin")
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ {name}")
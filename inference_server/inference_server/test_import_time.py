@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Regression test thời gian import: `import src.api` không được kéo theo
+vllm/torch/faiss/datasets/transformers/huggingface_hub/langchain và phải
+nằm trong budget đo bằng `python -X importtime`.
+
+Budget có thể chỉnh qua env IMPORT_BUDGET_MS (mặc định 2500 ms).
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent
+HEAVY_MODULES = (
+    "vllm",
+    "torch",
+    "faiss",
+    "datasets",
+    "transformers",
+    "huggingface_hub",
+    "langchain",
+    "langchain_core",
+)
+IMPORT_BUDGET_MS = float(os.environ.get("IMPORT_BUDGET_MS", "2500"))
+
+
+def _run_importtime(module: str):
+    env = dict(os.environ, GENERATION_BACKEND="mock", MEMORY_BACKEND="builtin")
+    probe = (
+        f"import sys, {module}; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            timings[name.strip()] = int(cumulative) / 1000.0  # µs -> ms
+    loaded_heavy = [m for m in proc.stdout.strip().split(",") if m]
+    return timings, loaded_heavy
+
+
+def test_api_import_skips_heavy_dependencies():
+    _, loaded_heavy = _run_importtime("src.api")
+    assert loaded_heavy == [], f"heavy modules imported eagerly: {loaded_heavy}"
+
+
+def test_api_import_within_budget():
+    timings, _ = _run_importtime("src.api")
+    assert "src.api" in timings
+    elapsed = timings["src.api"]
+    slowest = sorted(timings.items(), key=lambda item: item[1], reverse=True)[:5]
+    assert elapsed <= IMPORT_BUDGET_MS, (
+        f"import src.api took {elapsed:.0f} ms > budget {IMPORT_BUDGET_MS:.0f} ms; "
+        f"slowest: {slowest}"
+    )
+
+
+if __name__ == "__main__":
+    timings, loaded_heavy = _run_importtime("src.api")
+    print(f"import src.api: {timings.get('src.api', 0):.0f} ms (budget {IMPORT_BUDGET_MS:.0f} ms)")
+    print(f"heavy modules loaded: {loaded_heavy or 'none'}")
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ {name}")
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Test BM25 index: build từ shard arrow, ranking, fallback khi dense không dùng được và RRF."""
+
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from benchmarks.synthetic_corpus import generate_corpus
+from src.config import Settings
+from src.lexical_index import LexicalIndex, build_index, reciprocal_rank_fusion
+from src.retriever import PubMedRetriever
+
+SHARDS = [
+    [
+        ("Metformin in type 2 diabetes", "Metformin lowers glucose in diabetes patients.", 100),
+        ("Aspirin and stroke", "Low dose aspirin after ischemic stroke.", 101),
+    ],
+    [
+        ("Migraine prophylaxis", "Topiramate reduces migraine frequency; migraine migraine.", 102),
+        ("Sleep and depression", "Insomnia is associated with depression.", 103),
+        ("Diabetes diet", "Nutrition advice for diabetes.", 104),
+    ],
+]
+
+
+def test_bm25_ranks_matching_docs_with_global_row_ids(write_shards):
+    with tempfile.TemporaryDirectory() as tmp:
+        write_shards(Path(tmp) / "ds", SHARDS)
+        meta = build_index(Path(tmp) / "ds", Path(tmp) / "bm25", num_buckets=1 << 12)
+        assert meta["num_docs"] == 5
+
+        index = LexicalIndex(Path(tmp) / "bm25")
+        hits = index.search("migraine treatment", 3)
+        assert hits[0][0] == 2  # row đầu của shard thứ hai
+        assert [doc for doc, _ in index.search("diabetes", 5)] == [4, 0]  # doc ngắn hơn xếp trước
+        assert index.search("the of and", 5) == []
+
+        # Chỉ đọc 1 posting mỗi term: vẫn giữ doc có impact cao nhất
+        index.max_postings = 1
+        assert len(index.search("diabetes", 5)) == 1
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]])
+    assert [doc for doc, _ in fused][:2] == ["b", "a"]
+    assert {doc for doc, _ in fused} == {"a", "b", "c", "d"}
+
+
+def test_retriever_falls_back_to_bm25_and_fuses_in_hybrid_mode():
+    with tempfile.TemporaryDirectory() as tmp:
+        env = generate_corpus(Path(tmp), rows=2_000, dim=32, rows_per_shard=500)["env"]
+        build_index(Path(tmp) / "pubmed_ds_embedded", Path(tmp) / "bm25_index", num_buckets=1 << 14)
+        settings = Settings(
+            RAG_CACHE_DIR=env["RAG_CACHE_DIR"],
+            MEDCPT_ENCODER_ID=env["MEDCPT_ENCODER_ID"],
+            RAG_ACCESS_STATS_ENABLED=False,
+            RAG_DENSE_MAX_CONCURRENCY=1,
+            RAG_HYBRID_ENABLED=True,
+        )
+        retriever = PubMedRetriever(settings, load=False)
+        retriever.load_dataset()
+        retriever.load_lexical()
+        assert not retriever.available and retriever.lexical_available
+
+        docs = retriever.retrieve("đau đầu", 3, keywords=["migraine", "headache"])
+        assert [d["rank"] for d in docs] == [1, 2, 3]
+        assert all(d["retrieval"] == "bm25" for d in docs)
+        assert all("migraine" in f"{d['title']} {d['abstract']}" or "headache" in f"{d['title']} {d['abstract']}" for d in docs)
+
+        retriever.load_index()
+        retriever.load_encoder()
+        assert retriever.available
+        hybrid = retriever.retrieve("đau đầu", 4, keywords=["migraine"])
+        assert [d["rank"] for d in hybrid] == [1, 2, 3, 4]
+        assert len({d["pmid"] for d in hybrid}) == 4
+
+        # Dense đang bận hết slot -> fallback BM25 thay vì chờ
+        retriever._dense_slots.acquire()
+        try:
+            busy = retriever.retrieve("migraine", 2)
+        finally:
+            retriever._dense_slots.release()
+        assert [d["retrieval"] for d in busy] == ["bm25", "bm25"]
+
+        # Không có BM25 index: chờ slot dense thay vì trả về rỗng
+        retriever.lexical = None
+        retriever._refresh_available()
+        assert not retriever.lexical_available
+        retriever._dense_slots.acquire()
+        releaser = threading.Timer(0.1, retriever._dense_slots.release)
+        releaser.start()
+        waited = retriever.retrieve("migraine", 2)
+        releaser.join()
+        assert len(waited) == 2 and all("retrieval" not in d for d in waited)
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ {name}")
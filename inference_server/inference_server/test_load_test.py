@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Test benchmark load test: parse câu hỏi, thống kê percentile, so sánh baseline và fake engine."""
+
+import asyncio
+import sys
+from argparse import Namespace
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI, HTTPException
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from benchmarks.fakes import FakeEngine, SyntheticRetriever
+from benchmarks.load_test import (
+    build_workload,
+    compare_to_baseline,
+    load_question_sets,
+    percentile,
+    run_load_test,
+)
+from src.model_loader import MockSamplingParams
+
+
+def test_question_sets_from_repo_file():
+    sets = load_question_sets()
+    assert "Bác sĩ ơi, bệnh tiểu đường là gì?" in sets["single"]
+    assert sets["conversation"] and all(len(turns) > 1 for turns in sets["conversation"])
+    assert not any(q.startswith("→") for turns in sets["conversation"] for q in turns)
+
+
+def test_workload_has_requested_size_and_is_deterministic():
+    args = Namespace(requests=37, mix="single=0.5,conversation=0.5", seed=3)
+    sets = load_question_sets()
+    jobs = build_workload(args, sets)
+    assert sum(len(job) for job in jobs) == 37
+    assert jobs == build_workload(args, sets)
+
+
+def test_percentile_and_baseline_tolerance():
+    assert percentile([1, 2, 3, 4, 100], 50) == 3
+    assert percentile([1, 2, 3, 4, 100], 99) == 100
+    baseline = {
+        "throughput_rps": 10.0,
+        "errors": 0,
+        "latency_ms": {"p50": 100.0, "p95": 200.0, "p99": 300.0},
+        "stages_ms": {"history": {"p50": 0.01, "p95": 0.02, "p99": 0.02}},
+    }
+    report = {
+        "throughput_rps": 9.5,
+        "errors": 0,
+        "latency_ms": {"p50": 110.0, "p95": 260.0, "p99": 300.0},
+        "stages_ms": {"history": {"p50": 0.05, "p95": 0.08, "p99": 0.09}},
+    }
+    regressions = compare_to_baseline(report, baseline, tolerance=0.2)
+    assert regressions == ["latency_ms.p95 260.00 ms > baseline 200.00 ms (+20%)"]
+
+
+def test_fake_engine_and_retriever_are_deterministic():
+    engine = FakeEngine(token_latency_ms=0, answer_tokens=8)
+    params = MockSamplingParams(max_tokens=5)
+    first = engine.generate(["Câu hỏi A"], params)[0].outputs[0]
+    assert first.text == engine.generate(["Câu hỏi A"], params)[0].outputs[0].text
+    assert len(first.text.split()) == 5 and len(first.logprobs) == 5
+    router = engine.generate(["... local safety router ... User message:\nX\nIntent options:"], params)
+    assert '"SEARCH_DB"' in router[0].outputs[0].text
+
+    retriever = SyntheticRetriever(latency_ms=0)
+    assert retriever.retrieve("đau đầu", 3) == retriever.retrieve("đau đầu", 3)
+    assert [d["rank"] for d in retriever.retrieve("đau đầu", 3)] == [1, 2, 3]
+
+
+def test_run_load_test_collects_stage_timings():
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    def chat(payload: dict):
+        if "lỗi" in payload["question"]:
+            raise HTTPException(status_code=500, detail="boom")
+        return {"answer": "ok", "timings_ms": {"router": 1.0, "generation": 2.0, "total": 3.0}}
+
+    async def _run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await run_load_test(client, [["a b c d"], ["e f g h", "có lỗi"]], concurrency=2)
+
+    report = asyncio.run(_run()).report()
+    assert report["requests"] == 3 and report["errors"] == 1
+    assert report["status_codes"] == {"200": 2, "500": 1}
+    assert set(report["stages_ms"]) == {"router", "generation", "total"}
+    assert report["stages_ms"]["generation"]["p50"] == 2.0
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ {name}")
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Test báo cáo bộ nhớ theo thành phần và leak regression: nhiều session, RAM tăng có giới hạn."""
+
+import asyncio
+import gc
+import sys
+import tracemalloc
+from pathlib import Path
+
+import httpx
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from benchmarks.fakes import FakeEngine
+from src.config import Settings
+from src.memory import SessionMemoryManager
+from src.memory_report import MemoryReporter, estimate_bytes, format_report_line
+
+MAX_SESSIONS = 50
+
+
+def _run_sessions(pipeline, start: int, count: int, turns: int = 3) -> None:
+    for s in range(start, start + count):
+        for t in range(turns):
+            pipeline.ask(f"Câu hỏi {t} của phiên {s}: huyết áp cao nên ăn gì?", f"leak-{s}")
+
+
+def test_estimate_bytes_counts_shared_objects_once():
+    vector = np.zeros(1000, dtype="float32")
+    shared = "x" * 10_000
+    assert estimate_bytes([vector]) >= 4000
+    assert estimate_bytes([vector[:10]]) < 1000  # view không sở hữu buffer
+    assert estimate_bytes([shared, shared]) < estimate_bytes([shared, "y" * 10_000])
+
+
+def test_many_sessions_keep_memory_bounded(make_pipeline, hash_embedder):
+    pipeline = make_pipeline(
+        FakeEngine(token_latency_ms=0.0, answer_tokens=48, router_tokens=8),
+        SEMANTIC_CACHE_ENABLED=True,
+        SEMANTIC_CACHE_MAX_ENTRIES=64,
+        HISTORY_SELECTION_ENABLED=True,
+        MEMORY_MAX_SESSIONS=MAX_SESSIONS,
+    )
+    manager = pipeline.memory_manager
+    # tracemalloc chỉ thấy allocation sau start(): bật trước warm-up để object bị thay thế
+    # (entry cache, session bị bỏ) được trừ ra khỏi số đo
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        _run_sessions(pipeline, 0, 2 * MAX_SESSIONS)  # warm-up: cache, EWMA, histogram đã đầy
+        gc.collect()
+        baseline = tracemalloc.get_traced_memory()[0]
+        for round_start in (1000, 2000, 3000):
+            _run_sessions(pipeline, round_start, 4 * MAX_SESSIONS)
+        gc.collect()
+        growth = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        if started:
+            tracemalloc.stop()
+
+    stats = manager.memory_stats()
+    assert stats["count"] == stats["locks"] == MAX_SESSIONS and stats["turns"] == 3 * MAX_SESSIONS
+    # 600 session mới mà RAM tăng chưa tới nửa phần 50 session đang giữ: không có gì tích luỹ theo session
+    assert growth < stats["bytes"] / 2, (growth, stats["bytes"])
+
+    # Session gần nhất còn nguyên lịch sử, session cũ đã bị bỏ
+    assert len(manager.get_memory("leak-3199").messages) == 6
+    assert "leak-0" not in manager._sessions
+
+    report = MemoryReporter(pipeline).report()
+    assert report["components"]["sessions"]["bytes"] == stats["bytes"]
+    cache = report["components"]["semantic_cache"]
+    assert cache["count"] <= 64 and cache["vector_bytes"] == 64 * 16 * 4
+    assert report["estimated_bytes"] == stats["bytes"] + cache["bytes"] and report["mapped_bytes"] == 0
+    assert format_report_line(report).startswith("Memory: rss=")
+
+
+def test_eviction_skips_sessions_in_use():
+    manager = SessionMemoryManager(
+        Settings(MEMORY_BACKEND="builtin", MEMORY_MAX_SESSIONS=2, HISTORY_SELECTION_ENABLED=False)
+    )
+    with manager.session_lock("busy"):
+        manager.save_exchange("busy", "q", "a")
+        for i in range(5):
+            manager.save_exchange(f"s{i}", "q", "a")
+        assert "busy" in manager._sessions  # thread hiện tại đang giữ lock -> không bị bỏ
+    manager.save_exchange("s5", "q", "a")
+    assert list(manager._session_locks) == ["s4", "s5"]
+
+    # Lock đã được trả cho caller nhưng chưa acquire: session vẫn không bị bỏ
+    with manager.pin_session("waiting") as lock:
+        for i in range(6, 9):
+            manager.save_exchange(f"s{i}", "q", "a")
+        assert "waiting" in manager._session_locks
+        with lock:
+            manager.save_exchange("waiting", "q", "a")
+    assert manager.get_memory("waiting").messages[0].content == "q"
+    assert manager.memory_stats()["count"] <= 3
+    assert SessionMemoryManager(Settings()).settings.memory_max_sessions == 0  # mặc định không giới hạn
+
+
+def test_admin_memory_endpoint_with_tracemalloc_diff(in_process_app):
+    app = in_process_app()
+    from src import api
+
+    saved_reporter = api.memory_reporter
+    api.memory_reporter = MemoryReporter(api.pipeline, tracemalloc_frames=1)
+    api.settings.admin_token = "secret"
+    started = not tracemalloc.is_tracing()
+    api.memory_reporter.start()
+    headers = {"X-Admin-Token": "secret"}
+
+    async def _run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            denied = await client.get("/admin/memory")
+            first = await client.get("/admin/memory", params={"tracemalloc_top": 5}, headers=headers)
+            for i in range(5):
+                await client.post(
+                    "/v1/chat/completions", json={"question": "Bệnh gout là gì?", "session_id": f"mem-{i}"}
+                )
+            second = await client.get("/admin/memory", params={"tracemalloc_top": 5}, headers=headers)
+            return denied, first, second
+
+    try:
+        denied, first, second = asyncio.run(_run())
+    finally:
+        if started:
+            tracemalloc.stop()
+        api.memory_reporter = saved_reporter
+        api.settings.admin_token = None
+
+    assert denied.status_code == 403
+    assert first.json()["tracemalloc"]["baseline"] is True
+    body = second.json()
+    assert body["components"]["sessions"]["count"] >= 5
+    diff = body["tracemalloc"]
+    assert diff["baseline"] is False and 0 < len(diff["top"]) <= 5
+    assert {"location", "bytes", "bytes_diff", "count_diff"} <= set(diff["top"][0])
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
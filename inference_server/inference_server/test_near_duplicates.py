@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Test gộp abstract gần trùng lặp: SimHash, collapse theo rank và bù từ candidate over-fetch."""
+
+import sys
+import tempfile
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from benchmarks.near_duplicates import write_near_duplicate_corpus
+from src.config import Settings
+from src.dedup import build_signatures, collapse_near_duplicates, hamming, simhash
+from src.retriever import PubMedRetriever
+
+ABSTRACT = (
+    "Metformin remains the first line therapy for type 2 diabetes. In this randomized trial "
+    "of 1200 adults we compared early insulin with metformin and found similar glycemic "
+    "control at 24 months, fewer hypoglycemic events and lower weight gain in the metformin group."
+)
+
+
+def test_simhash_separates_near_duplicates_from_unrelated_text():
+    erratum = "Erratum: " + ABSTRACT.replace("1200", "1250")
+    unrelated = (
+        "Migraine prophylaxis with topiramate reduced monthly headache days in adolescents; "
+        "cognitive adverse effects were the main reason for discontinuation in this cohort."
+    )
+    assert simhash(ABSTRACT) == simhash(ABSTRACT)
+    assert hamming(simhash(ABSTRACT), simhash(erratum)) <= 10
+    assert hamming(simhash(ABSTRACT), simhash(unrelated)) > 16
+
+
+def test_collapse_keeps_best_ranked_and_backfills():
+    signatures = {"a": 0b0, "a2": 0b1, "b": (1 << 64) - 1, "c": 0xF0F0F0F0F0F0F0F0}
+    kept, dropped = collapse_near_duplicates(
+        ["a", "a2", "b", "c"], signatures.get, max_distance=3, limit=3
+    )
+    assert kept == ["a", "b", "c"] and dropped == 1
+
+
+def test_retriever_returns_distinct_clusters_with_precomputed_signatures():
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = write_near_duplicate_corpus(
+            Path(tmp), clusters=200, dup_fraction=1.0, max_variants=3,
+            abstract_words=120, dim=32, noise=0.01, seed=1,
+        )
+        cluster_of = corpus["cluster_of_pmid"]
+
+        def clusters(dedup: bool, with_signatures: bool):
+            settings = Settings(
+                RAG_CACHE_DIR=tmp,
+                MEDCPT_ENCODER_ID=str(Path(tmp) / "encoder"),
+                RAG_ACCESS_STATS_ENABLED=False,
+                RAG_DEDUP_ENABLED=dedup,
+                RAG_DEDUP_OVERFETCH=4.0,
+            )
+            retriever = PubMedRetriever(settings)
+            if not with_signatures:
+                retriever.signatures = None
+            docs = retriever.retrieve("Bệnh tiểu đường type 2 là gì?", 5)
+            assert [d["rank"] for d in docs] == [1, 2, 3, 4, 5]
+            return Counter(cluster_of[str(d["pmid"])] for d in docs)
+
+        assert max(clusters(False, False).values()) > 1
+        assert max(clusters(True, False).values()) == 1
+
+        build_signatures(Path(tmp) / "pubmed_ds_embedded", Path(tmp) / "simhash_signatures.npy")
+        signatures = np.load(Path(tmp) / "simhash_signatures.npy")
+        assert len(signatures) == corpus["rows"]
+        assert clusters(True, True) == clusters(True, False)
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ {name}")
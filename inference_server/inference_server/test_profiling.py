@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Test profiler theo request: file profile load được, xoay vòng thư mục, endpoint admin."""
+
+import asyncio
+import pstats
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.config import Settings
+from src.profiling import RequestProfiler
+
+
+def _busy(ms: float) -> dict:
+    end = time.perf_counter() + ms / 1000.0
+    while time.perf_counter() < end:
+        sum(range(100))
+    return {"trace_id": "abc123"}
+
+
+def test_profiler_modes_selection_and_rotation():
+    assert RequestProfiler.from_settings(Settings()) is None  # mặc định tắt hẳn
+
+    with tempfile.TemporaryDirectory() as tmp:
+        profiler = RequestProfiler(Path(tmp), header_enabled=True, max_files=2, rng=lambda: 0.5)
+        assert profiler.should_profile("1") and not profiler.should_profile(None)
+        assert RequestProfiler(Path(tmp), sample_rate=0.6, rng=lambda: 0.5).should_profile(None)
+
+        result, name = profiler.run(lambda: _busy(20))
+        assert result["trace_id"] == "abc123" and name.endswith("-abc123.prof")
+        stats = pstats.Stats(str(profiler.path_for(name)))
+        assert any(func[2] == "_busy" for func in stats.stats)
+
+        sampler = RequestProfiler(Path(tmp), mode="sample", max_files=2, sample_interval_ms=1.0)
+        _, folded = sampler.run(lambda: _busy(50))
+        lines = profiler.path_for(folded).read_text(encoding="utf-8").splitlines()
+        assert lines and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+        assert any("_busy (test_profiling.py" in line for line in lines)
+
+        try:
+            profiler.run(lambda: 1 / 0)
+        except ZeroDivisionError:
+            pass
+        # Chỉ giữ 2 file mới nhất; request lỗi vẫn có profile
+        names = [p["name"] for p in profiler.list_profiles()]
+        assert len(names) == 2 and any("failed-" in n for n in names)
+        assert profiler.path_for("../../etc/passwd") is None
+
+
+def test_profiled_request_produces_loadable_profile(in_process_app):
+    app = in_process_app()
+    from src import api
+
+    with tempfile.TemporaryDirectory() as tmp:
+        api.profiler = RequestProfiler(Path(tmp), header_enabled=True)
+        api.settings.admin_token = "secret"
+        admin = {"X-Admin-Token": "secret"}
+
+        async def _run():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+                body = {"question": "Bệnh tiểu đường type 2 là gì?", "session_id": "profiled"}
+                plain = await client.post("/v1/chat/completions", json=body)
+                profiled = await client.post("/v1/chat/completions", json=body, headers={"X-Profile": "1"})
+                forbidden = await client.get("/admin/profiles", headers={"X-Admin-Token": "wrong"})
+                listing = await client.get("/admin/profiles", headers=admin)
+                name = profiled.headers["X-Profile-Id"]
+                download = await client.get(f"/admin/profiles/{name}", headers=admin)
+                missing = await client.get("/admin/profiles/nope.prof", headers=admin)
+                return plain, profiled, forbidden, listing, download, missing
+
+        try:
+            plain, profiled, forbidden, listing, download, missing = asyncio.run(_run())
+        finally:
+            api.profiler = None
+            api.settings.admin_token = None
+
+        assert plain.status_code == profiled.status_code == 200 and "X-Profile-Id" not in plain.headers
+        assert profiled.headers["X-Profile-Id"].endswith(f"-{profiled.json()['trace_id']}.prof")
+        assert forbidden.status_code == 403 and missing.status_code == 404
+        assert [p["name"] for p in listing.json()["profiles"]] == [profiled.headers["X-Profile-Id"]]
+
+        copy = Path(tmp) / "download.prof"
+        copy.write_bytes(download.content)
+        stats = pstats.Stats(str(copy))
+        assert any(func[2] == "ask" and func[0].endswith("pipeline.py") for func in stats.stats)
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Test backend query encoder: int8/ONNX giữ parity với torch fp32 trên encoder stub."""
+
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from benchmarks.synthetic_corpus import write_stub_encoder
+from src.config import Settings
+from src.query_encoder import QueryEncoder, build_query_encoder, parity_report
+
+QUERIES = [
+    "Bệnh tiểu đường type 2 là gì?",
+    "diabetes insulin glucose",
+    "migraine headache treatment",
+    "statin cholesterol cardiovascular risk",
+]
+
+
+def _settings(encoder_dir: Path, backend: str, onnx_dir: Path) -> Settings:
+    return Settings(
+        MEDCPT_ENCODER_ID=str(encoder_dir),
+        QUERY_ENCODER_BACKEND=backend,
+        QUERY_ENCODER_ONNX_DIR=onnx_dir,
+    )
+
+
+def _check_backend(tmp: Path, backend: str, min_cosine: float) -> None:
+    encoder_dir, onnx_dir = tmp / "encoder", tmp / "onnx"
+    write_stub_encoder(encoder_dir, 32)
+    reference = build_query_encoder(_settings(encoder_dir, "torch", onnx_dir))
+    candidate = build_query_encoder(_settings(encoder_dir, backend, onnx_dir))
+    assert candidate.backend == backend
+
+    vector = candidate.encode_one(QUERIES[0])
+    assert vector.shape == (32,) and vector.dtype == np.float32
+    assert abs(float(np.linalg.norm(vector)) - 1.0) < 1e-4
+
+    report = parity_report(reference, candidate, QUERIES, corpus_texts=QUERIES, top_k=2)
+    assert report["cosine_min"] > min_cosine
+    assert 0.0 <= report["top2_overlap_min"] <= 1.0
+
+
+def test_torch_int8_matches_reference():
+    with tempfile.TemporaryDirectory() as tmp:
+        _check_backend(Path(tmp), "torch_int8", 0.98)
+
+
+def test_onnx_matches_reference_and_caches_export():
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnx")
+    with tempfile.TemporaryDirectory() as tmp:
+        _check_backend(Path(tmp), "onnx", 0.9999)
+        exported = list((Path(tmp) / "onnx").glob("*.onnx"))
+        assert len(exported) == 1
+        mtime = exported[0].stat().st_mtime_ns
+        # Lần build thứ hai dùng lại graph đã export
+        build_query_encoder(_settings(Path(tmp) / "encoder", "onnx", Path(tmp) / "onnx"))
+        assert exported[0].stat().st_mtime_ns == mtime
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        build_query_encoder(Settings(QUERY_ENCODER_BACKEND="tensorrt"))
+
+    class Incomplete(QueryEncoder):
+        backend = "incomplete"
+
+    # Thiếu encode(): lỗi ngay khi khởi tạo (trước khi load tokenizer), không phải ở request đầu
+    with pytest.raises(TypeError):
+        Incomplete("unused-model-id")
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ {name}")
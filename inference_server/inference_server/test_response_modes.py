@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Test response_mode full/compact/ids, serialize không qua Pydantic và gzip theo ngưỡng."""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from benchmarks.fakes import SyntheticRetriever
+from src.responses import FastJSONResponse, shape_response
+
+FIELDS = ("answer", "draft", "confidence", "context_docs", "router_plan", "warning")
+RESULT = {
+    "answer": "Trả lời [1].",
+    "draft": "Bản nháp",
+    "confidence": 0.8,
+    "context_docs": [{"title": "T", "abstract": "x" * 500, "pmid": "1", "score": 0.9, "rank": 1}],
+    "router_plan": {"intent": "GENERAL_MEDICAL_QA"},
+    "warning": None,
+    "internal": "không nằm trong schema",
+}
+
+
+def test_shape_response_modes():
+    full = shape_response(RESULT, "full", fields=FIELDS)
+    assert set(full) == set(FIELDS) and full["warning"] is None and full["context_docs"] == RESULT["context_docs"]
+
+    compact = shape_response(RESULT, "compact", fields=FIELDS, abstract_chars=100)
+    assert set(compact) == {"answer", "confidence", "context_docs"}
+    assert compact["context_docs"][0]["abstract"] == "x" * 100 + "…" and compact["context_docs"][0]["title"] == "T"
+    assert len(RESULT["context_docs"][0]["abstract"]) == 500  # không sửa result gốc
+
+    ids = shape_response(RESULT, "ids", fields=FIELDS)
+    assert ids["context_docs"] == [{"pmid": "1", "rank": 1, "score": 0.9}]
+    try:
+        shape_response(RESULT, "tiny", fields=FIELDS)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("unknown mode should be rejected")
+
+    assert FastJSONResponse({"answer": "Tiểu đường"}).body == '{"answer":"Tiểu đường"}'.encode("utf-8")
+
+
+def test_api_response_modes_and_gzip(in_process_app):
+    app = in_process_app(answer_tokens=64)
+    from src import api
+
+    api.pipeline.retriever = SyntheticRetriever(latency_ms=0.0, abstract_chars=1500)
+
+    async def _run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            async def post(mode, encoding="gzip"):
+                body = {"question": "Bệnh tiểu đường type 2 là gì?", "session_id": f"modes-{mode}"}
+                if mode:
+                    body["response_mode"] = mode
+                return await client.post("/v1/chat/completions", json=body, headers={"Accept-Encoding": encoding})
+
+            return [await post(None), await post("compact"), await post("ids"), await post("full", "identity"),
+                    await post("verbose")]
+
+    default, compact, ids, identity, invalid = asyncio.run(_run())
+    assert default.status_code == compact.status_code == ids.status_code == 200
+    full = default.json()
+    assert set(full) == set(api.ChatResponse.model_fields) and full["draft"] and full["router_plan"]
+    assert default.headers["content-encoding"] == "gzip" and default.num_bytes_downloaded < len(default.content)
+    assert "content-encoding" not in identity.headers
+
+    small = compact.json()
+    assert small["answer"] and "draft" not in small and "router_plan" not in small
+    assert all(len(doc["abstract"]) <= 241 for doc in small["context_docs"])
+    assert len(ids.content) < len(compact.content) < len(default.content)
+    assert set(ids.json()["context_docs"][0]) == {"pmid", "rank", "score"}
+    assert invalid.status_code == 422
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
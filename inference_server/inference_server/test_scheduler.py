@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Test scheduler: admission 429 + Retry-After, lane emergency ưu tiên, xoay vòng session, quá tải qua API."""
+
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.scheduler import QueueFullError, RequestScheduler
+
+EMERGENCY_QUESTION = "Bố tôi đột nhiên khó thở và đau ngực dữ dội, phải làm sao?"
+
+
+def _wait_for_queue(scheduler: RequestScheduler, depth: int) -> None:
+    deadline = time.monotonic() + 5
+    while sum(scheduler.stats()["queue_depth"].values()) < depth:
+        assert time.monotonic() < deadline, "waiter never queued"
+        time.sleep(0.001)
+
+
+def test_admission_rejects_with_retry_after():
+    scheduler = RequestScheduler(max_running=1, max_queue=1, emergency_queue=1, max_per_session=1)
+    with scheduler.admit("a"), scheduler.admit("b"):
+        try:
+            with scheduler.admit("c"):
+                pass
+        except QueueFullError as exc:
+            assert exc.reason == "queue_full" and exc.retry_after_s >= 1
+        else:
+            raise AssertionError("normal lane should be full")
+        with scheduler.admit("c", emergency=True) as ticket:
+            assert ticket.lane == "emergency"
+    with scheduler.admit("a"):
+        try:
+            with scheduler.admit("a"):
+                pass
+        except QueueFullError as exc:
+            assert exc.reason == "session_limit"
+        else:
+            raise AssertionError("per-session limit should apply")
+
+    stats = scheduler.stats()
+    assert stats["in_flight"] == 0
+    assert stats["rejected_total"] == {"queue_full": 1, "session_limit": 1}
+    text = scheduler.render_prometheus()
+    assert 'medassist_scheduler_rejected_total{reason="queue_full"} 1' in text
+    assert 'medassist_scheduler_admitted_total{lane="emergency"} 1' in text
+
+
+def test_emergency_first_then_round_robin_across_sessions():
+    scheduler = RequestScheduler(max_running=1, max_queue=10, max_per_session=5)
+    order = []
+
+    def worker(session_id: str, label: str, emergency: bool = False) -> None:
+        with scheduler.admit(session_id, emergency=emergency) as ticket, ticket.engine_slot():
+            order.append(label)
+
+    with scheduler.admit("holder") as holder, holder.engine_slot():
+        threads = []
+        for n, (session_id, label, emergency) in enumerate(
+            [("a", "a1", False), ("a", "a2", False), ("a", "a3", False), ("b", "b1", False), ("c", "c1", True)]
+        ):
+            threads.append(threading.Thread(target=worker, args=(session_id, label, emergency)))
+            threads[-1].start()
+            _wait_for_queue(scheduler, n + 1)
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert order == ["c1", "a1", "b1", "a2", "a3"]
+    stats = scheduler.stats()
+    assert stats["running"] == 0 and stats["queue_depth"] == {"emergency": 0, "normal": 0}
+
+
+def test_overload_returns_429_and_serves_emergencies(in_process_app):
+    app = in_process_app(token_latency_ms=1.0, answer_tokens=16)
+    from src import api
+
+    api.pipeline.scheduler = RequestScheduler(max_running=2, max_queue=4, emergency_queue=4)
+
+    async def _run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            async def post(question, session_id):
+                return await client.post(
+                    "/v1/chat/completions", json={"question": question, "session_id": session_id}
+                )
+
+            normal = [
+                asyncio.create_task(post("Bệnh tiểu đường type 2 là gì?", f"user-{i}")) for i in range(24)
+            ]
+            await asyncio.sleep(0.01)
+            emergency = [
+                asyncio.create_task(post(EMERGENCY_QUESTION, f"urgent-{i}")) for i in range(3)
+            ]
+            responses = await asyncio.gather(*normal, *emergency)
+            metrics = await client.get("/metrics")
+            return responses[: len(normal)], responses[len(normal):], metrics
+
+    normal, emergency, metrics = asyncio.run(_run())
+    rejected = [r for r in normal if r.status_code == 429]
+    assert rejected and all(int(r.headers["Retry-After"]) >= 1 for r in rejected)
+    assert all(r.status_code in (200, 429) for r in normal)
+    assert all(r.status_code == 200 for r in emergency)
+    assert all(r.json()["warning"] for r in emergency)
+    assert "queue" in emergency[0].json()["timings_ms"]
+    assert "medassist_scheduler_rejected_total" in metrics.text
+    stats = api.pipeline.scheduler.stats()
+    assert stats["in_flight"] == 0 and stats["admitted_total"]["emergency"] == 3
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""Test self-correction: điều kiện kích hoạt theo confidence/đoạn token thấp, gom batch verify, verdict/citations."""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from benchmarks.fakes import FakeEngine
+from src.config import Settings
+from src.model_loader import Generation
+from src.self_correction import (
+    VerificationBatcher,
+    cited_markers,
+    longest_low_span,
+    needs_self_correction,
+    parse_verification,
+)
+
+QUESTION = "Bệnh tiểu đường type 2 là gì?"
+SELF_CORRECTION = {
+    "SELF_CORRECTION_ENABLED": True,
+    "SELF_CORRECTION_MIN_CONFIDENCE": 0.6,
+    "SELF_CORRECTION_BATCH_WAIT_MS": 0,
+}
+
+
+def test_trigger_and_parse():
+    settings = Settings(SELF_CORRECTION_MIN_CONFIDENCE=0.6, SELF_CORRECTION_MAX_LOW_SPAN=3)
+    assert not needs_self_correction(Generation("ok", [0.9] * 20), settings)
+    assert needs_self_correction(Generation("low", [0.5] * 20), settings)
+    dip = [0.9] * 10 + [0.1] * 3 + [0.9] * 10
+    assert longest_low_span(dip, 0.3) == 3 and needs_self_correction(Generation("dip", dip), settings)
+    assert not needs_self_correction(Generation("", []), settings)
+
+    parsed = parse_verification(
+        'Kết quả: {"verdict": "FAIL", "final_answer": "Chưa đủ bằng chứng [2].", "citations": ["[2]", "[7]", "[2]"]}',
+        n_docs=3,
+    )
+    assert parsed.verdict == "fail" and parsed.citations == ["[2]"]
+    assert parsed.final_answer == "Chưa đủ bằng chứng [2]."
+    assert parse_verification("không phải JSON", 3) is None
+    assert parse_verification('{"verdict": "maybe"}', 3) is None
+    assert cited_markers("Theo [1] và [3], [1] ...", 2) == ["[1]"]
+
+
+def test_concurrent_verifications_share_one_engine_call():
+    calls = []
+
+    def generate(prompts, temperature, max_new_tokens):
+        calls.append((list(prompts), max_new_tokens))
+        return [(f"verified:{p}", 0.9) for p in prompts]
+
+    batcher = VerificationBatcher(max_batch=8, wait_s=0.2, max_new_tokens=64, generate=generate)
+    results = {}
+    threads = [
+        threading.Thread(target=lambda i=i: results.__setitem__(i, batcher.verify(f"p{i}"))) for i in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert results == {i: f"verified:p{i}" for i in range(5)}
+    assert len(calls) == 1 and sorted(calls[0][0]) == [f"p{i}" for i in range(5)] and calls[0][1] == 64
+    assert batcher.stats() == {"batches": 1, "verified": 5, "mean_batch_size": 5.0}
+
+    def broken(prompts, temperature, max_new_tokens):
+        raise RuntimeError("engine down")
+
+    try:
+        VerificationBatcher(wait_s=0.0, generate=broken).verify("p")
+    except RuntimeError as exc:
+        assert "engine down" in str(exc)
+    else:
+        raise AssertionError("engine error should propagate")
+
+
+def test_low_confidence_answers_are_verified(make_pipeline):
+    confident = make_pipeline(FakeEngine(token_latency_ms=0.0, confidence_range=(0.9, 0.95)), **SELF_CORRECTION)
+    response = confident.ask(QUESTION, "confident")
+    assert response["verdict"] == "pass" and "verified" not in response
+    assert "self_correction" not in response["timings_ms"]
+
+    engine = FakeEngine(token_latency_ms=0.0, answer_tokens=64, verify_tokens=64, confidence_range=(0.2, 0.3))
+    pipeline = make_pipeline(engine, **SELF_CORRECTION)
+    response = pipeline.ask(QUESTION, "unsure")
+    assert response["verified"] is True and response["verdict"] == "pass"
+    assert response["citations"] == ["[1]"]
+    assert "[1]." in response["answer"] and len(response["answer"].split()) < len(response["draft"].split())
+    assert "self_correction" in response["timings_ms"] and engine.verify_prompts == 1
+
+    responses = pipeline.ask_batch([(QUESTION, "batch-a"), ("Tôi bị đau đầu 3 ngày nay, có sao không?", "batch-b")])
+    assert all(r["verified"] for r in responses) and engine.verify_prompts == 3
+    assert pipeline.verifier.stats()["batches"] == 1  # ask_batch gọi engine trực tiếp cho cả batch
+
+    # Engine lỗi ở bước verify: vẫn trả draft thay vì làm hỏng cả request
+    def broken(prompts, temperature, max_new_tokens):
+        raise RuntimeError("engine down")
+
+    pipeline.verifier = VerificationBatcher(wait_s=0.0, generate=broken)
+    response = pipeline.ask(QUESTION, "verify-error")
+    assert response["answer"] and "verified" not in response and response["verdict"] == "pass"
+
+
+def test_verify_stops_with_the_request_deadline():
+    aborted = []
+
+    def slow_generate(prompts, temperature, max_new_tokens, should_stop=None):
+        deadline = time.monotonic() + 1
+        while time.monotonic() < deadline:
+            if should_stop is not None and should_stop():
+                aborted.append(len(prompts))
+                return [("", 0.0)] * len(prompts)
+            time.sleep(0.005)
+        return [("late", 0.9)] * len(prompts)
+
+    batcher = VerificationBatcher(wait_s=0.0, generate=slow_generate, poll_s=0.005)
+    stop_at = time.monotonic() + 0.05
+    started = time.monotonic()
+    assert batcher.verify("p", should_stop=lambda: time.monotonic() > stop_at) == ""
+    assert time.monotonic() - started < 0.5 and aborted == [1]
+
+    # Caller không dừng trong cùng batch: chỉ caller có deadline bỏ chờ, batch chạy tiếp
+    batcher = VerificationBatcher(max_batch=2, wait_s=0.5, generate=slow_generate, poll_s=0.005)
+    results = {}
+    waiting = threading.Thread(target=lambda: results.__setitem__("no_deadline", batcher.verify("a")))
+    waiting.start()
+    stop_at = time.monotonic() + 0.3
+    results["deadline"] = batcher.verify("b", should_stop=lambda: time.monotonic() > stop_at)
+    waiting.join(timeout=10)
+    assert results == {"deadline": "", "no_deadline": "late"} and aborted == [1]
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
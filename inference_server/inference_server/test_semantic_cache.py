@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""Test semantic response cache (không cần model embedding thật)."""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from benchmarks.fakes import FakeEngine
+from src import pipeline as pipeline_module
+from src.semantic_cache import SHARED_SCOPE, SemanticResponseCache, cache_scope, question_terms
+
+
+def _unit(*values):
+    vec = np.asarray(values, dtype="float32")
+    return vec / np.linalg.norm(vec)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_hit_above_threshold_and_miss_below():
+    cache = SemanticResponseCache(threshold=0.9, max_entries=8)
+    cache.store(_unit(1, 0, 0), {"answer": "A", "context_docs": [{"pmid": "1"}]})
+
+    hit = cache.lookup(_unit(1, 0.1, 0))
+    assert hit is not None
+    assert hit["answer"] == "A"
+    assert hit["context_docs"] == [{"pmid": "1"}]
+    assert cache.lookup(_unit(0, 1, 0)) is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+
+def test_lru_eviction_respects_size_cap():
+    cache = SemanticResponseCache(threshold=0.99, max_entries=2)
+    cache.store(_unit(1, 0, 0), {"answer": "x"})
+    cache.store(_unit(0, 1, 0), {"answer": "y"})
+    assert cache.lookup(_unit(1, 0, 0)) is not None  # x vừa được dùng
+    cache.store(_unit(0, 0, 1), {"answer": "z"})  # đẩy y ra
+
+    assert len(cache) == 2
+    assert cache.lookup(_unit(0, 1, 0)) is None
+    assert cache.lookup(_unit(1, 0, 0))["answer"] == "x"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_expiration():
+    clock = FakeClock()
+    cache = SemanticResponseCache(threshold=0.9, ttl_seconds=10, clock=clock)
+    cache.store(_unit(1, 0), {"answer": "old"})
+    clock.now = 11
+    assert cache.lookup(_unit(1, 0)) is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_namespace_change_invalidates():
+    cache = SemanticResponseCache(threshold=0.9, namespace="model-a|v1")
+    cache.store(_unit(1, 0), {"answer": "a"}, namespace="model-a|v1")
+    assert cache.lookup(_unit(1, 0), namespace="model-a|v1") is not None
+    assert cache.lookup(_unit(1, 0), namespace="model-a|v2") is None
+    assert len(cache) == 0
+
+
+def test_personal_intents_never_cross_sessions():
+    cache = SemanticResponseCache(threshold=0.9)
+    scope_a = cache_scope("PERSONAL_DB_QUERY", "session-a")
+    scope_b = cache_scope("PERSONAL_DB_QUERY", "session-b")
+    cache.store(_unit(1, 0), {"answer": "ket qua cua A"}, scope_a)
+
+    assert cache.lookup(_unit(1, 0), scope_b) is None
+    assert cache.lookup(_unit(1, 0), SHARED_SCOPE) is None
+    assert cache.lookup(_unit(1, 0), scope_a)["answer"] == "ket qua cua A"
+    assert cache_scope("GENERAL_MEDICAL_QA", "session-a") == SHARED_SCOPE
+
+
+def test_near_miss_with_different_drug_or_dose_is_not_a_hit():
+    cache = SemanticResponseCache(threshold=0.9)
+    question = "Uống paracetamol 500mg mỗi ngày có hại gan không?"
+    cache.store(_unit(1, 0), {"answer": "paracetamol 500mg"}, terms=question_terms(question))
+
+    # Embedding gần như trùng nhưng khác thuốc/liều -> miss
+    for near_miss in (
+        "Uống ibuprofen 500mg mỗi ngày có hại gan không?",
+        "Uống paracetamol 1000mg mỗi ngày có hại gan không?",
+    ):
+        assert cache.lookup(_unit(1, 0.01), terms=question_terms(near_miss)) is None
+    same = "Bác sĩ ơi, uống paracetamol 500mg mỗi ngày có hại gan không ạ"
+    assert cache.lookup(_unit(1, 0.01), terms=question_terms(same))["answer"] == "paracetamol 500mg"
+
+
+class FlakyEmbedder:
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+
+    def embed_one(self, text):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise RuntimeError("CUDA out of memory")
+        return _unit(1, 0, 0)
+
+
+@pytest.fixture
+def cached_pipeline(make_pipeline, monkeypatch):
+    """make_pipeline với semantic cache bật và embedder coi mọi câu hỏi là giống nhau."""
+
+    def _make(engine=None, **overrides):
+        pipeline = make_pipeline(engine, SEMANTIC_CACHE_ENABLED=True, **overrides)
+        monkeypatch.setattr(pipeline_module, "get_history_embedder", lambda: FlakyEmbedder(failures=0))
+        return pipeline
+
+    return _make
+
+
+def test_pipeline_does_not_serve_answer_for_a_different_drug(make_pipeline, cached_pipeline):
+    assert make_pipeline().semantic_cache is None  # mặc định tắt
+    # Embedder coi mọi câu hỏi là giống nhau (như model tiếng Anh với câu tiếng Việt)
+    pipeline = cached_pipeline()
+
+    assert pipeline.ask("Uống paracetamol 500mg có hại gan không?", "a")["cache_hit"] is False
+    assert pipeline.ask("Uống ibuprofen 500mg có hại gan không?", "b")["cache_hit"] is False
+    assert pipeline.ask("Uống paracetamol 500mg có hại gan không ạ?", "c")["cache_hit"] is True
+
+
+def test_answers_without_dense_retrieval_are_not_served_after_rag_recovers(cached_pipeline, monkeypatch):
+    pipeline = cached_pipeline()
+    question = "Bệnh tiểu đường là gì?"
+
+    pipeline.retriever.available = False  # warmup/degraded: không có retrieval
+    assert pipeline.ask(question, "a")["cache_hit"] is False
+    assert pipeline.ask(question, "b")["cache_hit"] is True
+
+    pipeline.retriever.available = True
+    recovered = pipeline.ask(question, "c")
+    assert recovered["cache_hit"] is False and recovered["context_docs"]
+
+    # Dense bị bỏ qua giữa chừng (chỉ có doc BM25): không lưu vào scope dense
+    original = pipeline.retriever.retrieve
+    monkeypatch.setattr(
+        pipeline.retriever,
+        "retrieve",
+        lambda *args, **kwargs: [{**doc, "retrieval": "bm25"} for doc in original(*args, **kwargs)],
+    )
+    other = "Uống paracetamol 500mg có hại gan không?"
+    assert pipeline.ask(other, "d")["cache_hit"] is False
+    assert pipeline.ask(other, "e")["cache_hit"] is False
+    assert pipeline.ask(question, "f")["cache_hit"] is True
+
+
+def test_cache_hit_keeps_verdict_and_citations(cached_pipeline):
+    engine = FakeEngine(token_latency_ms=0.0, verify_tokens=64, confidence_range=(0.2, 0.3))
+    pipeline = cached_pipeline(
+        engine,
+        SELF_CORRECTION_ENABLED=True,
+        SELF_CORRECTION_MIN_CONFIDENCE=0.6,
+        SELF_CORRECTION_BATCH_WAIT_MS=0,
+    )
+    question = "Bệnh tiểu đường là gì?"
+    first = pipeline.ask(question, "a")
+    assert first["verified"] is True and first["citations"] == ["[1]"]
+
+    hit = pipeline.ask(question, "b")
+    assert hit["cache_hit"] is True and engine.verify_prompts == 1
+    for key in ("answer", "verdict", "citations", "verified"):
+        assert hit[key] == first[key]
+
+
+def test_embedding_failure_skips_cache_for_that_request_only(make_pipeline, monkeypatch):
+    pipeline = make_pipeline(SEMANTIC_CACHE_ENABLED=True)
+    embedder = FlakyEmbedder(failures=2)
+    monkeypatch.setattr(pipeline_module, "get_history_embedder", lambda: embedder)
+    question = "Bệnh tiểu đường là gì?"
+    assert "cache_hit" not in pipeline.ask(question, "a")  # lỗi lần đầu: không backoff
+    assert "cache_hit" not in pipeline.ask(question, "b")
+    stats = pipeline.semantic_cache_stats()
+    assert stats["embed_failures"] == 2 and stats["embed_failure_streak"] == 2
+    assert 0 < stats["embed_backoff_s"] <= 1.0
+
+    pipeline.ask(question, "c")  # đang backoff: không gọi embedder
+    assert embedder.calls == 2 and pipeline.semantic_cache is not None
+
+    pipeline._cache_embed_backoff.retry_at = 0.0  # hết backoff
+    assert pipeline.ask(question, "d")["cache_hit"] is False
+    assert pipeline.ask(question, "e")["cache_hit"] is True
+    assert pipeline.semantic_cache_stats()["embed_failure_streak"] == 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
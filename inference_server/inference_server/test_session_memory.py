@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Test chọn lọc lịch sử hội thoại theo độ liên quan (SessionMemoryManager)."""
+
+import re
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.config import Settings
+from src.memory import SessionMemoryManager
+
+SETTINGS = Settings(MEMORY_BACKEND="builtin", HISTORY_SELECTION_ENABLED=True)
+
+
+class KeywordEmbedder:
+    """Embedder bag-of-words cố định để test không cần tải model."""
+
+    VOCAB = ["đầu", "đường", "áp", "ngủ", "dạ", "dày"]
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_one(self, text):
+        self.calls += 1
+        tokens = re.findall(r"\w+", text.lower())
+        vec = np.array([tokens.count(word) for word in self.VOCAB], dtype="float32") + 1e-3
+        return vec / np.linalg.norm(vec)
+
+
+def _fill(manager, n_turns):
+    topics = ["tiểu đường", "mất ngủ", "đau dạ dày"]
+    for i in range(n_turns):
+        topic = topics[i % len(topics)]
+        manager.save_exchange("s1", f"Hỏi về {topic} lần {i}", f"Trả lời về {topic}")
+    manager.save_exchange("s1", "Tôi bị đau đầu", "Đau đầu nên nghỉ ngơi")
+    manager.save_exchange("s1", "Cảm ơn bác sĩ", "Không có gì")
+
+
+def test_selected_history_is_bounded_and_relevant():
+    embedder = KeywordEmbedder()
+    manager = SessionMemoryManager(SETTINGS, embedder=embedder)
+    _fill(manager, 200)
+    embeds_after_save = embedder.calls
+    assert embeds_after_save == 202  # mỗi lượt embed đúng một lần
+
+    history = manager.get_relevant_history("s1", "Cơn đau đầu có nguy hiểm không?", top_k=2)
+    lines = history.splitlines()
+    assert len(lines) == 2 * 3  # top_k lượt + lượt cuối
+    assert "Bệnh nhân: Tôi bị đau đầu" in lines
+    assert lines[-2] == "Bệnh nhân: Cảm ơn bác sĩ"
+    assert embedder.calls == embeds_after_save + 1  # chỉ embed câu hỏi hiện tại
+
+
+def test_short_session_returns_all_turns():
+    manager = SessionMemoryManager(SETTINGS, embedder=KeywordEmbedder())
+    manager.save_exchange("s2", "Tôi bị mất ngủ", "Nên ngủ đúng giờ")
+    history = manager.get_relevant_history("s2", "còn gì nữa không")
+    assert history == "Bệnh nhân: Tôi bị mất ngủ\nBác sĩ AI: Nên ngủ đúng giờ"
+    assert manager.get_relevant_history("unknown", "xin chào") == "Chưa có lịch sử hội thoại."
+
+
+def test_reset_drops_turn_index():
+    manager = SessionMemoryManager(SETTINGS, embedder=KeywordEmbedder())
+    manager.save_exchange("s3", "Hỏi", "Đáp")
+    manager.reset("s3")
+    assert manager.get_relevant_history("s3", "Hỏi") == "Chưa có lịch sử hội thoại."
+
+
+class FlakyEmbedder(KeywordEmbedder):
+    """Lỗi `failures` lần đầu (vd. OOM tạm thời) rồi hoạt động bình thường."""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def embed_one(self, text):
+        if self.failures > 0:
+            self.failures -= 1
+            self.calls += 1
+            raise RuntimeError("CUDA out of memory")
+        return super().embed_one(text)
+
+
+def test_transient_embedding_error_does_not_disable_selection():
+    embedder = FlakyEmbedder(failures=1)
+    manager = SessionMemoryManager(SETTINGS, embedder=embedder)
+    _fill(manager, 30)  # lượt đầu lỗi: chỉ lượt đó không có vector
+    assert manager._embed_backoff.stats()["embed_failure_streak"] == 0
+
+    history = manager.get_relevant_history("s1", "Cơn đau đầu có nguy hiểm không?", top_k=2)
+    assert "Bệnh nhân: Tôi bị đau đầu" in history.splitlines()
+
+    embedder.failures = 2
+    manager.save_exchange("s1", "Hỏi", "Đáp")
+    manager.save_exchange("s1", "Hỏi lại", "Đáp lại")
+    calls = embedder.calls
+    manager.save_exchange("s1", "Đang backoff", "Không embed")
+    assert embedder.calls == calls  # lỗi liên tiếp: ngưng thử, không gọi embedder
+    assert manager._embed_backoff.stats()["embed_backoff_s"] > 0
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ {name}")
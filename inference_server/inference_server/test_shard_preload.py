@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Test shard access stats + preload shard nóng (dùng shard arrow tổng hợp, không cần HF)."""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from benchmarks.shard_preload import write_shards
+from src.config import Settings
+from src.retriever import PubMedRetriever
+from src.shard_stats import ShardAccessStats
+
+
+def _retriever(cache_dir, **overrides):
+    settings = Settings(
+        RAG_CACHE_DIR=cache_dir,
+        RAG_SHARD_CACHE_SIZE=overrides.pop("cache_size", 2),
+        RAG_ACCESS_STATS_FLUSH_SECONDS=overrides.pop("flush_seconds", -1),
+        **overrides,
+    )
+    retriever = PubMedRetriever(settings, load=False)
+    retriever.load_dataset()
+    if retriever.preload_thread is not None:
+        retriever.preload_thread.join(timeout=10)
+    return retriever
+
+
+def _dataset(tmp):
+    cache_dir = Path(tmp)
+    write_shards(cache_dir / "pubmed_ds_embedded", shards=4, rows_per_shard=50, abstract_chars=64)
+    return cache_dir
+
+
+def test_docs_map_across_shard_boundaries():
+    with tempfile.TemporaryDirectory() as tmp:
+        retriever = _retriever(_dataset(tmp))
+        docs = retriever.docs_for_indices([0, 49, 50, 199, 200, -1], [0.9, 0.8, 0.7, 0.6, 0.5, 0.4])
+        assert [d["title"] for d in docs] == [
+            "Synthetic article 0-0",
+            "Synthetic article 0-49",
+            "Synthetic article 1-0",
+            "Synthetic article 3-49",
+        ]
+        assert [d["rank"] for d in docs] == [1, 2, 3, 4]
+        assert len(retriever._file_cache) <= 2
+
+
+def test_stats_persist_and_preload_hottest_shards():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_dir = _dataset(tmp)
+        first = _retriever(cache_dir, RAG_PRELOAD_ENABLED=False)
+        first.docs_for_indices([150, 151, 152, 160, 10, 60], [1.0] * 6)  # shard 3 nóng nhất, rồi 0/1
+        first.flush_access_stats()
+
+        stats = ShardAccessStats(cache_dir / "shard_access_stats.json")
+        assert stats.load()
+        assert stats.hottest(1) == [("data-00003-of-00004.arrow", 4)]
+        assert stats.hottest_ranges(1)[0][:2] == ("data-00003-of-00004.arrow", 0)
+
+        cold = _retriever(cache_dir, RAG_PRELOAD_ENABLED=False)
+        assert len(cold._file_cache) == 0
+
+        warm = _retriever(cache_dir, RAG_PRELOAD_ENABLED=True, cache_size=1)
+        assert [f.name for f in warm._file_cache] == ["data-00003-of-00004.arrow"]
+
+
+def test_preload_respects_budget():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_dir = _dataset(tmp)
+        first = _retriever(cache_dir, RAG_PRELOAD_ENABLED=False)
+        first.docs_for_indices([0, 60, 120], [1.0] * 3)
+        first.flush_access_stats()
+
+        warm = _retriever(cache_dir, RAG_PRELOAD_ENABLED=True, RAG_PRELOAD_BUDGET_MB=0)
+        assert len(warm._file_cache) == 0
+
+
+def test_overlapping_flushes_each_publish_a_complete_file(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmp:
+        now = [0.0]
+        stats = ShardAccessStats(Path(tmp) / "stats.json", flush_seconds=10, clock=lambda: now[0])
+        replacing = threading.Event()
+        real_replace = os.replace
+        writes = []
+
+        def slow_replace(src, dst):
+            writes.append(Path(src).name)
+            replacing.set()
+            time.sleep(0.05)  # flush thứ hai chen vào giữa lúc lần đầu chưa publish
+            real_replace(src, dst)
+
+        monkeypatch.setattr(os, "replace", slow_replace)
+        stats.record("a.arrow", 0)
+        results = []
+        first = threading.Thread(target=lambda: results.append(stats.flush()))
+        first.start()
+        assert replacing.wait(5)
+        now[0] = 11.0
+        stats.record("a.arrow", 1)  # tới hạn: record tự flush trên thread này
+        first.join()
+
+        assert results == [True] and len(writes) == 2 and len(set(writes)) == 2
+        assert [p.name for p in Path(tmp).iterdir()] == ["stats.json"]  # không còn file tạm
+        assert not stats.flush()  # lượt flush đã được nhận, không còn gì để ghi
+        reloaded = ShardAccessStats(Path(tmp) / "stats.json")
+        assert reloaded.load() and reloaded.hottest() == [("a.arrow", 2)]
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ {name}")
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""Test dừng sinh sớm: section header lặp, stop_when trong SteppedVLLMEngine, max_new_tokens theo intent."""
+
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from benchmarks.fakes import FakeEngine
+from benchmarks.stop_sequences import engine_stop_prefix
+from src.model_loader import SteppedVLLMEngine, generate_with_confidence
+from src.utils import STOP_MARKERS, has_repeated_section, postprocess_answer, repeated_section_index
+
+SECTIONS = "\nKế hoạch đề xuất:\n- Đi khám bác sĩ.\nTài liệu tham khảo:\n[1] PMID: 123"
+DRAFT = "Tiểu đường type 2 là tình trạng đề kháng insulin [1]." + SECTIONS * 3
+
+
+def test_repeated_section_stop_keeps_final_answer():
+    assert repeated_section_index("Tiểu đường" + SECTIONS) == -1
+    assert repeated_section_index(DRAFT) == DRAFT.index("Kế hoạch đề xuất:", DRAFT.index(SECTIONS) + 2)
+    prefix = engine_stop_prefix(DRAFT)
+    assert prefix.endswith("Kế hoạch đề xuất:") and len(prefix) < len(DRAFT) * 0.6
+    assert postprocess_answer(prefix) == postprocess_answer(DRAFT)
+
+    tail = DRAFT[: DRAFT.index(SECTIONS) + len(SECTIONS)] + "\n### Question: Còn gì nữa?\n### Answer: ..."
+    assert postprocess_answer(engine_stop_prefix(tail)) == postprocess_answer(tail)
+
+
+class _FakeLLMEngine:
+    """LLMEngine giả: mỗi step() thêm một dòng của script vào mọi request đang chạy."""
+
+    def __init__(self, script):
+        self.script = script
+        self.running = {}
+        self.aborted = []
+        self.steps = 0
+
+    def add_request(self, request_id, prompt, params):
+        self.running[request_id] = (prompt, 0)
+
+    def abort_request(self, request_ids):
+        for request_id in request_ids:
+            self.aborted.append(request_id)
+            self.running.pop(request_id, None)
+
+    def has_unfinished_requests(self):
+        return bool(self.running)
+
+    def step(self):
+        time.sleep(0.001)
+        self.steps += 1
+        outputs = []
+        for request_id, (prompt, n) in list(self.running.items()):
+            n += 1
+            finished = n >= len(self.script)
+            text = "".join(self.script[:n])
+            completion = SimpleNamespace(text=text, logprobs=[{0: SimpleNamespace(logprob=-0.1)}] * n)
+            outputs.append(SimpleNamespace(request_id=request_id, prompt=prompt, outputs=[completion], finished=finished))
+            if finished:
+                del self.running[request_id]
+            else:
+                self.running[request_id] = (prompt, n)
+        return outputs
+
+
+def test_stepped_engine_stops_on_repeated_section():
+    script = [line + "\n" for line in DRAFT.splitlines()] + ["thêm\n"] * 200
+    llm_engine = _FakeLLMEngine(script)
+    engine = SteppedVLLMEngine(SimpleNamespace(llm_engine=llm_engine), poll_s=0.005)
+    params = SimpleNamespace(max_tokens=1024)
+
+    [output] = engine.generate(["prompt"], params, stop_when=has_repeated_section)
+    assert has_repeated_section(output.outputs[0].text)
+    assert postprocess_answer(output.outputs[0].text) == postprocess_answer(DRAFT)
+    deadline = time.monotonic() + 2
+    while not llm_engine.aborted and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert len(llm_engine.aborted) == 1 and llm_engine.steps < len(script)
+
+    [full] = engine.generate(["other"], params)
+    assert full.finished and full.outputs[0].text == "".join(script)
+
+
+class _FailingLLMEngine(_FakeLLMEngine):
+    """Như vLLM: add_request raise ValueError khi prompt quá dài; step() lỗi khi fail_next_step."""
+
+    def __init__(self, script):
+        super().__init__(script)
+        self.fail_next_step = False
+
+    def add_request(self, request_id, prompt, params):
+        if prompt.startswith("too long"):
+            raise ValueError("prompt is longer than max_model_len")
+        super().add_request(request_id, prompt, params)
+
+    def step(self):
+        if self.fail_next_step:
+            self.fail_next_step = False
+            raise RuntimeError("CUDA error")
+        return super().step()
+
+
+def test_stepped_engine_survives_add_request_and_step_failures():
+    llm_engine = _FailingLLMEngine(["a", "b", "c"])
+    engine = SteppedVLLMEngine(SimpleNamespace(llm_engine=llm_engine), poll_s=0.005)
+    params = SimpleNamespace(max_tokens=16)
+    deadline = time.monotonic() + 5
+    give_up = lambda: time.monotonic() > deadline  # noqa: E731  (test treo -> fail thay vì chờ mãi)
+
+    for prompts in (["too long"], ["ok", "too long"]):
+        try:
+            engine.generate(prompts, params, should_stop=give_up)
+            raise AssertionError("expected ValueError")
+        except ValueError:
+            pass
+    assert not give_up()
+    [output] = engine.generate(["ok"], params)  # thread step vẫn sống, không cần should_stop
+    assert output.finished and output.outputs[0].text == "abc"
+
+    llm_engine.fail_next_step = True
+    try:
+        engine.generate(["x", "y"], params, should_stop=give_up)
+        raise AssertionError("expected RuntimeError")
+    except RuntimeError:
+        pass
+    assert not give_up() and not llm_engine.running and len(llm_engine.aborted) >= 2
+    [output] = engine.generate(["after"], params)
+    assert output.outputs[0].text == "abc" and not engine._results
+
+
+class _RecordingEngine(FakeEngine):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.answer_params = []
+
+    def generate(self, prompts, sampling_params, use_tqdm=False, should_stop=None):
+        if "local safety router" not in prompts[0]:
+            self.answer_params.append(sampling_params)
+        return super().generate(prompts, sampling_params, use_tqdm, should_stop)
+
+
+def test_answer_uses_intent_budget_and_stop_strings(make_pipeline):
+    engine = _RecordingEngine(token_latency_ms=0.0, answer_tokens=400)
+    pipeline = make_pipeline(engine, MAX_NEW_TOKENS_BY_INTENT={"GENERAL_MEDICAL_QA": 96})
+
+    response = pipeline.ask("Bệnh tiểu đường type 2 là gì?", "budget")
+    assert len(response["draft"].split()) == 96
+    assert engine.answer_params[-1].max_tokens == 96
+    assert engine.answer_params[-1].stop == STOP_MARKERS
+    pipeline.ask("Bệnh tiểu đường type 2 là gì?", "explicit", max_new_tokens=40)
+    assert engine.answer_params[-1].max_tokens == 40
+
+    [batched] = pipeline.ask_batch([("Bệnh tiểu đường type 2 là gì?", "batch")], max_new_tokens=500)
+    assert engine.answer_params[-1].max_tokens == 96 and len(batched["draft"].split()) == 96
+
+    text, _ = generate_with_confidence("Câu trả lời", stop=["Note:"])
+    assert "Note:" not in text
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Test background warmup + readiness tracking (component nặng được stub bằng sleep)."""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.warmup import FAILED, READY, ReadinessTracker, run_stages, start_background
+
+
+def _sleeper(seconds):
+    return lambda: time.sleep(seconds)
+
+
+def _stages(delay=0.2):
+    return [
+        [
+            ("dataset", _sleeper(delay), False),
+            ("faiss_index", _sleeper(delay), False),
+            ("query_encoder", _sleeper(delay), False),
+            ("engine", _sleeper(delay), True),
+        ],
+        [("warmup_engine", _sleeper(0.01), True)],
+    ]
+
+
+def test_parallel_warmup_faster_than_sequential():
+    started = time.perf_counter()
+    run_stages(_stages(), ReadinessTracker(), max_workers=1)
+    sequential = time.perf_counter() - started
+
+    started = time.perf_counter()
+    run_stages(_stages(), ReadinessTracker(), max_workers=4)
+    parallel = time.perf_counter() - started
+
+    assert sequential >= 0.8
+    assert parallel < sequential / 2
+
+
+def test_readiness_transitions_in_background():
+    gate = threading.Event()
+    tracker = ReadinessTracker()
+    stages = [[("engine", gate.wait, True), ("dataset", lambda: None, False)]]
+    thread = start_background(stages, tracker)
+
+    snapshot = tracker.snapshot()
+    assert snapshot["status"] == "starting" and not snapshot["ready"]
+    assert set(snapshot["components"]) == {"engine", "dataset"}
+
+    gate.set()
+    thread.join(timeout=5)
+    snapshot = tracker.snapshot()
+    assert snapshot["ready"] and snapshot["status"] == "ready"
+    assert snapshot["components"]["engine"]["state"] == READY
+    assert snapshot["components"]["engine"]["load_seconds"] is not None
+    assert snapshot["startup_seconds"] is not None
+
+
+def test_optional_failure_degrades_but_required_failure_blocks():
+    def boom():
+        raise RuntimeError("index missing")
+
+    tracker = ReadinessTracker()
+    run_stages([[("faiss_index", boom, False), ("engine", lambda: None, True)]], tracker)
+    snapshot = tracker.snapshot()
+    assert snapshot["ready"] and snapshot["status"] == "degraded"
+    assert snapshot["components"]["faiss_index"]["state"] == FAILED
+    assert "index missing" in snapshot["components"]["faiss_index"]["error"]
+
+    tracker = ReadinessTracker()
+    run_stages([[("engine", boom, True)]], tracker)
+    assert not tracker.is_ready()
+    assert tracker.snapshot()["status"] == "failed"
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ {name}")
@@ -6,6 +6,9 @@ Requirements:
     pip install -r requirements_gpu.txt
 
 Usage:
+    # Mock mode (rules only, no GPU)
+    python qwen_router_server.py --port 8081 --mock
+
     # Full precision (requires 28GB+ VRAM)
     python qwen3_router_server.py --port 8081 --model Qwen/Qwen2.5-14B-Instruct
     
@@ -14,15 +17,25 @@ Usage:
     
     # 4-bit quantization (requires 10GB VRAM)
     python qwen3_router_server.py --port 8081 --model Qwen/Qwen2.5-14B-Instruct --quantize 4bit
+
+    # Dynamic batching: merge up to 16 requests (or wait at most 15ms) per generate call
+    python qwen_router_server.py --port 8081 --max-batch-size 16 --max-wait-ms 15
 """
 
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+import copy
+import inspect
 import json
 import re
 import os
+import queue
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
 import torch
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional
 import logging
 
 # Setup logging
@@ -40,6 +53,58 @@ model = None
 tokenizer = None
 model_name = None
 USE_MOCK = True
+batcher = None
+result_cache = None
+prefix_cache = None
+PREFIX_CACHE_ENABLED = True
+
+# 'score': one forward pass scoring every intent label (default)
+# 'generate': sample a JSON answer and parse it
+CLASSIFIER_MODE = "score"
+SCORE_TEMPERATURE = 1.0
+classifier_stats = {"model_calls": 0, "fallbacks": 0}
+
+INTENT_ACTIONS: Dict[str, str] = {
+    "EMERGENCY": "EMERGENCY_RESPONSE",
+    "PERSONAL_DB_QUERY": "SEARCH_DB",
+    "USER_INPUT_ANALYSIS": "CALL_GEMINI",
+    "GENERAL_MEDICAL_QA": "CALL_GEMINI",
+    "OPERATIONAL_ADMIN": "CALL_ADMIN_TOOL",
+    "OUT_OF_SCOPE": "REPLY_LOCALLY",
+}
+SCORE_ASSISTANT_PREFIX = '{"intent": "'
+
+# Larger /classify/batch requests are rejected with 413; longer inputs are cut
+# to MAX_INPUT_TOKENS so every prompt fits the model context
+MAX_BATCH_INPUTS = 64
+MAX_INPUT_TOKENS = 1024
+
+# Generation parameters for classification (override for deterministic tests)
+GENERATION_KWARGS: Dict[str, Any] = {
+    "max_new_tokens": 512,
+    "temperature": 0.3,
+    "top_p": 0.8,
+    "do_sample": True,
+}
+
+CLASSIFIER_SYSTEM_PROMPT = """You are an intent classifier for a medical chatbot. Analyze the user's question and return ONLY a JSON object with this exact format:
+{
+  "intent": "EMERGENCY | PERSONAL_DB_QUERY | USER_INPUT_ANALYSIS | GENERAL_MEDICAL_QA | OPERATIONAL_ADMIN | OUT_OF_SCOPE",
+  "confidence": 0.95,
+  "action": "EMERGENCY_RESPONSE | SEARCH_DB | CALL_GEMINI | CALL_ADMIN_TOOL | REPLY_LOCALLY",
+  "requires_auth": false,
+  "safety_flags": []
+}
+
+Intent definitions:
+- EMERGENCY: Life-threatening symptoms (chest pain, severe bleeding, unconscious, stroke, suicide)
+- PERSONAL_DB_QUERY: User asks about their past medical records ("my test", "my prescription")
+- USER_INPUT_ANALYSIS: User provides current vital signs for analysis (blood pressure, glucose)
+- GENERAL_MEDICAL_QA: General medical knowledge questions
+- OPERATIONAL_ADMIN: Booking appointments, pricing, hospital info
+- OUT_OF_SCOPE: Greetings, small talk, or non-medical topics
+
+Return ONLY valid JSON, no explanations."""
 
 def load_qwen3_model(model_path: str, quantization: Optional[str] = None):
     """Load Qwen3 14B model with optional quantization
@@ -72,6 +137,10 @@ def load_qwen3_model(model_path: str, quantization: Optional[str] = None):
             trust_remote_code=True,
             use_fast=True
         )
+        # Left padding so batched prompts end right before generation starts
+        tokenizer.padding_side = "left"
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
         logger.info("✓ Tokenizer loaded")
         
         # Configure model loading
@@ -115,6 +184,9 @@ def load_qwen3_model(model_path: str, quantization: Optional[str] = None):
         with torch.no_grad():
             outputs = model.generate(**inputs, max_new_tokens=5)
         logger.info("✓ Test inference successful!")
+        
+        if PREFIX_CACHE_ENABLED:
+            build_prefix_cache()
         logger.info("="*60)
         
         return True
@@ -200,81 +272,649 @@ def classify_intent_mock(user_input: str) -> Dict[str, Any]:
     }
 
 
-def classify_intent_with_model(user_input: str) -> Dict[str, Any]:
-    """
-    Qwen3 model inference for intent classification
-    Uses Qwen2.5-14B-Instruct with optimized prompt
-    """
-    try:
-        # Build classification prompt
-        system_prompt = """You are an intent classifier for a medical chatbot. Analyze the user's question and return ONLY a JSON object with this exact format:
-{
-  "intent": "EMERGENCY | PERSONAL_DB_QUERY | USER_INPUT_ANALYSIS | GENERAL_MEDICAL_QA | OPERATIONAL_ADMIN | OUT_OF_SCOPE",
-  "confidence": 0.95,
-  "action": "EMERGENCY_RESPONSE | SEARCH_DB | CALL_GEMINI | CALL_ADMIN_TOOL | REPLY_LOCALLY",
-  "requires_auth": false,
-  "safety_flags": []
-}
+def truncate_input(user_input: str) -> str:
+    """Keep the first MAX_INPUT_TOKENS tokens of an input (no-op in mock mode)"""
+    if USE_MOCK or tokenizer is None:
+        return user_input
+    ids = tokenizer(user_input, add_special_tokens=False)["input_ids"]
+    if len(ids) <= MAX_INPUT_TOKENS:
+        return user_input
+    logger.warning(f"⚠️  Input of {len(ids)} tokens truncated to {MAX_INPUT_TOKENS}")
+    return tokenizer.decode(ids[:MAX_INPUT_TOKENS], skip_special_tokens=True)
 
-Intent definitions:
-- EMERGENCY: Life-threatening symptoms (chest pain, severe bleeding, unconscious, stroke, suicide)
-- PERSONAL_DB_QUERY: User asks about their past medical records ("my test", "my prescription")
-- USER_INPUT_ANALYSIS: User provides current vital signs for analysis (blood pressure, glucose)
-- GENERAL_MEDICAL_QA: General medical knowledge questions
-- OPERATIONAL_ADMIN: Booking appointments, pricing, hospital info
-- OUT_OF_SCOPE: Greetings, small talk, or non-medical topics
 
-Return ONLY valid JSON, no explanations."""
+def build_classification_prompt(user_input: str) -> str:
+    """Render the chat-template prompt for one classification request"""
+    conversation = [
+        {"role": "system", "content": CLASSIFIER_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Classify: {user_input}"}
+    ]
+    return tokenizer.apply_chat_template(
+        conversation,
+        tokenize=False,
+        add_generation_prompt=True
+    )
 
-        # Format conversation
-        conversation = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Classify: {user_input}"}
-        ]
-        
-        # Apply chat template
-        prompt = tokenizer.apply_chat_template(
-            conversation,
+
+class SystemPromptCache:
+    """
+    past_key_values of the fixed classifier system prompt, computed once at load.
+    
+    Each request gets a copy of the cache so only its own user turn is prefilled.
+    """
+
+    def __init__(self, model, tokenizer, system_prompt: str):
+        prefix_text = tokenizer.apply_chat_template(
+            [{"role": "system", "content": system_prompt}],
             tokenize=False,
-            add_generation_prompt=True
+            add_generation_prompt=False,
         )
+        probe = build_classification_prompt("probe")
+        if not probe.startswith(prefix_text):
+            raise ValueError("Chat template does not render the system prompt as a stable prefix")
+        
+        self.prefix_text = prefix_text
+        self.prefix_ids = tokenizer(prefix_text, return_tensors="pt", add_special_tokens=False)["input_ids"]
         
-        # Tokenize and move to device
-        inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=2048)
-        inputs = {k: v.to(model.device) for k, v in inputs.items()}
+        from transformers import DynamicCache
         
-        # Generate with optimized parameters
+        start = time.perf_counter()
         with torch.no_grad():
-            outputs = model.generate(
-                **inputs,
-                max_new_tokens=512,
-                temperature=0.3,
-                top_p=0.8,
-                do_sample=True,
-                pad_token_id=tokenizer.pad_token_id if tokenizer.pad_token_id else tokenizer.eos_token_id,
-                eos_token_id=tokenizer.eos_token_id,
+            outputs = model(
+                input_ids=self.prefix_ids.to(model.device),
+                past_key_values=DynamicCache(),
+                use_cache=True,
             )
-        
-        # Decode response
-        response_ids = outputs[0][inputs['input_ids'].shape[1]:]
-        response = tokenizer.decode(response_ids, skip_special_tokens=True).strip()
-        
-        logger.debug(f"Model response: {response}")
-        
-        # Extract JSON from response
+        self.build_ms = (time.perf_counter() - start) * 1000
+        self.past_key_values = outputs.past_key_values
+        self.num_tokens = self.prefix_ids.shape[1]
+        self.nbytes = _kv_cache_nbytes(self.past_key_values)
+
+    def matches(self, prompts: List[str]) -> bool:
+        return all(p.startswith(self.prefix_text) for p in prompts)
+
+    def copy_for_batch(self, batch_size: int):
+        cache = copy.deepcopy(self.past_key_values)
+        if batch_size > 1:
+            cache.batch_repeat_interleave(batch_size)
+        return cache
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "tokens": self.num_tokens,
+            "bytes": self.nbytes,
+            "mb": round(self.nbytes / 1024**2, 3),
+            "build_ms": round(self.build_ms, 2),
+        }
+
+
+def _kv_cache_nbytes(cache) -> int:
+    if hasattr(cache, "key_cache"):
+        tensors = list(cache.key_cache) + list(cache.value_cache)
+    else:
+        tensors = [t for layer in cache for t in layer]
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def build_prefix_cache() -> Optional[SystemPromptCache]:
+    """Precompute the system-prompt KV cache (falls back to full prefill on failure)"""
+    global prefix_cache
+    try:
+        prefix_cache = SystemPromptCache(model, tokenizer, CLASSIFIER_SYSTEM_PROMPT)
+        info = prefix_cache.info()
+        logger.info(f"✓ System prompt KV cache: {info['tokens']} tokens, {info['mb']} MB")
+    except Exception as e:
+        logger.warning(f"⚠️  System prompt KV cache disabled: {e}")
+        prefix_cache = None
+    return prefix_cache
+
+
+class PrefillStats:
+    """Per-request prefill timing, split by whether the prefix cache was used"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.data = {
+            mode: {"requests": 0, "tokens": 0, "total_ms": 0.0, "last_ms": 0.0}
+            for mode in ("cached", "full")
+        }
+
+    def record(self, mode: str, requests: int, tokens: int, elapsed_ms: float) -> None:
+        with self._lock:
+            entry = self.data[mode]
+            entry["requests"] += requests
+            entry["tokens"] += tokens
+            entry["total_ms"] += elapsed_ms
+            entry["last_ms"] = elapsed_ms
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                mode: {
+                    "requests": entry["requests"],
+                    "avg_prefill_tokens": (entry["tokens"] / entry["requests"]) if entry["requests"] else 0.0,
+                    "avg_prefill_ms": (entry["total_ms"] / entry["requests"]) if entry["requests"] else 0.0,
+                    "last_prefill_ms": entry["last_ms"],
+                }
+                for mode, entry in self.data.items()
+            }
+
+
+prefill_stats = PrefillStats()
+
+
+def generate_responses(prompts: List[str]) -> List[str]:
+    """
+    Left-pad prompts into one batch, run a single model.generate and decode each row.
+    
+    When the system-prompt KV cache is available only the per-request suffix
+    is tokenized and prefilled; the cached prefix is shared by every row.
+    """
+    from transformers import DynamicCache
+    
+    batch_size = len(prompts)
+    use_prefix = prefix_cache is not None and prefix_cache.matches(prompts)
+    if use_prefix:
+        suffixes = [p[len(prefix_cache.prefix_text):] for p in prompts]
+        enc = tokenizer(suffixes, return_tensors="pt", padding=True, add_special_tokens=False)
+        prefix_ids = prefix_cache.prefix_ids.expand(batch_size, -1)
+        input_ids = torch.cat([prefix_ids, enc["input_ids"]], dim=1)
+        attention_mask = torch.cat(
+            [torch.ones_like(prefix_ids), enc["attention_mask"]], dim=1
+        )
+        past_key_values = prefix_cache.copy_for_batch(batch_size)
+        cached_len = prefix_cache.num_tokens
+    else:
+        enc = tokenizer(prompts, return_tensors="pt", padding=True, truncation=True, max_length=2048)
+        input_ids = enc["input_ids"]
+        attention_mask = enc["attention_mask"]
+        past_key_values = DynamicCache()
+        cached_len = 0
+    
+    input_ids = input_ids.to(model.device)
+    attention_mask = attention_mask.to(model.device)
+    
+    # Prefill everything except the last prompt token; generate() then
+    # continues from the cache exactly as it would after its own prefill
+    start = time.perf_counter()
+    if input_ids.shape[1] - cached_len > 1:
+        position_ids = (attention_mask.long().cumsum(-1) - 1).masked_fill(attention_mask == 0, 1)
+        with torch.no_grad():
+            model(
+                input_ids=input_ids[:, cached_len:-1],
+                attention_mask=attention_mask[:, :-1],
+                position_ids=position_ids[:, cached_len:-1],
+                past_key_values=past_key_values,
+                use_cache=True,
+            )
+    prefill_ms = (time.perf_counter() - start) * 1000
+    prefill_stats.record(
+        "cached" if use_prefix else "full",
+        batch_size,
+        int(attention_mask[:, cached_len:].sum().item()),
+        prefill_ms,
+    )
+    logger.debug(
+        f"Prefill {'cached' if use_prefix else 'full'}: batch={batch_size} "
+        f"tokens={input_ids.shape[1] - cached_len} time={prefill_ms:.1f}ms"
+    )
+
+    with torch.no_grad():
+        outputs = model.generate(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            past_key_values=past_key_values,
+            **GENERATION_KWARGS,
+            pad_token_id=tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id,
+            eos_token_id=tokenizer.eos_token_id,
+        )
+
+    # With left padding every row's prompt ends at the same column
+    prompt_len = input_ids.shape[1]
+    return [
+        tokenizer.decode(row[prompt_len:], skip_special_tokens=True).strip()
+        for row in outputs
+    ]
+
+
+def fallback_classification(user_input: str) -> Dict[str, Any]:
+    """Rule-based result used when the model fails; marked so it is never cached"""
+    return {**classify_intent_mock(user_input), "fallback": True}
+
+
+def parse_classification(response: str, user_input: str) -> Dict[str, Any]:
+    """Extract the JSON classification from a model response, falling back to rules"""
+    logger.debug(f"Model response: {response}")
+    try:
         json_match = re.search(r'\{[^}]+\}', response, re.DOTALL)
         if json_match:
-            json_str = json_match.group(0)
-            result = json.loads(json_str)
+            result = json.loads(json_match.group(0))
             logger.info(f"✓ Classified as: {result.get('intent')} (confidence: {result.get('confidence')})")
             return result
-        else:
-            logger.warning("⚠️  No JSON in model response, using fallback")
-            return classify_intent_mock(user_input)
-            
+        logger.warning("⚠️  No JSON in model response, using fallback")
+    except Exception as e:
+        logger.warning(f"⚠️  Invalid JSON in model response ({e}), using fallback")
+    classifier_stats["fallbacks"] += 1
+    return fallback_classification(user_input)
+
+
+def _label_continuation(intent: str) -> str:
+    return f'{intent}", "action": "{INTENT_ACTIONS[intent]}"'
+
+
+def score_intent_labels(user_inputs: List[str]) -> List[Dict[str, float]]:
+    """
+    Log-likelihood of every intent label (and its mapped action) for each input.
+    
+    All inputs x labels are scored in a single batched forward pass, reusing the
+    system-prompt KV cache when it is available. No tokens are generated.
+    """
+    labels = list(INTENT_ACTIONS)
+    prompts = [build_classification_prompt(text) + SCORE_ASSISTANT_PREFIX for text in user_inputs]
+    use_prefix = prefix_cache is not None and prefix_cache.matches(prompts)
+    cached_len = prefix_cache.num_tokens if use_prefix else 0
+    
+    label_ids = [
+        tokenizer(_label_continuation(label), add_special_tokens=False)["input_ids"]
+        for label in labels
+    ]
+    rows: List[List[int]] = []
+    for prompt in prompts:
+        context = prompt[len(prefix_cache.prefix_text):] if use_prefix else prompt
+        context_ids = tokenizer(context, add_special_tokens=not use_prefix)["input_ids"]
+        rows.extend(context_ids + ids for ids in label_ids)
+    
+    # Left-pad so every label continuation ends at the last column
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    width = max(len(row) for row in rows)
+    input_ids = torch.tensor([[pad_id] * (width - len(row)) + row for row in rows])
+    attention_mask = torch.tensor([[0] * (width - len(row)) + [1] * len(row) for row in rows])
+    batch_size = input_ids.shape[0]
+    
+    past_key_values = None
+    if use_prefix:
+        prefix_ids = prefix_cache.prefix_ids.expand(batch_size, -1)
+        attention_mask = torch.cat([torch.ones_like(prefix_ids), attention_mask], dim=1)
+        past_key_values = prefix_cache.copy_for_batch(batch_size)
+    position_ids = (attention_mask.cumsum(-1) - 1).masked_fill(attention_mask == 0, 1)[:, cached_len:]
+    
+    max_label_len = max(len(ids) for ids in label_ids)
+    forward_kwargs: Dict[str, Any] = {}
+    if "num_logits_to_keep" in inspect.signature(model.forward).parameters:
+        # Only the last positions are needed: avoids a (rows x seq x vocab) logits tensor
+        forward_kwargs["num_logits_to_keep"] = max_label_len + 1
+    
+    start = time.perf_counter()
+    with torch.no_grad():
+        logits = model(
+            input_ids=input_ids.to(model.device),
+            attention_mask=attention_mask.to(model.device),
+            position_ids=position_ids.to(model.device),
+            past_key_values=past_key_values,
+            use_cache=past_key_values is not None,
+            **forward_kwargs,
+        ).logits
+    # The scoring forward is the whole prefill: count requests, not the input x label rows
+    prefill_stats.record(
+        "cached" if use_prefix else "full",
+        len(user_inputs),
+        int(attention_mask[:, cached_len:].sum().item()),
+        (time.perf_counter() - start) * 1000,
+    )
+    
+    logits = logits[:, -(max_label_len + 1):-1, :].float()
+    targets = input_ids[:, -max_label_len:].to(logits.device)
+    token_logprobs = torch.log_softmax(logits, dim=-1).gather(-1, targets.unsqueeze(-1)).squeeze(-1)
+    
+    scores: List[Dict[str, float]] = []
+    for i in range(len(user_inputs)):
+        per_label = {}
+        for j, label in enumerate(labels):
+            n = len(label_ids[j])
+            per_label[label] = float(token_logprobs[i * len(labels) + j, -n:].sum())
+        scores.append(per_label)
+    return scores
+
+
+def scores_to_classification(label_logprobs: Dict[str, float]) -> Dict[str, Any]:
+    """Softmax (with temperature) over label log-likelihoods -> router JSON"""
+    labels = list(label_logprobs)
+    logits = torch.tensor([label_logprobs[label] for label in labels]) / SCORE_TEMPERATURE
+    probs = torch.softmax(logits, dim=0).tolist()
+    distribution = {label: round(p, 4) for label, p in zip(labels, probs)}
+    intent = max(distribution, key=distribution.get)
+    return {
+        "intent": intent,
+        "confidence": distribution[intent],
+        "action": INTENT_ACTIONS[intent],
+        "requires_auth": intent == "PERSONAL_DB_QUERY",
+        "safety_flags": ["EMERGENCY_DETECTED"] if intent == "EMERGENCY" else [],
+        "scores": distribution,
+    }
+
+
+def classify_batch_with_model(user_inputs: List[str]) -> List[Dict[str, Any]]:
+    """
+    Qwen3 model inference for a batch of classification requests
+    (one forward pass per decoding step for the whole batch)
+    """
+    try:
+        classifier_stats["model_calls"] += len(user_inputs)
+        if CLASSIFIER_MODE == "score":
+            return [scores_to_classification(s) for s in score_intent_labels(user_inputs)]
+        prompts = [build_classification_prompt(text) for text in user_inputs]
+        responses = generate_responses(prompts)
+        return [parse_classification(resp, text) for resp, text in zip(responses, user_inputs)]
     except Exception as e:
         logger.error(f"❌ Model inference error: {e}")
-        return classify_intent_mock(user_input)
+        classifier_stats["fallbacks"] += len(user_inputs)
+        return [fallback_classification(text) for text in user_inputs]
+
+
+def classify_intent_with_model(user_input: str) -> Dict[str, Any]:
+    """
+    Qwen3 model inference for intent classification
+    Uses Qwen2.5-14B-Instruct with optimized prompt
+    """
+    return classify_batch_with_model([user_input])[0]
+
+
+def classify_batch(user_inputs: List[str]) -> List[Dict[str, Any]]:
+    """Classify a batch with the model, or with rules in mock mode"""
+    if USE_MOCK:
+        return [classify_intent_mock(text) for text in user_inputs]
+    return classify_batch_with_model(user_inputs)
+
+
+class _PendingRequest:
+    __slots__ = ("user_input", "event", "result", "error")
+
+    def __init__(self, user_input: str):
+        self.user_input = user_input
+        self.event = threading.Event()
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[BaseException] = None
+
+
+class ClassificationBatcher:
+    """
+    Background worker that groups concurrent classification requests.
+
+    The worker takes the first queued request, then keeps collecting until
+    `max_batch_size` requests are queued or `max_wait_ms` has elapsed, runs
+    `classify_fn` once on the whole batch and hands each result back to the
+    waiting caller.
+    """
+
+    def __init__(
+        self,
+        classify_fn: Callable[[List[str]], List[Dict[str, Any]]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        self.classify_fn = classify_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max(max_wait_ms, 0.0) / 1000.0
+        self._queue: "queue.Queue[_PendingRequest]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.max_seen_batch = 0
+
+    def start(self) -> None:
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._worker, name="classification-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def submit_many(self, user_inputs: List[str], timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        self.start()
+        pending = [_PendingRequest(text) for text in user_inputs]
+        for item in pending:
+            self._queue.put(item)
+        results = []
+        for item in pending:
+            if not item.event.wait(timeout):
+                raise TimeoutError("Classification timed out")
+            if item.error is not None:
+                raise item.error
+            results.append(item.result)
+        return results
+
+    def submit(self, user_input: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        return self.submit_many([user_input], timeout=timeout)[0]
+
+    def _collect(self) -> List[_PendingRequest]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self) -> None:
+        while True:
+            batch = self._collect()
+            try:
+                results = self.classify_fn([item.user_input for item in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(
+                        f"classify_fn returned {len(results)} results for {len(batch)} inputs"
+                    )
+                for item, result in zip(batch, results):
+                    item.result = result
+            except Exception as e:
+                logger.error(f"❌ Batch classification failed: {e}")
+                for item in batch:
+                    item.error = e
+            finally:
+                with self._stats_lock:
+                    self.batches += 1
+                    self.requests += len(batch)
+                    self.max_seen_batch = max(self.max_seen_batch, len(batch))
+                for item in batch:
+                    item.event.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_s * 1000.0,
+                "batches": self.batches,
+                "requests": self.requests,
+                "avg_batch_size": (self.requests / self.batches) if self.batches else 0.0,
+                "max_seen_batch": self.max_seen_batch,
+                "queued": self._queue.qsize(),
+            }
+
+
+def configure_batcher(max_batch_size: int = 8, max_wait_ms: float = 10.0) -> ClassificationBatcher:
+    global batcher
+    batcher = ClassificationBatcher(classify_batch, max_batch_size, max_wait_ms)
+    batcher.start()
+    return batcher
+
+
+def get_batcher() -> ClassificationBatcher:
+    if batcher is None:
+        return configure_batcher()
+    return batcher
+
+
+class _Flight:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[BaseException] = None
+
+
+class ClassificationCache:
+    """
+    Normalized-input LRU cache with TTL and single-flight request coalescing.
+    
+    Identical inputs (after Unicode/whitespace/case normalization) are answered
+    from the cache; identical inputs that are already being classified wait for
+    the in-flight call instead of triggering another model.generate.
+    Fallback results (``"fallback": True``) are shared with coalesced callers but
+    not stored, so a transient model error is retried on the next request.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 4096,
+        ttl_seconds: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (created_at, result)
+        self._inflight: Dict[str, _Flight] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        text = unicodedata.normalize("NFC", text)
+        return " ".join(text.split()).lower()
+
+    def _key(self, text: str) -> str:
+        return f"{'mock' if USE_MOCK else CLASSIFIER_MODE}:{self.normalize(text)}"
+
+    def _store_locked(self, key: str, result: Dict[str, Any]) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (self._clock(), result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_compute(
+        self,
+        user_inputs: List[str],
+        compute_fn: Callable[[List[str]], List[Dict[str, Any]]],
+        timeout: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        keys = [self._key(text) for text in user_inputs]
+        results: List[Optional[Dict[str, Any]]] = [None] * len(user_inputs)
+        waits: Dict[int, _Flight] = {}
+        leaders: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (flight, text)
+
+        with self._lock:
+            now = self._clock()
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    created_at, result = entry
+                    if self.ttl_seconds <= 0 or now - created_at <= self.ttl_seconds:
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        results[i] = copy.deepcopy(result)
+                        continue
+                    del self._entries[key]
+                    self.expirations += 1
+                if key in leaders:
+                    waits[i] = leaders[key][0]
+                    self.coalesced += 1
+                    continue
+                flight = self._inflight.get(key)
+                if flight is not None:
+                    waits[i] = flight
+                    self.coalesced += 1
+                    continue
+                flight = _Flight()
+                self._inflight[key] = flight
+                leaders[key] = (flight, user_inputs[i])
+                waits[i] = flight
+                self.misses += 1
+
+        if leaders:
+            leader_keys = list(leaders)
+            try:
+                computed = compute_fn([leaders[key][1] for key in leader_keys])
+            except BaseException as e:
+                with self._lock:
+                    for key in leader_keys:
+                        self._inflight.pop(key, None)
+                for key in leader_keys:
+                    flight = leaders[key][0]
+                    flight.error = e
+                    flight.event.set()
+                raise
+            with self._lock:
+                for key, result in zip(leader_keys, computed):
+                    if not result.get("fallback"):
+                        self._store_locked(key, copy.deepcopy(result))
+                    self._inflight.pop(key, None)
+            for key, result in zip(leader_keys, computed):
+                flight = leaders[key][0]
+                flight.result = result
+                flight.event.set()
+
+        for i, flight in waits.items():
+            if not flight.event.wait(timeout):
+                raise TimeoutError("Classification timed out")
+            if flight.error is not None:
+                raise flight.error
+            results[i] = copy.deepcopy(flight.result)
+        return results
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": ((self.hits + self.coalesced) / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "in_flight": len(self._inflight),
+            }
+
+
+def configure_cache(max_entries: int = 4096, ttl_seconds: float = 300.0) -> ClassificationCache:
+    global result_cache
+    result_cache = ClassificationCache(max_entries, ttl_seconds)
+    return result_cache
+
+
+def get_cache() -> ClassificationCache:
+    if result_cache is None:
+        return configure_cache()
+    return result_cache
+
+
+def classify_inputs(user_inputs: List[str]) -> List[Dict[str, Any]]:
+    """Truncate -> cache -> single-flight -> batching worker -> model (or rules in mock mode)"""
+    user_inputs = [truncate_input(text) for text in user_inputs]
+    return get_cache().get_or_compute(user_inputs, get_batcher().submit_many)
 
 
 @app.route('/v1/chat/completions', methods=['POST'])
@@ -289,11 +929,8 @@ def chat_completions():
         
         user_message = messages[-1].get('content', '')
         
-        # Classify intent
-        if USE_MOCK:
-            result = classify_intent_mock(user_message)
-        else:
-            result = classify_intent_with_model(user_message)
+        # Classify intent (batched with concurrent requests)
+        result = classify_inputs([user_message])[0]
         
         # Return in OpenAI format
         return jsonify({
@@ -328,7 +965,15 @@ def health():
         "status": "ok",
         "model": model_name if model_name else "Mock",
         "mode": "mock" if USE_MOCK else "model",
-        "gpu": gpu_info
+        "gpu": gpu_info,
+        "batching": get_batcher().stats(),
+        "cache": get_cache().stats(),
+        "prefix_cache": {
+            "enabled": prefix_cache is not None,
+            **(prefix_cache.info() if prefix_cache is not None else {}),
+        },
+        "prefill": prefill_stats.summary(),
+        "classifier": {"mode": CLASSIFIER_MODE, **classifier_stats}
     })
 
 
@@ -342,10 +987,7 @@ def classify():
         if not user_input:
             return jsonify({"error": "No input provided"}), 400
         
-        if USE_MOCK:
-            result = classify_intent_mock(user_input)
-        else:
-            result = classify_intent_with_model(user_input)
+        result = classify_inputs([user_input])[0]
         
         return jsonify(result)
     
@@ -354,6 +996,31 @@ def classify():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/classify/batch', methods=['POST'])
+def classify_batch_endpoint():
+    """Batch classification endpoint: {"inputs": ["...", "..."]}"""
+    try:
+        data = request.json or {}
+        inputs = data.get('inputs')
+        
+        if not isinstance(inputs, list) or not inputs:
+            return jsonify({"error": "'inputs' must be a non-empty list"}), 400
+        if len(inputs) > MAX_BATCH_INPUTS:
+            return jsonify({
+                "error": f"Batch of {len(inputs)} inputs exceeds the limit of {MAX_BATCH_INPUTS}"
+            }), 413
+        if not all(isinstance(text, str) and text for text in inputs):
+            return jsonify({"error": "Every input must be a non-empty string"}), 400
+        
+        results = classify_inputs(inputs)
+        
+        return jsonify({"results": results})
+    
+    except Exception as e:
+        logger.error(f"Error in classify_batch: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 if __name__ == '__main__':
     import argparse
     
@@ -365,7 +1032,30 @@ if __name__ == '__main__':
                         help='Model path from HuggingFace')
     parser.add_argument('--quantize', type=str, choices=['4bit', '8bit'], default='8bit',
                         help='Quantization: 4bit (10GB), 8bit (16GB), or none for full precision')
+    parser.add_argument('--max-batch-size', type=int, default=8,
+                        help='Max classification requests merged into one generate call')
+    parser.add_argument('--max-wait-ms', type=float, default=10.0,
+                        help='Max time to wait for more requests before running a batch')
+    parser.add_argument('--max-batch-inputs', type=int, default=64,
+                        help='Max inputs accepted by /classify/batch (larger batches get 413)')
+    parser.add_argument('--max-input-tokens', type=int, default=1024,
+                        help='Inputs longer than this many tokens are truncated before classification')
+    parser.add_argument('--cache-size', type=int, default=4096,
+                        help='Max cached classification results (0 disables the result cache)')
+    parser.add_argument('--cache-ttl', type=float, default=300.0,
+                        help='Seconds a cached classification stays valid (0 = no expiry)')
+    parser.add_argument('--no-prefix-cache', action='store_true',
+                        help='Disable the precomputed system-prompt KV cache')
+    parser.add_argument('--classifier', choices=['score', 'generate'], default='score',
+                        help='score: rank intent labels by log-likelihood; generate: sample JSON')
+    parser.add_argument('--score-temperature', type=float, default=1.0,
+                        help='Softmax temperature for label-scoring confidences')
     args = parser.parse_args()
+    PREFIX_CACHE_ENABLED = not args.no_prefix_cache
+    CLASSIFIER_MODE = args.classifier
+    SCORE_TEMPERATURE = args.score_temperature
+    MAX_BATCH_INPUTS = args.max_batch_inputs
+    MAX_INPUT_TOKENS = args.max_input_tokens
     
     logger.info("="*60)
     logger.info("🏥 Qwen3 14B Router Server for Medical Chatbot")
@@ -378,12 +1068,17 @@ if __name__ == '__main__':
         logger.info("🚀 Mode: REAL MODEL (GPU required)")
         logger.info(f"📦 Model: {args.model}")
         logger.info(f"⚙️  Quantization: {args.quantize or 'None (Full Precision)'}")
+        logger.info(f"🏷️  Classifier: {args.classifier}")
         
         # Load model
         success = load_qwen3_model(args.model, args.quantize)
         if not success:
             logger.error("❌ Failed to load model, server will run in MOCK mode")
     
+    configure_batcher(args.max_batch_size, args.max_wait_ms)
+    configure_cache(args.cache_size, args.cache_ttl)
+    logger.info(f"📦 Batching: max {args.max_batch_size} requests / {args.max_wait_ms}ms")
+    
     logger.info("="*60)
     logger.info(f"🌐 Server: http://{args.host}:{args.port}")
     logger.info(f"📊 Health: http://{args.host}:{args.port}/health")
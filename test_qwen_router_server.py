@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""Tests for qwen_router_server (mock mode + tiny random CPU causal LM)."""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+import torch
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import qwen_router_server as router
+
+CHAT_TEMPLATE = (
+    "{% for message in messages %}<|im_start|>{{ message['role'] }}\n"
+    "{{ message['content'] }}<|im_end|>\n{% endfor %}"
+    "{% if add_generation_prompt %}<|im_start|>assistant\n{% endif %}"
+)
+
+
+def build_tiny_model():
+    """Tiny Qwen2-style model + byte-level BPE tokenizer built locally (no download)."""
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import PreTrainedTokenizerFast, Qwen2Config, Qwen2ForCausalLM
+
+    special = ["<|endoftext|>", "<|im_start|>", "<|im_end|>"]
+    bpe = Tokenizer(models.BPE())
+    bpe.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    bpe.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=400,
+        special_tokens=special,
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+    )
+    corpus = [router.CLASSIFIER_SYSTEM_PROMPT, "Classify: tôi bị đau đầu, đặt lịch khám"] * 4
+    bpe.train_from_iterator(corpus, trainer)
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=bpe,
+        eos_token="<|im_end|>",
+        pad_token="<|endoftext|>",
+        additional_special_tokens=special[1:],
+        model_input_names=["input_ids", "attention_mask"],
+    )
+    tokenizer.chat_template = CHAT_TEMPLATE
+    tokenizer.padding_side = "left"
+
+    torch.manual_seed(0)
+    config = Qwen2Config(
+        vocab_size=len(tokenizer),
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=2048,
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.pad_token_id,
+    )
+    model = Qwen2ForCausalLM(config).eval()
+    return model, tokenizer
+
+
+@pytest.fixture
+def tiny_model(monkeypatch):
+    model, tokenizer = build_tiny_model()
+    monkeypatch.setattr(router, "model", model)
+    monkeypatch.setattr(router, "tokenizer", tokenizer)
+    monkeypatch.setattr(router, "USE_MOCK", False)
+    monkeypatch.setattr(router, "prefix_cache", None)
+    monkeypatch.setattr(router, "prefill_stats", router.PrefillStats())
+    monkeypatch.setattr(router, "CLASSIFIER_MODE", "generate")
+    monkeypatch.setattr(
+        router,
+        "GENERATION_KWARGS",
+        {"max_new_tokens": 8, "do_sample": False},
+    )
+    return model, tokenizer
+
+
+@pytest.fixture
+def mock_mode(monkeypatch):
+    monkeypatch.setattr(router, "USE_MOCK", True)
+    monkeypatch.setattr(router, "batcher", None)
+    monkeypatch.setattr(router, "result_cache", None)
+
+
+def test_batcher_merges_concurrent_requests():
+    seen_batches = []
+    release = threading.Event()
+
+    def classify_fn(inputs):
+        release.wait(5)
+        seen_batches.append(list(inputs))
+        return [{"echo": text} for text in inputs]
+
+    batcher = router.ClassificationBatcher(classify_fn, max_batch_size=4, max_wait_ms=200)
+    results = {}
+
+    def call(i):
+        results[i] = batcher.submit(f"q{i}", timeout=10)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(6)]
+    for t in threads:
+        t.start()
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert {i: r["echo"] for i, r in results.items()} == {i: f"q{i}" for i in range(6)}
+    assert max(len(b) for b in seen_batches) <= 4
+    assert batcher.stats()["requests"] == 6
+    assert batcher.stats()["batches"] < 6
+
+
+def test_batch_errors_propagate_to_every_caller():
+    def classify_fn(inputs):
+        raise RuntimeError("boom")
+
+    batcher = router.ClassificationBatcher(classify_fn, max_batch_size=2, max_wait_ms=1)
+    with pytest.raises(RuntimeError):
+        batcher.submit("hello", timeout=5)
+
+
+def test_batch_endpoint_mock_mode(mock_mode):
+    client = router.app.test_client()
+    inputs = ["Tôi bị đau ngực dữ dội", "Xin chào", "Huyết áp 150/90 vừa đo"]
+    resp = client.post("/classify/batch", json={"inputs": inputs})
+    assert resp.status_code == 200
+    intents = [r["intent"] for r in resp.get_json()["results"]]
+    assert intents == ["EMERGENCY", "OUT_OF_SCOPE", "USER_INPUT_ANALYSIS"]
+
+    assert client.post("/classify/batch", json={"inputs": []}).status_code == 400
+    single = client.post("/classify", json={"input": "Xin chào"}).get_json()
+    assert single["intent"] == "OUT_OF_SCOPE"
+    health = client.get("/health").get_json()
+    assert health["batching"]["requests"] == 3
+    assert health["cache"]["hits"] == 1  # "Xin chào" was already classified in the batch
+
+
+def test_batch_endpoint_rejects_oversized_batches(mock_mode, monkeypatch):
+    monkeypatch.setattr(router, "MAX_BATCH_INPUTS", 2)
+    client = router.app.test_client()
+    resp = client.post("/classify/batch", json={"inputs": ["Xin chào"] * 3})
+    assert resp.status_code == 413
+    assert client.post("/classify/batch", json={"inputs": ["Xin chào"] * 2}).status_code == 200
+
+
+def test_long_inputs_are_truncated_to_context_budget(tiny_model, mock_mode, monkeypatch):
+    _, tokenizer = tiny_model
+    monkeypatch.setattr(router, "USE_MOCK", False)
+    monkeypatch.setattr(router, "MAX_INPUT_TOKENS", 8)
+    monkeypatch.setattr(router, "CLASSIFIER_MODE", "score")
+    monkeypatch.setattr(router, "classifier_stats", {"model_calls": 0, "fallbacks": 0})
+    long_input = "tôi bị đau đầu, đặt lịch khám " * 200
+    truncated = router.truncate_input(long_input)
+    assert len(tokenizer(truncated, add_special_tokens=False)["input_ids"]) <= 8
+    assert long_input.startswith(truncated.strip())
+    assert router.truncate_input("đau đầu") == "đau đầu"
+
+    client = router.app.test_client()
+    single = client.post("/classify", json={"input": long_input})
+    batch = client.post("/classify/batch", json={"inputs": [long_input, truncated]})
+    assert single.status_code == batch.status_code == 200
+    assert batch.get_json()["results"] == [single.get_json()] * 2
+    # Both endpoints classify the same truncated text: one model call, the rest are cache hits
+    assert router.classifier_stats["model_calls"] == 1
+    assert router.get_cache().stats()["hits"] == 2
+
+
+def test_left_padded_batch_matches_single_generation(tiny_model):
+    prompts = [
+        router.build_classification_prompt("đau đầu"),
+        router.build_classification_prompt("tôi muốn đặt lịch khám vào sáng thứ hai tuần sau"),
+    ]
+    batched = router.generate_responses(prompts)
+    single = [router.generate_responses([p])[0] for p in prompts]
+    assert batched == single
+
+
+def test_model_batch_falls_back_per_item(tiny_model):
+    # A random tiny model never emits valid JSON -> every item uses rule fallback
+    results = router.classify_batch_with_model(["Tôi bị co giật", "đặt lịch khám"])
+    assert [r["intent"] for r in results] == ["EMERGENCY", "OPERATIONAL_ADMIN"]
+    assert all(r["fallback"] for r in results)
+
+
+def test_score_mode_records_prefill_stats(tiny_model, monkeypatch):
+    monkeypatch.setattr(router, "CLASSIFIER_MODE", "score")
+    router.classify_batch_with_model(["đau đầu"])
+    assert router.build_prefix_cache() is not None
+    router.classify_batch_with_model(["đau đầu", "Xin chào"])
+
+    summary = router.prefill_stats.summary()
+    assert summary["full"]["requests"] == 1
+    assert summary["cached"]["requests"] == 2
+    assert summary["cached"]["avg_prefill_tokens"] < summary["full"]["avg_prefill_tokens"]
+    assert summary["cached"]["last_prefill_ms"] > 0
+    health = router.app.test_client().get("/health").get_json()
+    assert health["prefill"]["cached"]["requests"] > 0
+
+
+def test_prefix_cache_matches_full_prefill(tiny_model):
+    prompts = [
+        router.build_classification_prompt("đau đầu"),
+        router.build_classification_prompt("tôi muốn đặt lịch khám vào sáng thứ hai tuần sau"),
+    ]
+    full = router.generate_responses(prompts)
+    full_single = router.generate_responses(prompts[:1])
+
+    cache = router.build_prefix_cache()
+    assert cache is not None
+    assert cache.num_tokens > 100  # the long system prompt
+    assert cache.nbytes > 0
+
+    assert router.generate_responses(prompts[:1]) == full_single
+    assert router.generate_responses(prompts) == full
+    # the shared cache must not be mutated by requests
+    assert router.prefix_cache.past_key_values.get_seq_length() == cache.num_tokens
+
+    summary = router.prefill_stats.summary()
+    assert summary["cached"]["requests"] == 3
+    assert summary["full"]["requests"] == 3
+    assert summary["cached"]["avg_prefill_tokens"] < summary["full"]["avg_prefill_tokens"]
+    health = router.app.test_client().get("/health").get_json()
+    assert health["prefix_cache"]["enabled"] and health["prefix_cache"]["tokens"] == cache.num_tokens
+
+
+def test_cache_coalesces_identical_in_flight_requests():
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def compute(inputs):
+        calls.append(list(inputs))
+        started.set()
+        release.wait(5)
+        return [{"intent": "GENERAL_MEDICAL_QA", "text": text} for text in inputs]
+
+    cache = router.ClassificationCache(max_entries=8, ttl_seconds=60)
+    results = []
+    lock = threading.Lock()
+
+    def call(text):
+        res = cache.get_or_compute([text], compute, timeout=10)[0]
+        with lock:
+            results.append(res)
+
+    first = threading.Thread(target=call, args=("Tiểu đường là gì?",))
+    first.start()
+    started.wait(5)
+    others = [
+        threading.Thread(target=call, args=(variant,))
+        for variant in ["tiểu đường là gì?", "  Tiểu   đường là gì? ", "TIỂU ĐƯỜNG LÀ GÌ?"]
+    ]
+    for t in others:
+        t.start()
+    time.sleep(0.05)
+    release.set()
+    for t in [first] + others:
+        t.join()
+
+    assert len(calls) == 1
+    assert len(results) == 4
+    stats = cache.stats()
+    assert stats["misses"] == 1 and stats["coalesced"] == 3 and stats["in_flight"] == 0
+
+    # later identical requests are cache hits; duplicates inside one call are deduped
+    cache.get_or_compute(["tiểu đường là gì?", "Cao huyết áp", "cao huyết áp"], compute)
+    assert calls[-1] == ["Cao huyết áp"]
+    assert cache.stats()["hits"] == 1
+
+
+def test_cache_ttl_lru_and_errors():
+    clock = [0.0]
+    cache = router.ClassificationCache(max_entries=2, ttl_seconds=10, clock=lambda: clock[0])
+    compute = lambda inputs: [{"intent": text} for text in inputs]
+
+    cache.get_or_compute(["a", "b"], compute)
+    cache.get_or_compute(["a"], compute)  # a most recently used
+    cache.get_or_compute(["c"], compute)  # evicts b
+    assert cache.stats()["evictions"] == 1
+    clock[0] = 11
+    cache.get_or_compute(["a"], compute)
+    assert cache.stats()["expirations"] == 1
+
+    def failing(inputs):
+        raise RuntimeError("model down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute(["new"], failing)
+    assert cache.stats()["in_flight"] == 0
+    assert cache.get_or_compute(["new"], compute) == [{"intent": "new"}]
+
+
+def test_model_error_fallback_is_not_cached(tiny_model, monkeypatch):
+    calls = []
+
+    def flaky_generate(prompts):
+        calls.append(len(prompts))
+        if len(calls) == 1:
+            raise RuntimeError("CUDA out of memory")
+        return ['{"intent": "GENERAL_MEDICAL_QA", "confidence": 0.9}'] * len(prompts)
+
+    monkeypatch.setattr(router, "generate_responses", flaky_generate)
+    cache = router.ClassificationCache(max_entries=8, ttl_seconds=60)
+    [first] = cache.get_or_compute(["Tôi bị co giật"], router.classify_batch_with_model)
+    assert first["intent"] == "EMERGENCY" and first["fallback"]
+    assert cache.stats()["size"] == 0
+
+    [second] = cache.get_or_compute(["Tôi bị co giật"], router.classify_batch_with_model)
+    assert calls == [1, 1] and second == {"intent": "GENERAL_MEDICAL_QA", "confidence": 0.9}
+    assert cache.get_or_compute(["Tôi bị co giật"], router.classify_batch_with_model) == [second]
+    assert calls == [1, 1] and cache.stats()["hits"] == 1
+
+
+def _naive_label_logprob(model, tokenizer, user_input, label):
+    prompt = router.build_classification_prompt(user_input) + router.SCORE_ASSISTANT_PREFIX
+    context = tokenizer(prompt)["input_ids"]
+    continuation = tokenizer(router._label_continuation(label), add_special_tokens=False)["input_ids"]
+    ids = torch.tensor([context + continuation])
+    with torch.no_grad():
+        logprobs = torch.log_softmax(model(input_ids=ids).logits[0, :-1].float(), dim=-1)
+    targets = ids[0, 1:]
+    return float(logprobs[-len(continuation):].gather(-1, targets[-len(continuation):, None]).sum())
+
+
+@pytest.mark.parametrize("use_prefix_cache", [False, True])
+def test_label_scores_match_naive_loglikelihood(tiny_model, monkeypatch, use_prefix_cache):
+    model, tokenizer = tiny_model
+    if use_prefix_cache:
+        assert router.build_prefix_cache() is not None
+    inputs = ["đau đầu", "tôi muốn đặt lịch khám vào sáng thứ hai"]
+    scores = router.score_intent_labels(inputs)
+    for text, per_label in zip(inputs, scores):
+        assert list(per_label) == list(router.INTENT_ACTIONS)
+        for label, value in per_label.items():
+            assert value == pytest.approx(_naive_label_logprob(model, tokenizer, text, label), abs=1e-3)
+
+
+def test_score_mode_returns_distribution_without_generation(tiny_model, monkeypatch):
+    monkeypatch.setattr(router, "CLASSIFIER_MODE", "score")
+    monkeypatch.setattr(router, "classifier_stats", {"model_calls": 0, "fallbacks": 0})
+
+    def no_generate(*args, **kwargs):
+        raise AssertionError("score mode must not call generate")
+
+    monkeypatch.setattr(tiny_model[0], "generate", no_generate)
+    results = router.classify_batch_with_model(["Tôi bị co giật", "Xin chào"])
+    for result in results:
+        assert result["intent"] in router.INTENT_ACTIONS
+        assert result["action"] == router.INTENT_ACTIONS[result["intent"]]
+        assert sum(result["scores"].values()) == pytest.approx(1.0, abs=1e-3)
+        assert result["confidence"] == max(result["scores"].values())
+    assert router.classifier_stats == {"model_calls": 2, "fallbacks": 0}
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))